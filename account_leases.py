@@ -0,0 +1,306 @@
+"""
+Account leases for running several sync worker processes
+Each worker heartbeats into a shared lease store and claims the accounts
+that rendezvous hashing assigns to it among the live workers. A lease
+expires unless renewed, so when a worker dies its heartbeat and leases
+lapse and the survivors pick its accounts up without any coordination.
+An account is only synced by the worker holding its lease.
+
+The store is pluggable: SQLiteLeaseBackend uses the app's database (fine
+for workers sharing one host or volume), MemoryLeaseBackend serves a single
+process, and LEASE_BACKEND may name any class with the same methods
+(``module.ClassName``), e.g. one backed by Postgres or Redis.
+"""
+
+import hashlib
+import importlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from config import LEASE_BACKEND, LEASE_TTL, LEASE_HEARTBEAT_INTERVAL, SYNC_WORKER_ID
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class SQLiteLeaseBackend:
+    """Leases and worker heartbeats in two tables of the shared SQLite database"""
+
+    def __init__(self, db_path='reachinbox.db', busy_timeout=10):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sync_workers (
+                worker_id TEXT PRIMARY KEY,
+                heartbeat_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS account_leases (
+                account_id INTEGER PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                acquired_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+
+    def heartbeat(self, worker_id, ttl, now):
+        """Record that ``worker_id`` is alive; returns the ids of all live workers"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                INSERT INTO sync_workers (worker_id, heartbeat_at) VALUES (?, ?)
+                ON CONFLICT(worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+            ''', (worker_id, now))
+            conn.execute('DELETE FROM sync_workers WHERE heartbeat_at < ?', (now - ttl,))
+            rows = conn.execute('SELECT worker_id FROM sync_workers').fetchall()
+            conn.execute('COMMIT')
+            return {row[0] for row in rows}
+        finally:
+            conn.close()
+
+    def acquire(self, owner, account_ids, ttl, now):
+        """
+        Take or extend leases on ``account_ids`` that are free, expired or
+        already ours; returns the ids now held by ``owner``
+        """
+        if not account_ids:
+            return set()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''
+                INSERT INTO account_leases (account_id, owner, expires_at, acquired_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(account_id) DO UPDATE SET
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at,
+                    acquired_at = CASE WHEN account_leases.owner = excluded.owner
+                                       THEN account_leases.acquired_at ELSE excluded.acquired_at END
+                WHERE account_leases.owner = excluded.owner OR account_leases.expires_at < ?
+            ''', [(account_id, owner, now + ttl, now, now) for account_id in account_ids])
+            held = self._owned(conn, owner)
+            conn.execute('COMMIT')
+            return held & set(account_ids)
+        finally:
+            conn.close()
+
+    def release(self, owner, account_ids):
+        conn = self._connect()
+        try:
+            conn.executemany('DELETE FROM account_leases WHERE owner = ? AND account_id = ?',
+                             [(owner, account_id) for account_id in account_ids])
+        finally:
+            conn.close()
+
+    def _owned(self, conn, owner):
+        rows = conn.execute('SELECT account_id FROM account_leases WHERE owner = ?', (owner,)).fetchall()
+        return {row[0] for row in rows}
+
+    def leave(self, worker_id):
+        """Drop the worker's heartbeat and every lease it holds (clean shutdown)"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM account_leases WHERE owner = ?', (worker_id,))
+            conn.execute('DELETE FROM sync_workers WHERE worker_id = ?', (worker_id,))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+
+class MemoryLeaseBackend:
+    """In-process lease store with the same semantics (single process, tests)"""
+
+    def __init__(self):
+        self._workers = {}
+        self._leases = {}  # account_id -> (owner, expires_at)
+        self._lock = threading.Lock()
+
+    def heartbeat(self, worker_id, ttl, now):
+        with self._lock:
+            self._workers[worker_id] = now
+            for other in [w for w, seen in self._workers.items() if seen < now - ttl]:
+                del self._workers[other]
+            return set(self._workers)
+
+    def acquire(self, owner, account_ids, ttl, now):
+        with self._lock:
+            held = set()
+            for account_id in account_ids:
+                lease = self._leases.get(account_id)
+                if lease is None or lease[0] == owner or lease[1] < now:
+                    self._leases[account_id] = (owner, now + ttl)
+                    held.add(account_id)
+            return held
+
+    def release(self, owner, account_ids):
+        with self._lock:
+            for account_id in account_ids:
+                if self._leases.get(account_id, (None,))[0] == owner:
+                    del self._leases[account_id]
+
+    def leave(self, worker_id):
+        with self._lock:
+            self._workers.pop(worker_id, None)
+            for account_id in [a for a, (holder, _) in self._leases.items() if holder == worker_id]:
+                del self._leases[account_id]
+
+
+LEASE_BACKENDS = {'sqlite': SQLiteLeaseBackend, 'memory': MemoryLeaseBackend}
+
+
+def create_lease_backend(name=LEASE_BACKEND, db_path='reachinbox.db'):
+    """Backend by short name (``sqlite``, ``memory``) or dotted ``module.ClassName``"""
+    if name == 'sqlite':
+        return SQLiteLeaseBackend(db_path)
+    if name in LEASE_BACKENDS:
+        return LEASE_BACKENDS[name]()
+    module_name, _, class_name = name.rpartition('.')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def default_worker_id():
+    return SYNC_WORKER_ID or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def preferred_worker(account_id, workers):
+    """Rendezvous hashing: every worker computes the same owner, and only ~1/N accounts move when N changes"""
+    return max(workers, key=lambda worker: hashlib.sha1(f"{worker}:{account_id}".encode()).digest())
+
+
+class AccountLeaseManager:
+    """
+    Keeps this worker's share of accounts leased.
+
+    Every ``heartbeat_interval`` it heartbeats, renews the leases it holds,
+    claims free or expired accounts assigned to it, and hands back accounts
+    now assigned to another live worker once they are no longer syncing.
+    ``holds()`` is checked before each sync; a lease not renewed within its
+    TTL is treated as lost even before another worker takes it.
+    """
+
+    def __init__(self, backend, accounts_fn, worker_id=None, ttl=LEASE_TTL,
+                 heartbeat_interval=LEASE_HEARTBEAT_INTERVAL, busy_fn=None):
+        self.backend = backend
+        self.accounts_fn = accounts_fn  # () -> accounts that should be synced by someone
+        self.busy_fn = busy_fn or set  # () -> ids whose sync is in progress here
+        self.worker_id = worker_id or default_worker_id()
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self._held = {}  # account_id -> local expiry of our lease
+        self._accounts = {}
+        self._workers = {self.worker_id}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'heartbeats': 0, 'acquired': 0, 'released': 0, 'lost': 0, 'errors': 0}
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._loop, name='lease-heartbeat', daemon=True)
+        self._thread.start()
+        logging.info(f"🪪 Sync worker {self.worker_id} holding {len(self._held)} account leases")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.heartbeat_interval)
+            self._thread = None
+        try:
+            self.backend.leave(self.worker_id)
+        except Exception as e:
+            logging.warning(f"Could not release leases for {self.worker_id}: {e}")
+        with self._lock:
+            self._held.clear()
+
+    def _loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            self.heartbeat()
+
+    def heartbeat(self, now=None):
+        """One round of heartbeat, renewal, claiming and rebalancing; returns the held account ids"""
+        now = time.time() if now is None else now
+        try:
+            accounts = {account['id']: account for account in self.accounts_fn()}
+            workers = self.backend.heartbeat(self.worker_id, self.ttl, now) | {self.worker_id}
+            busy = self.busy_fn()
+            with self._lock:
+                held = set(self._held)
+            mine = {account_id for account_id in accounts if preferred_worker(account_id, workers) == self.worker_id}
+            # Accounts that moved to another worker (or were removed) are handed back once idle
+            give_up = {account_id for account_id in held - mine if account_id not in busy}
+            if give_up:
+                self.backend.release(self.worker_id, give_up)
+            acquired = self.backend.acquire(self.worker_id, (mine | held) - give_up, self.ttl, now)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logging.error(f"❌ Lease heartbeat failed for {self.worker_id}: {e}")
+            return self.held_ids(now)
+
+        with self._lock:
+            lost = set(self._held) - acquired - give_up
+            self.stats['heartbeats'] += 1
+            self.stats['acquired'] += len(acquired - set(self._held))
+            self.stats['released'] += len(give_up)
+            self.stats['lost'] += len(lost)
+            self._held = {account_id: now + self.ttl for account_id in acquired}
+            self._accounts = accounts
+            self._workers = workers
+        if lost:
+            logging.warning(f"⚠️ {self.worker_id} lost leases on {len(lost)} accounts")
+        return acquired
+
+    def claim(self, account_ids, now=None):
+        """
+        Lease whichever of ``account_ids`` no live worker holds (say, an
+        account added a moment ago) and return the ids this worker now holds.
+        Claimed accounts assigned to another worker are handed back by the
+        next heartbeat once they are idle.
+        """
+        now = time.time() if now is None else now
+        try:
+            acquired = self.backend.acquire(self.worker_id, set(account_ids), self.ttl, now)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logging.error(f"❌ Lease claim failed for {self.worker_id}: {e}")
+            acquired = set()
+        with self._lock:
+            for account_id in acquired:
+                self._held[account_id] = now + self.ttl
+        return {account_id for account_id in account_ids if self.holds(account_id, now)}
+
+    def holds(self, account_id, now=None):
+        """True while our lease on the account is known to be valid"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._held.get(account_id, 0) > now
+
+    def held_ids(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return {account_id for account_id, expires in self._held.items() if expires > now}
+
+    def held_accounts(self, now=None):
+        """Account dicts this worker should be syncing"""
+        held = self.held_ids(now)
+        with self._lock:
+            return [account for account_id, account in self._accounts.items() if account_id in held]
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, worker_id=self.worker_id, workers=len(self._workers), held=len(self._held))
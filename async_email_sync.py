@@ -0,0 +1,451 @@
+"""
+Asyncio IMAP sync engine
+Keeps thousands of tenant mailboxes current from a single worker process:
+one lightweight task per mailbox, a semaphore cap on concurrent logins, the
+shared MIME parse process pool and a thread executor for blocking
+classification/storage.
+"""
+
+import asyncio
+import re
+import ssl
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from python_models import Database
+from email_classifier import classify_single_email, notify_if_interested
+from ingest_pipeline import IngestPipeline, NewMailProgress
+from mime_parser import get_parse_pool
+from imap_throttle import get_throttle, backoff_delay, is_throttle_response, get_throttle_stats
+from config import (
+    SYNC_DAYS, IDLE_TIMEOUT, IDLE_POLL_INTERVAL, RECONNECT_DELAY, IMAP_TIMEOUT,
+    ASYNC_MAX_CONCURRENT_LOGINS, ASYNC_IO_WORKERS, ACCOUNT_REFRESH_INTERVAL
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+LITERAL = re.compile(rb'\{(\d+)\}\r\n$')
+UID_ITEM = re.compile(rb'UID (\d+)')
+EXISTS_RESPONSE = re.compile(rb'^\* (\d+) EXISTS')
+
+FETCH_BATCH_SIZE = 50
+
+
+class IMAPCommandError(Exception):
+    """Raised when the server answers a command with NO or BAD"""
+
+
+class AsyncIMAPClient:
+    """Minimal non-blocking IMAP4rev1 client built on asyncio streams"""
+
+    def __init__(self, host, port=993, timeout=IMAP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.capabilities = set()
+        self.throttle = get_throttle(host)  # Shared by every mailbox on this host
+        self._tag_counter = 0
+        self._idling = False
+
+    async def connect(self):
+        await asyncio.sleep(self.throttle.delay('login'))
+        use_ssl = ssl.create_default_context() if self.port == 993 else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=use_ssl), self.timeout
+        )
+        greeting, _ = await self._read_response()
+        if not greeting.startswith(b'* OK'):
+            raise ConnectionError(f"Unexpected greeting: {greeting.strip()!r}")
+
+    async def login(self, user, password):
+        await self.command(b'LOGIN', _quote(user), _quote(password))
+        untagged = await self.command(b'CAPABILITY')
+        for text, _ in untagged:
+            if text.startswith(b'* CAPABILITY'):
+                self.capabilities = set(text.decode(errors='replace').upper().split()[2:])
+
+    async def select(self, mailbox='INBOX'):
+        return await self.command(b'SELECT', _quote(mailbox))
+
+    async def uid_search(self, criteria):
+        untagged = await self.command(b'UID SEARCH', criteria.encode())
+        uids = []
+        for text, _ in untagged:
+            if text.startswith(b'* SEARCH'):
+                uids.extend(int(uid) for uid in text.split()[2:])
+        return uids
+
+    async def uid_fetch_rfc822(self, uids):
+        """Fetch full messages; returns a list of (uid, raw_bytes)"""
+        uid_set = ','.join(str(uid) for uid in uids).encode()
+        untagged = await self.command(b'UID FETCH', uid_set, b'(UID RFC822)')
+        messages = []
+        for text, literals in untagged:
+            match = UID_ITEM.search(text)
+            if b' FETCH ' in text and match and literals:
+                messages.append((int(match.group(1)), literals[0]))
+        # Downloaded bytes count against the host's byte budget
+        await asyncio.sleep(self.throttle.delay('bytes', sum(len(raw) for _, raw in messages)))
+        return messages
+
+    async def noop(self):
+        return await self.command(b'NOOP')
+
+    async def idle(self, timeout):
+        """Wait in IDLE until EXISTS arrives or timeout expires; True on new mail"""
+        tag = self._next_tag()
+        await self._send(tag + b' IDLE\r\n')
+        self._idling = True
+        while True:
+            text, _ = await self._read_response()
+            if text.startswith(b'+'):
+                break
+            if text.startswith(tag):
+                raise IMAPCommandError(f"IDLE rejected: {text.strip()!r}")
+
+        new_mail = False
+        deadline = time.monotonic() + timeout
+        try:
+            while not new_mail:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                text, _ = await self._read_response(remaining)
+                if text.startswith(b'* BYE'):
+                    raise ConnectionError(f"Server closed IDLE: {text.strip()!r}")
+                new_mail = bool(EXISTS_RESPONSE.match(text))
+        except asyncio.TimeoutError:
+            pass
+
+        await self._send(b'DONE\r\n')
+        self._idling = False
+        await self._collect(tag)
+        return new_mail
+
+    async def logout(self):
+        try:
+            # A connection cancelled mid-IDLE cannot take commands; just drop it
+            if self.writer and not self._idling:
+                # Not via command(): the BYE that answers LOGOUT is no throttle signal
+                tag = self._next_tag()
+                await self._send(tag + b' LOGOUT\r\n')
+                await asyncio.wait_for(self._collect(tag, bye_expected=True), 5)
+        except Exception:
+            pass
+        finally:
+            if self.writer:
+                self.writer.close()
+
+    async def command(self, *parts):
+        """
+        Send one command under the host's rate limits; throttle responses are
+        retried with backoff, a BYE is re-raised and holds the host only if
+        it says the server is throttling
+        """
+        for attempt in range(self.throttle.retry_limit + 1):
+            await asyncio.sleep(self.throttle.delay('command'))
+            try:
+                tag = self._next_tag()
+                await self._send(tag + b' ' + b' '.join(parts) + b'\r\n')
+                untagged = await self._collect(tag)
+            except IMAPCommandError as e:
+                if attempt == self.throttle.retry_limit or not is_throttle_response(str(e)):
+                    raise
+                self.throttle.throttled(e)
+                self.throttle.retried()
+                continue
+            except ConnectionError as e:
+                if 'BYE' in str(e) and is_throttle_response(str(e)):
+                    self.throttle.throttled(e)
+                raise
+            self.throttle.succeeded()
+            return untagged
+
+    async def _collect(self, tag, bye_expected=False):
+        """Read untagged responses until the tagged completion for ``tag``"""
+        untagged = []
+        while True:
+            text, literals = await self._read_response()
+            if text.startswith(tag + b' '):
+                status = text[len(tag) + 1:].split(b' ', 1)[0]
+                if status != b'OK':
+                    raise IMAPCommandError(text.strip().decode(errors='replace'))
+                return untagged
+            if text.startswith(b'* BYE') and not bye_expected:
+                raise ConnectionError(f"Server closed connection: {text.strip()!r}")
+            untagged.append((text, literals))
+
+    async def _read_response(self, timeout=None):
+        """Read one response line, pulling any {n} literals into a side list"""
+        timeout = timeout or self.timeout
+        line = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not line:
+            raise ConnectionError("Connection closed by server")
+
+        parts, literals = [line], []
+        while True:
+            match = LITERAL.search(line)
+            if not match:
+                break
+            literals.append(await asyncio.wait_for(self.reader.readexactly(int(match.group(1))), self.timeout))
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            parts.append(line)
+        return b''.join(parts), literals
+
+    async def _send(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def _next_tag(self):
+        self._tag_counter += 1
+        return b'A%04d' % self._tag_counter
+
+
+def _quote(value):
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'.encode()
+
+
+def stored_fields(record):
+    """Map a mime_parser record onto the fields we store"""
+    return {
+        'subject': record['subject'],
+        'sender': record['sender'],
+        'date_received': record['date'],
+        'content': record['text'][:5000]
+    }
+
+
+class AsyncEmailSyncEngine:
+    """Runs one asyncio task per active mailbox in the multi-tenant database"""
+
+    def __init__(self, db=None, sync_days=SYNC_DAYS, max_concurrent_logins=ASYNC_MAX_CONCURRENT_LOGINS,
+                 parse_pool=None, io_workers=ASYNC_IO_WORKERS):
+        self.db = db or Database()
+        self.sync_days = sync_days
+        self.max_concurrent_logins = max_concurrent_logins
+        self.parse_pool = parse_pool or get_parse_pool()
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='sync-io')
+        # Messages are parsed here in fetch batches, so the pipeline starts at classify
+        self.pipeline = IngestPipeline(
+            parse=None,
+            classify=self._classify_item,
+            persist=self._persist_item,
+            notify=self._notify_item,
+        )
+        self.login_semaphore = None
+        self.tasks = {}
+        self.new_mail = {}  # account id -> NewMailProgress; survives reconnects
+        self._progress_lock = threading.Lock()  # Pipeline threads record stored UIDs
+        self.running = True
+        self._stats_lock = threading.Lock()  # Pipeline threads update the counters too
+        self.stats = {
+            'mailboxes': 0,
+            'logins': 0,
+            'login_failures': 0,
+            'sync_errors': 0,
+            'emails_synced': 0,
+            'idle_events': 0
+        }
+
+    async def run(self):
+        """Keep one task per active account, picking up added/removed accounts"""
+        self.login_semaphore = asyncio.Semaphore(self.max_concurrent_logins)
+        self.pipeline.start()
+        logging.info(f"🚀 Async sync engine started (max {self.max_concurrent_logins} concurrent logins)")
+        try:
+            while self.running:
+                await self._refresh_accounts()
+                await asyncio.sleep(ACCOUNT_REFRESH_INTERVAL)
+        finally:
+            await self.shutdown()
+
+    async def _refresh_accounts(self):
+        accounts = await self._in_thread(self.db.get_all_active_email_accounts)
+        active_ids = {account['id'] for account in accounts}
+
+        for account in accounts:
+            if account['id'] not in self.tasks:
+                self.tasks[account['id']] = asyncio.create_task(self._mailbox_task(account))
+
+        for account_id in list(self.tasks):
+            if account_id not in active_ids:
+                self.tasks.pop(account_id).cancel()
+
+        with self._stats_lock:
+            self.stats['mailboxes'] = len(self.tasks)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    async def _mailbox_task(self, account):
+        """Connect, catch up, then wait for new mail for a single mailbox"""
+        failures = 0
+        # Spread the first logins out so a restart does not hit providers all at once
+        await asyncio.sleep(random.uniform(0, 5))
+
+        while self.running:
+            client = AsyncIMAPClient(account['imap_host'], account['imap_port'])
+            logged_in = False
+            try:
+                async with self.login_semaphore:
+                    await client.connect()
+                    await client.login(account['email'], account['password'])
+                    logged_in = True
+                    await client.select('INBOX')
+                self._count('logins')
+                failures = 0
+
+                progress = await self._new_mail_progress(account)
+                await self._sync_new(client, account, progress)
+
+                while self.running:
+                    if 'IDLE' in client.capabilities:
+                        has_new = await client.idle(min(IDLE_TIMEOUT, 29 * 60))
+                    else:
+                        await asyncio.sleep(IDLE_POLL_INTERVAL)
+                        await client.noop()
+                        has_new = True  # A UID search above last_uid is cheap
+                    if has_new:
+                        self._count('idle_events')
+                        await self._sync_new(client, account, progress)
+
+            except Exception as e:
+                failures += 1
+                self._count('sync_errors' if logged_in else 'login_failures')
+                logging.error(f"Async sync error for {account['email']}: {e}")
+            finally:
+                await client.logout()
+
+            await asyncio.sleep(backoff_delay(failures, cap=RECONNECT_DELAY))
+
+    async def _new_mail_progress(self, account):
+        """The account's new-mail progress, loaded from the database on first connect only"""
+        if account['id'] not in self.new_mail:
+            last_uid = await self._in_thread(self.db.get_max_uid, account['id'])
+            self.new_mail.setdefault(account['id'], NewMailProgress(last_uid))
+        return self.new_mail[account['id']]
+
+    async def _sync_new(self, client, account, progress):
+        """
+        Fetch and parse every message above ``progress.last_uid`` and queue
+        it for classification and storage; UIDs still in the pipeline (from
+        before a reconnect, say) are not fetched again
+        """
+        with self._progress_lock:
+            last_uid, in_flight = progress.last_uid, progress.skip()
+        if last_uid:
+            uids = await client.uid_search(f'UID {last_uid + 1}:*')
+        else:
+            since_date = (datetime.now() - timedelta(days=self.sync_days)).strftime("%d-%b-%Y")
+            uids = await client.uid_search(f'SINCE "{since_date}"')
+        uids = sorted(uid for uid in uids if uid > last_uid and uid not in in_flight)
+
+        for i in range(0, len(uids), FETCH_BATCH_SIZE):
+            batch = await client.uid_fetch_rfc822(uids[i:i + FETCH_BATCH_SIZE])
+            # The whole fetch batch goes to the parse pool in one call
+            records = await self._in_thread(self.parse_pool.parse_batch, [raw for _, raw in batch])
+            # Classification and storage run in the ingest pipeline; a full
+            # classify queue blocks this put, which is our backpressure
+            for (uid, _), record in zip(batch, records):
+                if record is None:
+                    logging.warning(f"Could not parse UID {uid} for {account['email']}, skipping")
+                    continue
+                await self._in_thread(self.pipeline.submit_parsed, self._new_item(account, progress, uid, record))
+
+        if uids:
+            logging.info(f"📧 Queued {len(uids)} new emails for {account['email']}")
+
+    def _new_item(self, account, progress, uid, record):
+        """A pipeline item whose storage (or failure) is recorded in ``progress``"""
+        with self._progress_lock:
+            progress.queued(uid)
+
+        def stored():
+            with self._progress_lock:
+                progress.finished(uid, stored=not item.get('store_failed'))
+
+        item = {
+            'account': account,
+            'uid': str(uid),
+            'fields': stored_fields(record),
+            'on_done': stored
+        }
+        return item
+
+    def _classify_item(self, item):
+        fields = item['fields']
+        try:
+            item['classification'] = classify_single_email({
+                'user_id': item['account']['user_id'],  # Selects the tenant's classification rules
+                'subject': fields['subject'],
+                'content': fields['content'],
+                'sender': fields['sender']
+            }, notify=False)
+        except Exception as e:
+            logging.warning(f"Classification failed: {e}")
+            item['classification'] = {'category': 'Uncategorized', 'confidence_score': 0.0}
+        return item
+
+    def _persist_item(self, item):
+        account, fields, classification = item['account'], item['fields'], item['classification']
+        email_id = self.db.store_email({
+            'user_id': account['user_id'],
+            'account_id': account['id'],
+            'uid': item['uid'],
+            'subject': fields['subject'],
+            'sender': fields['sender'],
+            'content': fields['content'],
+            'category': classification.get('category', 'Uncategorized'),
+            'confidence_score': classification.get('confidence_score', 0.0),
+            'date_received': fields['date_received']
+        })
+        if email_id is None:
+            item['store_failed'] = True  # Fetched again next cycle
+            raise RuntimeError(f"email {account['id']}/{item['uid']} was not stored")
+        self._count('emails_synced')
+        return item
+
+    def _notify_item(self, item):
+        notify_if_interested(item['fields'], item['classification'])
+
+    async def _in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.io_executor, func, *args)
+
+    def stop(self):
+        self.running = False
+
+    async def shutdown(self):
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks.clear()
+        await self._in_thread(self.pipeline.stop)
+        self.io_executor.shutdown(wait=False)
+        logging.info("⏹️ Async sync engine stopped")
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['ingest_pipeline'] = self.pipeline.get_metrics()
+        stats['imap_throttle'] = get_throttle_stats()
+        return stats
+
+
+def main():
+    """Run the async sync engine until interrupted"""
+    engine = AsyncEmailSyncEngine()
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        logging.info("Shutting down...")
+
+
+if __name__ == "__main__":
+    main()
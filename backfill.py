@@ -0,0 +1,331 @@
+"""
+Resumable historical backfill
+Imports a mailbox's history newest-first in UID ranges, so recent mail is
+usable within seconds, and checkpoints the lowest fully stored UID after
+every range. Large mailboxes fetch ranges over several connections at once,
+within the provider's per-account connection limit. A crashed or time-boxed
+backfill resumes from its checkpoint without refetching anything stored.
+"""
+
+import re
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from imap_throttle import imap_call, charge_bytes
+from folders import quote_mailbox
+from config import (
+    BACKFILL_DAYS, BACKFILL_BATCH_SIZE, BACKFILL_MAX_CONNECTIONS,
+    PROVIDER_CONNECTION_LIMITS, DEFAULT_PROVIDER_CONNECTION_LIMIT
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+UID_ITEM = re.compile(rb'UID (\d+)')
+
+
+def fetch_messages(mail, uids):
+    """Fetch full messages for a list of UIDs in one UID FETCH; returns [(uid, raw_bytes)]"""
+    if not uids:
+        return []
+    uid_set = ','.join(str(int(uid)) for uid in uids)
+    status, data = imap_call(mail, mail.uid, 'fetch', uid_set, '(UID RFC822)')
+    if status != 'OK':
+        return []
+    messages = []
+    for part in data:
+        if not isinstance(part, tuple):
+            continue
+        match = UID_ITEM.search(part[0])
+        if match:
+            messages.append((int(match.group(1)), part[1]))
+    charge_bytes(mail, sum(len(raw) for _, raw in messages))
+    return messages
+
+
+def search_uids(mail, criteria):
+    """UID SEARCH returning ints"""
+    status, data = imap_call(mail, mail.uid, 'search', None, criteria)
+    if status != 'OK' or not data or not data[0]:
+        return []
+    return [int(uid) for uid in data[0].split()]
+
+
+def backfill_connections(imap_host):
+    """
+    Connections to use for one account's backfill: the provider's
+    per-account limit, less one kept free for IDLE/incremental sync
+    """
+    host = (imap_host or '').lower()
+    limit = next(
+        (value for suffix, value in PROVIDER_CONNECTION_LIMITS.items() if host.endswith(suffix)),
+        DEFAULT_PROVIDER_CONNECTION_LIMIT
+    )
+    return max(1, min(BACKFILL_MAX_CONNECTIONS, limit - 1))
+
+
+def selected_response(mail, name):
+    """Numeric SELECT response code such as UIDVALIDITY or UIDNEXT (0 if not sent)"""
+    _, data = mail.response(name)
+    try:
+        return int(data[-1])
+    except (TypeError, ValueError, IndexError):
+        return 0
+
+
+def select_mailbox(mail, mailbox='INBOX'):
+    """
+    SELECT a mailbox; returns its message count and the UIDVALIDITY,
+    UIDNEXT and HIGHESTMODSEQ codes from the response (0 when not sent)
+    """
+    status, data = mail.select(quote_mailbox(mailbox))
+    try:
+        exists = int(data[0]) if status == 'OK' else 0
+    except (TypeError, ValueError, IndexError):
+        exists = 0
+    return {
+        'mailbox': mailbox,
+        'exists': exists,
+        'uidvalidity': selected_response(mail, 'UIDVALIDITY'),
+        'uidnext': selected_response(mail, 'UIDNEXT'),
+        'highestmodseq': selected_response(mail, 'HIGHESTMODSEQ')
+    }
+
+
+class BackfillJob:
+    """
+    Newest-first backfill of one mailbox with per-batch checkpoints.
+
+    ``store`` persists checkpoints (``get_backfill_checkpoint`` /
+    ``save_backfill_checkpoint``, see python_models.Database).
+    ``submit(uid, raw, on_done)`` hands a fetched message to the ingest
+    pipeline; ``on_done()`` must be called once the message is stored (or
+    dropped). The checkpoint only moves past a range after every message in
+    it and in all newer ranges is done, so it is monotonic even when ranges
+    are fetched concurrently.
+
+    Everything above ``high_uid`` (the top UID when the job was created) is
+    left to the incremental sync.
+    """
+
+    def __init__(self, store, account_key, submit, mailbox='INBOX', days=BACKFILL_DAYS,
+                 batch_size=BACKFILL_BATCH_SIZE):
+        self.store = store
+        self.account_key = str(account_key)
+        self.submit = submit
+        self.mailbox = mailbox
+        self.days = days
+        self.batch_size = batch_size
+        self.checkpoint = None
+        self._pending = deque()  # [low_uid, remaining] per planned UID range, newest first
+        self._lock = threading.Lock()
+        self._all_submitted = False
+        self.remaining_uids = 0  # Left to fetch after the last prepare()/run()
+        self.selected = None  # select_mailbox() result from the last prepare()
+
+    @property
+    def high_uid(self):
+        return self.checkpoint['high_uid'] if self.checkpoint else 0
+
+    @property
+    def complete(self):
+        return bool(self.checkpoint) and self.checkpoint['status'] == 'complete'
+
+    def search_criteria(self):
+        if self.days <= 0:
+            return 'ALL'
+        since_date = (datetime.now() - timedelta(days=self.days)).strftime("%d-%b-%Y")
+        return f'(SINCE "{since_date}")'
+
+    def start(self, uidvalidity, uids, top_uid=0):
+        """
+        Load or create the checkpoint for this mailbox and return the UIDs
+        still to fetch, newest first. ``uids`` is the search result for the
+        backfill window and ``top_uid`` the mailbox's highest UID (UIDNEXT - 1),
+        which bounds the backfill even when the window is empty.
+        """
+        checkpoint = self.store.get_backfill_checkpoint(self.account_key, self.mailbox)
+        if checkpoint and checkpoint['uidvalidity'] != uidvalidity:
+            logging.warning(f"📦 UIDVALIDITY changed for {self.account_key}/{self.mailbox}, restarting backfill")
+            checkpoint = None
+        if checkpoint and self._deeper_than(checkpoint):
+            # Depth was increased: keep walking down from the current checkpoint
+            checkpoint['status'] = 'running'
+            checkpoint['days'] = self.days
+        if not checkpoint:
+            checkpoint = {
+                'account_key': self.account_key,
+                'mailbox': self.mailbox,
+                'uidvalidity': uidvalidity,
+                'high_uid': max(max(uids, default=0), top_uid),
+                'low_uid': None,
+                'days': self.days,
+                'fetched': 0,
+                'status': 'running'
+            }
+        self.checkpoint = checkpoint
+        self.store.save_backfill_checkpoint(checkpoint)
+
+        if checkpoint['status'] == 'complete':
+            return []
+        frontier = checkpoint['low_uid'] if checkpoint['low_uid'] is not None else checkpoint['high_uid'] + 1
+        remaining = sorted((uid for uid in uids if uid < frontier), reverse=True)
+        if not remaining:
+            self._mark_complete()
+        return remaining
+
+    def _deeper_than(self, checkpoint):
+        if checkpoint['days'] <= 0:
+            return False  # Already covers the whole mailbox
+        return self.days <= 0 or self.days > checkpoint['days']
+
+    def plan(self, remaining):
+        """
+        Split the remaining UIDs (newest first) into contiguous UID ranges and
+        register each one for checkpointing, in order, before any is fetched.
+        Ranges can then be fetched by several connections in any order while
+        the checkpoint still only moves downward.
+        """
+        work = deque()
+        with self._lock:
+            for i in range(0, len(remaining), self.batch_size):
+                uids = remaining[i:i + self.batch_size]
+                entry = [min(uids), None]  # None until the range is fetched
+                self._pending.append(entry)
+                work.append((uids, entry))
+            self._all_submitted = True
+        return work
+
+    def submit_batch(self, entry, messages):
+        """
+        Queue one fetched range (newest first) for ingest. UIDs the server
+        did not return were expunged meanwhile and count as done.
+        """
+        with self._lock:
+            entry[1] = len(messages)
+            self.checkpoint['fetched'] += len(messages)
+            if not messages:
+                self._advance()
+
+        def on_done():
+            with self._lock:
+                entry[1] -= 1
+                self._advance()
+
+        for uid, raw in messages:
+            self.submit(uid, raw, on_done)
+
+    def _advance(self):
+        # Called with the lock held: move the checkpoint past every leading
+        # range that is fully stored
+        moved = False
+        while self._pending and self._pending[0][1] is not None and self._pending[0][1] <= 0:
+            low_uid, _ = self._pending.popleft()
+            self.checkpoint['low_uid'] = low_uid
+            moved = True
+        if moved:
+            self.store.save_backfill_checkpoint(self.checkpoint)
+        if self._all_submitted and not self._pending and self.checkpoint['status'] != 'complete':
+            self._mark_complete()
+
+    def _mark_complete(self):
+        self.checkpoint['status'] = 'complete'
+        self.store.save_backfill_checkpoint(self.checkpoint)
+        logging.info(f"📦 Backfill complete for {self.account_key}/{self.mailbox}")
+
+    def prepare(self, mail):
+        """SELECT the mailbox over imaplib and load the checkpoint; returns the UIDs left to fetch"""
+        self.selected = select_mailbox(mail, self.mailbox)
+        top_uid = max(self.selected['uidnext'] - 1, 0)
+        uids = search_uids(mail, self.search_criteria())
+        remaining = self.start(self.selected['uidvalidity'], uids, top_uid)
+        self.remaining_uids = len(remaining)
+        if remaining:
+            logging.info(f"📦 Backfilling {len(remaining)} emails for {self.account_key} (newest first)")
+        return remaining
+
+    def run(self, mail, deadline=None, remaining=None, connect=None, connections=1, release=None):
+        """
+        Backfill over an imaplib connection until done or ``deadline``
+        (time.monotonic()) passes. Pass ``remaining`` from prepare() if it
+        was already called. Returns the number of messages queued.
+
+        With ``connect`` (returns a new logged-in imaplib connection to the
+        same account) and ``connections`` > 1, UID ranges are fetched over
+        that many concurrent connections, ``mail`` being one of them. Extra
+        connections are handed to ``release(conn, healthy)`` afterwards, or
+        logged out.
+        """
+        if remaining is None:
+            remaining = self.prepare(mail)
+        if not remaining:
+            return 0
+
+        work = self.plan(remaining)
+        workers = min(connections, len(work)) if connect else 1
+        if workers <= 1:
+            queued = self._fetch_ranges(mail, work, deadline)
+        else:
+            logging.info(f"📦 Fetching {len(work)} UID ranges for {self.account_key} over {workers} connections")
+            queued = self._fetch_parallel(mail, work, deadline, connect, workers, release)
+
+        self.remaining_uids = sum(len(uids) for uids, _ in work)
+        if work:
+            logging.info(f"⏸️ Backfill for {self.account_key} paused, {self.remaining_uids} emails left")
+        return queued
+
+    def _fetch_ranges(self, mail, work, deadline):
+        """Fetch UID ranges off the shared work queue, newest first, until it is empty"""
+        queued = 0
+        while True:
+            with self._lock:
+                if not work or (deadline and time.monotonic() > deadline):
+                    return queued
+                uids, entry = work.popleft()
+            try:
+                messages = sorted(fetch_messages(mail, uids), reverse=True)
+            except Exception:
+                # Leave the range for another connection or the next run
+                with self._lock:
+                    work.appendleft((uids, entry))
+                raise
+            self.submit_batch(entry, messages)
+            queued += len(messages)
+
+    def _fetch_parallel(self, mail, work, deadline, connect, workers, release):
+        counts = []
+
+        def worker(conn):
+            own = conn is None
+            healthy = True
+            try:
+                if own:
+                    conn = connect()
+                    if not conn:
+                        return
+                    conn.select(quote_mailbox(self.mailbox))
+                counts.append(self._fetch_ranges(conn, work, deadline))
+            except Exception as e:
+                healthy = False
+                logging.warning(f"Backfill connection for {self.account_key} failed: {e}")
+            finally:
+                if own and conn:
+                    if release:
+                        release(conn, healthy)
+                    else:
+                        try:
+                            conn.logout()
+                        except Exception:
+                            pass
+
+        threads = [
+            threading.Thread(target=worker, args=(mail if i == 0 else None,),
+                             name=f'backfill-{self.account_key}-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(counts)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark HTML-to-text extraction throughput (MB/s)
+
+Usage:
+    python benchmark_html_text.py                     # synthetic newsletter
+    python benchmark_html_text.py newsletters/*.eml   # real .eml / .html files
+
+For .eml files the first text/html part is used. Compares the old regex tag
+stripping with html_to_text, both uncapped and at the 2000 char classifier cap.
+"""
+
+import re
+import sys
+import time
+from email import message_from_bytes
+from html_text import html_to_text, _part_text
+
+
+def legacy_strip(markup, max_chars=None):
+    """What EmailSyncService.extract_email_body used to do"""
+    return re.sub(r'<[^>]+>', '', markup).strip()[:max_chars]
+
+
+def synthetic_newsletter(repeat=400):
+    """Table-heavy marketing HTML with inline CSS, tracking pixels and entities"""
+    head = (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Weekly digest</title>"
+        "<style>" + ".c{color:#333;font-family:Arial}" * 200 + "</style>"
+        "<!--[if mso]><xml><o:OfficeDocumentSettings/></xml><![endif]--></head><body>"
+    )
+    block = (
+        "<table role=\"presentation\" width=\"100%\" cellpadding=\"0\" cellspacing=\"0\"><tr>"
+        "<td class=\"c\" style=\"padding:16px 24px;font-size:14px;line-height:20px\">"
+        "<h2 style=\"margin:0\">Top story&nbsp;&mdash; markets &amp; more</h2>"
+        "<p>Stocks rallied on Tuesday as investors weighed the latest earnings &#8212; "
+        "read the full analysis on our site. <a href=\"https://example.com/track?id=123&amp;u=9\">"
+        "Read more&nbsp;&raquo;</a></p>"
+        "<img src=\"https://example.com/pixel.gif\" width=\"1\" height=\"1\" alt=\"\">"
+        "</td></tr></table>\n"
+    )
+    tail = "<script>window.tracking = {id: 1};</script></body></html>"
+    return head + block * repeat + tail
+
+
+def load_documents(paths):
+    documents = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if path.endswith('.eml'):
+            msg = message_from_bytes(data)
+            for part in msg.walk():
+                if part.get_content_type() == 'text/html':
+                    documents.append(_part_text(part))
+                    break
+        else:
+            documents.append(data.decode('utf-8', errors='replace'))
+    return documents
+
+
+def measure(name, func, documents, rounds):
+    total_bytes = sum(len(doc.encode('utf-8')) for doc in documents) * rounds
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for doc in documents:
+            func(doc)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<28} {total_bytes / elapsed / 1e6:8.1f} MB/s  ({elapsed:.3f}s)")
+
+
+def main():
+    documents = load_documents(sys.argv[1:]) if len(sys.argv) > 1 else [synthetic_newsletter()]
+    if not documents:
+        print("No HTML found in the given files")
+        return
+
+    size = sum(len(doc) for doc in documents)
+    rounds = max(1, int(20_000_000 / size))
+    print(f"📊 {len(documents)} document(s), {size / 1024:.0f} KB total, {rounds} rounds")
+    print("=" * 60)
+    measure("legacy regex strip", legacy_strip, documents, rounds)
+    measure("html_to_text (full)", html_to_text, documents, rounds)
+    measure("html_to_text (2000 cap)", lambda doc: html_to_text(doc, 2000), documents, rounds)
+
+
+if __name__ == "__main__":
+    main()
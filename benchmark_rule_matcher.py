@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark rule-based classification cost per email (µs/email)
+
+Usage:
+    python benchmark_rule_matcher.py              # synthetic 5 KB bodies
+    python benchmark_rule_matcher.py mail/*.eml   # real .eml files
+
+Compares the old chain of per-category substring scans with RuleMatcher,
+using the Aho-Corasick automaton when pyahocorasick is installed and the
+str.find fallback otherwise, and checks all of them pick the same category.
+"""
+
+import sys
+import time
+from email import message_from_bytes
+from email.policy import default
+from rule_matcher import RuleMatcher, DEFAULT_RULES, AHOCORASICK_AVAILABLE
+
+
+def legacy_classify(subject, content, sender):
+    """What EmailClassifier.rule_based_classify used to do"""
+    subject, content, sender = subject.lower(), content.lower(), sender.lower()
+    for rule in DEFAULT_RULES:
+        texts = [{'subject': subject, 'content': content, 'sender': sender}[field] for field in rule['fields']]
+        if any(pattern in text for pattern in rule['patterns'] for text in texts):
+            return rule['category']
+    return None
+
+
+def synthetic_emails(size=5000):
+    """5 KB bodies: most match no rule (the common case that goes to the AI), some match late rules"""
+    filler = ("Hi Sam, following up on the numbers we went through last week. The team reviewed "
+              "the rollout plan and the budget for next quarter and has a few questions on pricing. ")
+    body = (filler * (size // len(filler) + 1))[:size]
+    return [
+        ('Q3 rollout', body, 'sam@lead.com'),
+        ('Re: Q3 rollout', body[:-40] + ' Happy to look at a proposal next week.', 'sam@lead.com'),
+        ('Re: Q3 rollout', body[:-40] + ' We are not a good fit right now, sorry.', 'sam@lead.com'),
+        ('Weekly digest', body, 'news@no-reply.example.com'),
+    ]
+
+
+def load_emails(paths):
+    emails = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            msg = message_from_bytes(f.read(), policy=default)
+        part = msg.get_body(preferencelist=('plain', 'html'))
+        emails.append((str(msg['subject'] or ''), part.get_content() if part else '', str(msg['from'] or '')))
+    return emails
+
+
+def measure(name, func, emails, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for email in emails:
+            func(*email)
+    elapsed = time.perf_counter() - started
+    per_email = elapsed / (rounds * len(emails)) * 1e6
+    print(f"{name:<34} {per_email:8.1f} µs/email  ({elapsed:.3f}s)")
+    return per_email
+
+
+def main():
+    emails = load_emails(sys.argv[1:]) if len(sys.argv) > 1 else synthetic_emails()
+    if not emails:
+        print("No emails found in the given files")
+        return
+
+    matchers = [('str.find fallback', RuleMatcher(use_automaton=False))]
+    if AHOCORASICK_AVAILABLE:
+        matchers.append(('Aho-Corasick', RuleMatcher(use_automaton=True)))
+    else:
+        print("⚠️ pyahocorasick not installed, only the fallback is measured")
+
+    for name, matcher in matchers:
+        mismatched = [e for e in emails if matcher.classify(*e) != legacy_classify(*e)]
+        if mismatched:
+            print(f"❌ {name} disagrees with the legacy rules on {len(mismatched)} email(s)")
+            return
+
+    size = sum(len(email[1]) for email in emails) / len(emails)
+    rounds = max(1, int(20_000_000 / (size * len(emails))))
+    print(f"📊 {len(emails)} email(s), {size / 1024:.1f} KB average body, {rounds} rounds")
+    print("=" * 60)
+    baseline = measure("legacy substring scans", legacy_classify, emails, rounds)
+    for name, matcher in matchers:
+        per_email = measure(f"RuleMatcher ({name})", matcher.classify, emails, rounds)
+        print(f"{'':<34} {baseline / per_email:8.1f}x vs legacy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Persistent classification cache
+AI classifications are cached by a hash of the email's normalized content, so
+re-syncs, duplicate deliveries, reruns of classify_existing_emails.py and
+template mail that differs only in numbers or whitespace never pay for the
+same LLM call twice.
+
+The key covers the subject without Re:/Fwd: prefixes, the sender's domain,
+the body as classified (quotes and signature already stripped), the
+conversation's category when the classifier gets one, and
+CLASSIFIER_VERSION, which is bumped whenever the prompt or model changes.
+Text is lowercased, whitespace collapsed and digit runs masked.
+
+Entries live in SQLite (python_models.Database) with a small in-process LRU
+in front. They expire ``ttl`` seconds after being stored, and beyond
+``max_entries`` the least recently used are evicted.
+"""
+
+import re
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from email.utils import parseaddr
+from thread_index import base_subject
+from config import (
+    CLASSIFICATION_CACHE_DB, CLASSIFICATION_CACHE_TTL, CLASSIFICATION_CACHE_MAX_ENTRIES,
+    CLASSIFICATION_CACHE_MEMORY_ENTRIES, CLASSIFIER_VERSION
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DIGITS = re.compile(r'\d+')
+
+# Stores between eviction passes, and cache hits recorded in the store at once
+EVICT_EVERY = 500
+FLUSH_HITS_EVERY = 100
+
+
+def normalize_text(text):
+    return DIGITS.sub('0', ' '.join((text or '').lower().split()))
+
+
+def sender_domain(sender):
+    address = parseaddr(sender or '')[1] or (sender or '')
+    return address.rpartition('@')[2].strip().lower()
+
+
+def cache_key(email_data, version=CLASSIFIER_VERSION):
+    """Hash of the normalized content the classifier decides on"""
+    parts = [
+        str(version),
+        normalize_text(base_subject(email_data.get('subject', ''))),
+        sender_domain(email_data.get('sender', '')),
+        normalize_text(email_data.get('content', '')),
+        email_data.get('thread_category') or '',
+    ]
+    return hashlib.sha256('\0'.join(parts).encode('utf-8', errors='replace')).hexdigest()
+
+
+class ClassificationCache:
+    """
+    Cache of classifications in ``store`` (python_models.Database:
+    ``get_cached_classification``, ``save_cached_classification``,
+    ``touch_cached_classifications``, ``evict_cached_classifications``).
+    Without a store one is opened on ``db_path`` at first use.
+
+    ``get`` returns {'category', 'confidence_score'} or None and ``put``
+    stores a result. ``get_stats`` reports hits, misses and the hit rate.
+    """
+
+    def __init__(self, store=None, db_path=CLASSIFICATION_CACHE_DB, ttl=CLASSIFICATION_CACHE_TTL,
+                 max_entries=CLASSIFICATION_CACHE_MAX_ENTRIES, memory_entries=CLASSIFICATION_CACHE_MEMORY_ENTRIES,
+                 version=CLASSIFIER_VERSION):
+        self._store = store
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.version = version
+        self._memory = OrderedDict()  # key -> (category, confidence, created_at), most recently used last
+        self._used = {}  # key -> (hits, last used) not yet recorded in the store
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'memory_hits': 0, 'misses': 0, 'stores': 0, 'evicted': 0}
+
+    @property
+    def store(self):
+        if self._store is None:
+            # Opened on first use, so importing the classifier touches no database
+            from python_models import Database
+            self._store = Database(self.db_path)
+        return self._store
+
+    def key(self, email_data):
+        return cache_key(email_data, self.version)
+
+    def get(self, email_data):
+        key = self.key(email_data)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[2] > now - self.ttl:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+            else:
+                entry = None
+        if entry is None:
+            found = self.store.get_cached_classification(key, created_after=now - self.ttl)
+            if found:
+                entry = (found['category'], found['confidence_score'], found['created_at'])
+        with self._lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self._remember(key, entry)
+            hits, _ = self._used.get(key, (0, now))
+            self._used[key] = (hits + 1, now)
+            flush = len(self._used) >= FLUSH_HITS_EVERY
+        if flush:
+            self.flush()
+        return {'category': entry[0], 'confidence_score': entry[1]}
+
+    def put(self, email_data, classification):
+        key = self.key(email_data)
+        now = time.time()
+        category, confidence = classification['category'], classification.get('confidence_score', 0.0)
+        if not self.store.save_cached_classification(key, category, confidence, now):
+            return
+        with self._lock:
+            self._remember(key, (category, confidence, now))
+            self.stats['stores'] += 1
+            evict = self.stats['stores'] % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def flush(self):
+        """Record pending hits (for LRU order and per-entry hit counts) in the store"""
+        with self._lock:
+            used, self._used = self._used, {}
+        if used:
+            self.store.touch_cached_classifications(used)
+
+    def evict(self):
+        """Drop expired and least recently used entries beyond ``max_entries``"""
+        self.flush()
+        evicted = self.store.evict_cached_classifications(time.time() - self.ttl, self.max_entries)
+        with self._lock:
+            self.stats['evicted'] += evicted
+            # Entries evicted from the store may still be in memory; start over rather than serve them
+            if evicted:
+                self._memory.clear()
+        if evicted:
+            logging.info(f"🗑️ Evicted {evicted} cached classifications")
+        return evicted
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
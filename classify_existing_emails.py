@@ -7,8 +7,8 @@ This script will classify all emails that don't have categories yet
 import requests
 import json
 import logging
-import time
-from email_classifier import classify_single_email
+from email_classifier import classify_emails_batch, classifier
+from config import AI_BATCH_SIZE, AI_MAX_IN_FLIGHT
 from datetime import datetime
 
 # Configure logging
@@ -108,19 +108,35 @@ def batch_classify_emails():
     
     logger.info(f"📧 Processing {total_emails} emails...")
     
-    for email in emails:
+    # Let the local model and the kNN vote answer what they confidently can
+    if classifier.local_model:
+        classifier.local_model.load()
+    if classifier.knn and classifier.knn.load_encoder():
+        classifier.knn.load()
+    
+    # Enough emails per call to keep every in-flight AI request full
+    chunk_size = max(1, AI_BATCH_SIZE * AI_MAX_IN_FLIGHT)
+    for offset in range(0, total_emails, chunk_size):
+        chunk = emails[offset:offset + chunk_size]
+        
+        # Prepare email data for classification
+        batch = [{
+            'subject': email.get('subject', ''),
+            'sender': email.get('sender', ''),
+            'content': email.get('body', '') or email.get('subject', ''),
+            'account_email': email.get('account_email', '')
+        } for email in chunk]
+        
         try:
-            # Prepare email data for classification
-            email_data = {
-                'subject': email.get('subject', ''),
-                'sender': email.get('sender', ''),
-                'content': email.get('body', '') or email.get('subject', ''),
-                'account_email': email.get('account_email', '')
-            }
-            
-            # Classify the email
-            classification = classify_single_email(email_data)
-            
+            # Classify the chunk (rules and cache first, the rest in batched AI requests)
+            classifications = classify_emails_batch(batch)
+        except Exception as e:
+            failed += len(chunk)
+            processed += len(chunk)
+            logger.error(f"❌ Error classifying emails {offset + 1}-{offset + len(chunk)}: {e}")
+            continue
+        
+        for email, classification in zip(chunk, classifications):
             # Update in Elasticsearch
             if update_email_classification(email['_id'], classification):
                 successful += 1
@@ -133,23 +149,14 @@ def batch_classify_emails():
                 logger.error(f"❌ [{processed + 1}/{total_emails}] Failed to update: {email.get('subject', 'No Subject')[:50]}...")
             
             processed += 1
-            
-            # Progress update every 10 emails
-            if processed % 10 == 0:
-                elapsed = (datetime.now() - start_time).total_seconds()
-                rate = processed / elapsed if elapsed > 0 else 0
-                eta = (total_emails - processed) / rate if rate > 0 else 0
-                
-                logger.info(f"📊 Progress: {processed}/{total_emails} ({processed/total_emails*100:.1f}%) | "
-                           f"Rate: {rate:.1f} emails/sec | ETA: {eta:.0f}s")
-            
-            # Small delay to avoid overwhelming the system
-            time.sleep(0.1)
-            
-        except Exception as e:
-            failed += 1
-            logger.error(f"❌ Error processing email {processed + 1}: {e}")
-            processed += 1
+        
+        # Progress update after every chunk
+        elapsed = (datetime.now() - start_time).total_seconds()
+        rate = processed / elapsed if elapsed > 0 else 0
+        eta = (total_emails - processed) / rate if rate > 0 else 0
+        
+        logger.info(f"📊 Progress: {processed}/{total_emails} ({processed/total_emails*100:.1f}%) | "
+                   f"Rate: {rate:.1f} emails/sec | ETA: {eta:.0f}s")
     
     # Final statistics
     end_time = datetime.now()
@@ -163,6 +170,13 @@ def batch_classify_emails():
     logger.info(f"❌ Failed: {failed}")
     logger.info(f"⏱️ Duration: {duration:.2f} seconds")
     logger.info(f"🚀 Average Rate: {processed/duration:.2f} emails/second")
+    if classifier.local_model:
+        logger.info(f"🧠 Local model: {classifier.local_model.describe()}")
+    if classifier.knn:
+        logger.info(f"🧭 kNN classifier: {classifier.knn.describe()}")
+    if classifier.cache:
+        cache = classifier.cache.get_stats()
+        logger.info(f"🗃️ Classification cache: {cache['hits']} hits, {cache['misses']} misses (hit rate {cache['hit_rate']:.0%})")
     logger.info("")
     logger.info("📋 CATEGORY BREAKDOWN:")
     for category, count in stats.items():
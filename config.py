@@ -34,8 +34,113 @@ ELASTICSEARCH_CONFIG = {
 
 # Sync Configuration
 SYNC_DAYS = int(os.getenv("SYNC_DAYS", "30"))
+BACKFILL_DAYS = int(os.getenv("BACKFILL_DAYS", os.getenv("SYNC_DAYS", "30")))  # History to import; 0 = whole mailbox
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "100"))  # UIDs per fetch and per checkpoint
+BACKFILL_TIME_BUDGET = int(os.getenv("BACKFILL_TIME_BUDGET", "240"))  # Seconds of backfill per periodic account sync
+BACKFILL_MAX_CONNECTIONS = int(os.getenv("BACKFILL_MAX_CONNECTIONS", "14"))  # Parallel IMAP connections per mailbox backfill
+MAILBOX_FLAG_SCAN_LIMIT = int(os.getenv("MAILBOX_FLAG_SCAN_LIMIT", "1000"))  # Newest messages whose flags are rescanned on servers without CONDSTORE
+# Folders synced per account unless the account sets its own (names, or SPECIAL-USE roles like \Sent)
+SYNC_FOLDERS = os.getenv("SYNC_FOLDERS", "INBOX,\\Sent,\\Archive")
+FOLDER_MIN_INTERVAL = int(os.getenv("FOLDER_MIN_INTERVAL", "300"))  # Seconds between polls of a non-INBOX folder with changes
+FOLDER_MAX_INTERVAL = int(os.getenv("FOLDER_MAX_INTERVAL", "3600"))  # Longest an idle non-INBOX folder goes unpolled
+FOLDER_LIST_REFRESH = int(os.getenv("FOLDER_LIST_REFRESH", "3600"))  # Seconds a folder LIST is reused
+# Concurrent IMAP connections providers allow per account (matched on host suffix)
+PROVIDER_CONNECTION_LIMITS = {
+    "gmail.com": 15,
+    "googlemail.com": 15,
+    "office365.com": 8,
+    "outlook.com": 8,
+    "yahoo.com": 5,
+    "me.com": 5,
+}
+DEFAULT_PROVIDER_CONNECTION_LIMIT = int(os.getenv("DEFAULT_PROVIDER_CONNECTION_LIMIT", "4"))
 IDLE_TIMEOUT = int(os.getenv("IDLE_TIMEOUT", "300"))
 RECONNECT_DELAY = int(os.getenv("RECONNECT_DELAY", "60"))
+IDLE_POLL_INTERVAL = int(os.getenv("IDLE_POLL_INTERVAL", "30"))  # NOOP polling for servers without IDLE
+IMAP_TIMEOUT = int(os.getenv("IMAP_TIMEOUT", "60"))  # Socket timeout for IMAP commands
+
+# IMAP Rate Limiting (token buckets per IMAP host, shared by every account on it)
+IMAP_LOGIN_RATE = float(os.getenv("IMAP_LOGIN_RATE", "2"))  # Logins per second
+IMAP_LOGIN_BURST = int(os.getenv("IMAP_LOGIN_BURST", "10"))
+IMAP_COMMAND_RATE = float(os.getenv("IMAP_COMMAND_RATE", "50"))  # Commands per second
+IMAP_COMMAND_BURST = int(os.getenv("IMAP_COMMAND_BURST", "100"))
+IMAP_BYTES_RATE = int(os.getenv("IMAP_BYTES_RATE", str(20 * 1024 * 1024)))  # Downloaded bytes per second
+IMAP_BYTES_BURST = int(os.getenv("IMAP_BYTES_BURST", str(50 * 1024 * 1024)))
+IMAP_RETRY_LIMIT = int(os.getenv("IMAP_RETRY_LIMIT", "4"))  # Retries of a throttled command
+IMAP_BACKOFF_BASE = float(os.getenv("IMAP_BACKOFF_BASE", "1"))  # Seconds, doubled per throttle signal
+IMAP_BACKOFF_MAX = float(os.getenv("IMAP_BACKOFF_MAX", os.getenv("RECONNECT_DELAY", "60")))
+# Per-provider overrides of the limits above (matched on host suffix)
+PROVIDER_RATE_LIMITS = {
+    "gmail.com": {"login_rate": 1, "login_burst": 10},
+    "office365.com": {"login_rate": 0.5, "login_burst": 5, "command_rate": 20, "command_burst": 40},
+    "yahoo.com": {"login_rate": 0.5, "login_burst": 3, "command_rate": 10, "command_burst": 20},
+}
+
+# IMAP Connection Pool (authenticated sessions kept between sync cycles)
+IMAP_POOL_MAX_CONNECTIONS = int(os.getenv("IMAP_POOL_MAX_CONNECTIONS", "200"))  # Open sockets across all accounts
+IMAP_POOL_IDLE_TIMEOUT = int(os.getenv("IMAP_POOL_IDLE_TIMEOUT", "900"))  # Log out sessions unused this long (servers drop them at ~30 min)
+IMAP_POOL_HEALTH_CHECK_AFTER = int(os.getenv("IMAP_POOL_HEALTH_CHECK_AFTER", "60"))  # NOOP idle sessions older than this before reuse
+IMAP_POOL_WAIT = int(os.getenv("IMAP_POOL_WAIT", "30"))  # Seconds to wait for a free slot when the pool is full
+
+# Async Sync Engine Configuration
+ASYNC_MAX_CONCURRENT_LOGINS = int(os.getenv("ASYNC_MAX_CONCURRENT_LOGINS", "50"))
+ASYNC_IO_WORKERS = int(os.getenv("ASYNC_IO_WORKERS", "32"))  # Threads for DB writes and classification
+ACCOUNT_REFRESH_INTERVAL = int(os.getenv("ACCOUNT_REFRESH_INTERVAL", "60"))
+
+# Parallel Sync Configuration
+SYNC_MAX_WORKERS = int(os.getenv("SYNC_MAX_WORKERS", "8"))  # Accounts synced at once
+SYNC_MAX_PER_HOST = int(os.getenv("SYNC_MAX_PER_HOST", "4"))  # Accounts synced at once per IMAP host
+SYNC_ACCOUNT_TIMEOUT = int(os.getenv("SYNC_ACCOUNT_TIMEOUT", "300"))  # Seconds before an account sync is abandoned
+
+# Adaptive Sync Scheduling (per-account poll intervals, see sync_scheduler.py)
+SCHEDULER_MIN_INTERVAL = int(os.getenv("SCHEDULER_MIN_INTERVAL", "60"))  # Seconds; busiest inboxes
+SCHEDULER_MAX_INTERVAL = int(os.getenv("SCHEDULER_MAX_INTERVAL", "3600"))  # Seconds; quiet or failing inboxes
+SCHEDULER_DEFAULT_INTERVAL = int(os.getenv("SYNC_INTERVAL_MINUTES", "5")) * 60  # Until an arrival rate is known
+SCHEDULER_ACTIVE_INTERVAL = int(os.getenv("SCHEDULER_ACTIVE_INTERVAL", "60"))  # Accounts of users on the dashboard
+SCHEDULER_ACTIVE_WINDOW = int(os.getenv("SCHEDULER_ACTIVE_WINDOW", "900"))  # Seconds since last dashboard visit
+SCHEDULER_TARGET_PER_POLL = float(os.getenv("SCHEDULER_TARGET_PER_POLL", "1"))  # New messages expected per poll
+SCHEDULER_RATE_SMOOTHING = float(os.getenv("SCHEDULER_RATE_SMOOTHING", "0.3"))  # EWMA weight of the latest poll
+SCHEDULER_TICK = int(os.getenv("SCHEDULER_TICK", "5"))  # Longest the scheduler loop sleeps
+STATS_LOG_INTERVAL = int(os.getenv("STATS_LOG_INTERVAL", "300"))  # Seconds between sync stats summaries
+
+# Sync Job Queue (coalesced on-demand and periodic account syncs)
+SYNC_JOB_WORKERS = int(os.getenv("SYNC_JOB_WORKERS", "2"))  # Batches run at once; one is kept for on-demand syncs
+SYNC_JOB_BATCH_SIZE = int(os.getenv("SYNC_JOB_BATCH_SIZE", "50"))  # Accounts handed to the sync pool at once
+SYNC_JOB_RETENTION = int(os.getenv("SYNC_JOB_RETENTION", "600"))  # Seconds finished jobs stay queryable
+SYNC_ON_DEMAND_WORKERS = int(os.getenv("SYNC_ON_DEMAND_WORKERS", "4"))  # Accounts synced at once for on-demand jobs
+
+# Distributed Sync Workers (account leases, see account_leases.py)
+SYNC_WORKER_ID = os.getenv("SYNC_WORKER_ID", "")  # Defaults to hostname-pid
+LEASE_BACKEND = os.getenv("LEASE_BACKEND", "sqlite")  # sqlite, memory, or module.ClassName
+LEASE_TTL = int(os.getenv("LEASE_TTL", "60"))  # Seconds a lease or heartbeat lasts unrenewed (failover time)
+LEASE_HEARTBEAT_INTERVAL = int(os.getenv("LEASE_HEARTBEAT_INTERVAL", "15"))  # Must be well under LEASE_TTL
+
+# Ingest Pipeline Configuration (fetch -> parse -> classify -> persist -> notify)
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "200"))  # Bound on each stage's input queue
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", "2"))
+INGEST_CLASSIFY_WORKERS = int(os.getenv("INGEST_CLASSIFY_WORKERS", "4"))
+INGEST_PERSIST_WORKERS = int(os.getenv("INGEST_PERSIST_WORKERS", "1"))
+INGEST_NOTIFY_WORKERS = int(os.getenv("INGEST_NOTIFY_WORKERS", "2"))
+INGEST_PARSE_BATCH_SIZE = int(os.getenv("INGEST_PARSE_BATCH_SIZE", "32"))  # Messages handed to the parser at once
+
+# Cross-Account Message Deduplication (see message_dedup.py)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "True").lower() == "true"  # Copies of a message already classified in another account reuse its classification
+DEDUP_WAIT_TIMEOUT = int(os.getenv("DEDUP_WAIT_TIMEOUT", "30"))  # Seconds a copy waits for another account's in-flight classification
+
+# Conversation Threading (see thread_index.py)
+THREADING_ENABLED = os.getenv("THREADING_ENABLED", "True").lower() == "true"
+THREAD_HISTORY_LIMIT = int(os.getenv("THREAD_HISTORY_LIMIT", "5"))  # Earlier messages given to classification and reply suggestions
+
+# Offline Archive Import (mbox / Maildir, see mail_importer.py)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))  # Messages parsed, stored and checkpointed together
+IMPORT_MAILBOX_PREFIX = os.getenv("IMPORT_MAILBOX_PREFIX", "Import/")  # Keeps imported folders apart from IMAP-synced ones
+IMPORT_PROGRESS_INTERVAL = int(os.getenv("IMPORT_PROGRESS_INTERVAL", "10"))  # Seconds between progress log lines
+
+# MIME Parsing Configuration
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 2)))  # 0 parses in-process
+PARSE_BATCH_SIZE = int(os.getenv("PARSE_BATCH_SIZE", "16"))  # Messages per worker call
+PARSE_SHM_THRESHOLD = int(os.getenv("PARSE_SHM_THRESHOLD", str(256 * 1024)))  # Bytes before using shared memory
+PARSE_MAX_TEXT_CHARS = int(os.getenv("PARSE_MAX_TEXT_CHARS", "5000"))
 
 # For now, store emails in memory/JSON until Elasticsearch is implemented
 EMAIL_STORAGE_MODE = os.getenv("EMAIL_STORAGE_MODE", "elasticsearch")
@@ -49,6 +154,41 @@ AI_CLASSIFICATION_ENABLED = os.getenv("AI_CLASSIFICATION_ENABLED", "False").lowe
 AI_MODEL = os.getenv("AI_MODEL", "gpt-3.5-turbo")
 AI_MAX_TOKENS = int(os.getenv("AI_MAX_TOKENS", "150"))
 AI_TEMPERATURE = float(os.getenv("AI_TEMPERATURE", "0.3"))
+# Batched / concurrent AI classification (see llm_batch.py); the budget is shared by every AI call
+AI_BATCH_SIZE = int(os.getenv("AI_BATCH_SIZE", "20"))  # Emails packed into one prompt; 1 = one email per request
+AI_MAX_IN_FLIGHT = int(os.getenv("AI_MAX_IN_FLIGHT", "8"))  # Concurrent AI requests per batch run
+AI_REQUESTS_PER_MINUTE = int(os.getenv("AI_REQUESTS_PER_MINUTE", "500"))  # Set to the API key's RPM limit
+AI_TOKENS_PER_MINUTE = int(os.getenv("AI_TOKENS_PER_MINUTE", "60000"))  # Set to the API key's TPM limit
+AI_RETRY_LIMIT = int(os.getenv("AI_RETRY_LIMIT", "3"))  # Retries of a rate-limited request
+# Local classifier tier (naive Bayes trained on stored labels, see local_classifier.py)
+LOCAL_MODEL_ENABLED = os.getenv("LOCAL_MODEL_ENABLED", "True").lower() == "true"
+LOCAL_MODEL_DB = os.getenv("LOCAL_MODEL_DB", "reachinbox.db")  # Database with the labelled emails
+LOCAL_MODEL_THRESHOLD = float(os.getenv("LOCAL_MODEL_THRESHOLD", "0.98"))  # Posterior above which the AI is skipped
+LOCAL_MODEL_MIN_EXAMPLES = int(os.getenv("LOCAL_MODEL_MIN_EXAMPLES", "500"))  # Labelled emails before the model answers
+LOCAL_MODEL_MIN_LABEL_CONFIDENCE = float(os.getenv("LOCAL_MODEL_MIN_LABEL_CONFIDENCE", "0.8"))  # Stored labels below this are not learned
+LOCAL_MODEL_RETRAIN_INTERVAL = int(os.getenv("LOCAL_MODEL_RETRAIN_INTERVAL", "900"))  # Seconds between incremental training runs
+# Embedding kNN tier (vote of the nearest labelled emails, see knn_classifier.py); uses LOCAL_MODEL_DB's labels
+KNN_ENABLED = os.getenv("KNN_ENABLED", "True").lower() == "true"
+KNN_INDEX_PATH = os.getenv("KNN_INDEX_PATH", "./knn_index.npz")  # Saved embedding matrix; empty = rebuilt each start
+KNN_K = int(os.getenv("KNN_K", "15"))  # Neighbours that vote
+KNN_MIN_MARGIN = float(os.getenv("KNN_MIN_MARGIN", "0.6"))  # Winning vote share minus the runner-up's; closer votes go to the AI
+KNN_MIN_SIMILARITY = float(os.getenv("KNN_MIN_SIMILARITY", "0.5"))  # Cosine similarity the nearest neighbour needs
+KNN_MIN_EXAMPLES = int(os.getenv("KNN_MIN_EXAMPLES", "200"))  # Indexed emails before the tier answers
+KNN_MAX_CHARS = int(os.getenv("KNN_MAX_CHARS", "1000"))  # Subject + body characters embedded (the model truncates anyway)
+KNN_RETRAIN_INTERVAL = int(os.getenv("KNN_RETRAIN_INTERVAL", "300"))  # Seconds between index updates
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")  # sentence-transformers model shared with reply suggestions
+# Strip quoted history and signatures before classification and RAG embedding
+STRIP_QUOTED_REPLIES = os.getenv("STRIP_QUOTED_REPLIES", "True").lower() == "true"
+CLASSIFICATION_RULES_FILE = os.getenv("CLASSIFICATION_RULES_FILE", "")  # JSON/YAML rule overrides (see rule_engine.py); empty = built-in rules
+RULES_RELOAD_INTERVAL = int(os.getenv("RULES_RELOAD_INTERVAL", "30"))  # Seconds between checks of the rules file for changes
+
+# Classification Cache (AI results by normalized content, see classification_cache.py)
+CLASSIFICATION_CACHE_ENABLED = os.getenv("CLASSIFICATION_CACHE_ENABLED", "True").lower() == "true"
+CLASSIFICATION_CACHE_DB = os.getenv("CLASSIFICATION_CACHE_DB", "reachinbox.db")
+CLASSIFICATION_CACHE_TTL = int(os.getenv("CLASSIFICATION_CACHE_TTL", str(30 * 24 * 3600)))  # Seconds a cached result is reused
+CLASSIFICATION_CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFICATION_CACHE_MAX_ENTRIES", "200000"))  # Least recently used beyond this are evicted
+CLASSIFICATION_CACHE_MEMORY_ENTRIES = int(os.getenv("CLASSIFICATION_CACHE_MEMORY_ENTRIES", "5000"))  # In-process LRU in front of SQLite
+CLASSIFIER_VERSION = os.getenv("CLASSIFIER_VERSION", "1")  # Bump when the AI prompt or model changes; old cache entries stop matching
 
 # RAG Reply Suggestion Configuration
 RAG_ENABLED = os.getenv("RAG_ENABLED", "True").lower() == "true"
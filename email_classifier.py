@@ -2,10 +2,18 @@ import os
 import openai
 import json
 import logging
+import threading
 from typing import Dict, Any, Optional
 import re
 from datetime import datetime
 from dotenv import load_dotenv
+from reply_cleaner import clean_reply
+from config import STRIP_QUOTED_REPLIES, CLASSIFICATION_CACHE_ENABLED, LOCAL_MODEL_ENABLED, KNN_ENABLED, AI_MODEL
+from rule_engine import RuleEngine
+from classification_cache import ClassificationCache, cache_key
+from local_classifier import LocalClassifier
+from knn_classifier import KNNClassifier
+from llm_batch import BatchClassifier, budget as llm_budget, estimate_tokens, is_rate_limit
 
 # Import notification service
 try:
@@ -43,65 +51,77 @@ class EmailClassifier:
             "Spam",
             "Out of Office"
         ]
-    
-    def rule_based_classify(self, email_data: Dict[str, Any]) -> Optional[str]:
-        """
-        Pre-classify emails using rule-based detection
-        Returns category if confident, None if needs AI classification
-        """
-        subject = email_data.get('subject', '').lower()
-        content = email_data.get('content', '').lower()
-        sender = email_data.get('sender', '').lower()
         
-        # Out of Office detection
-        ooo_patterns = [
-            'out of office', 'currently away', 'vacation', 'holiday',
-            'automatic reply', 'auto reply', 'away from office',
-            'not available', 'on leave', 'traveling'
-        ]
-        if any(pattern in subject or pattern in content for pattern in ooo_patterns):
-            return "Out of Office"
+        # How much quoted history / signature text was kept out of classification
+        self._preprocess_lock = threading.Lock()
+        self.preprocess_stats = {
+            "emails": 0,
+            "original_chars": 0,
+            "removed_chars": 0,
+            "quoted_chars": 0,
+            "signature_chars": 0
+        }
         
-        # Spam detection
-        spam_patterns = [
-            'unsubscribe', 'click here', 'limited time offer', 'act now',
-            'free gift', 'congratulations', 'you have won', 'claim now',
-            'viagra', 'casino', 'lottery', 'millionaire', 'inheritance'
-        ]
-        spam_domains = ['noreply', 'no-reply', 'donotreply']
+        # Keyword rules (per tenant), compiled at load and hot-reloaded from CLASSIFICATION_RULES_FILE
+        self.rule_engine = RuleEngine()
         
-        if (any(pattern in subject or pattern in content for pattern in spam_patterns) or
-            any(domain in sender for domain in spam_domains)):
-            return "Spam"
+        # AI results by normalized content, so identical mail is never sent to the AI twice
+        self.cache = ClassificationCache() if CLASSIFICATION_CACHE_ENABLED else None
         
-        # Meeting detection
-        meeting_patterns = [
-            'meeting', 'calendar', 'scheduled', 'appointment', 'invite',
-            'zoom', 'teams', 'google meet', 'conference call', 'call scheduled',
-            'booking confirmed', 'meeting request', 'reschedule'
-        ]
-        if any(pattern in subject or pattern in content for pattern in meeting_patterns):
-            return "Meeting Booked"
+        # Local model trained on stored labels; its confident answers skip the AI (the sync service trains it)
+        self.local_model = LocalClassifier(self.categories) if LOCAL_MODEL_ENABLED else None
         
-        # Interest indicators
-        interested_patterns = [
-            'interested', 'tell me more', 'looking forward', 'sounds good',
-            'please send', 'would like to', 'can you', 'more information',
-            'demo', 'trial', 'proposal'
-        ]
-        if any(pattern in content for pattern in interested_patterns):
-            return "Interested"
+        # Vote of the nearest labelled emails by embedding; only clear votes skip the AI (the sync service loads it)
+        self.knn = KNNClassifier(self.categories) if KNN_ENABLED else None
         
-        # Not interested indicators
-        not_interested_patterns = [
-            'not interested', 'no thank you', 'remove me', 'stop emailing',
-            'not at this time', 'pass on this', 'not a good fit'
-        ]
-        if any(pattern in content for pattern in not_interested_patterns):
-            return "Not Interested"
+        # Many emails per AI request, several requests in flight (batch_classify)
+        self.batcher = BatchClassifier(self.categories)
+    
+    def preprocess(self, email_data: Dict[str, Any]) -> tuple[Dict[str, Any], int]:
+        """
+        Strip quoted replies and signatures from the content to classify
+        Returns (email_data copy with cleaned content, characters removed)
+        """
+        if not STRIP_QUOTED_REPLIES or not email_data.get('content'):
+            return email_data, 0
         
-        # Return None if no clear rule match - needs AI classification
-        return None
+        cleaned = clean_reply(email_data['content'])
+        with self._preprocess_lock:
+            self.preprocess_stats["emails"] += 1
+            for key in ("original_chars", "removed_chars", "quoted_chars", "signature_chars"):
+                self.preprocess_stats[key] += cleaned[key]
+        return {**email_data, 'content': cleaned['text']}, cleaned['removed_chars']
+    
+    def get_preprocess_stats(self) -> Dict[str, Any]:
+        """Totals of text removed before classification"""
+        with self._preprocess_lock:
+            stats = dict(self.preprocess_stats)
+        stats["removed_ratio"] = round(stats["removed_chars"] / stats["original_chars"], 3) if stats["original_chars"] else 0.0
+        return stats
+    
+    def rule_decision(self, email_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        The rule that decides the email's category (for its tenant), or None
+        """
+        return self.rule_engine.matcher(email_data.get('user_id')).decide(
+            email_data.get('subject', ''), email_data.get('content', ''), email_data.get('sender', '')
+        )
+    
+    def rule_based_classify(self, email_data: Dict[str, Any]) -> Optional[str]:
+        """
+        Pre-classify emails using rule-based detection
+        Returns category if confident, None if needs AI classification
+        """
+        rule = self.rule_decision(email_data)
+        return rule['category'] if rule else None
+    
+    def rule_matches(self, email_data: Dict[str, Any]) -> list:
+        """
+        Every keyword rule hit in the email, with category, field and position
+        """
+        return self.rule_engine.matcher(email_data.get('user_id')).matches(
+            email_data.get('subject', ''), email_data.get('content', ''), email_data.get('sender', '')
+        )
     
     def ai_classify(self, email_data: Dict[str, Any]) -> tuple[str, float]:
         """
@@ -116,6 +136,7 @@ class EmailClassifier:
             subject = email_data.get('subject', '')
             sender = email_data.get('sender', '')
             content = email_data.get('content', '')[:1500]  # Limit content length
+            conversation = self._thread_prompt(email_data.get('thread_history'))
             
             prompt = f"""
 Classify this email into exactly one of these categories:
@@ -129,7 +150,7 @@ Email Details:
 Subject: {subject}
 Sender: {sender}
 Content: {content}
-
+{conversation}
 Instructions:
 - Analyze the tone, intent, and content carefully
 - "Interested" = Shows interest in product/service, asks questions, wants more info
@@ -141,8 +162,9 @@ Instructions:
 Return only the category name, nothing else.
 """
 
+            llm_budget.acquire(estimate_tokens(prompt, 20))
             response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
+                model=AI_MODEL,
                 messages=[
                     {"role": "system", "content": "You are an expert email classifier. Respond with only the category name."},
                     {"role": "user", "content": prompt}
@@ -163,42 +185,21 @@ Return only the category name, nothing else.
                 return "Uncategorized", 0.0
                 
         except Exception as e:
+            if is_rate_limit(e):
+                llm_budget.rate_limited(e)
             logger.error(f"❌ AI classification failed: {e}")
             return "Uncategorized", 0.0
     
-    def classify_email(self, email_data: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Main classification method that combines rule-based and AI classification
-        Returns classification result with metadata
-        """
-        start_time = datetime.now()
-        
-        # Try rule-based classification first
-        rule_category = self.rule_based_classify(email_data)
-        
-        if rule_category:
-            # Rule-based classification successful
-            result = {
-                "category": rule_category,
-                "confidence_score": 0.95,  # High confidence for rule-based
-                "classification_method": "Rule",
-                "classified_at": datetime.now().isoformat(),
-                "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000)
-            }
-            logger.info(f"✅ Rule-based classification: {rule_category}")
-        else:
-            # Use AI classification for complex cases
-            ai_category, confidence = self.ai_classify(email_data)
-            result = {
-                "category": ai_category,
-                "confidence_score": confidence,
-                "classification_method": "AI",
-                "classified_at": datetime.now().isoformat(),
-                "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000)
-            }
-            logger.info(f"✅ AI classification: {ai_category} (confidence: {confidence})")
-        
-        return result
+    def _thread_prompt(self, history) -> str:
+        """Earlier messages of the conversation, for the AI prompt"""
+        if not history:
+            return ""
+        lines = [
+            f"- From {message.get('sender', '')} ({message.get('category') or 'unclassified'}): "
+            f"{' '.join((message.get('content') or '').split())[:300]}"
+            for message in history
+        ]
+        return "\nEarlier messages in this conversation (oldest first):\n" + "\n".join(lines) + "\n"
     
     def _send_notification_if_interested(self, email_data: Dict[str, Any], classification_result: Dict[str, Any]):
         """
@@ -231,57 +232,153 @@ Return only the category name, nothing else.
             except Exception as e:
                 logger.error(f"❌ Feature 4: Error executing Slack & Webhook integration: {e}")
     
-    def classify_email(self, email_data: Dict[str, Any]) -> Dict[str, Any]:
+    def classify_email(self, email_data: Dict[str, Any], notify: bool = True) -> Dict[str, Any]:
         """
         Main classification method that combines rule-based and AI classification
         Returns classification result with metadata
+        
+        Pass notify=False when notifications are sent separately (e.g. by the
+        ingest pipeline's notify stage) so classification never waits on Slack.
         """
         start_time = datetime.now()
         
-        # Try rule-based classification first
-        rule_category = self.rule_based_classify(email_data)
+        # Classify only what the sender wrote in this message
+        classify_data, removed_chars = self.preprocess(email_data)
         
-        if rule_category:
-            # Rule-based classification successful
-            result = {
-                "category": rule_category,
-                "confidence_score": 0.95,  # High confidence for rule-based
-                "classification_method": "Rule",
-                "classified_at": datetime.now().isoformat(),
-                "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000)
-            }
-            logger.info(f"✅ Rule-based classification: {rule_category}")
-        else:
+        # Try rule-based classification (or a cached AI result) first
+        decided = self._classify_without_ai(classify_data)
+        if decided is None:
+            decided = self._knn_decisions([classify_data])[0]
+        if decided is None and not self.ai_enabled:
+            decided = self._unclassified()
+        if decided is None:
             # Use AI classification
-            ai_category, confidence = self.ai_classify(email_data)
-            result = {
-                "category": ai_category,
-                "confidence_score": confidence,
-                "classification_method": "AI",
-                "classified_at": datetime.now().isoformat(),
-                "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000)
-            }
-            logger.info(f"✅ AI classification: {ai_category} (confidence: {confidence})")
+            ai_category, confidence = self.ai_classify(classify_data)
+            decided = self._ai_result(classify_data, ai_category, confidence)
+        result = self._finish(decided, email_data, start_time, removed_chars)
         
         # Send notification if email is classified as 'Interested'
-        self._send_notification_if_interested(email_data, result)
+        if notify:
+            self._send_notification_if_interested(email_data, result)
         
         return result
     
-    def batch_classify(self, emails: list) -> list:
+    def _classify_without_ai(self, classify_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Rule, cache or local model decision, None if the email needs the AI"""
+        rule = self.rule_decision(classify_data)
+        if rule:
+            logger.info(f"✅ Rule-based classification: {rule['category']}")
+            return {"category": rule['category'], "confidence_score": rule['weight'], "classification_method": "Rule"}
+        cached = self.cache.get(classify_data) if self.cache and self.ai_enabled else None
+        if cached:
+            logger.info(f"✅ Cache classification: {cached['category']} (confidence: {cached['confidence_score']})")
+            return {**cached, "classification_method": "Cache"}
+        local = self.local_model.predict(classify_data) if self.local_model else None
+        if local:
+            logger.info(f"✅ Local model classification: {local['category']} (confidence: {local['confidence_score']})")
+            return {**local, "classification_method": "Local"}
+        return None
+    
+    def _knn_decisions(self, batch: list) -> list:
+        """kNN decision per email (embedded together), None where the vote is too close"""
+        if not self.knn:
+            return [None] * len(batch)
+        try:
+            votes = self.knn.predict_many(batch)
+        except Exception as e:
+            logger.error(f"❌ kNN classification failed: {e}")
+            return [None] * len(batch)
+        decisions = []
+        for vote in votes:
+            if vote:
+                logger.info(f"✅ kNN classification: {vote['category']} (confidence: {vote['confidence_score']}, margin: {vote['margin']})")
+                vote = {"category": vote['category'], "confidence_score": vote['confidence_score'], "classification_method": "KNN"}
+            decisions.append(vote)
+        return decisions
+    
+    def _ai_result(self, classify_data: Dict[str, Any], category: str, confidence: float) -> Dict[str, Any]:
+        """Record an AI answer in the cache"""
+        if self.cache and category in self.categories:
+            self.cache.put(classify_data, {"category": category, "confidence_score": confidence})
+        logger.info(f"✅ AI classification: {category} (confidence: {confidence})")
+        return {"category": category, "confidence_score": confidence, "classification_method": "AI"}
+    
+    def _unclassified(self) -> Dict[str, Any]:
+        """Nothing decided the email and the AI is off"""
+        return {"category": "Uncategorized", "confidence_score": 0.0, "classification_method": "Unclassified"}
+    
+    def _finish(self, decided: Dict[str, Any], email_data: Dict[str, Any], start_time, removed_chars: int) -> Dict[str, Any]:
+        result = {
+            **decided,
+            "classified_at": datetime.now().isoformat(),
+            "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000),
+            "content_chars_removed": removed_chars
+        }
+        # Nothing decided (AI off or failed): keep the conversation's current category
+        if result["category"] == "Uncategorized" and email_data.get('thread_category'):
+            result["category"] = email_data['thread_category']
+            result["confidence_score"] = round(0.8 * (email_data.get('thread_confidence') or 0.0), 2)
+            result["classification_method"] = "Thread"
+        return result
+    
+    def batch_classify(self, emails: list, notify: bool = True) -> list:
         """
         Classify multiple emails in batch
         Returns list of emails with classification data added
+        
+        Emails the rules, cache and local model don't decide are embedded together
+        for the kNN vote; what it leaves goes to the AI together: several per
+        request, several requests at once (see llm_batch.py).
         """
         logger.info(f"🔄 Starting batch classification of {len(emails)} emails...")
+        start_time = datetime.now()
         
         classified_emails = []
-        stats = {"Rule": 0, "AI": 0, "Failed": 0}
+        stats = {"Rule": 0, "Cache": 0, "Local": 0, "KNN": 0, "AI": 0, "Thread": 0, "Unclassified": 0, "Failed": 0}
         interested_count = 0
         
+        # Rules, cache and local model first; what's left goes to the AI in one batched run
+        prepared, failures, need_ai = [], {}, []
         for i, email in enumerate(emails):
             try:
-                classification = self.classify_email(email)
+                classify_data, removed_chars = self.preprocess(email)
+                decided = self._classify_without_ai(classify_data)
+                prepared.append([classify_data, removed_chars, decided])
+                if decided is None:
+                    need_ai.append(i)
+            except Exception as e:
+                prepared.append(None)
+                failures[i] = e
+        
+        # One embedding batch for the kNN vote; close votes stay with the AI
+        for i, decided in zip(need_ai, self._knn_decisions([prepared[i][0] for i in need_ai])):
+            prepared[i][2] = decided
+        need_ai = [i for i in need_ai if prepared[i][2] is None]
+        
+        # Copies of the same content in this batch are asked about once
+        first_copy = {}
+        for i in need_ai:
+            first_copy.setdefault(cache_key(prepared[i][0]), i)
+        unique = list(first_copy.values())
+        if not self.ai_enabled:
+            for i in need_ai:
+                prepared[i][2] = self._unclassified()
+        elif unique:
+            answers = self.batcher.classify_many([prepared[i][0] for i in unique])
+            logger.info(f"🤖 Batched AI classification: {self.batcher.get_stats()}, budget: {llm_budget.get_stats()}")
+            answer_of = dict(zip(unique, answers))
+            for i in need_ai:
+                category, confidence = answer_of[first_copy[cache_key(prepared[i][0])]]
+                prepared[i][2] = self._ai_result(prepared[i][0], category, confidence)
+        
+        for i, email in enumerate(emails):
+            try:
+                if i in failures:
+                    raise failures[i]
+                _, removed_chars, decided = prepared[i]
+                classification = self._finish(decided, email, start_time, removed_chars)
+                if notify:
+                    self._send_notification_if_interested(email, classification)
                 email.update(classification)
                 classified_emails.append(email)
                 
@@ -290,9 +387,6 @@ Return only the category name, nothing else.
                 # Count interested emails
                 if classification.get("category") == "Interested":
                     interested_count += 1
-                
-                if (i + 1) % 10 == 0:
-                    logger.info(f"📊 Progress: {i + 1}/{len(emails)} emails classified (Interested: {interested_count})")
                     
             except Exception as e:
                 logger.error(f"❌ Failed to classify email {i}: {e}")
@@ -313,13 +407,17 @@ Return only the category name, nothing else.
 # Global classifier instance
 classifier = EmailClassifier()
 
-def classify_single_email(email_data: Dict[str, Any]) -> Dict[str, Any]:
+def classify_single_email(email_data: Dict[str, Any], notify: bool = True) -> Dict[str, Any]:
     """Convenience function to classify a single email"""
-    return classifier.classify_email(email_data)
+    return classifier.classify_email(email_data, notify=notify)
+
+def notify_if_interested(email_data: Dict[str, Any], classification_result: Dict[str, Any]):
+    """Convenience function to send Feature 4 notifications for an already classified email"""
+    classifier._send_notification_if_interested(email_data, classification_result)
 
-def classify_emails_batch(emails: list) -> list:
+def classify_emails_batch(emails: list, notify: bool = True) -> list:
     """Convenience function to classify multiple emails"""
-    return classifier.batch_classify(emails)
+    return classifier.batch_classify(emails, notify=notify)
 
 if __name__ == "__main__":
     # Test the classifier
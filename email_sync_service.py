@@ -7,8 +7,16 @@ from datetime import datetime, timedelta
 from email.header import decode_header
 from email import message_from_bytes
 from database import email_storage
-from config import ACCOUNTS, SYNC_DAYS, IDLE_TIMEOUT, RECONNECT_DELAY
-from email_classifier import classify_single_email
+from config import ACCOUNTS, IDLE_TIMEOUT, RECONNECT_DELAY, IMAP_TIMEOUT, INGEST_PARSE_BATCH_SIZE, DEDUP_ENABLED
+from imap_throttle import open_imap, imap_call, get_throttle_stats
+from email_classifier import classify_single_email, notify_if_interested
+from imap_idle import IdlePushEngine, IdleWatcher
+from ingest_pipeline import IngestPipeline, NewMailProgress
+from backfill import BackfillJob, fetch_messages, backfill_connections
+from python_models import Database
+from message_dedup import MessageDedupIndex
+from mime_parser import get_parse_pool
+from html_text import extract_body
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -18,6 +26,21 @@ class EmailSyncService:
         self.active_connections = {}
         self.sync_threads = []
         self.running = True
+        self.push_engine = IdlePushEngine(self.connect_to_account, self.fetch_new_emails)
+        self.new_mail = {}  # account email -> NewMailProgress
+        self.pending_changed = threading.Condition()  # Guards new_mail
+        self.checkpoints = Database()  # Backfill checkpoints survive restarts
+        # Accounts CC'd on the same thread: classify and notify each message once
+        self.dedup = MessageDedupIndex(self.checkpoints) if DEDUP_ENABLED else None
+        self.pipeline = IngestPipeline(
+            parse=self.parse_item,
+            classify=self.classify_item,
+            persist=self.persist_item,
+            notify=self.notify_item,
+            persist_workers=1,  # EmailStorage writes are not thread-safe
+            parse_batch_size=INGEST_PARSE_BATCH_SIZE
+        )
+        self.pipeline.start()
     
     def decode_header_safe(self, header_value):
         """Safely decode email headers"""
@@ -36,8 +59,9 @@ class EmailSyncService:
     def connect_to_account(self, account):
         """Establish IMAP connection for an account"""
         try:
-            mail = imaplib.IMAP4_SSL(account['imap_server'])
-            mail.login(account['email'], account['password'])
+            # Login is rate limited per IMAP host and retried if throttled
+            mail = open_imap(account['imap_server'], 993, account['email'], account['password'],
+                             timeout=IMAP_TIMEOUT)
             mail.select('INBOX')
             
             logging.info(f"Connected to {account['email']}")
@@ -46,30 +70,37 @@ class EmailSyncService:
             logging.error(f"Failed to connect to {account['email']}: {e}")
             return None
     
-    def fetch_last_30_days(self, account):
-        """Fetch emails from the last 30 days for initial sync"""
+    def run_backfill(self, account):
+        """Import mailbox history newest-first, resuming from the last checkpoint"""
         mail = self.connect_to_account(account)
         if not mail:
             return
         
         try:
-            # Calculate date 30 days ago
-            since_date = (datetime.now() - timedelta(days=SYNC_DAYS)).strftime("%d-%b-%Y")
+            def submit(uid, raw, on_done):
+                self.pipeline.submit({
+                    'account_email': account['email'],
+                    'uid': str(uid),
+                    'raw': raw,
+                    'on_done': on_done
+                })
             
-            # Search for emails from last 30 days
-            status, data = mail.search(None, f'(SINCE "{since_date}")')
-            email_ids = data[0].split()
+            job = BackfillJob(self.checkpoints, account['email'], submit)
+            # Large mailboxes fetch UID ranges over several connections
+            queued = job.run(
+                mail,
+                connect=lambda: self.connect_to_account(account),
+                connections=backfill_connections(account['imap_server'])
+            )
+            logging.info(f"Queued {queued} historical emails for {account['email']}")
             
-            logging.info(f"Found {len(email_ids)} emails in last {SYNC_DAYS} days for {account['email']}")
-            
-            # Fetch emails in batches to avoid overwhelming the server
-            batch_size = 50
-            for i in range(0, len(email_ids), batch_size):
-                batch = email_ids[i:i+batch_size]
-                self.fetch_emails_batch(mail, batch, account['email'])
-                time.sleep(1)  # Small delay between batches
-            
-            self.storage.update_sync_status(account['email'], email_ids[-1].decode() if email_ids else None)
+            # Everything above the backfill window belongs to the incremental sync
+            with self.pending_changed:
+                last_uid = self.storage.get_last_uid(account['email'])
+                if job.high_uid > int(last_uid or 0):
+                    self.storage.update_sync_status(account['email'], str(job.high_uid))
+                    if account['email'] in self.new_mail:
+                        self.new_mail[account['email']].last_uid = job.high_uid
             
         except Exception as e:
             logging.error(f"Error during initial sync for {account['email']}: {e}")
@@ -81,147 +112,159 @@ class EmailSyncService:
                 pass
     
     def fetch_emails_batch(self, mail, email_ids, account_email):
-        """Fetch a batch of emails"""
-        for email_id in email_ids:
-            try:
-                status, msg_data = mail.fetch(email_id, '(RFC822)')
-                if status != 'OK':
-                    continue
-                
-                msg = message_from_bytes(msg_data[0][1])
-                
-                # Extract email details
-                subject = self.decode_header_safe(msg.get('Subject'))
-                sender = self.decode_header_safe(msg.get('From'))
-                date_received = msg.get('Date', 'Unknown')
-                message_id = msg.get('Message-ID')
-                
-                # Extract email body for better classification
-                body = self.extract_email_body(msg)
-                
-                # Clean up data
-                subject = subject.replace('\n', ' ').replace('\r', ' ').strip()
-                sender = sender.replace('\n', ' ').replace('\r', ' ').strip()
-                date_received = date_received.replace('\n', ' ').replace('\r', ' ').strip()
-                
-                # Prepare email data for classification
-                email_data_for_classification = {
-                    'subject': subject,
-                    'sender': sender,
-                    'content': body or subject,  # Use body if available, otherwise subject
-                    'account_email': account_email
-                }
-                
-                # Classify the email using AI
-                try:
-                    classification_result = classify_single_email(email_data_for_classification)
-                    logging.info(f"📋 Email classified as: {classification_result.get('category', 'Unknown')}")
-                except Exception as e:
-                    logging.warning(f"⚠️ Classification failed for email {email_id}: {e}")
-                    classification_result = {
-                        'category': 'Uncategorized',
-                        'confidence_score': 0.0,
-                        'classification_method': 'Failed',
-                        'classified_at': datetime.now().isoformat()
-                    }
-                
-                # Store in storage system with classification
-                self.storage.insert_email(
-                    account_email=account_email,
-                    uid=email_id.decode(),
-                    subject=subject,
-                    sender=sender,
-                    date_received=date_received,
-                    message_id=message_id,
-                    body=body,
-                    classification=classification_result
-                )
-                
-            except Exception as e:
-                logging.warning(f"Error processing email {email_id}: {e}")
+        """Fetch a batch of emails by UID and queue them for ingest"""
+        try:
+            for i in range(0, len(email_ids), 50):
+                for uid, raw in fetch_messages(mail, email_ids[i:i + 50]):
+                    # Parsing, classification and storage run on the pipeline's workers
+                    self.submit_new_email(account_email, uid, raw)
+        except Exception as e:
+            logging.warning(f"Error fetching emails for {account_email}: {e}")
+    
+    def submit_new_email(self, account_email, uid, raw):
+        """Queue a new message; the account's last_uid advances once it is stored"""
+        with self.pending_changed:
+            self.new_mail[account_email].queued(uid)
+        
+        def stored():
+            with self.pending_changed:
+                progress = self.new_mail[account_email]
+                # Unparseable messages are dropped for good; failed writes are retried
+                if progress.finished(uid, stored=not item.get('store_failed')):
+                    self.storage.update_sync_status(account_email, str(progress.last_uid))
+        
+        item = {
+            'account_email': account_email,
+            'uid': str(uid),
+            'raw': raw,
+            'on_done': stored
+        }
+        self.pipeline.submit(item)
+    
+    def parse_item(self, items):
+        """Ingest parse stage: a batch of raw RFC822 bytes -> email fields, parsed in the process pool"""
+        records = get_parse_pool().parse_batch([item.pop('raw') for item in items])
+        
+        parsed = []
+        for item, record in zip(items, records):
+            if record is None:
+                logging.warning(f"⚠️ Could not parse email {item['uid']}, skipping")
+                parsed.append(None)
+                continue
+            
+            # Clean up data
+            item['fields'] = {
+                'subject': record['subject'].replace('\n', ' ').replace('\r', ' ').strip(),
+                'sender': record['sender'].replace('\n', ' ').replace('\r', ' ').strip(),
+                'date_received': (record['date'] or 'Unknown').replace('\n', ' ').replace('\r', ' ').strip(),
+                'message_id': record['message_id'],
+                # Email body for better classification
+                'body': record['text'][:2000]
+            }
+            parsed.append(item)
+        return parsed
+    
+    def classify_item(self, item):
+        """Ingest classify stage (notifications are sent by the notify stage)"""
+        fields = item['fields']
+        
+        # Prepare email data for classification
+        item['email_data'] = {
+            'subject': fields['subject'],
+            'sender': fields['sender'],
+            'content': fields['body'] or fields['subject'],  # Use body if available, otherwise subject
+            'account_email': item['account_email']
+        }
+        
+        claim = None
+        if self.dedup:
+            claim = self.dedup.claim(fields['message_id'], fields['sender'], fields['subject'], fields['body'])
+            if claim['classification']:
+                # Already classified (and notified) for another account
+                item['classification'] = claim['classification']
+                item['duplicate'] = True
+                return item
+        
+        # Classify the email using AI
+        try:
+            item['classification'] = classify_single_email(item['email_data'], notify=False)
+            logging.info(f"📋 Email classified as: {item['classification'].get('category', 'Unknown')}")
+            if claim:
+                self.dedup.complete(claim, item['classification'])
+        except Exception as e:
+            logging.warning(f"⚠️ Classification failed for email {item['uid']}: {e}")
+            item['classification'] = {
+                'category': 'Uncategorized',
+                'confidence_score': 0.0,
+                'classification_method': 'Failed',
+                'classified_at': datetime.now().isoformat()
+            }
+        finally:
+            if claim:
+                self.dedup.release(claim)
+        return item
+    
+    def persist_item(self, item):
+        """Ingest persist stage: store the email with its classification"""
+        fields = item['fields']
+        inserted = self.storage.insert_email(
+            account_email=item['account_email'],
+            uid=item['uid'],
+            subject=fields['subject'],
+            sender=fields['sender'],
+            date_received=fields['date_received'],
+            message_id=fields['message_id'],
+            body=fields['body'],
+            classification=item['classification']
+        )
+        if not inserted:
+            # Raised so the pipeline counts an error and skips notify
+            item['store_failed'] = True
+            raise RuntimeError(f"email {item['account_email']}/{item['uid']} was not stored")
+        return item
+    
+    def notify_item(self, item):
+        """Ingest notify stage: Slack/webhook for Interested emails"""
+        if item.get('duplicate'):
+            return
+        notify_if_interested(item['email_data'], item['classification'])
     
     def extract_email_body(self, msg):
         """Extract text content from email message"""
         try:
-            body = ""
-            if msg.is_multipart():
-                for part in msg.walk():
-                    if part.get_content_type() == "text/plain":
-                        payload = part.get_payload(decode=True)
-                        if payload:
-                            body += payload.decode('utf-8', errors='replace')
-                    elif part.get_content_type() == "text/html" and not body:
-                        # Use HTML as fallback if no plain text
-                        payload = part.get_payload(decode=True)
-                        if payload:
-                            import re
-                            html_content = payload.decode('utf-8', errors='replace')
-                            # Basic HTML tag removal
-                            body = re.sub(r'<[^>]+>', '', html_content)
-            else:
-                payload = msg.get_payload(decode=True)
-                if payload:
-                    body = payload.decode('utf-8', errors='replace')
-            
-            # Clean and limit body length
-            body = body.strip()[:2000]  # Limit to 2000 characters
-            return body
+            return extract_body(msg, max_chars=2000)  # Limit to 2000 characters
         except Exception as e:
             logging.warning(f"Error extracting email body: {e}")
             return ""
     
     def idle_monitor(self, account):
-        """Monitor account for new emails using Gmail-compatible polling"""
-        while self.running:
-            mail = self.connect_to_account(account)
-            if not mail:
-                logging.warning(f"Reconnecting to {account['email']} in {RECONNECT_DELAY} seconds...")
-                time.sleep(RECONNECT_DELAY)
-                continue
-            
-            try:
-                # Gmail-compatible approach: check for new emails every 30 seconds
-                # This is more efficient than IDLE for Gmail
-                self.fetch_new_emails(mail, account)
-                
-                # Keep connection alive and wait
-                for i in range(6):  # 6 * 5 = 30 seconds
-                    if not self.running:
-                        break
-                    time.sleep(5)
-                
-            except Exception as e:
-                logging.error(f"Monitor error for {account['email']}: {e}")
-            finally:
-                try:
-                    mail.close()
-                    mail.logout()
-                except:
-                    pass
-                
-                if self.running:
-                    time.sleep(5)  # Brief wait before reconnecting
+        """Monitor account for new emails over a persistent IDLE connection"""
+        watcher = IdleWatcher(account, self.connect_to_account, self.fetch_new_emails)
+        self.push_engine.watchers[account['email']] = watcher
+        watcher.run()
     
     def fetch_new_emails(self, mail, account):
         """Fetch new emails using UID-based detection"""
         try:
-            # Get the last UID we processed
-            last_uid = self.storage.get_last_uid(account['email'])
+            # The last UID with everything up to it stored, and what the pipeline still holds
+            with self.pending_changed:
+                progress = self.new_mail.get(account['email'])
+                if progress is None:
+                    last_uid = self.storage.get_last_uid(account['email'])
+                    progress = self.new_mail[account['email']] = NewMailProgress(int(last_uid) if last_uid else 0)
+                last_uid_int = progress.last_uid
+                in_flight = progress.skip()
             
-            # Search for all emails (we'll filter by UID)
-            status, data = mail.search(None, 'ALL')
+            # Ask the server only for UIDs above the last one stored
+            status, data = imap_call(mail, mail.uid, 'search', None, f'UID {last_uid_int + 1}:*')
             if status == 'OK' and data[0]:
-                all_uids = [int(uid) for uid in data[0].split()]
-                
-                # Find new emails (UIDs greater than last processed)
-                last_uid_int = int(last_uid) if last_uid else 0
-                new_uids = [str(uid) for uid in all_uids if uid > last_uid_int]
+                # "N:*" always matches the highest UID, even when it is below N
+                new_uids = [int(uid) for uid in data[0].split() if int(uid) > last_uid_int and int(uid) not in in_flight]
                 
                 if new_uids:
-                    # Fetch only the new emails
-                    self.fetch_emails_batch(mail, [uid.encode() for uid in new_uids], account['email'])
-                    self.storage.update_sync_status(account['email'], new_uids[-1])
-                    logging.info(f"Synced {len(new_uids)} new emails for {account['email']}")
+                    # Fetch only the new emails; last_uid advances as they are stored
+                    self.fetch_emails_batch(mail, new_uids, account['email'])
+                    logging.info(f"Queued {len(new_uids)} new emails for {account['email']}")
                     
         except Exception as e:
             logging.error(f"Error fetching new emails for {account['email']}: {e}")
@@ -233,15 +276,11 @@ class EmailSyncService:
         # First, do initial sync for all accounts
         for account in ACCOUNTS:
             logging.info(f"Starting initial sync for {account['email']}")
-            self.fetch_last_30_days(account)
+            self.run_backfill(account)
         
-        # Then start IDLE monitoring threads
-        for account in ACCOUNTS:
-            thread = threading.Thread(target=self.idle_monitor, args=(account,))
-            thread.daemon = True
-            thread.start()
-            self.sync_threads.append(thread)
-            logging.info(f"Started IDLE thread for {account['email']}")
+        # Then keep one persistent IDLE connection per account
+        self.push_engine.start(ACCOUNTS)
+        self.sync_threads.extend(self.push_engine.threads)
         
         logging.info("Email Sync Service started successfully!")
     
@@ -249,6 +288,8 @@ class EmailSyncService:
         """Stop the email synchronization service"""
         logging.info("Stopping Email Sync Service...")
         self.running = False
+        self.push_engine.stop()
+        self.pipeline.stop()  # Drains queued emails before returning
         
         # Close all connections
         for connection in self.active_connections.values():
@@ -268,8 +309,13 @@ class EmailSyncService:
             sync_status = self.storage.get_sync_status(account['email'])
             stats[account['email']] = {
                 'email_count': email_count,
-                'sync_status': sync_status
+                'sync_status': sync_status,
+                'push': self.push_engine.get_stats().get(account['email'])
             }
+        stats['ingest_pipeline'] = self.pipeline.get_metrics()
+        stats['imap_throttle'] = get_throttle_stats()
+        if self.dedup:
+            stats['dedup'] = self.dedup.get_stats()
         return stats
 
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+"""
+Shared sentence-transformers encoder
+The reply suggestion engine and the kNN classifier use the same embedding
+model; loading it once per process keeps the ~90 MB model (and its load
+time) from being paid twice.
+"""
+
+import threading
+import logging
+from config import EMBEDDING_MODEL
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+_encoders = {}
+_lock = threading.Lock()
+
+
+def get_encoder(name=EMBEDDING_MODEL):
+    """The process-wide SentenceTransformer for ``name`` (loaded on first use), or None if unavailable"""
+    if not SENTENCE_TRANSFORMERS_AVAILABLE:
+        return None
+    with _lock:
+        if name not in _encoders:
+            _encoders[name] = SentenceTransformer(name)
+            logging.info(f"✅ Loaded embedding model {name}")
+        return _encoders[name]
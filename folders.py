@@ -0,0 +1,160 @@
+"""
+Mail folder discovery and per-folder polling
+Finds an account's Sent, Archive and other folders with LIST, using the
+SPECIAL-USE attributes (RFC 6154) and common names where the server has no
+SPECIAL-USE. Which folders are synced is configurable per account.
+INBOX is synced on every cycle. Other folders are polled on their own
+interval, which doubles each time a poll finds nothing new and resets
+once one does.
+"""
+
+import re
+import time
+import threading
+import logging
+from imap_throttle import imap_call
+from config import SYNC_FOLDERS, FOLDER_MIN_INTERVAL, FOLDER_MAX_INTERVAL, FOLDER_LIST_REFRESH
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+LIST_LINE = re.compile(r'\((?P<attributes>[^)]*)\) (?P<delimiter>"(?:[^"\\]|\\.)*"|NIL) (?P<name>.*)')
+
+SPECIAL_USE = {
+    '\\sent': 'sent', '\\archive': 'archive', '\\all': 'all', '\\drafts': 'drafts',
+    '\\junk': 'junk', '\\trash': 'trash', '\\flagged': 'flagged'
+}
+
+# Folder names used by servers without SPECIAL-USE
+NAME_HINTS = {
+    'sent': {'sent', 'sent items', 'sent messages', 'sent mail', 'inbox.sent', 'inbox/sent'},
+    'archive': {'archive', 'archives', 'inbox.archive', 'inbox/archive'}
+}
+
+
+def quote_mailbox(name):
+    """Mailbox name as an IMAP quoted string (imaplib sends arguments as-is)"""
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _unquote(text):
+    text = text.strip()
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', text[1:-1])
+    return text
+
+
+def list_folders(mail):
+    """LIST "" "*" -> [{'name', 'attributes', 'role'}]; role is 'inbox', a SPECIAL-USE role or None"""
+    status, data = imap_call(mail, mail.list)
+    if status != 'OK':
+        return []
+    folders = []
+    for item in data or []:
+        if isinstance(item, tuple):  # Name sent as a literal
+            line, name = item[0].decode(errors='replace'), item[1].decode(errors='replace')
+        elif isinstance(item, bytes):
+            line, name = item.decode(errors='replace'), None
+        else:
+            continue
+        match = LIST_LINE.match(line)
+        if not match:
+            continue
+        attributes = {attribute.lower() for attribute in match.group('attributes').split()}
+        if '\\noselect' in attributes or '\\nonexistent' in attributes:
+            continue
+        name = name if name is not None else _unquote(match.group('name'))
+        role = 'inbox' if name.upper() == 'INBOX' else None
+        role = role or next((SPECIAL_USE[a] for a in attributes if a in SPECIAL_USE), None)
+        folders.append({'name': name, 'attributes': attributes, 'role': role})
+
+    # No SPECIAL-USE for a role: fall back to the usual folder names
+    for role, names in NAME_HINTS.items():
+        if not any(folder['role'] == role for folder in folders):
+            match = next((f for f in folders if f['role'] is None and f['name'].lower() in names), None)
+            if match:
+                match['role'] = role
+    return folders
+
+
+def resolve_folders(folders, wanted):
+    """
+    Pick folders from a LIST result. ``wanted`` holds folder names or
+    SPECIAL-USE roles written as ``\\Sent``, ``\\Archive``...; missing ones are
+    skipped. INBOX is always first.
+    """
+    chosen = [{'name': 'INBOX', 'role': 'inbox'}]
+    for entry in wanted:
+        entry = entry.strip()
+        if not entry or entry.upper() == 'INBOX':
+            continue
+        if entry.startswith('\\'):
+            role = SPECIAL_USE.get(entry.lower())
+            folder = next((f for f in folders if role and f['role'] == role), None)
+        else:
+            folder = next((f for f in folders if f['name'] == entry), None)
+        if folder and all(folder['name'] != c['name'] for c in chosen):
+            chosen.append({'name': folder['name'], 'role': folder['role']})
+    return chosen
+
+
+def account_folder_setting(account):
+    """The account's folder list (``sync_folders`` column) or the SYNC_FOLDERS default"""
+    return [entry for entry in (account.get('sync_folders') or SYNC_FOLDERS).split(',') if entry.strip()]
+
+
+class FolderSyncPlanner:
+    """
+    Decides which of an account's folders a sync cycle covers.
+
+    LIST results are cached per account for ``list_refresh`` seconds. INBOX
+    is always due; every other folder is due once its interval has passed.
+    That interval starts at ``min_interval`` and doubles (up to
+    ``max_interval``) each time a poll of the folder finds no changes.
+    """
+
+    def __init__(self, min_interval=FOLDER_MIN_INTERVAL, max_interval=FOLDER_MAX_INTERVAL,
+                 list_refresh=FOLDER_LIST_REFRESH):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.list_refresh = list_refresh
+        self._folders = {}  # account_id -> (listed_at, resolved folders, setting they were resolved for)
+        self._schedule = {}  # (account_id, folder name) -> [next_due, interval]
+        self._lock = threading.Lock()
+
+    def folders_for(self, account, mail, now=None):
+        """The account's configured folders that exist on the server (LIST cached)"""
+        now = time.monotonic() if now is None else now
+        wanted = account_folder_setting(account)
+        if [entry.strip().upper() for entry in wanted] == ['INBOX']:
+            return [{'name': 'INBOX', 'role': 'inbox'}]  # Nothing to discover
+        with self._lock:
+            cached = self._folders.get(account['id'])
+        if cached and now - cached[0] < self.list_refresh and cached[2] == wanted:
+            return cached[1]
+        try:
+            folders = resolve_folders(list_folders(mail), wanted)
+        except Exception as e:
+            logging.warning(f"Folder discovery failed for {account['email']}: {e}")
+            return cached[1] if cached else [{'name': 'INBOX', 'role': 'inbox'}]
+        with self._lock:
+            self._folders[account['id']] = (now, folders, wanted)
+        if len(folders) > 1:
+            logging.info(f"📁 Syncing {', '.join(f['name'] for f in folders)} for {account['email']}")
+        return folders
+
+    def due(self, account_id, folders, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return [
+                folder for folder in folders
+                if folder['role'] == 'inbox' or self._schedule.get((account_id, folder['name']), [0])[0] <= now
+            ]
+
+    def record(self, account_id, name, changed, now=None):
+        """Schedule the folder's next poll after one that did (or didn't) find changes"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._schedule.setdefault((account_id, name), [now, self.min_interval])
+            entry[1] = self.min_interval if changed else min(entry[1] * 2, self.max_interval)
+            entry[0] = now + entry[1]
+            return entry[1]
@@ -0,0 +1,76 @@
+// HTML-to-text for email bodies.
+// Same rules as html_text.py on the Python side: script/style/head are
+// dropped, entities decoded, block tags become line breaks, and with a cap
+// only a growing prefix of the document is converted.
+
+const SKIP_TAGS = ['script', 'style', 'head', 'title', 'noscript', 'template', 'svg'];
+const BLOCK_TAGS = [
+    'br', 'p', 'div', 'tr', 'li', 'ul', 'ol', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'blockquote', 'pre', 'hr', 'section', 'article', 'header', 'footer', 'dt', 'dd'
+];
+
+// Only complete hidden elements are dropped; an unclosed <head> or <style>
+// is usually a broken template and the rest of the message is kept
+const HIDDEN = new RegExp(`<(${SKIP_TAGS.join('|')})\\b[^>]*>[\\s\\S]*?</\\1\\s*>|<!--[\\s\\S]*?(?:-->|$)`, 'gi');
+const BLOCK = new RegExp(`</?(?:${BLOCK_TAGS.join('|')})\\b[^>]*>`, 'gi');
+const CELL = /<\/?t[dh]\b[^>]*>/gi;
+const TAG = /<\/?[a-zA-Z][^>]*>|<![^>]*>|<\?[^>]*>/g;
+const WINDOW_FACTOR = 8;
+
+// Named entities that show up in real newsletters; numeric references are decoded generically
+const NAMED_ENTITIES = {
+    nbsp: '\u00a0', amp: '&', lt: '<', gt: '>', quot: '"', apos: "'",
+    copy: '©', reg: '®', trade: '™', hellip: '…',
+    mdash: '—', ndash: '–', lsquo: '‘', rsquo: '’',
+    ldquo: '“', rdquo: '”', bull: '•', middot: '·',
+    zwnj: '', zwj: '', shy: '', euro: '€', pound: '£'
+};
+const ENTITY = /&(#[xX][0-9a-fA-F]+|#[0-9]+|[a-zA-Z]+);?/g;
+
+function decodeEntities(text) {
+    return text.replace(ENTITY, (match, name) => {
+        if (name[0] === '#') {
+            const code = name[1] === 'x' || name[1] === 'X'
+                ? parseInt(name.slice(2), 16)
+                : parseInt(name.slice(1), 10);
+            return code > 0 && code <= 0x10ffff ? String.fromCodePoint(code) : '\ufffd';
+        }
+        const decoded = NAMED_ENTITIES[name.toLowerCase()];
+        return decoded === undefined ? match : decoded;
+    });
+}
+
+function normalizeText(text) {
+    return text
+        .replace(/\r\n?/g, '\n')
+        .split('\n')
+        .map(line => line.split(/\s+/).filter(Boolean).join(' '))
+        .join('\n')
+        .replace(/\n{3,}/g, '\n\n')
+        .trim();
+}
+
+function convert(markup) {
+    let text = markup.replace(BLOCK, '\n').replace(CELL, ' ').replace(TAG, '');
+    if (text.includes('&')) text = decodeEntities(text);
+    return normalizeText(text);
+}
+
+function htmlToText(markup, maxChars = Infinity) {
+    if (!markup) return '';
+    markup = markup.replace(HIDDEN, '');
+    if (maxChars === Infinity) return convert(markup);
+
+    let window = maxChars * WINDOW_FACTOR;
+    while (window < markup.length) {
+        // Cut just after a tag so no tag is split in half
+        const cut = markup.indexOf('>', window) + 1;
+        if (!cut) break;
+        const text = convert(markup.substring(0, cut));
+        if (text.length >= maxChars) return text.substring(0, maxChars).trimEnd();
+        window *= 4;
+    }
+    return convert(markup).substring(0, maxChars).trimEnd();
+}
+
+module.exports = { htmlToText, decodeEntities, normalizeText };
@@ -0,0 +1,165 @@
+"""
+Email body extraction and HTML-to-text
+One set of rules for every sync path: text/plain parts are preferred, HTML
+parts are converted with a few regex passes (script/style/head dropped,
+entities decoded, block tags become line breaks), window by window when a
+length cap is given so conversion stops once the cap is reached. Payloads
+are decoded with the charset from their part headers (or an HTML <meta>
+tag) instead of assuming utf-8.
+"""
+
+import re
+import codecs
+import html
+
+# Content of these elements is never shown to the reader
+SKIP_TAGS = ('script', 'style', 'head', 'title', 'noscript', 'template', 'svg')
+BLOCK_TAGS = (
+    'br', 'p', 'div', 'tr', 'li', 'ul', 'ol', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'blockquote', 'pre', 'hr', 'section', 'article', 'header', 'footer', 'dt', 'dd'
+)
+
+# An unclosed <head> or <style> is usually a broken template, so only
+# complete elements are dropped and the rest of the message is kept
+HIDDEN = re.compile(r'<(%s)\b[^>]*>.*?</\1\s*>|<!--.*?(?:-->|$)' % '|'.join(SKIP_TAGS), re.S | re.I)
+HIDDEN_START = re.compile(r'<(?:%s)\b|<!--' % '|'.join(SKIP_TAGS), re.I)
+BLOCK = re.compile(r'</?(?:%s)\b[^>]*>' % '|'.join(BLOCK_TAGS), re.I)
+CELL = re.compile(r'</?t[dh]\b[^>]*>', re.I)
+TAG = re.compile(r'</?[a-zA-Z][^>]*>|<![^>]*>|<\?[^>]*>')
+BLANK_LINES = re.compile(r'\n{3,}')
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([A-Za-z0-9_:.-]+)', re.I)
+
+# First window converted when a cap is given: newsletter HTML is mostly
+# markup, so a capped conversion usually finishes on the first window
+WINDOW_FACTOR = 8
+
+# Labels mail clients send that Python either doesn't know or should widen
+# to the superset browsers actually use
+CHARSET_ALIASES = {
+    'iso-8859-1': 'cp1252',
+    'latin1': 'cp1252',
+    'us-ascii': 'utf-8',
+    'ascii': 'utf-8',
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'ks_c_5601-1987': 'cp949',
+    'unknown-8bit': 'utf-8',
+    'x-unknown': 'utf-8',
+}
+
+
+def decode_payload(payload, charset=None):
+    """Decode bytes with the declared charset, falling back to utf-8"""
+    charset = (charset or 'utf-8').strip().strip('"\'').lower()
+    charset = CHARSET_ALIASES.get(charset, charset)
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        charset = 'utf-8'
+    return payload.decode(charset, errors='replace')
+
+
+def _part_text(part):
+    payload = part.get_payload(decode=True)
+    if not payload:
+        return ""
+    charset = part.get_content_charset()
+    if not charset and part.get_content_type() == 'text/html':
+        # Fall back to <meta charset> the way a browser would
+        match = META_CHARSET.search(payload, 0, 2048)
+        if match:
+            charset = match.group(1).decode('ascii')
+    return decode_payload(payload, charset)
+
+
+def normalize_text(text):
+    """Collapse whitespace within lines and runs of blank lines, keeping line structure"""
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = '\n'.join(' '.join(line.split()) for line in text.split('\n'))
+    return BLANK_LINES.sub('\n\n', text).strip()
+
+
+def _strip_tags(markup):
+    markup = BLOCK.sub('\n', markup)
+    markup = CELL.sub(' ', markup)
+    markup = TAG.sub('', markup)
+    if '&' in markup:
+        markup = html.unescape(markup)
+    return markup
+
+
+def _convert(markup):
+    return normalize_text(_strip_tags(markup))
+
+
+def _next_hidden(markup, start, end):
+    """The first hidden element starting in markup[start:end] (it may end past ``end``), or None"""
+    for opening in HIDDEN_START.finditer(markup, start, end):
+        match = HIDDEN.match(markup, opening.start())
+        if match:
+            return match
+    return None
+
+
+def html_to_text(markup, max_chars=None):
+    """
+    Convert HTML to readable text.
+
+    With ``max_chars`` the document is converted window by window (each
+    window cut just after a tag, hidden elements dropped as they are
+    reached) and conversion stops once enough text has been produced, so
+    the markup after that point is never scanned or converted.
+    """
+    if not markup:
+        return ""
+    if max_chars is None:
+        return _convert(HIDDEN.sub('', markup))
+
+    pieces = []
+    visible_chars = 0  # Non-whitespace characters so far: a lower bound on the normalized length
+    window = max_chars * WINDOW_FACTOR
+    position = 0
+    while position < len(markup) and visible_chars < max_chars:
+        cut = len(markup)
+        if cut - position > window:
+            # Cut just after a tag so no tag or entity is split in half
+            cut = markup.find('>', position + window) + 1 or len(markup)
+            window *= 2
+        resume = cut
+        hidden = _next_hidden(markup, position, cut)
+        if hidden:
+            cut, resume = hidden.start(), hidden.end()
+        piece = _strip_tags(markup[position:cut])
+        pieces.append(piece)
+        visible_chars += sum(map(len, piece.split()))
+        position = resume
+    return normalize_text(''.join(pieces))[:max_chars].rstrip()
+
+
+def extract_body(msg, max_chars=None):
+    """
+    Readable body of an email.message.Message: the text/plain parts joined,
+    or the first text/html part converted to text. Attachments are skipped.
+    """
+    plain_parts = []
+    html_part = None
+    for part in msg.walk():
+        if part.is_multipart() or part.get_content_disposition() == 'attachment':
+            continue
+        content_type = part.get_content_type()
+        if content_type == 'text/plain':
+            plain_parts.append(part)
+        elif content_type == 'text/html' and html_part is None:
+            html_part = part
+
+    if plain_parts:
+        body = ""
+        for part in plain_parts:
+            body += _part_text(part)
+            if max_chars is not None and len(body) >= max_chars:
+                break
+        body = normalize_text(body)
+        return body[:max_chars].rstrip() if max_chars is not None else body
+    if html_part is not None:
+        return html_to_text(_part_text(html_part), max_chars)
+    return ""
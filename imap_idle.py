@@ -0,0 +1,255 @@
+"""
+IMAP IDLE push engine
+Keeps one authenticated connection per mailbox parked in IDLE (RFC 2177) and
+fetches new mail as soon as the server announces it with an EXISTS response.
+"""
+
+import random
+import re
+import select
+import ssl
+import threading
+import time
+import logging
+from config import IDLE_TIMEOUT, IDLE_POLL_INTERVAL, RECONNECT_DELAY
+from imap_throttle import backoff_delay
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Servers drop IDLE after 30 minutes (RFC 2177), so always renew before that
+MAX_IDLE_SECONDS = 29 * 60
+
+EXISTS_RESPONSE = re.compile(rb'^\* (\d+) EXISTS')
+
+
+class IdleWatcher:
+    """
+    Watches a single mailbox over one persistent IMAP connection.
+
+    Uses IDLE when the server advertises it and falls back to NOOP polling
+    otherwise. ``on_new_mail(mail, account)`` is called on the live connection
+    whenever new messages arrive, and once after every (re)connect to catch up.
+    """
+
+    def __init__(self, account, connect, on_new_mail, idle_timeout=IDLE_TIMEOUT,
+                 poll_interval=IDLE_POLL_INTERVAL, reconnect_delay=RECONNECT_DELAY):
+        self.account = account
+        self.connect = connect
+        self.on_new_mail = on_new_mail
+        self.idle_timeout = min(idle_timeout, MAX_IDLE_SECONDS)
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self.mail = None
+        self.running = True
+        self.stats = {
+            'mode': None,
+            'connects': 0,
+            'idle_renewals': 0,
+            'exists_events': 0,
+            'last_event_at': None
+        }
+
+    def stop(self):
+        """Ask the watcher to leave IDLE and disconnect"""
+        self.running = False
+
+    def run(self):
+        """Main loop: connect, catch up, then wait for new mail until stopped"""
+        failures = 0
+        while self.running:
+            self.mail = self.connect(self.account)
+            if not self.mail:
+                failures += 1
+                self._backoff(failures)
+                continue
+
+            failures = 0
+            self.stats['connects'] += 1
+            try:
+                # Catch up on anything that arrived while we were disconnected
+                self.on_new_mail(self.mail, self.account)
+
+                if 'IDLE' in self.mail.capabilities:
+                    self.stats['mode'] = 'idle'
+                    self._idle_loop()
+                else:
+                    self.stats['mode'] = 'poll'
+                    self._poll_loop()
+
+            except Exception as e:
+                logging.error(f"IDLE watcher error for {self.account['email']}: {e}")
+                failures += 1
+            finally:
+                self._disconnect()
+
+            if self.running and failures:
+                self._backoff(failures)
+
+    def _idle_loop(self):
+        """Park the connection in IDLE, renewing it before the server timeout"""
+        logging.info(f"📬 IDLE push active for {self.account['email']}")
+        while self.running:
+            tag = self._start_idle()
+            new_mail = self._wait_in_idle()
+            new_mail = self._finish_idle(tag) or new_mail
+
+            if new_mail:
+                self.stats['exists_events'] += 1
+                self.stats['last_event_at'] = time.time()
+                self.on_new_mail(self.mail, self.account)
+            else:
+                self.stats['idle_renewals'] += 1
+
+    def _start_idle(self):
+        """Send IDLE and wait for the server's continuation response"""
+        tag = self.mail._new_tag()
+        self.mail.send(tag + b' IDLE\r\n')
+        while True:
+            line = self.mail.readline()
+            if not line:
+                raise ConnectionError("Connection closed while entering IDLE")
+            if line.startswith(b'+'):
+                return tag
+            if line.startswith(tag):
+                raise ConnectionError(f"Server rejected IDLE: {line.strip()!r}")
+            # Untagged data sent before the continuation is harmless; keep reading
+
+    def _wait_in_idle(self):
+        """Block until EXISTS arrives, the IDLE window expires or we are stopped"""
+        deadline = time.time() + self.idle_timeout
+        while self.running and time.time() < deadline:
+            # Wake up at least once a second so stop() is honoured promptly
+            if not self._wait_readable(min(1.0, deadline - time.time())):
+                continue
+
+            line = self.mail.readline()
+            if not line:
+                raise ConnectionError("Connection closed during IDLE")
+            if line.startswith(b'* BYE'):
+                raise ConnectionError(f"Server closed IDLE: {line.strip()!r}")
+            if EXISTS_RESPONSE.match(line):
+                return True
+        return False
+
+    def _finish_idle(self, tag):
+        """Send DONE and drain responses up to the tagged completion"""
+        self.mail.send(b'DONE\r\n')
+        new_mail = False
+        while True:
+            line = self.mail.readline()
+            if not line:
+                raise ConnectionError("Connection closed while leaving IDLE")
+            if EXISTS_RESPONSE.match(line):
+                new_mail = True
+            if line.startswith(tag):
+                if b' OK' not in line:
+                    raise ConnectionError(f"IDLE ended abnormally: {line.strip()!r}")
+                return new_mail
+
+    def _wait_readable(self, timeout):
+        """Return True when a line can be read without blocking on the socket"""
+        if self._buffered():
+            return True
+        sock = self.mail.sock
+        readable, _, _ = select.select([sock], [], [], max(timeout, 0))
+        return bool(readable)
+
+    def _buffered(self):
+        """
+        Data already read off the socket but not yet consumed. imaplib reads
+        through a buffered file, so when ``+ idling`` and ``* N EXISTS`` (or
+        EXPUNGE and EXISTS) arrive in one packet the second line sits in that
+        buffer where select() can't see it. A non-blocking peek returns what
+        is buffered, pulling in anything the socket or TLS layer already holds.
+        """
+        reader = getattr(self.mail, 'file', None)
+        if reader is None or not hasattr(reader, 'peek'):
+            sock = self.mail.sock
+            return bool(hasattr(sock, 'pending') and sock.pending())
+        sock = self.mail.sock
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            return bool(reader.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def _poll_loop(self):
+        """NOOP polling for servers without IDLE support"""
+        logging.info(f"📭 {self.account['email']} does not support IDLE, polling every {self.poll_interval}s")
+        self.mail.response('EXISTS')  # Discard the count reported by SELECT
+        while self.running:
+            for _ in range(self.poll_interval):
+                if not self.running:
+                    return
+                time.sleep(1)
+
+            self.mail.noop()
+            if self.mail.response('EXISTS')[1] not in (None, [None]):
+                self.stats['exists_events'] += 1
+                self.stats['last_event_at'] = time.time()
+                self.on_new_mail(self.mail, self.account)
+
+    def _backoff(self, failures):
+        """Exponential backoff with jitter so many mailboxes never reconnect in lockstep"""
+        delay = backoff_delay(failures, cap=self.reconnect_delay)
+        logging.warning(f"Reconnecting to {self.account['email']} in {delay:.1f} seconds...")
+        slept = 0.0
+        while self.running and slept < delay:
+            time.sleep(min(1.0, delay - slept))
+            slept += 1.0
+
+    def _disconnect(self):
+        if not self.mail:
+            return
+        try:
+            self.mail.logout()
+        except Exception:
+            pass
+        self.mail = None
+
+
+class IdlePushEngine:
+    """Runs one IdleWatcher thread per account"""
+
+    def __init__(self, connect, on_new_mail, startup_spread=5.0):
+        self.connect = connect
+        self.on_new_mail = on_new_mail
+        self.startup_spread = startup_spread
+        self.watchers = {}
+        self.threads = []
+
+    def start(self, accounts):
+        """Start watching every account, spreading logins over a short window"""
+        for account in accounts:
+            watcher = IdleWatcher(account, self._staggered_connect(), self.on_new_mail)
+            thread = threading.Thread(target=watcher.run, daemon=True)
+            thread.start()
+            self.watchers[account['email']] = watcher
+            self.threads.append(thread)
+            logging.info(f"Started IDLE watcher for {account['email']}")
+
+    def _staggered_connect(self):
+        """Delay only the first login of each watcher to avoid a login storm at startup"""
+        state = {'first': True}
+
+        def connect(account):
+            if state['first']:
+                state['first'] = False
+                time.sleep(random.uniform(0, self.startup_spread))
+            return self.connect(account)
+
+        return connect
+
+    def stop(self, timeout=5):
+        """Stop all watchers and wait briefly for them to log out"""
+        for watcher in self.watchers.values():
+            watcher.stop()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def get_stats(self):
+        """Per-account watcher statistics"""
+        return {email: dict(watcher.stats) for email, watcher in self.watchers.items()}
@@ -0,0 +1,214 @@
+"""
+Reusable IMAP connection pool
+Keeps authenticated sessions alive between sync cycles so an account is not
+put through a TLS handshake and LOGIN every few minutes. Idle sessions are
+checked with NOOP before reuse, evicted after sitting unused too long, and
+the total number of open sockets is capped across all accounts.
+"""
+
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from imap_throttle import imap_call
+from config import IMAP_POOL_MAX_CONNECTIONS, IMAP_POOL_IDLE_TIMEOUT, IMAP_POOL_HEALTH_CHECK_AFTER, IMAP_POOL_WAIT
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def _logout(mail):
+    """Log out without CLOSE (no implicit expunge), ignoring errors"""
+    try:
+        mail.logout()
+    except Exception:
+        pass
+
+
+class IMAPConnectionPool:
+    """
+    Authenticated imaplib connections keyed by account.
+
+    ``connect(account)`` opens and logs in a new connection (or returns
+    None). checkout() hands out an idle session for the account when one is
+    healthy, else a new one; checkin() returns it for the next cycle. An
+    account can hold several sessions (parallel backfill), all counted
+    against ``max_connections``.
+    """
+
+    def __init__(self, connect, max_connections=IMAP_POOL_MAX_CONNECTIONS,
+                 idle_timeout=IMAP_POOL_IDLE_TIMEOUT, health_check_after=IMAP_POOL_HEALTH_CHECK_AFTER,
+                 wait_timeout=IMAP_POOL_WAIT):
+        self.connect = connect
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.wait_timeout = wait_timeout
+        self._idle = {}  # account key -> deque of (mail, fingerprint, idle_since), most recent last
+        self._open = 0
+        self._cond = threading.Condition()
+        self.stats = {
+            'created': 0,
+            'reused': 0,
+            'health_checks': 0,
+            'health_failures': 0,
+            'evicted_idle': 0,
+            'evicted_for_capacity': 0,
+            'discarded': 0,
+            'waits': 0
+        }
+
+    def _key(self, account):
+        return account.get('id') or account['email']
+
+    def _fingerprint(self, account):
+        """Sessions are only reused while the account's server and credentials are unchanged"""
+        parts = (account.get('imap_host') or account.get('imap_server'), account.get('imap_port'),
+                 account['email'], account.get('password'))
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def checkout(self, account):
+        """A logged-in connection for ``account`` (reused when possible), or None"""
+        key, fingerprint = self._key(account), self._fingerprint(account)
+        while True:
+            mail = self._take_idle(key, fingerprint)
+            if mail is None:
+                break
+            if self._healthy(mail):
+                self._count('reused')
+                return mail
+            self._close(mail)
+
+        if not self._reserve_slot():
+            logging.warning(f"🔌 IMAP pool full ({self.max_connections} connections), skipping {account['email']}")
+            return None
+        try:
+            mail = self.connect(account)
+        except Exception as e:
+            logging.error(f"Failed to connect to IMAP for {account['email']}: {e}")
+            mail = None
+        if mail is None:
+            self._release_slot()
+            return None
+        mail._pool_fingerprint = fingerprint
+        self._count('created')
+        return mail
+
+    def checkin(self, account, mail, healthy=True):
+        """Return a connection after use; unhealthy ones (errors, aborted sockets) are closed"""
+        if mail is None:
+            return
+        if not healthy:
+            self._count('discarded')
+            self._close(mail)
+            return
+        with self._cond:
+            fingerprint = getattr(mail, '_pool_fingerprint', None)
+            self._idle.setdefault(self._key(account), deque()).append((mail, fingerprint, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, account, mail):
+        self.checkin(account, mail, healthy=False)
+
+    def evict_idle(self):
+        """Log out sessions that sat unused longer than ``idle_timeout``; returns how many"""
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._cond:
+            for key in list(self._idle):
+                sessions = self._idle[key]
+                while sessions and sessions[0][2] < cutoff:
+                    expired.append(sessions.popleft()[0])
+                if not sessions:
+                    del self._idle[key]
+        for mail in expired:
+            self._close(mail)
+        self._count('evicted_idle', len(expired))
+        return len(expired)
+
+    def close_all(self):
+        with self._cond:
+            sessions = [entry[0] for idle in self._idle.values() for entry in idle]
+            self._idle.clear()
+        for mail in sessions:
+            self._close(mail)
+
+    def get_stats(self):
+        with self._cond:
+            idle = sum(len(sessions) for sessions in self._idle.values())
+            return dict(self.stats, open=self._open, idle=idle, in_use=self._open - idle)
+
+    def _count(self, name, amount=1):
+        with self._cond:
+            self.stats[name] += amount
+
+    def _take_idle(self, key, fingerprint):
+        """Most recently used idle session for the account (stale credentials are dropped)"""
+        while True:
+            with self._cond:
+                sessions = self._idle.get(key)
+                if not sessions:
+                    return None
+                mail, session_fingerprint, idle_since = sessions.pop()
+                if not sessions:
+                    del self._idle[key]
+            if session_fingerprint != fingerprint:
+                self._close(mail)
+                continue
+            mail._pool_idle_since = idle_since
+            return mail
+
+    def _healthy(self, mail):
+        """NOOP sessions that have been idle a while; the server may have dropped them"""
+        if time.monotonic() - mail._pool_idle_since < self.health_check_after:
+            return True
+        self._count('health_checks')
+        try:
+            status, _ = imap_call(mail, mail.noop)
+            if status == 'OK':
+                return True
+        except Exception:
+            pass
+        self._count('health_failures')
+        return False
+
+    def _reserve_slot(self):
+        """Count a new socket against the cap, evicting the least recently used idle session if full"""
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            while self._open >= self.max_connections:
+                victim = self._pop_lru_idle()
+                if victim is not None:
+                    self._open -= 1
+                    self.stats['evicted_for_capacity'] += 1
+                    threading.Thread(target=_logout, args=(victim,), daemon=True).start()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._open += 1
+            return True
+
+    def _pop_lru_idle(self):
+        # Called with the lock held
+        oldest_key = None
+        for key, sessions in self._idle.items():
+            if sessions and (oldest_key is None or sessions[0][2] < self._idle[oldest_key][0][2]):
+                oldest_key = key
+        if oldest_key is None:
+            return None
+        mail = self._idle[oldest_key].popleft()[0]
+        if not self._idle[oldest_key]:
+            del self._idle[oldest_key]
+        return mail
+
+    def _release_slot(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def _close(self, mail):
+        _logout(mail)
+        self._release_slot()
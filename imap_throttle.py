@@ -0,0 +1,255 @@
+"""
+Per-host IMAP rate limiting and adaptive throttling
+Every IMAP host gets token buckets for logins, commands and downloaded
+bytes. A throttle response (NO [THROTTLED], "too many connections", BYE...)
+puts the whole host on hold with jittered exponential backoff and halves its
+rates, which recover again as commands succeed. Counters show where the
+time went: waiting for tokens, backing off, or doing work.
+"""
+
+import re
+import time
+import random
+import imaplib
+import logging
+import threading
+from config import (
+    IMAP_LOGIN_RATE, IMAP_LOGIN_BURST, IMAP_COMMAND_RATE, IMAP_COMMAND_BURST,
+    IMAP_BYTES_RATE, IMAP_BYTES_BURST, IMAP_RETRY_LIMIT, IMAP_BACKOFF_BASE,
+    IMAP_BACKOFF_MAX, PROVIDER_RATE_LIMITS
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Response text providers use when they want clients to slow down
+THROTTLE_RESPONSE = re.compile(
+    r'\[THROTTLED\]|\[LIMIT\]|\[UNAVAILABLE\]|\[INUSE\]'
+    r'|too many (?:simultaneous |concurrent |open )?connections|rate limit|try again later'
+    r'|bandwidth limits?(?: exceeded)?|command or bandwidth limits|temporarily unavailable|server busy',
+    re.I
+)
+# Failures that waiting will not fix, whatever else their text says
+NOT_THROTTLE_RESPONSE = re.compile(r'\[(?:AUTHENTICATIONFAILED|AUTHORIZATIONFAILED|OVERQUOTA)\]', re.I)
+
+# Rates never drop below this fraction of the configured limit
+MIN_RATE_SCALE = 0.1
+# Fraction of the configured rate regained per successful command
+RATE_RECOVERY = 0.05
+
+
+def backoff_delay(attempt, base=IMAP_BACKOFF_BASE, cap=IMAP_BACKOFF_MAX):
+    """Exponential backoff with jitter so many clients never retry in lockstep"""
+    delay = min(cap, base * 2 ** min(attempt, 16))
+    return random.uniform(delay / 2, delay)
+
+
+def is_throttle_response(text):
+    if isinstance(text, (list, tuple)):
+        text = b' '.join(part for part in text if isinstance(part, bytes))
+    if isinstance(text, bytes):
+        text = text.decode(errors='replace')
+    text = text or ''
+    return bool(THROTTLE_RESPONSE.search(text)) and not NOT_THROTTLE_RESPONSE.search(text)
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations instead of blocking: reserve()
+    takes the tokens (possibly going into debt) and returns how long the
+    caller must wait before using them
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.scale = 1.0
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        if self.rate <= 0:
+            return 0.0  # Unlimited
+        with self._lock:
+            now = time.monotonic()
+            rate = self.rate * self.scale
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / rate if self.tokens < 0 else 0.0
+
+
+class HostThrottle:
+    """Login, command and byte limits plus adaptive backoff for one IMAP host"""
+
+    KINDS = ('login', 'command', 'bytes')
+    COUNTERS = {'login': 'logins', 'command': 'commands', 'bytes': 'bytes'}
+
+    def __init__(self, host, login_rate=IMAP_LOGIN_RATE, login_burst=IMAP_LOGIN_BURST,
+                 command_rate=IMAP_COMMAND_RATE, command_burst=IMAP_COMMAND_BURST,
+                 bytes_rate=IMAP_BYTES_RATE, bytes_burst=IMAP_BYTES_BURST,
+                 retry_limit=IMAP_RETRY_LIMIT, backoff_base=IMAP_BACKOFF_BASE,
+                 backoff_max=IMAP_BACKOFF_MAX):
+        self.host = host
+        self.buckets = {
+            'login': TokenBucket(login_rate, login_burst),
+            'command': TokenBucket(command_rate, command_burst),
+            'bytes': TokenBucket(bytes_rate, bytes_burst)
+        }
+        self.retry_limit = retry_limit
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hold_until = 0.0
+        self.level = 0  # Consecutive throttle signals
+        self.scale = 1.0
+        self._lock = threading.Lock()
+        self.counters = {
+            'logins': 0,
+            'commands': 0,
+            'bytes': 0,
+            'throttled': 0,
+            'retries': 0,
+            'wait_seconds': {kind: 0.0 for kind in self.KINDS},
+            'backoff_seconds': 0.0
+        }
+
+    def delay(self, kind, amount=1):
+        """
+        Take ``amount`` tokens of ``kind`` and return the seconds to wait
+        before going ahead (for callers that sleep themselves, e.g. asyncio)
+        """
+        wait = self.buckets[kind].reserve(amount)
+        with self._lock:
+            wait = max(wait, self.hold_until - time.monotonic())
+            self.counters[self.COUNTERS[kind]] += amount
+            if wait > 0:
+                self.counters['wait_seconds'][kind] += wait
+        return max(wait, 0.0)
+
+    def acquire(self, kind, amount=1):
+        """Blocking form of delay()"""
+        wait = self.delay(kind, amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self, reason=''):
+        """The server pushed back: hold the host and slow every bucket down"""
+        with self._lock:
+            delay = backoff_delay(self.level, self.backoff_base, self.backoff_max)
+            self.level += 1
+            self.hold_until = max(self.hold_until, time.monotonic() + delay)
+            self.scale = max(MIN_RATE_SCALE, self.scale / 2)
+            for bucket in self.buckets.values():
+                bucket.scale = self.scale
+            self.counters['throttled'] += 1
+            self.counters['backoff_seconds'] += delay
+        logging.warning(f"🐢 {self.host} throttled ({str(reason)[:80]}); backing off {delay:.1f}s, rate at {self.scale:.0%}")
+        return delay
+
+    def retried(self):
+        with self._lock:
+            self.counters['retries'] += 1
+
+    def succeeded(self):
+        if self.level == 0 and self.scale >= 1.0:
+            return
+        with self._lock:
+            self.level = 0
+            self.scale = min(1.0, self.scale + RATE_RECOVERY)
+            for bucket in self.buckets.values():
+                bucket.scale = self.scale
+
+    def call(self, fn, *args, kind='command'):
+        """
+        Run one blocking imaplib call under the host's limits. Throttle
+        responses (raised or returned as NO) are retried with backoff. An
+        abort (BYE or dropped connection) is re-raised, since that connection
+        cannot be reused; it only holds the host if it says the server is
+        throttling, so one flaky or timed-out account never slows a shared
+        host down for everyone.
+        """
+        for attempt in range(self.retry_limit + 1):
+            self.acquire(kind)
+            try:
+                result = fn(*args)
+            except imaplib.IMAP4.abort as e:
+                if is_throttle_response(str(e)):
+                    self.throttled(e)
+                raise
+            except imaplib.IMAP4.error as e:
+                if attempt == self.retry_limit or not is_throttle_response(str(e)):
+                    raise
+                self.throttled(e)
+                self.retried()
+                continue
+            if (isinstance(result, tuple) and len(result) == 2 and result[0] == 'NO'
+                    and is_throttle_response(result[1]) and attempt < self.retry_limit):
+                self.throttled(result[1])
+                self.retried()
+                continue
+            self.succeeded()
+            return result
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['wait_seconds'] = {kind: round(value, 3) for kind, value in self.counters['wait_seconds'].items()}
+            stats['backoff_seconds'] = round(self.counters['backoff_seconds'], 3)
+            stats['rate_scale'] = round(self.scale, 3)
+            stats['on_hold'] = round(max(0.0, self.hold_until - time.monotonic()), 3)
+        return stats
+
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+def get_throttle(host):
+    """Shared HostThrottle for an IMAP host (or connection object with .host)"""
+    if not isinstance(host, str):
+        host = getattr(host, 'host', '') or ''
+    host = host.lower()
+    with _throttles_lock:
+        throttle = _throttles.get(host)
+        if throttle is None:
+            overrides = next(
+                (limits for suffix, limits in PROVIDER_RATE_LIMITS.items() if host.endswith(suffix)), {}
+            )
+            throttle = _throttles[host] = HostThrottle(host, **overrides)
+        return throttle
+
+
+def imap_call(host, fn, *args, kind='command'):
+    """Run ``fn(*args)`` under ``host``'s limits, see HostThrottle.call"""
+    return get_throttle(host).call(fn, *args, kind=kind)
+
+
+def charge_bytes(host, amount):
+    """Account for downloaded bytes, sleeping if the host's byte budget is spent"""
+    if amount:
+        get_throttle(host).acquire('bytes', amount)
+
+
+def open_imap(host, port, user, password, use_ssl=True, timeout=None):
+    """Open and log in to an IMAP connection under the host's login limit"""
+    def connect():
+        mail = (imaplib.IMAP4_SSL if use_ssl else imaplib.IMAP4)(host, port, timeout=timeout)
+        try:
+            mail.login(user, password)
+        except Exception:
+            try:
+                mail.shutdown()
+            except Exception:
+                pass
+            raise
+        return mail
+
+    return imap_call(host, connect, kind='login')
+
+
+def get_throttle_stats():
+    """Counters per IMAP host"""
+    with _throttles_lock:
+        throttles = list(_throttles.values())
+    return {throttle.host: throttle.get_stats() for throttle in throttles}
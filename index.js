@@ -11,6 +11,8 @@ const database = require('./models')
 const { generateToken, authenticateToken, requireAuth } = require('./auth')
 const Imap = require('imap')
 const { simpleParser } = require('mailparser')
+const { htmlToText } = require('./htmlText')
+const { SyncQueue, describeJob, ON_DEMAND, PERIODIC } = require('./syncQueue')
 
 let app = express()
 
@@ -27,18 +29,26 @@ app.use(cookieParser())
 let emailSyncStarted = false
 let activeImapConnections = new Map()
 
-async function syncEmailsForUser(userId) {
+// One queued or running sync per account; on-demand requests jump ahead of periodic ones
+const syncQueue = new SyncQueue(syncEmailsFromAccount, {
+    concurrency: parseInt(process.env.SYNC_JOB_WORKERS) || 2
+})
+
+// Queue a sync of all of a user's accounts and return the job without waiting
+async function queueUserSync(userId, priority = PERIODIC) {
+    const accounts = await database.getUserEmailAccounts(userId)
+    return syncQueue.enqueue(userId, accounts, { priority })
+}
+
+async function syncEmailsForUser(userId, { priority = PERIODIC } = {}) {
     try {
         console.log(`📧 Starting email sync for user ${userId}`)
         
-        // Get user's email accounts
-        const accounts = await database.getUserEmailAccounts(userId)
-        
-        for (const account of accounts) {
-            await syncEmailsFromAccount(userId, account)
-        }
+        const job = await queueUserSync(userId, priority)
+        await job.promise
         
         console.log(`✅ Email sync completed for user ${userId}`)
+        return job
     } catch (error) {
         console.error(`❌ Email sync error for user ${userId}:`, error.message)
     }
@@ -212,11 +222,10 @@ function startEmailSyncService() {
             console.log("🔄 Running scheduled email sync...")
             const users = await database.getAllUsers()
             
-            for (const user of users) {
-                await syncEmailsForUser(user.id)
-            }
+            // Accounts still syncing from the last tick or an on-demand request are joined, not restarted
+            await Promise.all(users.map(user => syncEmailsForUser(user.id)))
             
-            console.log(`✅ Scheduled sync completed for ${users.length} users`)
+            console.log(`✅ Scheduled sync completed for ${users.length} users`, syncQueue.getStats())
         } catch (error) {
             console.error('❌ Email sync interval error:', error.message)
         }
@@ -410,7 +419,7 @@ app.post('/api/accounts/add', authenticateToken, async (req, res) => {
         // Start sync in background
         setTimeout(async () => {
             try {
-                await syncEmailsForUser(req.user.id)
+                await syncEmailsForUser(req.user.id, { priority: ON_DEMAND })
                 console.log(`✅ Initial sync completed for user ${req.user.id}`)
             } catch (syncError) {
                 console.error(`❌ Initial sync failed for user ${req.user.id}:`, syncError.message)
@@ -466,6 +475,7 @@ app.delete('/api/accounts/:id', authenticateToken, async (req, res) => {
 app.get('/api/emails', authenticateToken, async (req, res) => {
     try {
         const { category, limit } = req.query
+        database.touchUserActivity(req.user.id)
         
         let emails
         if (category) {
@@ -710,12 +720,21 @@ app.post('/api/sync-emails', authenticateToken, async (req, res) => {
     try {
         console.log(`📧 Manual sync request for user ${req.user.id}`)
         
-        // Trigger email sync for this user
-        await syncEmailsForUser(req.user.id)
+        // Queued ahead of periodic syncs; joins a sync of the same accounts already in progress
+        const job = await queueUserSync(req.user.id, ON_DEMAND)
+        if (req.body.wait === false || req.query.wait === 'false') {
+            return res.status(202).json({
+                success: true,
+                message: 'Email sync queued',
+                ...describeJob(job)
+            })
+        }
+        await job.promise
         
         res.json({
             success: true,
-            message: 'Email sync completed successfully'
+            message: 'Email sync completed successfully',
+            ...describeJob(job)
         })
         
     } catch (error) {
@@ -731,6 +750,7 @@ app.post('/api/sync-emails', authenticateToken, async (req, res) => {
 app.post('/fetch-emails', authenticateToken, async (req, res) => {
     try {
         const { subject, category, account, total = 100, sortBy = 'date_desc', fromDate, toDate } = req.body;
+        database.touchUserActivity(req.user.id);
         
         // Use the new search function
         const searchParams = {
@@ -783,6 +803,8 @@ app.get('/', (req, res) => {
 // Dashboard (for authenticated users)
 app.get('/dashboard', requireAuth, async (req, res) => {
     try {
+        database.touchUserActivity(req.user.id)
+        
         // Get user's email accounts and recent emails
         const accounts = await database.getUserEmailAccounts(req.user.id)
         
@@ -934,26 +956,10 @@ ${req.user.name}`,
 function extractTextFromHTML(htmlContent) {
     if (!htmlContent) return '';
     
-    // Remove HTML tags and decode entities
-    let text = htmlContent
-        .replace(/<script[^>]*>.*?<\/script>/gi, '') // Remove scripts
-        .replace(/<style[^>]*>.*?<\/style>/gi, '') // Remove styles
-        .replace(/<[^>]*>/g, ' ') // Remove HTML tags
-        .replace(/&nbsp;/g, ' ') // Replace non-breaking spaces
-        .replace(/&amp;/g, '&') // Decode ampersands
-        .replace(/&lt;/g, '<') // Decode less than
-        .replace(/&gt;/g, '>') // Decode greater than
-        .replace(/&quot;/g, '"') // Decode quotes
-        .replace(/&#39;/g, "'") // Decode apostrophes
-        .replace(/\s+/g, ' ') // Collapse multiple spaces
-        .trim();
-    
-    // Limit to reasonable length for AI analysis (first 2000 characters)
-    if (text.length > 2000) {
-        text = text.substring(0, 2000) + '...';
-    }
-    
-    return text;
+    // Limit to reasonable length for AI analysis (first 2000 characters);
+    // the scanner stops as soon as it has that much text
+    const text = htmlToText(htmlContent, 2001);
+    return text.length > 2000 ? text.substring(0, 2000) + '...' : text;
 }
 
 // OpenAI integration function with enhanced RAG
@@ -1463,7 +1469,7 @@ app.post('/api/setup-email-accounts', authenticateToken, async (req, res) => {
         console.log(`🚀 Starting immediate email sync for user ${userId}`)
         setTimeout(async () => {
             try {
-                await syncEmailsForUser(userId)
+                await syncEmailsForUser(userId, { priority: ON_DEMAND })
                 console.log(`✅ Initial email sync completed for user ${userId}`)
             } catch (syncError) {
                 console.error(`❌ Email sync failed for user ${userId}:`, syncError.message)
@@ -1487,12 +1493,22 @@ app.post('/api/manual-sync', authenticateToken, async (req, res) => {
     try {
         console.log("🔄 Manual sync triggered by user:", req.user.id)
         
-        await syncEmailsForUser(req.user.id)
+        const job = await queueUserSync(req.user.id, ON_DEMAND)
+        if (req.body.wait === false || req.query.wait === 'false') {
+            return res.status(202).json({
+                success: true,
+                message: "Email sync queued",
+                timestamp: new Date().toISOString(),
+                ...describeJob(job)
+            })
+        }
+        await job.promise
         
         res.json({
             success: true,
             message: "Email sync completed successfully",
-            timestamp: new Date().toISOString()
+            timestamp: new Date().toISOString(),
+            ...describeJob(job)
         })
     } catch (error) {
         console.error("❌ Manual sync error:", error)
@@ -1503,6 +1519,15 @@ app.post('/api/manual-sync', authenticateToken, async (req, res) => {
     }
 })
 
+// Status of a sync job started with { wait: false }
+app.get('/api/sync-jobs/:jobId', authenticateToken, (req, res) => {
+    const job = syncQueue.getJob(req.params.jobId)
+    if (!job || job.userId !== req.user.id) {
+        return res.status(404).json({ success: false, error: 'Sync job not found' })
+    }
+    res.json({ success: true, ...describeJob(job) })
+})
+
 // Quick login helper endpoint for development
 app.post('/api/quick-login', async (req, res) => {
     try {
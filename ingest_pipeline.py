@@ -0,0 +1,275 @@
+"""
+Staged email ingest pipeline
+Decouples IMAP fetch from MIME parsing, classification, storage and
+notifications. Stages are connected by bounded queues and each has its own
+worker threads, so a slow LLM call or Slack post no longer keeps the IMAP
+connection idle; when a downstream stage falls behind, upstream puts block
+(backpressure) and the blocked time is reported in the metrics.
+"""
+
+import queue
+import threading
+import time
+import logging
+from config import (
+    INGEST_QUEUE_SIZE, INGEST_PARSE_WORKERS, INGEST_CLASSIFY_WORKERS,
+    INGEST_PERSIST_WORKERS, INGEST_NOTIFY_WORKERS
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+_STOP = object()
+
+
+def _finish_item(item):
+    callback = item.pop('on_done', None)
+    if callback:
+        try:
+            callback()
+        except Exception as e:
+            logging.warning(f"Ingest completion callback failed: {e}")
+
+
+class NewMailProgress:
+    """
+    New-mail UIDs of one account on their way through the ingest pipeline.
+    ``last_uid`` only moves past a UID once it and every lower queued UID
+    have been stored, so a crash or stop never skips unstored mail.
+    """
+
+    def __init__(self, last_uid):
+        self.last_uid = last_uid
+        self.pending = set()  # Queued, not stored yet
+        self.stored = set()  # Stored, but above a lower UID that is not
+        self.failed = set()  # Storing failed: fetched again next cycle
+
+    def skip(self):
+        """UIDs above last_uid that must not be fetched again"""
+        return self.pending | self.stored
+
+    def queued(self, uid):
+        self.pending.add(uid)
+        self.failed.discard(uid)
+
+    def finished(self, uid, stored):
+        """Record an ingested UID; returns True if last_uid moved"""
+        self.pending.discard(uid)
+        (self.stored if stored else self.failed).add(uid)
+        blocking = min(self.pending | self.failed, default=None)
+        done = {u for u in self.stored if blocking is None or u < blocking}
+        if not done:
+            return False
+        self.last_uid = max(self.last_uid, max(done))
+        self.stored -= done
+        return True
+
+
+class PipelineStage:
+    """
+    One pipeline stage: a bounded input queue drained by ``workers`` threads.
+
+    ``handler(item)`` returns the item to pass downstream, or None to drop it.
+    With ``batch_size`` > 1 the handler receives a list of up to that many
+    queued items and returns a list (None entries are dropped).
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=INGEST_QUEUE_SIZE, batch_size=1):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next_stage = None
+        self.on_finished = None
+        self.finishes_items = False
+        self.threads = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._inflight = 0
+        self.metrics = {
+            'processed': 0,
+            'errors': 0,
+            'busy_seconds': 0.0,
+            'blocked_put_seconds': 0.0,  # Time producers waited on a full queue
+            'max_depth': 0
+        }
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'ingest-{self.name}-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, item):
+        """Enqueue an item, blocking while the stage is at capacity"""
+        with self._lock:
+            self._inflight += 1
+        started = time.monotonic()
+        self.queue.put(item)
+        waited = time.monotonic() - started
+        with self._lock:
+            self.metrics['blocked_put_seconds'] += waited
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], self.queue.qsize())
+
+    def stop(self):
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join(5)
+        self.threads = []
+
+    def wait_idle(self, timeout=None):
+        """Wait until every item put into this stage has been handled"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _work(self):
+        while True:
+            items, stop = self._take()
+            if items:
+                self._handle(items)
+            if stop:
+                return
+
+    def _take(self):
+        """Block for one item, then grab whatever else is queued up to batch_size"""
+        item = self.queue.get()
+        if item is _STOP:
+            return [], True
+        items = [item]
+        while len(items) < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _handle(self, items):
+        started = time.monotonic()
+        results = []
+        failed = 0
+        try:
+            if self.batch_size > 1:
+                results = self.handler(items)
+                failed = sum(1 for result in results if result is None)
+            else:
+                results = [self.handler(items[0])]
+        except Exception as e:
+            failed = len(items)
+            logging.error(f"❌ Ingest stage '{self.name}' failed: {e}")
+
+        if self.on_finished:
+            for item, result in zip(items, results or [None] * len(items)):
+                if result is None or self.finishes_items:
+                    self.on_finished(item)
+
+        # Hand off before marking done so wait_idle() on an earlier stage
+        # implies the items are already visible to the next one
+        if self.next_stage:
+            for result in results:
+                if result is not None:
+                    self.next_stage.put(result)
+
+        with self._idle:
+            self.metrics['processed'] += len(items)
+            self.metrics['errors'] += failed
+            self.metrics['busy_seconds'] += time.monotonic() - started
+            self._inflight -= len(items)
+            if not self._inflight:
+                self._idle.notify_all()
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics['depth'] = self.queue.qsize()
+        metrics['capacity'] = self.queue.maxsize
+        metrics['workers'] = self.workers
+        return metrics
+
+
+class IngestPipeline:
+    """
+    parse -> classify -> persist -> notify, fed by the IMAP fetch loop.
+
+    Items are dicts; each handler enriches the item and returns it. The fetch
+    side calls ``submit(item)`` with raw message bytes, or ``submit_parsed``
+    when it already parsed the message itself. An optional ``item['on_done']``
+    callback runs once the item is stored or dropped, which is what backfill
+    checkpoints are built on. With ``parse_batch_size`` > 1
+    the parse handler receives lists of items so it can batch work out to a
+    process pool. Without a ``parse`` handler there is no parse stage and
+    every item comes in through ``submit_parsed``.
+    """
+
+    def __init__(self, parse, classify, persist, notify=None,
+                 parse_workers=INGEST_PARSE_WORKERS, classify_workers=INGEST_CLASSIFY_WORKERS,
+                 persist_workers=INGEST_PERSIST_WORKERS, notify_workers=INGEST_NOTIFY_WORKERS,
+                 queue_size=INGEST_QUEUE_SIZE, parse_batch_size=1):
+        self.stages = []
+        if parse:
+            self.stages.append(PipelineStage('parse', parse, parse_workers, queue_size, batch_size=parse_batch_size))
+        self.stages.append(PipelineStage('classify', classify, classify_workers, queue_size))
+        self.stages.append(PipelineStage('persist', persist, persist_workers, queue_size))
+        if notify:
+            self.stages.append(PipelineStage('notify', notify, notify_workers, queue_size))
+
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+        self.stage_by_name = {stage.name: stage for stage in self.stages}
+        # Items leave the tracked part of the pipeline when dropped before
+        # persist, or when persist has handled them
+        for stage in self.stages:
+            stage.on_finished = _finish_item
+            if stage.name == 'persist':
+                stage.finishes_items = True
+                break
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        for stage in self.stages:
+            stage.start()
+        self.running = True
+        logging.info("🚰 Ingest pipeline started: " + ", ".join(
+            f"{stage.name} x{stage.workers}" for stage in self.stages
+        ))
+
+    def stop(self):
+        """Stop workers stage by stage, letting queued items drain first"""
+        for stage in self.stages:
+            stage.wait_idle(timeout=30)
+            stage.stop()
+        self.running = False
+
+    def submit(self, item):
+        """Queue a fetched message (``item['raw']``) for parsing"""
+        self.stage_by_name['parse'].put(item)
+
+    def submit_parsed(self, item):
+        """Queue an already parsed message straight for classification"""
+        self.stage_by_name['classify'].put(item)
+
+    def wait_until_persisted(self, timeout=None):
+        """Block until everything submitted so far has been stored"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in ('parse', 'classify', 'persist'):
+            if name not in self.stage_by_name:
+                continue
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not self.stage_by_name[name].wait_idle(remaining):
+                return False
+        return True
+
+    def get_metrics(self):
+        """Per-stage throughput and backpressure metrics"""
+        return {stage.name: stage.get_metrics() for stage in self.stages}
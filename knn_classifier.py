@@ -0,0 +1,298 @@
+"""
+Embedding kNN classification
+Emails are embedded with the shared sentence-transformers model (see
+embedding_model.py) and classified by a similarity-weighted vote of their
+``k`` nearest already-labelled emails. The index is a NumPy matrix of
+normalized embeddings, so a whole batch of emails is searched with one
+matrix product; it grows incrementally as labelled emails are stored and is
+saved as an .npz file between runs.
+
+A vote only decides when it is clear: the winning category's share of the
+neighbours' weight must lead the runner-up by ``min_margin`` and the
+nearest neighbour must be at least ``min_similarity`` alike. Everything else
+goes on to the AI.
+"""
+
+import os
+import time
+import threading
+import logging
+from config import (
+    KNN_INDEX_PATH, KNN_K, KNN_MIN_MARGIN, KNN_MIN_SIMILARITY, KNN_MIN_EXAMPLES,
+    KNN_RETRAIN_INTERVAL, KNN_MAX_CHARS, LOCAL_MODEL_DB, LOCAL_MODEL_MIN_LABEL_CONFIDENCE
+)
+from embedding_model import get_encoder
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+EMBED_BATCH = 64
+TRAIN_BATCH = 1000
+
+
+def email_text(email_data):
+    """What gets embedded: subject and (cleaned) body, capped"""
+    return f"{email_data.get('subject') or ''}\n{email_data.get('content') or ''}"[:KNN_MAX_CHARS]
+
+
+class EmbeddingIndex:
+    """Normalized embeddings and their category indices, with room to grow"""
+
+    def __init__(self, dimensions=0):
+        self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self.labels = np.zeros(0, dtype=np.int16)
+        self.size = 0
+
+    def add(self, vectors, labels):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.vectors.shape[1] != vectors.shape[1]:
+            if self.size:
+                raise ValueError(f"Embedding size changed from {self.vectors.shape[1]} to {vectors.shape[1]}")
+            self.vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        needed = self.size + len(vectors)
+        if needed > len(self.vectors):
+            # Double the capacity so appends are amortized O(1)
+            capacity = max(needed, 2 * len(self.vectors), 1024)
+            grown = np.zeros((capacity, vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            grown_labels = np.zeros(capacity, dtype=np.int16)
+            grown_labels[:self.size] = self.labels[:self.size]
+            self.vectors, self.labels = grown, grown_labels
+        self.vectors[self.size:needed] = vectors
+        self.labels[self.size:needed] = labels
+        self.size = needed
+
+    def copy(self):
+        index = EmbeddingIndex(self.vectors.shape[1])
+        index.vectors, index.labels, index.size = self.vectors.copy(), self.labels.copy(), self.size
+        return index
+
+    def neighbours(self, queries, k):
+        """(similarities, labels) of the ``k`` nearest entries per query, most similar first"""
+        similarities = queries @ self.vectors[:self.size].T
+        k = min(k, self.size)
+        nearest = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        nearest_similarities = np.take_along_axis(similarities, nearest, axis=1)
+        order = np.argsort(-nearest_similarities, axis=1)
+        return (np.take_along_axis(nearest_similarities, order, axis=1),
+                self.labels[:self.size][np.take_along_axis(nearest, order, axis=1)])
+
+
+class KNNClassifier:
+    """
+    kNN tier over ``store`` (python_models.Database: ``get_labelled_emails``);
+    without a store one is opened on ``db_path`` when training starts.
+    ``encoder`` is anything with a sentence-transformers style ``encode``;
+    by default the shared model is loaded by ``start()``.
+
+    ``predict_many(emails)`` returns {'category', 'confidence_score',
+    'margin'} or None per email, embedding them in one batch. ``train()``
+    adds labelled emails stored since the last run and ``start()`` loads the
+    saved index and keeps training every ``interval`` seconds.
+    """
+
+    def __init__(self, categories, store=None, encoder=None, db_path=LOCAL_MODEL_DB, index_path=KNN_INDEX_PATH,
+                 k=KNN_K, min_margin=KNN_MIN_MARGIN, min_similarity=KNN_MIN_SIMILARITY, min_examples=KNN_MIN_EXAMPLES,
+                 min_label_confidence=LOCAL_MODEL_MIN_LABEL_CONFIDENCE):
+        self.categories = list(categories)
+        self._store = store
+        self.encoder = encoder
+        self.db_path = db_path
+        self.index_path = index_path
+        self.k = k
+        self.min_margin = min_margin
+        self.min_similarity = min_similarity
+        self.min_examples = min_examples
+        self.min_label_confidence = min_label_confidence
+        self.index = None
+        self.trained_through = 0
+        self._train_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'predictions': 0, 'decided': 0, 'low_margin': 0, 'added': 0, 'seconds': 0.0}
+
+    @property
+    def available(self):
+        return NUMPY_AVAILABLE and self.encoder is not None
+
+    @property
+    def store(self):
+        if self._store is None:
+            from python_models import Database
+            self._store = Database(self.db_path)
+        return self._store
+
+    def embed(self, emails):
+        vectors = self.encoder.encode(
+            [email_text(email) for email in emails], batch_size=EMBED_BATCH, normalize_embeddings=True
+        )
+        return np.asarray(vectors, dtype=np.float32).reshape(len(emails), -1)
+
+    def predict_many(self, emails):
+        index = self.index
+        if not emails or not self.available or index is None or index.size < self.min_examples:
+            return [None] * len(emails)
+        started = time.perf_counter()
+        similarities, labels = index.neighbours(self.embed(emails), self.k)
+        weights = np.clip(similarities, 0.0, None)
+        results = []
+        decided = 0
+        for row_weights, row_labels, nearest in zip(weights, labels, similarities[:, 0]):
+            votes = np.bincount(row_labels, weights=row_weights, minlength=len(self.categories))
+            total = votes.sum()
+            if total <= 0:
+                results.append(None)
+                continue
+            shares = np.sort(votes / total)[::-1]
+            margin = float(shares[0] - (shares[1] if len(shares) > 1 else 0.0))
+            if margin < self.min_margin or nearest < self.min_similarity:
+                results.append(None)
+                continue
+            decided += 1
+            results.append({
+                'category': self.categories[int(np.argmax(votes))],
+                'confidence_score': round(float(shares[0]), 3),
+                'margin': round(margin, 3)
+            })
+        with self._lock:
+            self.stats['predictions'] += len(emails)
+            self.stats['decided'] += decided
+            self.stats['low_margin'] += len(emails) - decided
+            self.stats['seconds'] += time.perf_counter() - started
+        return results
+
+    def add(self, emails, categories):
+        """Add labelled emails to the index right away"""
+        labelled = [(email, self.categories.index(c)) for email, c in zip(emails, categories) if c in self.categories]
+        if not labelled or not self.available:
+            return 0
+        vectors = self.embed([email for email, _ in labelled])
+        with self._train_lock:
+            index = self.index.copy() if self.index is not None else EmbeddingIndex(vectors.shape[1])
+            index.add(vectors, [label for _, label in labelled])
+            self.index = index  # Swapped in whole; searches never see a half-added batch
+        with self._lock:
+            self.stats['added'] += len(labelled)
+        return len(labelled)
+
+    def train(self):
+        """Add the labelled emails stored since the last run; returns how many were added"""
+        if not self.available:
+            return 0
+        added = 0
+        with self._train_lock:
+            index = self.index.copy() if self.index is not None else None
+            trained_through = self.trained_through
+            while True:
+                rows = self.store.get_labelled_emails(trained_through, self.categories, self.min_label_confidence, TRAIN_BATCH)
+                rows_to_add = [row for row in rows if row['classification_method'] not in ('Local', 'KNN')]  # Never learn our own answers
+                if rows_to_add:
+                    vectors = self.embed(rows_to_add)
+                    index = index or EmbeddingIndex(vectors.shape[1])
+                    index.add(vectors, [self.categories.index(row['category']) for row in rows_to_add])
+                    added += len(rows_to_add)
+                if rows:
+                    trained_through = rows[-1]['id']
+                if len(rows) < TRAIN_BATCH:
+                    break
+            self.index, self.trained_through = index, trained_through
+            if added:
+                self.save()
+        with self._lock:
+            self.stats['added'] += added
+        if added:
+            logging.info(f"🧭 kNN index: added {added} emails, {self.index.size} in total")
+        return added
+
+    def save(self):
+        if not self.index_path or self.index is None:
+            return False
+        try:
+            temporary = f"{self.index_path}.tmp.npz"
+            np.savez(temporary, vectors=self.index.vectors[:self.index.size], labels=self.index.labels[:self.index.size],
+                     categories=np.array(self.categories), trained_through=self.trained_through)
+            os.replace(temporary, self.index_path)
+            return True
+        except Exception as e:
+            logging.error(f"❌ Failed to save kNN index: {e}")
+            return False
+
+    def load(self):
+        """Pick up the saved index (dropped if it was built for other categories)"""
+        if not self.index_path or not os.path.exists(self.index_path) or not NUMPY_AVAILABLE:
+            return False
+        try:
+            with np.load(self.index_path) as saved:
+                if list(saved['categories']) != self.categories:
+                    logging.warning("⚠️ Saved kNN index has other categories, rebuilding it")
+                    return False
+                index = EmbeddingIndex(saved['vectors'].shape[1])
+                index.add(saved['vectors'], saved['labels'])
+                trained_through = int(saved['trained_through'])
+        except Exception as e:
+            logging.error(f"❌ Saved kNN index is unreadable, rebuilding it: {e}")
+            return False
+        with self._train_lock:
+            self.index, self.trained_through = index, trained_through
+        logging.info(f"🧭 Loaded kNN index of {index.size} emails")
+        return True
+
+    def load_encoder(self):
+        """Load the shared embedding model unless one was given; False if kNN can't run"""
+        if not NUMPY_AVAILABLE:
+            logging.warning("kNN classification not available (numpy not installed)")
+            return False
+        if self.encoder is None:
+            try:
+                self.encoder = get_encoder()
+            except Exception as e:
+                logging.error(f"❌ Embedding model not loaded, kNN classification disabled: {e}")
+                return False
+            if self.encoder is None:
+                logging.warning("kNN classification not available (sentence-transformers not installed)")
+                return False
+        return True
+
+    def start(self, interval=KNN_RETRAIN_INTERVAL):
+        """Load the encoder and saved index, then add new labels every ``interval`` seconds"""
+        if self._thread or not self.load_encoder():
+            return
+        self.load()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='knn-index-trainer', daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.train()
+            except Exception as e:
+                logging.error(f"❌ kNN index update failed: {e}")
+            if self._stop.wait(interval):
+                return
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread, self._stop = None, threading.Event()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['index_size'] = self.index.size if self.index is not None else 0
+        stats['hit_rate'] = round(stats['decided'] / stats['predictions'], 3) if stats['predictions'] else 0.0
+        stats['ms_per_email'] = round(1000 * stats.pop('seconds') / stats['predictions'], 2) if stats['predictions'] else 0.0
+        return stats
+
+    def describe(self):
+        stats = self.get_stats()
+        return (
+            f"{stats['index_size']} indexed emails, {stats['decided']}/{stats['predictions']} emails decided by vote "
+            f"(hit rate {stats['hit_rate']:.0%}), {stats['ms_per_email']} ms per email"
+        )
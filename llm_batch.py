@@ -0,0 +1,249 @@
+"""
+Batched, concurrent AI classification under a shared rate budget
+Backfills used to classify one email per ChatCompletion call, one call at a
+time. Here several emails are packed into one prompt that asks for a JSON
+list of per-email categories, and batches are sent concurrently (up to
+``max_in_flight`` requests at once) with openai's async API. With
+``batch_size=1`` this is a plain concurrent mode.
+
+Every AI call in the process, single or batched, draws from one budget of
+requests and tokens per minute (AI_REQUESTS_PER_MINUTE,
+AI_TOKENS_PER_MINUTE), so concurrent batches never exceed the account's
+quota. A rate-limit error holds the budget with backoff and the batch is
+retried. Emails a batch reply leaves out or mislabels are retried once in a
+later batch; what is still missing stays Uncategorized.
+"""
+
+import re
+import json
+import time
+import asyncio
+import threading
+import logging
+import openai
+from imap_throttle import TokenBucket, backoff_delay
+from config import (
+    AI_MODEL, AI_BATCH_SIZE, AI_MAX_IN_FLIGHT, AI_REQUESTS_PER_MINUTE, AI_TOKENS_PER_MINUTE, AI_RETRY_LIMIT
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CONFIDENCE = 0.85  # Same as a single AI classification
+CONTENT_CHARS = 1000  # Per email in a batch (a single classification sends 1500)
+HISTORY_CHARS = 200  # Per earlier message of the email's thread (a single classification sends 300)
+TOKENS_PER_RESULT = 15
+CODE_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+def estimate_tokens(text, max_tokens=0):
+    """Rough token count (about 4 characters per token) plus the reply allowance"""
+    return len(text) // 4 + max_tokens
+
+
+def is_rate_limit(error):
+    """openai.error.RateLimitError (HTTP 429) or a message saying the same"""
+    return getattr(error, 'http_status', None) == 429 or 'rate limit' in str(error).lower()
+
+
+class LLMBudget:
+    """
+    Requests-per-minute and tokens-per-minute buckets shared by every AI
+    call. ``delay(tokens)`` reserves one request and ``tokens`` tokens and
+    returns the seconds to wait before sending; ``settle`` corrects the
+    token estimate with the usage the API reported.
+    """
+
+    def __init__(self, rpm=AI_REQUESTS_PER_MINUTE, tpm=AI_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(rpm / 60.0, rpm)
+        self.tokens = TokenBucket(tpm / 60.0, tpm)
+        self.hold_until = 0.0
+        self.level = 0  # Consecutive rate-limit errors
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'tokens': 0, 'rate_limited': 0, 'wait_seconds': 0.0}
+
+    def delay(self, tokens):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        with self._lock:
+            wait = max(wait, self.hold_until - time.monotonic(), 0.0)
+            self.counters['requests'] += 1
+            self.counters['tokens'] += tokens
+            self.counters['wait_seconds'] += wait
+        return wait
+
+    def acquire(self, tokens):
+        """Blocking form of delay()"""
+        wait = self.delay(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def settle(self, estimated, used):
+        if used:
+            self.tokens.reserve(used - estimated)  # A negative amount gives tokens back
+            with self._lock:
+                self.counters['tokens'] += used - estimated
+
+    def rate_limited(self, reason=''):
+        """The API pushed back: hold every caller with backoff"""
+        with self._lock:
+            delay = backoff_delay(self.level)
+            self.level += 1
+            self.hold_until = max(self.hold_until, time.monotonic() + delay)
+            self.counters['rate_limited'] += 1
+        logging.warning(f"🐢 AI rate limited ({str(reason)[:80]}); backing off {delay:.1f}s")
+        return delay
+
+    def succeeded(self):
+        if self.level:
+            with self._lock:
+                self.level = 0
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+# One budget for the whole process
+budget = LLMBudget()
+
+
+def build_batch_prompt(emails, categories):
+    """One prompt asking for the category of every email, as JSON"""
+    items = []
+    for number, email in enumerate(emails, 1):
+        content = ' '.join((email.get('content') or '').split())[:CONTENT_CHARS]
+        item = f"[{number}]\nSubject: {email.get('subject', '')}\nSender: {email.get('sender', '')}\nContent: {content}"
+        if email.get('thread_category'):
+            item += f"\nEarlier in this conversation: {email['thread_category']}"
+        if email.get('thread_history'):
+            item += "\nEarlier messages in this conversation (oldest first):" + ''.join(
+                f"\n- From {message.get('sender', '')} ({message.get('category') or 'unclassified'}): "
+                f"{' '.join((message.get('content') or '').split())[:HISTORY_CHARS]}"
+                for message in email['thread_history']
+            )
+        items.append(item)
+    return f"""
+Classify each of the {len(emails)} emails below into exactly one of these categories:
+{chr(10).join('- ' + category for category in categories)}
+
+Instructions:
+- Analyze the tone, intent, and content of each email separately
+- "Interested" = Shows interest in product/service, asks questions, wants more info
+- "Meeting Booked" = Contains meeting invites, calendar links, scheduled calls
+- "Not Interested" = Explicitly declines, says no, asks to be removed
+- "Spam" = Promotional content, suspicious offers, unrelated marketing
+- "Out of Office" = Automatic replies indicating absence
+
+Return only JSON: {{"results": [{{"id": <email number>, "category": "<category name>"}}, ...]}}
+with one entry per email.
+
+{chr(10).join(items)}
+"""
+
+
+def parse_batch_response(text, count, categories):
+    """Category per email (None where the reply has no valid one)"""
+    found = [None] * count
+    try:
+        data = json.loads(CODE_FENCE.sub('', (text or '').strip()))
+    except ValueError:
+        return found
+    results = data.get('results', []) if isinstance(data, dict) else data
+    for entry in results if isinstance(results, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            index = int(entry.get('id')) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < count and entry.get('category') in categories:
+            found[index] = entry['category']
+    return found
+
+
+class BatchClassifier:
+    """
+    Classifies many emails with batched, concurrent AI calls.
+
+    ``classify_many(emails)`` returns a (category, confidence) per email in
+    order, ("Uncategorized", 0.0) where no valid answer came back. It runs
+    its own event loop, so call it from a thread rather than from inside a
+    coroutine (which can await ``classify_many_async`` instead).
+    """
+
+    def __init__(self, categories, batch_size=AI_BATCH_SIZE, max_in_flight=AI_MAX_IN_FLIGHT,
+                 budget=budget, retry_limit=AI_RETRY_LIMIT, model=AI_MODEL):
+        self.categories = list(categories)
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.budget = budget
+        self.retry_limit = retry_limit
+        self.model = model
+        self._lock = threading.Lock()
+        self.stats = {'emails': 0, 'batches': 0, 'classified': 0, 'retried': 0, 'failed': 0}
+
+    def classify_many(self, emails):
+        return asyncio.run(self.classify_many_async(emails))
+
+    async def classify_many_async(self, emails):
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        found = [None] * len(emails)
+        pending = list(range(len(emails)))
+        for attempt in range(2):  # Left-out emails get one more try
+            if not pending:
+                break
+            chunks = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+            results = await asyncio.gather(*(
+                self._classify_chunk([emails[i] for i in chunk], semaphore) for chunk in chunks
+            ))
+            for chunk, categories in zip(chunks, results):
+                for index, category in zip(chunk, categories):
+                    found[index] = category
+            pending = [i for i in pending if found[i] is None]
+            if attempt == 0 and pending:
+                self._count('retried', len(pending))
+        self._count('emails', len(emails))
+        self._count('classified', len(emails) - len(pending))
+        self._count('failed', len(pending))
+        return [(category, CONFIDENCE) if category else ("Uncategorized", 0.0) for category in found]
+
+    async def _classify_chunk(self, chunk, semaphore):
+        prompt = build_batch_prompt(chunk, self.categories)
+        max_tokens = TOKENS_PER_RESULT * len(chunk) + 20
+        estimated = estimate_tokens(prompt, max_tokens)
+        for attempt in range(self.retry_limit + 1):
+            wait = self.budget.delay(estimated)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with semaphore:
+                try:
+                    response = await openai.ChatCompletion.acreate(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": "You are an expert email classifier. Respond with only JSON."},
+                            {"role": "user", "content": prompt}
+                        ],
+                        max_tokens=max_tokens,
+                        temperature=0.1,
+                        response_format={"type": "json_object"}
+                    )
+                except Exception as e:
+                    if is_rate_limit(e) and attempt < self.retry_limit:
+                        self.budget.rate_limited(e)
+                        continue
+                    logging.error(f"❌ Batch AI classification of {len(chunk)} emails failed: {e}")
+                    return [None] * len(chunk)
+            self.budget.succeeded()
+            usage = response.get('usage') or {}
+            self.budget.settle(estimated, usage.get('total_tokens'))
+            self._count('batches', 1)
+            return parse_batch_response(response.choices[0].message.content, len(chunk), self.categories)
+        return [None] * len(chunk)
+
+    def _count(self, key, amount):
+        with self._lock:
+            self.stats[key] += amount
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,266 @@
+"""
+Local text classifier tier between the rules and the AI
+A multinomial naive Bayes model over hashed word and word-pair features
+(subject, body and sender domain), trained from the categories already
+stored in the emails table. Naive Bayes is just counts, so training is
+incremental: each run learns only the emails stored since the last one and
+the model (a few count tables) is saved in the database for other processes.
+
+Emails the model scores at or above ``threshold`` skip the AI. Accuracy is
+measured test-then-train: before learning an AI-labelled email the model
+predicts it, so ``get_stats`` reports how often a confident local answer
+agrees with the AI on mail the model had not seen, and how much of that
+mail it would have answered (coverage).
+"""
+
+import re
+import json
+import math
+import zlib
+import threading
+import logging
+from email.utils import parseaddr
+from reply_cleaner import clean_reply
+from config import (
+    STRIP_QUOTED_REPLIES, LOCAL_MODEL_DB, LOCAL_MODEL_THRESHOLD, LOCAL_MODEL_MIN_EXAMPLES,
+    LOCAL_MODEL_MIN_LABEL_CONFIDENCE, LOCAL_MODEL_RETRAIN_INTERVAL
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+WORD = re.compile(r"[a-z][a-z0-9']+")
+N_FEATURES = 1 << 18
+MODEL_NAME = 'naive_bayes'
+TRAIN_BATCH = 1000
+
+# Labels the AI produced (its own or cached); the model is evaluated against these
+AI_METHODS = ('AI', 'Cache')
+
+
+def features(subject, content, sender):
+    """Hashed presence features: words and word pairs of subject and body, plus the sender domain"""
+    found = set()
+    for prefix, text in (('s', subject), ('b', content)):
+        words = WORD.findall((text or '').lower())
+        found.update(f'{prefix}:{word}' for word in words)
+        found.update(f'{prefix}:{a} {b}' for a, b in zip(words, words[1:]))
+    domain = (parseaddr(sender or '')[1] or sender or '').rpartition('@')[2].lower()
+    if domain:
+        found.add(f'd:{domain}')
+    # crc32 rather than hash(): stable across processes, so saved models stay valid
+    return {zlib.crc32(feature.encode('utf-8')) % N_FEATURES for feature in found}
+
+
+class NaiveBayesModel:
+    """Multinomial naive Bayes over presence features with Laplace smoothing ``alpha``"""
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.documents = {}  # category -> emails learned
+        self.counts = {}  # category -> {feature: emails containing it}
+        self.totals = {}  # category -> sum of its feature counts
+        self.vocabulary = set()
+
+    def learn(self, feature_set, category):
+        counts = self.counts.setdefault(category, {})
+        for feature in feature_set:
+            counts[feature] = counts.get(feature, 0) + 1
+        self.totals[category] = self.totals.get(category, 0) + len(feature_set)
+        self.documents[category] = self.documents.get(category, 0) + 1
+        self.vocabulary.update(feature_set)
+
+    def predict(self, feature_set):
+        """(category, posterior probability) of the most likely category, or (None, 0.0)"""
+        total_documents = sum(self.documents.values())
+        if not total_documents:
+            return None, 0.0
+        vocabulary = len(self.vocabulary) + 1
+        scores = {}
+        for category, documents in self.documents.items():
+            counts = self.counts[category]
+            denominator = math.log(self.totals[category] + self.alpha * vocabulary)
+            scores[category] = math.log(documents / total_documents) + sum(
+                math.log(counts.get(feature, 0) + self.alpha) - denominator for feature in feature_set
+            )
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / normalizer
+
+    def copy(self):
+        model = NaiveBayesModel(self.alpha)
+        model.documents = dict(self.documents)
+        model.counts = {category: dict(counts) for category, counts in self.counts.items()}
+        model.totals = dict(self.totals)
+        model.vocabulary = set(self.vocabulary)
+        return model
+
+    def to_json(self):
+        return json.dumps({
+            'alpha': self.alpha,
+            'documents': self.documents,
+            'counts': {category: {str(f): n for f, n in counts.items()} for category, counts in self.counts.items()},
+            'totals': self.totals
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        model = cls(data['alpha'])
+        model.documents = data['documents']
+        model.totals = data['totals']
+        model.counts = {category: {int(f): n for f, n in counts.items()} for category, counts in data['counts'].items()}
+        for counts in model.counts.values():
+            model.vocabulary.update(counts)
+        return model
+
+
+class LocalClassifier:
+    """
+    Naive Bayes tier over ``store`` (python_models.Database:
+    ``get_labelled_emails``, ``get_local_model``, ``save_local_model``);
+    without a store one is opened on ``db_path`` when training starts.
+
+    ``predict(email_data)`` returns {'category', 'confidence_score'} when the
+    model is trained (``min_examples`` emails) and confident, else None; it
+    never touches the database. ``train()`` learns newly stored labels and
+    ``start()`` loads the saved model and retrains every ``interval`` seconds.
+    """
+
+    def __init__(self, categories, store=None, db_path=LOCAL_MODEL_DB, threshold=LOCAL_MODEL_THRESHOLD,
+                 min_examples=LOCAL_MODEL_MIN_EXAMPLES, min_label_confidence=LOCAL_MODEL_MIN_LABEL_CONFIDENCE):
+        self.categories = list(categories)
+        self._store = store
+        self.db_path = db_path
+        self.threshold = threshold
+        self.min_examples = min_examples
+        self.min_label_confidence = min_label_confidence
+        self.model = NaiveBayesModel()
+        self.trained_through = 0
+        self._train_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {
+            'predictions': 0, 'confident': 0, 'trained': 0,
+            'evaluated': 0, 'evaluated_confident': 0, 'agreed': 0
+        }
+
+    @property
+    def store(self):
+        if self._store is None:
+            from python_models import Database
+            self._store = Database(self.db_path)
+        return self._store
+
+    def _features(self, email_data, clean=False):
+        content = email_data.get('content') or ''
+        if clean and STRIP_QUOTED_REPLIES:
+            content = clean_reply(content)['text']
+        return features(email_data.get('subject'), content, email_data.get('sender'))
+
+    def predict(self, email_data):
+        """Confident local classification of an (already preprocessed) email, or None"""
+        model = self.model
+        if sum(model.documents.values()) < self.min_examples:
+            return None
+        category, confidence = model.predict(self._features(email_data))
+        with self._lock:
+            self.stats['predictions'] += 1
+            if confidence < self.threshold:
+                return None
+            self.stats['confident'] += 1
+        return {'category': category, 'confidence_score': round(confidence, 3)}
+
+    def load(self):
+        """Pick up the saved model, e.g. one trained by another process"""
+        saved = self.store.get_local_model(MODEL_NAME)
+        if not saved:
+            return False
+        try:
+            model = NaiveBayesModel.from_json(saved['state'])
+        except (ValueError, KeyError, TypeError) as e:
+            logging.error(f"❌ Saved local model is unreadable, retraining from scratch: {e}")
+            return False
+        with self._train_lock:
+            self.model, self.trained_through = model, saved['trained_through']
+        logging.info(f"🧠 Loaded local model trained on {sum(model.documents.values())} emails")
+        return True
+
+    def train(self):
+        """Learn the labelled emails stored since the last run; returns how many were learned"""
+        learned = 0
+        with self._train_lock:
+            # Train a copy and swap it in, so predictions never see a model mid-update
+            model, trained_through = self.model.copy(), self.trained_through
+            while True:
+                rows = self.store.get_labelled_emails(trained_through, self.categories, self.min_label_confidence, TRAIN_BATCH)
+                for row in rows:
+                    if row['classification_method'] in ('Local', 'KNN'):
+                        continue  # Never learn from local answers, ours or the kNN tier's
+                    feature_set = self._features(row, clean=True)
+                    if row['classification_method'] in AI_METHODS and sum(model.documents.values()) >= self.min_examples:
+                        self._evaluate(model, feature_set, row['category'])
+                    model.learn(feature_set, row['category'])
+                    learned += 1
+                if rows:
+                    trained_through = rows[-1]['id']
+                if len(rows) < TRAIN_BATCH:
+                    break
+            self.model, self.trained_through = model, trained_through
+            if learned:
+                self.store.save_local_model(MODEL_NAME, model.to_json(), trained_through)
+        with self._lock:
+            self.stats['trained'] += learned
+        if learned:
+            logging.info(f"🧠 Local model learned {learned} emails; {self.describe()}")
+        return learned
+
+    def _evaluate(self, model, feature_set, label):
+        """Test-then-train: score an AI-labelled email before learning it"""
+        category, confidence = model.predict(feature_set)
+        with self._lock:
+            self.stats['evaluated'] += 1
+            if confidence >= self.threshold:
+                self.stats['evaluated_confident'] += 1
+                self.stats['agreed'] += category == label
+
+    def start(self, interval=LOCAL_MODEL_RETRAIN_INTERVAL):
+        """Load the saved model, train, then retrain every ``interval`` seconds in the background"""
+        if self._thread:
+            return
+        self.load()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='local-model-trainer', daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.train()
+            except Exception as e:
+                logging.error(f"❌ Local model training failed: {e}")
+            if self._stop.wait(interval):
+                return
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread, self._stop = None, threading.Event()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['hit_rate'] = round(stats['confident'] / stats['predictions'], 3) if stats['predictions'] else 0.0
+        stats['accuracy'] = round(stats['agreed'] / stats['evaluated_confident'], 3) if stats['evaluated_confident'] else None
+        stats['coverage'] = round(stats['evaluated_confident'] / stats['evaluated'], 3) if stats['evaluated'] else None
+        stats['examples'] = sum(self.model.documents.values())
+        return stats
+
+    def describe(self):
+        stats = self.get_stats()
+        accuracy = f"{stats['accuracy']:.1%}" if stats['accuracy'] is not None else 'n/a'
+        coverage = f"{stats['coverage']:.0%}" if stats['coverage'] is not None else 'n/a'
+        return (
+            f"{stats['examples']} examples, {stats['confident']}/{stats['predictions']} emails answered locally "
+            f"(hit rate {stats['hit_rate']:.0%}), agreement with AI labels {accuracy} at {coverage} coverage"
+        )
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Offline mail archive importer
+Loads mbox files and Maildir directories from disk into an email account
+without going through IMAP. Messages are streamed from disk in batches,
+parsed in the MIME process pool, classified with the local rules only (no
+LLM calls) and stored with one bulk insert per batch. Progress is
+checkpointed per source after every batch, so an interrupted import resumes
+where it stopped; importing a source again never duplicates rows.
+
+Usage:
+    python mail_importer.py --user-id 1 --account-id 2 archive.mbox ~/Maildir
+    python mail_importer.py --benchmark archive.mbox   # throughput into a scratch database
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from mime_parser import get_parse_pool
+from folders import NAME_HINTS
+from email_classifier import classifier
+from python_models import Database
+from thread_index import ThreadIndex
+from config import IMPORT_BATCH_SIZE, IMPORT_MAILBOX_PREFIX, IMPORT_PROGRESS_INTERVAL, THREADING_ENABLED
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Maildir info flags (the ":2,FRS" filename suffix) as IMAP flags
+MAILDIR_FLAGS = {'D': '\\Draft', 'F': '\\Flagged', 'R': '\\Answered', 'S': '\\Seen', 'T': '\\Deleted'}
+
+
+def _is_maildir(path):
+    return all(os.path.isdir(os.path.join(path, name)) for name in ('cur', 'new'))
+
+
+def _mbox_folder(path):
+    name, extension = os.path.splitext(os.path.basename(path))
+    name = name if extension.lower() == '.mbox' else os.path.basename(path)
+    return 'INBOX' if name.upper() == 'INBOX' else name
+
+
+def find_sources(path):
+    """
+    [(kind, path, folder)] for an mbox file, a directory of mbox files
+    (e.g. a Thunderbird profile) or a Maildir with its Maildir++ subfolders
+    """
+    path = os.path.abspath(path)
+    if os.path.isfile(path):
+        return [('mbox', path, _mbox_folder(path))]
+    if _is_maildir(path):
+        sources = [('maildir', path, 'INBOX')]
+        for name in sorted(os.listdir(path)):
+            if name.startswith('.') and _is_maildir(os.path.join(path, name)):
+                sources.append(('maildir', os.path.join(path, name), name[1:]))
+        return sources
+    sources = []
+    for name in sorted(os.listdir(path)):
+        if name.startswith('.') or name.endswith('.msf'):  # Thunderbird index files
+            continue
+        sources.extend(find_sources(os.path.join(path, name)))
+    return sources
+
+
+def iter_mbox(path, start=0):
+    """
+    Stream an mbox file from byte offset ``start``; yields (uid, raw, flags,
+    position) where uid is the offset of the message's From_ line and
+    position is where the next message starts. ">From " lines are unescaped
+    (mboxrd).
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        offset, lines, position = None, [], start
+        for line in f:
+            if line.startswith(b'From '):
+                if offset is not None:
+                    yield str(offset), b''.join(lines), None, position
+                offset, lines = position, []
+            elif offset is not None:
+                if line.startswith(b'>') and line.lstrip(b'>').startswith(b'From '):
+                    lines.append(line[1:])
+                else:
+                    lines.append(line)
+            position += len(line)
+        if offset is not None:
+            yield str(offset), b''.join(lines), None, position
+
+
+def iter_maildir(path, after=None):
+    """
+    Stream a Maildir's cur/ and new/ messages in filename order (delivery
+    time first), skipping names up to ``after``; yields (uid, raw, flags,
+    position) where uid and position are the message's unique name
+    """
+    entries = []
+    for subdir in ('cur', 'new'):
+        for name in os.listdir(os.path.join(path, subdir)):
+            if name.startswith('.'):
+                continue
+            unique, _, info = name.partition(':')
+            entries.append((unique, info, os.path.join(path, subdir, name)))
+    entries.sort()
+    for unique, info, filename in entries:
+        if after is not None and unique <= after:
+            continue
+        flags = ' '.join(MAILDIR_FLAGS[c] for c in info[2:] if c in MAILDIR_FLAGS) if info.startswith('2,') else ''
+        try:
+            with open(filename, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:  # Moved by a mail client while we were importing
+            continue
+        yield unique, raw, flags, unique
+
+
+def classify_locally(fields, role=None):
+    """Rule-based category only; whatever the rules don't match stays Uncategorized"""
+    if role == 'sent':
+        return 'Sent', 1.0
+    data, _ = classifier.preprocess(fields)
+    rule = classifier.rule_decision(data)
+    return (rule['category'], rule['weight']) if rule else ('Uncategorized', 0.0)
+
+
+class MailImporter:
+    """
+    Imports archive sources into one account.
+
+    Each batch of ``batch_size`` messages is parsed in the parse pool and
+    handed to a single writer thread, which classifies it, stores it with
+    ``store_emails_bulk`` and then advances the source's checkpoint, while
+    the next batch is read and parsed. Messages are added to the account's
+    conversation threads unless ``threads`` is False. ``stats`` holds counts
+    and the seconds spent in each stage.
+    """
+
+    def __init__(self, db, account, batch_size=IMPORT_BATCH_SIZE, mailbox_prefix=IMPORT_MAILBOX_PREFIX,
+                 parse_pool=None, progress_interval=IMPORT_PROGRESS_INTERVAL, threads=THREADING_ENABLED):
+        self.db = db
+        self.account = account
+        self.batch_size = batch_size
+        self.mailbox_prefix = mailbox_prefix
+        self.parse_pool = parse_pool or get_parse_pool()
+        self.progress_interval = progress_interval
+        self.threads = ThreadIndex(db) if threads else None
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.stats = {
+            'messages': 0,
+            'bytes': 0,
+            'stored': 0,
+            'duplicates': 0,
+            'parse_failed': 0,
+            'sources': 0,
+            'categories': Counter(),
+            'read_seconds': 0.0,
+            'parse_seconds': 0.0,
+            'classify_seconds': 0.0,
+            'thread_seconds': 0.0,
+            'store_seconds': 0.0,
+            'elapsed_seconds': 0.0
+        }
+
+    def import_path(self, path, restart=False):
+        for kind, source, folder in find_sources(path):
+            self.import_source(kind, source, folder, restart)
+        return self.stats
+
+    def import_source(self, kind, source, folder, restart=False):
+        """Import one mbox file or Maildir folder, resuming from its checkpoint unless ``restart``"""
+        checkpoint = None if restart else self.db.get_import_checkpoint(self.account['id'], source)
+        if checkpoint and checkpoint['status'] == 'complete':
+            logging.info(f"⏭️ {source} already imported ({checkpoint['imported']} messages)")
+            return
+        mailbox = self.mailbox_prefix + folder
+        checkpoint = checkpoint or {
+            'account_id': self.account['id'], 'source': source, 'mailbox': mailbox,
+            'position': None, 'imported': 0, 'status': 'running'
+        }
+        if checkpoint['position'] is not None:
+            logging.info(f"↩️ Resuming {source} after {checkpoint['imported']} messages")
+        role = next((role for role, names in NAME_HINTS.items() if folder.lower() in names), None)
+        if kind == 'mbox':
+            messages = iter_mbox(source, int(checkpoint['position'] or 0))
+        else:
+            messages = iter_maildir(source, checkpoint['position'])
+
+        started = last_log = time.monotonic()
+        count = 0
+        pending = None
+        while True:
+            clock = time.perf_counter()
+            batch = list(islice(messages, self.batch_size))
+            self.stats['read_seconds'] += time.perf_counter() - clock
+            if not batch:
+                break
+            clock = time.perf_counter()
+            records = self.parse_pool.parse_batch([raw for _, raw, _, _ in batch])
+            self.stats['parse_seconds'] += time.perf_counter() - clock
+            if pending:
+                pending.result()  # One batch in flight keeps memory flat and checkpoints in order
+            pending = self.writer.submit(self._store_batch, batch, records, mailbox, role, checkpoint)
+            count += len(batch)
+            self.stats['messages'] += len(batch)
+            self.stats['bytes'] += sum(len(raw) for _, raw, _, _ in batch)
+
+            if time.monotonic() - last_log >= self.progress_interval:
+                last_log = time.monotonic()
+                logging.info(f"📥 {mailbox}: {count} messages ({count / (last_log - started):.0f}/s)")
+        if pending:
+            pending.result()
+
+        checkpoint['status'] = 'complete'
+        self.db.save_import_checkpoint(checkpoint)
+        self.stats['sources'] += 1
+        self.stats['elapsed_seconds'] += time.monotonic() - started
+        logging.info(f"✅ Imported {count} messages from {source} into {mailbox}")
+
+    def _store_batch(self, batch, records, mailbox, role, checkpoint):
+        clock = time.perf_counter()
+        rows, headers = [], []
+        for (uid, _, flags, _), record in zip(batch, records):
+            if record is None:
+                self.stats['parse_failed'] += 1
+                continue
+            fields = {'subject': record['subject'], 'sender': record['sender'], 'content': record['text'][:5000]}
+            category, confidence = classify_locally({**fields, 'user_id': self.account['user_id']}, role)
+            self.stats['categories'][category] += 1
+            rows.append({
+                **fields,
+                'user_id': self.account['user_id'],
+                'account_id': self.account['id'],
+                'uid': uid,
+                'category': category,
+                'confidence_score': confidence,
+                'date_received': record['date'],
+                'mailbox': mailbox,
+                'flags': flags
+            })
+            headers.append((record['message_id'], record['in_reply_to'], record['references']))
+        self.stats['classify_seconds'] += time.perf_counter() - clock
+
+        clock = time.perf_counter()
+        if self.threads:
+            for row, (message_id, in_reply_to, references) in zip(rows, headers):
+                thread = self.threads.add_message(self.account['id'], message_id, in_reply_to, references, row['subject'])
+                row['thread_id'] = thread['id']
+                self.threads.record_category(thread['id'], row)
+        self.stats['thread_seconds'] += time.perf_counter() - clock
+
+        clock = time.perf_counter()
+        if self.threads:
+            # Later messages of the batch may have merged threads handed out earlier
+            with self.threads.locked(self.account['id']):
+                for row in rows:
+                    row['thread_id'] = self.threads.resolve(row['thread_id'])
+                inserted = self.db.store_emails_bulk(rows)
+        else:
+            inserted = self.db.store_emails_bulk(rows)
+        if inserted is None:
+            raise RuntimeError(f"Storing a batch from {checkpoint['source']} failed; rerun to resume")
+        self.stats['stored'] += inserted
+        self.stats['duplicates'] += len(rows) - inserted
+        checkpoint['position'] = str(batch[-1][3])
+        checkpoint['imported'] += len(batch)
+        self.db.save_import_checkpoint(checkpoint)
+        self.stats['store_seconds'] += time.perf_counter() - clock
+
+    def close(self):
+        self.writer.shutdown(wait=True)
+
+
+def print_report(stats):
+    elapsed = stats['elapsed_seconds'] or 1e-9
+    print(f"\n📊 Imported {stats['messages']} messages ({stats['bytes'] / 1e6:.1f} MB) "
+          f"from {stats['sources']} sources in {elapsed:.1f}s")
+    print(f"   {stats['messages'] / elapsed:.0f} messages/s, {stats['bytes'] / 1e6 / elapsed:.1f} MB/s")
+    print(f"   stored {stats['stored']}, already present {stats['duplicates']}, unparseable {stats['parse_failed']}")
+    for stage in ('read', 'parse', 'classify', 'thread', 'store'):
+        print(f"   {stage:<9} {stats[stage + '_seconds']:8.2f}s")
+    print("   categories: " + ", ".join(f"{name} {count}" for name, count in stats['categories'].most_common()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import mbox files and Maildir directories into an email account")
+    parser.add_argument('paths', nargs='+', help="mbox files, directories of mbox files, or Maildirs")
+    parser.add_argument('--user-id', type=int)
+    parser.add_argument('--account-id', type=int)
+    parser.add_argument('--db', default='reachinbox.db')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument('--restart', action='store_true', help="Ignore checkpoints and read every source again")
+    parser.add_argument('--no-threads', action='store_true', help="Skip conversation threading")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="Import into a scratch database and report per-stage throughput")
+    args = parser.parse_args(argv)
+
+    scratch = None
+    if args.benchmark:
+        scratch = tempfile.TemporaryDirectory()
+        db = Database(os.path.join(scratch.name, 'import_benchmark.db'))
+        account = {'id': 1, 'user_id': 1}
+    else:
+        if args.user_id is None or args.account_id is None:
+            parser.error("--user-id and --account-id are required (or use --benchmark)")
+        db = Database(args.db)
+        account = next((a for a in db.get_user_email_accounts(args.user_id) if a['id'] == args.account_id), None)
+        if not account:
+            parser.error(f"No active account {args.account_id} for user {args.user_id}")
+
+    importer = MailImporter(db, account, batch_size=args.batch_size, threads=THREADING_ENABLED and not args.no_threads)
+    try:
+        for path in args.paths:
+            importer.import_path(path, restart=args.restart or args.benchmark)
+    except KeyboardInterrupt:
+        logging.info("⏸️ Import interrupted; run again to resume")
+        return 1
+    finally:
+        importer.close()
+        get_parse_pool().shutdown()
+        print_report(importer.stats)
+        if scratch:
+            scratch.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Incremental mailbox state sync (flags and deletions)
+New mail only ever adds rows; this keeps the stored copy of a mailbox in
+step with the server as messages are read, flagged, moved or deleted, at a
+cost proportional to what changed:
+
+- QRESYNC: one UID FETCH (CHANGEDSINCE modseq VANISHED) returns the flags
+  changed and the UIDs expunged since the last sync.
+- CONDSTORE: the same FETCH for flags; expunges are found with the UID-set
+  diff below.
+- Neither: flags of the newest stored messages are rescanned, and
+  expunges are found with the UID-set diff.
+
+The UID-set diff is skipped when EXISTS grew by exactly the number of UIDs
+that arrived since the last UIDNEXT (nothing can have been expunged);
+otherwise one UID SEARCH ALL is compared with the stored UIDs.
+"""
+
+import re
+import weakref
+import logging
+from imap_throttle import imap_call
+from backfill import search_uids
+from config import MAILBOX_FLAG_SCAN_LIMIT
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+FETCH_UID = re.compile(rb'UID (\d+)')
+FETCH_FLAGS = re.compile(rb'FLAGS \(([^)]*)\)')
+FETCH_MODSEQ = re.compile(rb'MODSEQ \((\d+)\)')
+
+# Extensions each logged-in session can use (see enable_qresync)
+_session_extensions = weakref.WeakKeyDictionary()
+
+
+def enable_qresync(mail):
+    """
+    Right after login: ENABLE QRESYNC when the server offers it, and record
+    which of CONDSTORE/QRESYNC this session can use
+    """
+    extensions = set()
+    try:
+        status, data = imap_call(mail, mail.capability)
+        if status == 'OK' and data and data[-1]:
+            # Servers often advertise more after login than in the greeting imaplib kept
+            mail.capabilities = tuple(data[-1].decode().upper().split())
+            extensions = set(mail.capabilities) & {'CONDSTORE', 'QRESYNC'}
+        if 'QRESYNC' in extensions:
+            status, _ = imap_call(mail, mail.enable, 'QRESYNC')
+            if status != 'OK':
+                extensions.discard('QRESYNC')
+    except Exception as e:
+        logging.warning(f"Could not enable QRESYNC: {e}")
+        extensions.discard('QRESYNC')
+    _session_extensions[mail] = extensions
+    return extensions
+
+
+def session_extensions(mail):
+    return _session_extensions.get(mail, set())
+
+
+def uid_set(uids):
+    """Compact IMAP UID set: [1, 2, 3, 7] -> '1:3,7'"""
+    ranges = []
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(low) if low == high else f'{low}:{high}' for low, high in ranges)
+
+
+def parse_uid_set(text):
+    """'1:3,7' -> {1, 2, 3, 7}"""
+    uids = set()
+    for part in text.split(','):
+        low, _, high = part.strip().partition(':')
+        if not low.isdigit():
+            continue
+        low, high = int(low), int(high) if high.isdigit() else int(low)
+        uids.update(range(min(low, high), max(low, high) + 1))
+    return uids
+
+
+def fetch_flags(mail, uids, changed_since=None, vanished=False, modseq=False):
+    """
+    UID FETCH (FLAGS), optionally CHANGEDSINCE a modseq (which implies
+    MODSEQ); returns ({uid: (flags, modseq or 0)}, vanished_uids)
+    """
+    items = '(UID FLAGS MODSEQ)' if modseq else '(UID FLAGS)'
+    if changed_since is not None:
+        items += f" (CHANGEDSINCE {changed_since}{' VANISHED' if vanished else ''})"
+    status, data = imap_call(mail, mail.uid, 'fetch', uids, items)
+    if status != 'OK':
+        raise RuntimeError(f"FLAGS fetch failed: {data}")
+    changes = {}
+    for part in data or []:
+        line = part[0] if isinstance(part, tuple) else part
+        if not isinstance(line, bytes):
+            continue
+        uid, flags = FETCH_UID.search(line), FETCH_FLAGS.search(line)
+        if uid and flags:
+            modseq = FETCH_MODSEQ.search(line)
+            changes[int(uid.group(1))] = (flags.group(1).decode(), int(modseq.group(1)) if modseq else 0)
+    gone = set()
+    if vanished:
+        _, responses = mail.response('VANISHED')
+        for response in responses or []:
+            if response:
+                text = response.decode() if isinstance(response, bytes) else response
+                gone |= parse_uid_set(text.replace('(EARLIER)', ''))
+    return changes, gone
+
+
+class MailboxStateSync:
+    """
+    Brings stored flags and deletions for one mailbox up to date.
+
+    ``store`` provides ``get_mailbox_state``/``save_mailbox_state``,
+    ``get_account_uids``, ``update_email_flags`` and ``delete_emails_by_uid``
+    (see python_models.Database). Flag changes for messages that were
+    fetched but are still in the ingest pipeline (``pending``) cannot be
+    stored yet, so the saved HIGHESTMODSEQ stays below them and they are
+    fetched again next time.
+    """
+
+    def __init__(self, store, account_id, mailbox='INBOX', flag_scan_limit=MAILBOX_FLAG_SCAN_LIMIT):
+        self.store = store
+        self.account_id = account_id
+        self.mailbox = mailbox
+        self.flag_scan_limit = flag_scan_limit
+
+    def run(self, mail, selected, pending=()):
+        """
+        Sync after ``mail`` has SELECTed the mailbox (``selected`` is the
+        backfill.select_mailbox() result); returns what was done
+        """
+        state = self.store.get_mailbox_state(self.account_id, self.mailbox)
+        if state and state['uidvalidity'] != selected['uidvalidity']:
+            logging.warning(f"UIDVALIDITY changed for {self.account_id}/{self.mailbox}; resyncing mailbox state")
+            state = None
+        extensions = session_extensions(mail)
+        modseq = selected['highestmodseq'] if 'CONDSTORE' in extensions or 'QRESYNC' in extensions else 0
+        stored = self.store.get_account_uids(self.account_id, self.mailbox)
+        result = {'mode': 'scan', 'flags_updated': 0, 'deleted': 0}
+
+        if modseq and state and state['highestmodseq']:
+            qresync = 'QRESYNC' in extensions
+            result['mode'] = 'qresync' if qresync else 'condstore'
+            if modseq == state['highestmodseq']:
+                changes, gone = {}, set()  # No flag changes (nor expunges, with QRESYNC)
+            else:
+                changes, gone = fetch_flags(mail, '1:*', changed_since=state['highestmodseq'], vanished=qresync)
+            if not qresync:
+                gone = self._expunged(mail, state, selected, stored)
+        else:
+            # First sync, or a server without CONDSTORE: rescan the newest stored messages
+            scan = sorted(stored)[-self.flag_scan_limit:] if modseq == 0 else sorted(stored)
+            changes = fetch_flags(mail, uid_set(scan), modseq=bool(modseq))[0] if scan else {}
+            gone = self._expunged(mail, state, selected, stored)
+
+        gone &= stored
+        if gone:
+            self.store.delete_emails_by_uid(self.account_id, gone, self.mailbox)
+        updated = self.store.update_email_flags(
+            self.account_id, {uid: flags for uid, (flags, _) in changes.items() if uid not in gone}, self.mailbox
+        )
+        waiting = [mod for uid, (_, mod) in changes.items() if mod and uid in pending and uid not in updated]
+        if modseq and waiting:
+            modseq = min(min(waiting) - 1, modseq)
+
+        self.store.save_mailbox_state({
+            'account_id': self.account_id,
+            'mailbox': self.mailbox,
+            'uidvalidity': selected['uidvalidity'],
+            'highestmodseq': modseq,
+            'uidnext': selected['uidnext'],
+            'exists': selected['exists']
+        })
+        result['flags_updated'] = len(updated)
+        result['deleted'] = len(gone)
+        if gone or updated:
+            logging.info(
+                f"🏷️ {self.account_id}/{self.mailbox}: {len(updated)} flag changes, "
+                f"{len(gone)} messages removed ({result['mode']})"
+            )
+        return result
+
+    def _expunged(self, mail, state, selected, stored):
+        """Stored UIDs no longer on the server, skipping the search when the counts rule it out"""
+        if not stored:
+            return set()
+        if state and state['uidnext']:
+            arrived = 0
+            if selected['uidnext'] > state['uidnext']:
+                arrived = len([uid for uid in search_uids(mail, f"UID {state['uidnext']}:*")
+                               if uid >= state['uidnext']])
+            if selected['exists'] == state['exists'] + arrived:
+                return set()
+        return stored - set(search_uids(mail, 'ALL'))
@@ -0,0 +1,144 @@
+"""
+Cross-account message deduplication
+When several team members are on the same thread, every account receives
+its own copy of each message. The dedup index lets the first copy to arrive
+be classified (and notified) once; later copies in other accounts reuse its
+classification and are only linked to their account.
+
+Copies are keyed by normalized Message-ID, or by a hash of sender, subject
+and body for messages without one. A copy only reuses an entry when its
+content hash matches too, so a forged Message-ID cannot pull another
+tenant's classification onto different content. Classifications are only
+reused within a scope (the tenant), because each tenant can override the
+classification rules.
+"""
+
+import re
+import hashlib
+import threading
+import logging
+from email.utils import parseaddr
+from config import DEDUP_WAIT_TIMEOUT
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MESSAGE_ID = re.compile(r'<([^<>\s]+)>')
+
+
+def normalize_message_id(value):
+    """'<Abc@Mail.Example.COM>' -> 'Abc@mail.example.com' (domain part is case-insensitive); None if missing"""
+    if not value or value == 'Unknown':
+        return None
+    match = MESSAGE_ID.search(value)
+    message_id = match.group(1) if match else value.strip()
+    if not message_id:
+        return None
+    local, at, domain = message_id.rpartition('@')
+    return f'{local}@{domain.lower()}' if at else message_id
+
+
+def content_hash(sender, subject, content):
+    """Hash of sender address, subject and whitespace-normalized body"""
+    address = parseaddr(sender or '')[1].lower() or (sender or '').strip().lower()
+    text = '\0'.join([address, ' '.join((subject or '').split()), ' '.join((content or '').split())])
+    return hashlib.sha256(text.encode('utf-8', errors='replace')).hexdigest()
+
+
+def message_key(message_id, body_hash):
+    normalized = normalize_message_id(message_id)
+    return f'mid:{normalized}' if normalized else f'sha256:{body_hash}'
+
+
+class MessageDedupIndex:
+    """
+    Dedup index over ``store`` (python_models.Database: ``get_message_dedup``,
+    ``save_message_dedup``, ``add_message_copy``).
+
+    ``claim`` returns a claim dict; ``claim['key']`` identifies the message
+    across all accounts, while its classification is only shared with
+    claims made for the same ``scope``. When ``claim['classification']`` is set
+    the copy is a duplicate and can skip classification. Otherwise the caller
+    classifies it and passes the result to ``complete`` (or calls
+    ``release`` if classification failed). A copy arriving while the same
+    message is still being classified waits up to ``wait_timeout`` seconds
+    for that result instead of classifying it a second time.
+    """
+
+    def __init__(self, store, wait_timeout=DEDUP_WAIT_TIMEOUT):
+        self.store = store
+        self.wait_timeout = wait_timeout
+        self._inflight = {}  # key -> threading.Event set when its classification is stored
+        self._lock = threading.Lock()
+        self.stats = {'lookups': 0, 'reused': 0, 'waited': 0, 'hash_mismatches': 0}
+
+    def claim(self, message_id, sender, subject, content, scope=None):
+        body_hash = content_hash(sender, subject, content)
+        key = message_key(message_id, body_hash)
+        claim = {
+            'key': key,
+            'entry': key if scope is None else f'{key}#{scope}',  # What the classification is recorded under
+            'hash': body_hash,
+            'classification': None,
+            'owner': False
+        }
+        with self._lock:
+            self.stats['lookups'] += 1
+            waiting = self._inflight.get(claim['entry'])
+        if not waiting:
+            if self._reuse(claim):
+                return claim
+            with self._lock:
+                waiting = self._inflight.get(claim['entry'])
+                if not waiting:
+                    self._inflight[claim['entry']] = threading.Event()
+                    claim['owner'] = True
+                    return claim
+
+        # Another account's copy is being classified right now
+        with self._lock:
+            self.stats['waited'] += 1
+        waiting.wait(self.wait_timeout)
+        self._reuse(claim)
+        return claim
+
+    def _reuse(self, claim):
+        entry = self.store.get_message_dedup(claim['entry'])
+        if not entry:
+            return False
+        if entry['content_hash'] != claim['hash']:
+            with self._lock:
+                self.stats['hash_mismatches'] += 1
+            return False
+        claim['classification'] = {
+            'category': entry['category'],
+            'confidence_score': entry['confidence_score'],
+            'classification_method': 'Duplicate'
+        }
+        self.store.add_message_copy(claim['entry'])
+        with self._lock:
+            self.stats['reused'] += 1
+        return True
+
+    def complete(self, claim, classification):
+        """Record the first copy's classification for later copies"""
+        if claim['owner']:
+            self.store.save_message_dedup({
+                'message_key': claim['entry'],
+                'content_hash': claim['hash'],
+                'category': classification.get('category', 'Uncategorized'),
+                'confidence_score': classification.get('confidence_score', 0.0)
+            })
+        self.release(claim)
+
+    def release(self, claim):
+        """Wake copies waiting on this claim (they classify themselves if nothing was recorded)"""
+        if claim['owner']:
+            with self._lock:
+                event = self._inflight.pop(claim['entry'], None)
+            if event:
+                event.set()
+            claim['owner'] = False
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,172 @@
+"""
+MIME parsing and text extraction
+Turns raw RFC822 bytes into a compact parsed record. ParsePool runs the
+parsing in worker processes so large backfills scale with CPU cores instead
+of being serialised on the GIL of the sync thread.
+"""
+
+import codecs
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from email.header import decode_header
+from email.parser import Parser
+from email import policy
+from multiprocessing import shared_memory
+from html_text import extract_body
+from config import PARSE_WORKERS, PARSE_BATCH_SIZE, PARSE_SHM_THRESHOLD, PARSE_MAX_TEXT_CHARS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+_parser = Parser(policy=policy.compat32)
+
+
+def decode_header_safe(header_value):
+    """Safely decode an email header to text"""
+    if not header_value:
+        return "Unknown"
+    try:
+        decoded = decode_header(header_value)[0][0]
+        if isinstance(decoded, bytes):
+            return decoded.decode('utf-8', errors='replace')
+        return str(decoded)
+    except Exception:
+        return str(header_value)
+
+
+def parse_message(raw):
+    """
+    Parse raw message bytes (or any bytes-like buffer) into a compact record:
+    decoded headers, extracted text (capped at PARSE_MAX_TEXT_CHARS) and sizes.
+    """
+    # Same decoding BytesParser does, but it also takes memoryviews (shared memory slices)
+    msg = _parser.parsestr(codecs.decode(raw, 'ascii', 'surrogateescape'))
+    text = extract_body(msg, PARSE_MAX_TEXT_CHARS)
+    attachments = sum(1 for part in msg.walk() if part.get_filename())
+
+    return {
+        'subject': decode_header_safe(msg.get('Subject')),
+        'sender': decode_header_safe(msg.get('From')),
+        'date': msg.get('Date', ''),
+        'message_id': msg.get('Message-ID'),
+        'in_reply_to': msg.get('In-Reply-To'),
+        'references': msg.get('References'),
+        'text': text,
+        'raw_size': len(raw),
+        'attachments': attachments
+    }
+
+
+def _parse_safe(raw):
+    try:
+        return parse_message(raw)
+    except Exception as e:
+        logging.warning(f"Failed to parse message: {e}")
+        return None
+
+
+def _parse_chunk(raws):
+    """Worker entry point for small chunks sent by value"""
+    return [_parse_safe(raw) for raw in raws]
+
+
+def _parse_shared(shm_name, offsets):
+    """Worker entry point: parse messages from slices of a shared memory block"""
+    # Workers share the parent's resource tracker (forkserver), so the attach
+    # registration is cleared when the parent unlinks the block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        return [_parse_safe(shm.buf[start:end]) for start, end in offsets]
+    finally:
+        shm.close()
+
+
+class ParsePool:
+    """
+    Process pool for MIME parsing.
+
+    ``parse_batch`` splits a batch of raw messages into chunks of
+    ``batch_size`` per worker call. Chunks larger than ``shm_threshold`` bytes
+    are copied into a shared memory block that workers read slices of,
+    instead of pickling every message through a pipe (the worker still
+    copies each slice while decoding it).
+    """
+
+    def __init__(self, workers=PARSE_WORKERS, batch_size=PARSE_BATCH_SIZE, shm_threshold=PARSE_SHM_THRESHOLD):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.shm_threshold = shm_threshold
+        self.executor = None
+        if workers > 0:
+            # forkserver keeps workers from inheriting locks held by sync threads
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('forkserver')
+            )
+
+    def parse(self, raw):
+        return self.parse_batch([raw])[0]
+
+    def parse_batch(self, raws):
+        """Parse raw messages; returns records in the same order (None on failure)"""
+        # A single message (e.g. an IDLE push) parses faster inline than via IPC
+        if not self.executor or len(raws) == 1:
+            return _parse_chunk(raws)
+
+        jobs = []
+        try:
+            for i in range(0, len(raws), self.batch_size):
+                chunk = raws[i:i + self.batch_size]
+                total = sum(len(raw) for raw in chunk)
+                if total >= self.shm_threshold:
+                    shm, offsets = self._pack(chunk, total)
+                    jobs.append((None, shm))  # Tracked before submit, which can raise
+                    jobs[-1] = (self.executor.submit(_parse_shared, shm.name, offsets), shm)
+                else:
+                    jobs.append((self.executor.submit(_parse_chunk, chunk), None))
+
+            records = []
+            for future, _ in jobs:
+                records.extend(future.result())
+            return records
+        finally:
+            # Every block is released, even when a worker (or the pool) failed
+            for future, shm in jobs:
+                if future and not future.done():
+                    future.cancel()
+                    if shm and not future.cancelled():
+                        # A worker may still be reading it; wait before unlinking
+                        try:
+                            future.exception()
+                        except Exception:
+                            pass
+                if shm:
+                    shm.close()
+                    shm.unlink()
+
+    def _pack(self, chunk, total):
+        shm = shared_memory.SharedMemory(create=True, size=total)
+        offsets = []
+        position = 0
+        for raw in chunk:
+            shm.buf[position:position + len(raw)] = raw
+            offsets.append((position, position + len(raw)))
+            position += len(raw)
+        return shm, offsets
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool():
+    """Shared process pool so every sync service in a process reuses the same workers"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParsePool()
+    return _pool
@@ -70,9 +70,22 @@ class Database {
                             return reject(err);
                         }
 
-                        console.log('Database tables initialized');
-                        this.tablesInitialized = true;
-                        resolve();
+                        // Last dashboard visit per user, read by the Python sync scheduler
+                        this.db.run(`
+                            CREATE TABLE IF NOT EXISTS user_activity (
+                                user_id INTEGER PRIMARY KEY,
+                                last_seen_at INTEGER NOT NULL
+                            )
+                        `, (err) => {
+                            if (err) {
+                                console.error('Error creating user_activity table:', err);
+                                return reject(err);
+                            }
+
+                            console.log('Database tables initialized');
+                            this.tablesInitialized = true;
+                            resolve();
+                        });
                     });
                 });
             });
@@ -120,6 +133,20 @@ class Database {
         });
     }
 
+    // Dashboard activity: accounts of active users are polled more often
+    async touchUserActivity(userId) {
+        return new Promise((resolve) => {
+            this.db.run(
+                "INSERT OR REPLACE INTO user_activity (user_id, last_seen_at) VALUES (?, CAST(strftime('%s', 'now') AS INTEGER))",
+                [userId],
+                (err) => {
+                    if (err) console.error('Error recording user activity:', err);
+                    resolve();
+                }
+            );
+        });
+    }
+
     async getAllUsers() {
         return new Promise((resolve, reject) => {
             this.db.all(
@@ -222,16 +249,35 @@ class Database {
         });
     }
 
-    async getUserEmails(userId, limit = 50) {
+    // Sent and Archive mail share the emails table; the Python sync adds the mailbox column.
+    // Pass mailbox = null to read every folder.
+    async mailboxFilter(mailbox) {
+        if (!mailbox) return { clause: '', params: [] };
+        if (!this.hasMailboxColumn) {
+            const columns = await new Promise((resolve, reject) => {
+                this.db.all('PRAGMA table_info(emails)', (err, rows) => {
+                    if (err) reject(err);
+                    else resolve(rows || []);
+                });
+            });
+            this.hasMailboxColumn = columns.some(column => column.name === 'mailbox');
+        }
+        // Before the column exists every stored row came from INBOX
+        if (!this.hasMailboxColumn) return { clause: '', params: [] };
+        return { clause: ' AND e.mailbox = ?', params: [mailbox] };
+    }
+
+    async getUserEmails(userId, limit = 50, mailbox = 'INBOX') {
+        const folder = await this.mailboxFilter(mailbox);
         return new Promise((resolve, reject) => {
             this.db.all(
                 `SELECT e.*, ea.email as account_email 
                  FROM emails e 
                  JOIN email_accounts ea ON e.account_id = ea.id 
-                 WHERE e.user_id = ? 
+                 WHERE e.user_id = ?${folder.clause} 
                  ORDER BY e.date_received DESC 
                  LIMIT ?`,
-                [userId, limit],
+                [userId, ...folder.params, limit],
                 (err, rows) => {
                     if (err) reject(err);
                     else resolve(rows);
@@ -240,15 +286,16 @@ class Database {
         });
     }
 
-    async getUserEmailsByCategory(userId, category) {
+    async getUserEmailsByCategory(userId, category, mailbox = 'INBOX') {
+        const folder = await this.mailboxFilter(mailbox);
         return new Promise((resolve, reject) => {
             this.db.all(
                 `SELECT e.*, ea.email as account_email 
                  FROM emails e 
                  JOIN email_accounts ea ON e.account_id = ea.id 
-                 WHERE e.user_id = ? AND e.category = ? 
+                 WHERE e.user_id = ? AND e.category = ?${folder.clause} 
                  ORDER BY e.date_received DESC`,
-                [userId, category],
+                [userId, category, ...folder.params],
                 (err, rows) => {
                     if (err) reject(err);
                     else resolve(rows);
@@ -258,12 +305,14 @@ class Database {
     }
 
     async searchUserEmails(userId, searchParams = {}) {
+        const mailbox = searchParams.mailbox === 'all' ? null : (searchParams.mailbox || 'INBOX');
+        const folder = await this.mailboxFilter(mailbox);
         return new Promise((resolve, reject) => {
             let query = `SELECT e.*, ea.email as account_email 
                         FROM emails e 
                         JOIN email_accounts ea ON e.account_id = ea.id 
-                        WHERE e.user_id = ?`;
-            let params = [userId];
+                        WHERE e.user_id = ?${folder.clause}`;
+            let params = [userId, ...folder.params];
 
             // Add search filters
             if (searchParams.subject && searchParams.subject.trim()) {
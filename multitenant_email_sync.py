@@ -1,13 +1,31 @@
 import imaplib
 import email
+import socket
 import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from email.header import decode_header
 from email import message_from_bytes
 from python_models import Database
-from email_classifier import classify_single_email
+from email_classifier import classify_single_email, notify_if_interested
+from sync_pool import AccountSyncPool
+from sync_jobs import SyncJobQueue, ON_DEMAND, PERIODIC
+from ingest_pipeline import IngestPipeline
+from backfill import BackfillJob, fetch_messages, search_uids, backfill_connections
+from mailbox_state import MailboxStateSync, enable_qresync
+from folders import FolderSyncPlanner
+from message_dedup import MessageDedupIndex
+from thread_index import ThreadIndex
+from mime_parser import get_parse_pool
+from imap_throttle import open_imap, backoff_delay, get_throttle_stats
+from imap_pool import IMAPConnectionPool
+from html_text import extract_body
+from config import (
+    IMAP_TIMEOUT, INGEST_PARSE_BATCH_SIZE, BACKFILL_DAYS, BACKFILL_TIME_BUDGET, SYNC_ON_DEMAND_WORKERS,
+    DEDUP_ENABLED, THREADING_ENABLED
+)
 import os
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,11 +34,34 @@ class MultiTenantEmailSyncService:
     def __init__(self):
         self.db = Database()
         self.active_connections = {}
+        self.last_sync_info = {}  # account_id -> new mail and backfill state of its last sync
+        self.pending_uids = {}  # (account_id, mailbox) -> UIDs fetched but not yet stored by the pipeline
+        self.pending_changed = threading.Condition()  # Guards pending_uids; notified as UIDs are stored
+        self.folder_planner = FolderSyncPlanner()
+        # Team members CC'd on the same thread: classify and notify each message once
+        self.dedup = MessageDedupIndex(self.db) if DEDUP_ENABLED else None
+        self.threads = ThreadIndex(self.db) if THREADING_ENABLED else None
         self.sync_threads = []
         self.running = True
-        self.sync_days = 30  # Sync last 30 days of emails
+        self.sync_days = BACKFILL_DAYS  # History to import per mailbox
         self.idle_timeout = 300  # 5 minutes
         self.reconnect_delay = 30  # 30 seconds
+        self.sync_pool = AccountSyncPool()
+        # On-demand syncs get their own threads so they never queue behind a periodic batch
+        self.on_demand_pool = AccountSyncPool(max_workers=SYNC_ON_DEMAND_WORKERS)
+        # Logged-in sessions are reused across cycles instead of a LOGIN per account per cycle
+        self.imap_pool = IMAPConnectionPool(self.connect_to_imap)
+        self.pipeline = IngestPipeline(
+            parse=self.parse_item,
+            classify=self.classify_item,
+            persist=self.persist_item,
+            notify=self.notify_item,
+            parse_batch_size=INGEST_PARSE_BATCH_SIZE
+        )
+        self.pipeline.start()
+        # Every account sync goes through one coalescing queue (one sync per account at a time)
+        self.sync_jobs = SyncJobQueue(self.sync_accounts)
+        self.sync_jobs.start()
     
     def decode_header_safe(self, header_value):
         """Safely decode email headers"""
@@ -39,14 +80,13 @@ class MultiTenantEmailSyncService:
     def connect_to_imap(self, account):
         """Connect to IMAP server for a specific email account"""
         try:
-            # Create IMAP connection
-            if account['imap_port'] == 993:
-                mail = imaplib.IMAP4_SSL(account['imap_host'], account['imap_port'])
-            else:
-                mail = imaplib.IMAP4(account['imap_host'], account['imap_port'])
-            
-            # Login
-            mail.login(account['email'], account['password'])
+            # Connect and log in, rate limited per IMAP host and retried if throttled
+            mail = open_imap(
+                account['imap_host'], account['imap_port'], account['email'], account['password'],
+                use_ssl=account['imap_port'] == 993, timeout=IMAP_TIMEOUT
+            )
+            # Flag changes and deletions are synced incrementally where the server allows
+            enable_qresync(mail)
             logging.info(f"Connected to IMAP for {account['email']}")
             return mail
             
@@ -55,127 +95,344 @@ class MultiTenantEmailSyncService:
             return None
     
     def sync_emails_for_account(self, account):
-        """Sync emails for a specific user account"""
+        """
+        Sync one account: INBOX every cycle, plus whichever of its other
+        folders (Sent, Archive, ...) are due. Folders run concurrently on
+        their own pooled sessions, sharing the provider's per-account
+        connection budget.
+        """
         emails_synced = 0
+        mail = None
+        healthy = False
+        executor = None
         try:
-            mail = self.connect_to_imap(account)
+            mail = self.imap_pool.checkout(account)
             if not mail:
                 return emails_synced
+            self.active_connections[account['id']] = [mail]
+            deadline = time.monotonic() + BACKFILL_TIME_BUDGET
             
-            # Select INBOX
-            mail.select('INBOX')
+            folders = self.folder_planner.due(account['id'], self.folder_planner.folders_for(account, mail))
+            budget = backfill_connections(account['imap_host'])
+            concurrent = min(len(folders), budget)
+            share = max(1, budget // concurrent)  # Backfill connections per folder
             
-            # Calculate date range
-            since_date = (datetime.now() - timedelta(days=self.sync_days)).strftime("%d-%b-%Y")
+            # Other folders on their own sessions while INBOX uses this one
+            futures = {}
+            if concurrent > 1:
+                executor = ThreadPoolExecutor(max_workers=concurrent - 1, thread_name_prefix=f"folders-{account['id']}")
+                futures = {
+                    executor.submit(self.sync_folder_on_new_session, account, folder, deadline, share): folder
+                    for folder in folders[1:]
+                }
+            inbox = self.sync_folder(account, mail, folders[0], deadline, share)
+            results = [inbox]
+            if concurrent == 1:
+                for folder in folders[1:]:
+                    results.append(self.sync_folder(account, mail, folder, deadline, share))
+            for future in futures:
+                result = future.result()
+                if result:
+                    results.append(result)
             
-            # Search for emails since the date
-            status, messages = mail.search(None, f'(SINCE "{since_date}")')
+            for result in results:
+                emails_synced += result['queued']
+                if result['role'] != 'inbox':
+                    self.folder_planner.record(account['id'], result['mailbox'], result['changed'])
+            healthy = True
+            self.last_sync_info[account['id']] = {
+                'new_messages': inbox['new_messages'],
+                'backfill_pending': any(result['backfill_pending'] for result in results)
+            }
             
-            if status != 'OK':
-                logging.error(f"Failed to search emails for {account['email']}")
-                return emails_synced
+            logging.info(
+                f"Email sync completed for {account['email']}. Queued {emails_synced} new emails "
+                f"from {len(results)} folder(s)."
+            )
             
-            email_ids = messages[0].split()
-            logging.info(f"Found {len(email_ids)} emails for {account['email']}")
+        except Exception as e:
+            logging.error(f"Email sync failed for {account['email']}: {e}")
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+            self.active_connections.pop(account['id'], None)
+            # Keep the session for the next cycle unless something went wrong on it
+            self.imap_pool.checkin(account, mail, healthy=healthy)
+        
+        return emails_synced
+    
+    def sync_folder_on_new_session(self, account, folder, deadline, connections):
+        """sync_folder() on a pooled session of its own; a failing folder doesn't fail the account"""
+        conn = self.imap_pool.checkout(account)
+        if not conn:
+            return None
+        self.active_connections.setdefault(account['id'], []).append(conn)
+        healthy = False
+        try:
+            result = self.sync_folder(account, conn, folder, deadline, connections)
+            healthy = True
+            return result
+        except Exception as e:
+            logging.warning(f"Sync of {folder['name']} failed for {account['email']}: {e}")
+            return None
+        finally:
+            self.imap_pool.checkin(account, conn, healthy=healthy)
+    
+    def sync_folder(self, account, mail, folder, deadline, connections=1):
+        """
+        Sync one folder over ``mail``: new mail first, then another slice of
+        the newest-first history backfill (resumed from its checkpoint), then
+        flag changes and deletions since the last sync
+        """
+        mailbox = folder['name']
+        with self.pending_changed:
+            pending = self.pending_uids.setdefault((account['id'], mailbox), set())
+        queued = 0
+        
+        def submit(uid, raw, on_done=None):
+            # Hand the raw message to the ingest pipeline; parsing, classification
+            # and storage happen on their own workers while we keep fetching
+            with self.pending_changed:
+                pending.add(uid)
             
-            # Process emails
-            for i, email_id in enumerate(email_ids[-100:]):  # Limit to last 100 emails for demo
-                try:
-                    # Check if email already exists
-                    existing_email = self.db.get_email_by_uid(account['user_id'], account['id'], email_id.decode())
-                    if existing_email:
-                        continue
-                    
-                    # Fetch email
-                    status, msg_data = mail.fetch(email_id, '(RFC822)')
-                    if status != 'OK':
-                        continue
-                    
-                    # Parse email
-                    email_message = message_from_bytes(msg_data[0][1])
-                    
-                    # Extract email data
-                    subject = self.decode_header_safe(email_message.get('Subject', ''))
-                    sender = self.decode_header_safe(email_message.get('From', ''))
-                    date_str = email_message.get('Date', '')
-                    
-                    # Get email body
-                    body = self.extract_email_body(email_message)
-                    
-                    # Classify email using AI
-                    try:
-                        email_data_for_classification = {
-                            'subject': subject,
-                            'content': body,
-                            'sender': sender
-                        }
-                        classification_result = classify_single_email(email_data_for_classification)
-                        category = classification_result.get('category', 'Uncategorized')
-                        confidence = classification_result.get('confidence', 0.0)
-                    except Exception as e:
-                        logging.warning(f"Classification failed: {e}")
-                        category, confidence = "Uncategorized", 0.0
-                    
-                    # Store email in database
-                    email_data = {
-                        'user_id': account['user_id'],
-                        'account_id': account['id'],
-                        'uid': email_id.decode(),
-                        'subject': subject,
-                        'sender': sender,
-                        'content': body,
-                        'category': category,
-                        'confidence_score': confidence,
-                        'date_received': date_str
-                    }
-                    
-                    self.db.store_email(email_data)
-                    emails_synced += 1
-                    
-                    if i % 10 == 0:
-                        logging.info(f"Processed {i+1}/{len(email_ids[-100:])} emails for {account['email']}")
-                
-                except Exception as e:
-                    logging.error(f"Error processing email {email_id} for {account['email']}: {e}")
-                    continue
+            def stored():
+                with self.pending_changed:
+                    pending.discard(uid)
+                    self.pending_changed.notify_all()
+                # A row that failed to store must not move the backfill checkpoint past it
+                if on_done and not item.get('store_failed'):
+                    on_done()
             
+            item = {
+                'account': account,
+                'mailbox': mailbox,
+                'folder_role': folder['role'],
+                'uid': str(uid),
+                'raw': raw,
+                'on_done': stored
+            }
+            self.pipeline.submit(item)
+        
+        # Selects the folder and loads its checkpoint
+        job = BackfillJob(self.db, account['id'], submit, mailbox=mailbox, days=self.sync_days)
+        remaining = job.prepare(mail)
+        
+        # New mail: everything above both the backfill window and what we stored,
+        # except what an earlier cycle fetched and the pipeline hasn't stored yet.
+        # Snapshot in-flight UIDs first: anything stored after that is in get_max_uid
+        with self.pending_changed:
+            in_flight = set(pending)
+        last_uid = max(job.high_uid, self.db.get_max_uid(account['id'], mailbox))
+        new_uids = [
+            uid for uid in search_uids(mail, f'UID {last_uid + 1}:*')
+            if uid > last_uid and uid not in in_flight
+        ]
+        for i in range(0, len(new_uids), job.batch_size):
+            for uid, raw in fetch_messages(mail, new_uids[i:i + job.batch_size]):
+                submit(uid, raw)
+                queued += 1
+        
+        # History, newest first, until done or out of time for this cycle;
+        # large folders fetch UID ranges over several connections
+        queued += job.run(
+            mail, deadline=deadline, remaining=remaining,
+            connect=lambda: self.imap_pool.checkout(account),
+            connections=connections,
+            release=lambda conn, ok: self.imap_pool.checkin(account, conn, healthy=ok)
+        )
+        
+        # Read/unread and other flag changes, and messages deleted or moved away
+        changes = {'flags_updated': 0, 'deleted': 0}
+        try:
+            changes = MailboxStateSync(self.db, account['id'], mailbox).run(mail, job.selected, pending)
+        except imaplib.IMAP4.abort:
+            raise
+        except (imaplib.IMAP4.error, RuntimeError) as e:
+            logging.warning(f"Mailbox state sync of {mailbox} failed for {account['email']}: {e}")
+        
+        return {
+            'mailbox': mailbox,
+            'role': folder['role'],
+            'queued': queued,
+            'new_messages': len(new_uids),
+            'backfill_pending': job.remaining_uids > 0,
+            'changed': bool(queued or changes['flags_updated'] or changes['deleted'])
+        }
+    
+    def disconnect_imap(self, mail):
+        """Close the selected mailbox and log out, ignoring errors"""
+        try:
             mail.close()
+        except Exception:
+            pass
+        try:
             mail.logout()
-            logging.info(f"Email sync completed for {account['email']}. Synced {emails_synced} new emails.")
-            
+        except Exception:
+            pass
+    
+    def abort_account_sync(self, account):
+        """Unblock a hung account sync by shutting down its IMAP socket"""
+        for mail in list(self.active_connections.get(account['id'], [])):
+            try:
+                mail.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    
+    def parse_item(self, items):
+        """Ingest parse stage: a batch of raw RFC822 bytes -> stored fields, parsed in the process pool"""
+        records = get_parse_pool().parse_batch([item.pop('raw') for item in items])
+        parsed = []
+        for item, record in zip(items, records):
+            if record is None:
+                logging.warning(f"Could not parse email {item['uid']}, skipping")
+                parsed.append(None)
+                continue
+            item['fields'] = {
+                'subject': record['subject'],
+                'sender': record['sender'],
+                'date_received': record['date'],
+                'message_id': record['message_id'],
+                'in_reply_to': record['in_reply_to'],
+                'references': record['references'],
+                'content': record['text'][:5000]
+            }
+            parsed.append(item)
+        return parsed
+    
+    def thread_item(self, item):
+        """Add the message to its account's conversation thread; returns the thread (None if threading is off)"""
+        if not self.threads:
+            return None
+        fields = item['fields']
+        try:
+            thread = self.threads.add_message(
+                item['account']['id'], fields['message_id'], fields['in_reply_to'], fields['references'],
+                fields['subject']
+            )
         except Exception as e:
-            logging.error(f"Email sync failed for {account['email']}: {e}")
-        
-        return emails_synced
+            logging.warning(f"Threading failed: {e}")
+            return None
+        item['thread_id'] = thread['id']
+        return thread
+    
+    def classify_item(self, item):
+        """Ingest classify stage (notifications are sent by the notify stage)"""
+        fields = item['fields']
+        thread = self.thread_item(item)
+        if item.get('folder_role') == 'sent':
+            # Our own replies are kept for thread context, not lead classification
+            item['classification'] = {'category': 'Sent', 'confidence_score': 1.0}
+            return item
+        claim = None
+        if self.dedup:
+            # Scoped to the tenant: another tenant's rules may classify the same message differently
+            claim = self.dedup.claim(fields['message_id'], fields['sender'], fields['subject'], fields['content'],
+                                     scope=f"user:{item['account']['user_id']}")
+            item['message_key'] = claim['key']
+            if claim['classification']:
+                # Already classified (and notified) for another of the tenant's accounts: just link this copy
+                item['classification'] = claim['classification']
+                item['duplicate'] = True
+                if thread:
+                    self.threads.record_category(thread['id'], item['classification'])
+                return item
+        email_data = {
+            'user_id': item['account']['user_id'],  # Selects the tenant's classification rules
+            'subject': fields['subject'],
+            'content': fields['content'],
+            'sender': fields['sender']
+        }
+        if thread and thread['message_count'] > 1:
+            # Earlier messages of the conversation inform this one's classification
+            email_data['thread_category'] = thread['category']
+            email_data['thread_confidence'] = thread['confidence_score']
+            email_data['thread_history'] = self.threads.history(thread['id'])
+        try:
+            item['classification'] = classify_single_email(email_data, notify=False)
+            if claim:
+                self.dedup.complete(claim, item['classification'])
+            if thread:
+                self.threads.record_category(thread['id'], item['classification'])
+        except Exception as e:
+            logging.warning(f"Classification failed: {e}")
+            item['classification'] = {'category': 'Uncategorized', 'confidence_score': 0.0}
+        finally:
+            if claim:
+                self.dedup.release(claim)
+        return item
+    
+    def persist_item(self, item):
+        """Ingest persist stage: store the classified email"""
+        account, fields, classification = item['account'], item['fields'], item['classification']
+        email_data = {
+            'user_id': account['user_id'],
+            'account_id': account['id'],
+            'uid': item['uid'],
+            'subject': fields['subject'],
+            'sender': fields['sender'],
+            'content': fields['content'],
+            'category': classification.get('category', 'Uncategorized'),
+            'confidence_score': classification.get('confidence_score', 0.0),
+            'classification_method': classification.get('classification_method'),
+            'date_received': fields['date_received'],
+            'mailbox': item.get('mailbox', 'INBOX'),
+            'message_key': item.get('message_key')
+        }
+        if self.threads and item.get('thread_id'):
+            # The thread may have been merged into another since classification
+            with self.threads.locked(account['id']):
+                email_data['thread_id'] = self.threads.resolve(item['thread_id'])
+                email_id = self.db.store_email(email_data)
+        else:
+            email_id = self.db.store_email(email_data)
+        if email_id is None:
+            # Raised so the pipeline counts an error and skips notify
+            item['store_failed'] = True
+            raise RuntimeError(f"email {account['id']}/{email_data['mailbox']}/{item['uid']} was not stored")
+        return item
+    
+    def notify_item(self, item):
+        """Ingest notify stage: Slack/webhook for Interested emails arriving in INBOX"""
+        if item.get('folder_role', 'inbox') == 'inbox' and not item.get('duplicate'):
+            notify_if_interested(item['fields'], item['classification'])
     
     def extract_email_body(self, email_message):
         """Extract email body from email message"""
-        body = ""
-        
-        if email_message.is_multipart():
-            for part in email_message.walk():
-                content_type = part.get_content_type()
-                if content_type == "text/plain":
-                    try:
-                        body = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                        break
-                    except:
-                        continue
-                elif content_type == "text/html" and not body:
-                    try:
-                        body = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                    except:
-                        continue
-        else:
-            try:
-                body = email_message.get_payload(decode=True).decode('utf-8', errors='replace')
-            except:
-                body = str(email_message.get_payload())
-        
-        return body[:5000]  # Limit body length
+        return extract_body(email_message, max_chars=5000)  # Limit body length
+    
+    def sync_accounts(self, accounts, on_demand=False):
+        """Sync a set of accounts in parallel now; returns {account_id: emails_synced or exception}"""
+        self.imap_pool.evict_idle()
+        pool = self.on_demand_pool if on_demand else self.sync_pool
+        return pool.run(accounts, self.sync_emails_for_account, on_timeout=self.abort_account_sync)
     
-    def sync_user_accounts(self, user_id):
-        """Sync all email accounts for a specific user"""
+    def request_sync(self, accounts, user_id=None, on_demand=False, on_complete=None):
+        """
+        Queue a sync of ``accounts`` and return the SyncJob. Accounts already
+        queued or syncing are joined rather than synced twice; on-demand
+        requests run ahead of periodic ones.
+        """
+        priority = ON_DEMAND if on_demand else PERIODIC
+        return self.sync_jobs.submit(accounts, user_id=user_id, priority=priority, on_complete=on_complete)
+    
+    def get_sync_job(self, job_id):
+        """Status of a queued/finished sync job (None once expired or unknown)"""
+        job = self.sync_jobs.get(job_id)
+        if not job:
+            return None
+        status = job.to_dict()
+        if status['status'] == 'done':
+            status['summary'] = self._summarize(job.accounts, job.results)
+        return status
+    
+    def sync_user_accounts(self, user_id, wait=True, claim=None):
+        """
+        Sync all email accounts for a specific user, ahead of periodic syncs.
+        With ``wait=False`` returns at once with the job id to poll.
+        ``claim(account_ids)`` returns the ids this process may sync (those
+        it holds a lease on, see account_leases.py); the other accounts are
+        left to the worker that holds them.
+        """
         try:
             accounts = self.db.get_user_email_accounts(user_id)
             
@@ -183,55 +440,128 @@ class MultiTenantEmailSyncService:
                 logging.info(f"No email accounts found for user {user_id}")
                 return {'success': True, 'emails_synced': 0, 'message': 'No email accounts found'}
             
-            logging.info(f"Starting sync for user {user_id} with {len(accounts)} accounts")
+            active_accounts = [a for a in accounts if a['is_active']]
+            skipped = 0
+            if claim:
+                allowed = claim([a['id'] for a in active_accounts])
+                skipped = sum(1 for a in active_accounts if a['id'] not in allowed)
+                active_accounts = [a for a in active_accounts if a['id'] in allowed]
+                if skipped:
+                    logging.info(f"{skipped} of user {user_id}'s accounts are synced by the worker holding their lease")
+            logging.info(f"Starting sync for user {user_id} with {len(active_accounts)} accounts")
             
-            total_emails_synced = 0
+            account_ids = {a['id'] for a in active_accounts}
+            already_in_flight = self.in_flight(account_ids)
+            job = self.request_sync(active_accounts, user_id=user_id, on_demand=True)
+            if not wait:
+                return {'success': True, 'job_id': job.id, 'status': job.status, 'coalesced': job.coalesced,
+                        'accounts_skipped': skipped}
             
-            for account in accounts:
-                if not account['is_active']:
-                    continue
-                
-                logging.info(f"Syncing emails for {account['email']}")
-                emails_synced = self.sync_emails_for_account(account)
-                total_emails_synced += emails_synced
+            results = job.wait(timeout=self.sync_pool.account_timeout * 2)
+            summary = self._summarize(active_accounts, results)
+            summary['job_id'] = job.id
+            summary['accounts_skipped'] = skipped
             
-            logging.info(f"Sync completed for user {user_id}. Total emails synced: {total_emails_synced}")
+            # On-demand syncs return once the emails this sync fetched are stored,
+            # without waiting behind other tenants' items in the shared pipeline
+            submitted = self.in_flight(account_ids) - already_in_flight
+            self.wait_until_stored(submitted, timeout=self.sync_pool.account_timeout)
             
-            return {
-                'success': True, 
-                'emails_synced': total_emails_synced,
-                'accounts_synced': len([a for a in accounts if a['is_active']]),
-                'message': f'Successfully synced {total_emails_synced} emails from {len([a for a in accounts if a["is_active"]])} accounts'
-            }
+            logging.info(f"Sync completed for user {user_id}. Total emails synced: {summary['emails_synced']}")
+            return summary
             
         except Exception as e:
             logging.error(f"Failed to sync accounts for user {user_id}: {e}")
             return {'success': False, 'error': str(e), 'emails_synced': 0}
     
-    def sync_all_users(self):
-        """Sync emails for all users in the system"""
+    def sync_all_users(self, users=None):
+        """
+        Sync emails for all users in the system in one parallel cycle.
+        Returns {user_id: summary} in the same format as sync_user_accounts.
+        """
         try:
-            users = self.db.get_all_users()
+            users = users if users is not None else self.db.get_all_users()
             
+            accounts_by_user = {}
             for user in users:
-                logging.info(f"Starting sync for user: {user['email']}")
-                self.sync_user_accounts(user['id'])
-                
-                # Small delay between users to prevent overwhelming
-                time.sleep(2)
+                accounts_by_user[user['id']] = [
+                    a for a in self.db.get_user_email_accounts(user['id']) if a['is_active']
+                ]
             
+            all_accounts = [a for accounts in accounts_by_user.values() for a in accounts]
+            logging.info(f"Starting sync for {len(users)} users ({len(all_accounts)} accounts)")
+            
+            # One queued job for every account so a slow server only delays its own tenant
+            results = self.request_sync(all_accounts).wait()
+            
+            summaries = {
+                user_id: self._summarize(accounts, results)
+                for user_id, accounts in accounts_by_user.items()
+            }
             logging.info("Completed sync for all users")
+            return summaries
             
         except Exception as e:
             logging.error(f"Failed to sync all users: {e}")
+            return {}
+    
+    def in_flight(self, account_ids):
+        """{((account_id, mailbox), uid)} fetched for these accounts but not yet stored"""
+        with self.pending_changed:
+            return {
+                (key, uid) for key, uids in self.pending_uids.items() if key[0] in account_ids for uid in uids
+            }
+    
+    def wait_until_stored(self, items, timeout=None):
+        """Block until every ((account_id, mailbox), uid) in ``items`` has left the pipeline"""
+        remaining = list(items)
+        
+        def stored():
+            while remaining and remaining[-1][1] not in self.pending_uids.get(remaining[-1][0], ()):
+                remaining.pop()
+            return not remaining
+        
+        with self.pending_changed:
+            return self.pending_changed.wait_for(stored, timeout)
+    
+    def get_pipeline_metrics(self):
+        """Queue depth, throughput and backpressure per ingest stage"""
+        return self.pipeline.get_metrics()
+    
+    def get_connection_pool_stats(self):
+        """Open, idle and reused IMAP sessions"""
+        return self.imap_pool.get_stats()
+    
+    def get_throttle_stats(self):
+        """Per-IMAP-host request counters and time spent waiting or backing off"""
+        return get_throttle_stats()
+    
+    def _summarize(self, accounts, results):
+        """Build the per-user result dict from per-account pool results"""
+        synced = [results.get(a['id']) for a in accounts]
+        total_emails_synced = sum(r for r in synced if isinstance(r, int))
+        errors = [f"{a['email']}: {r}" for a, r in zip(accounts, synced) if isinstance(r, Exception)]
+        accounts_synced = len(accounts) - len(errors)
+        
+        summary = {
+            'success': not errors or accounts_synced > 0,
+            'emails_synced': total_emails_synced,
+            'accounts_synced': accounts_synced,
+            'message': f'Successfully synced {total_emails_synced} emails from {accounts_synced} accounts'
+        }
+        if errors:
+            summary['error'] = '; '.join(errors)
+        return summary
     
     def start_periodic_sync(self, interval_minutes=30):
         """Start periodic sync for all users"""
         def sync_loop():
+            failures = 0
             while self.running:
                 try:
                     logging.info("Starting periodic sync for all users")
                     self.sync_all_users()
+                    failures = 0
                     logging.info(f"Sleeping for {interval_minutes} minutes")
                     
                     # Sleep in small chunks to allow for clean shutdown
@@ -241,8 +571,10 @@ class MultiTenantEmailSyncService:
                         time.sleep(1)
                         
                 except Exception as e:
-                    logging.error(f"Error in sync loop: {e}")
-                    time.sleep(60)  # Wait 1 minute before retrying
+                    failures += 1
+                    delay = backoff_delay(failures)
+                    logging.error(f"Error in sync loop: {e}; retrying in {delay:.0f}s")
+                    time.sleep(delay)
         
         sync_thread = threading.Thread(target=sync_loop, daemon=True)
         sync_thread.start()
@@ -252,6 +584,11 @@ class MultiTenantEmailSyncService:
     def stop(self):
         """Stop the sync service"""
         self.running = False
+        self.sync_jobs.stop()
+        self.sync_pool.shutdown()
+        self.on_demand_pool.shutdown()
+        self.pipeline.stop()
+        self.imap_pool.close_all()
         logging.info("Email sync service stopped")
 
 def main():
@@ -3,6 +3,32 @@ import bcrypt
 import logging
 from datetime import datetime
 
+# UIDs are only unique within one folder of one account
+EMAILS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS emails (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        account_id INTEGER NOT NULL,
+        uid TEXT NOT NULL,
+        subject TEXT,
+        sender TEXT,
+        content TEXT,
+        category TEXT,
+        confidence_score REAL,
+        date_received TEXT,
+        raw_message TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        flags TEXT,
+        mailbox TEXT NOT NULL DEFAULT 'INBOX',
+        message_key TEXT,
+        thread_id INTEGER,
+        classification_method TEXT,
+        UNIQUE(account_id, mailbox, uid),
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (account_id) REFERENCES email_accounts(id)
+    )
+'''
+
 class Database:
     def __init__(self, db_path='reachinbox.db'):
         self.db_path = db_path
@@ -42,23 +68,121 @@ class Database:
             ''')
             
             # Create emails table
+            cursor.execute(EMAILS_TABLE)
+            
+            # Backfill progress per mailbox (see backfill.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+                    account_key TEXT NOT NULL,
+                    mailbox TEXT NOT NULL,
+                    uidvalidity INTEGER NOT NULL,
+                    high_uid INTEGER NOT NULL,
+                    low_uid INTEGER,
+                    days INTEGER NOT NULL,
+                    fetched INTEGER DEFAULT 0,
+                    status TEXT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (account_key, mailbox)
+                )
+            ''')
+            
+            # Last dashboard visit per user (written by the web app, read by the sync scheduler)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_activity (
+                    user_id INTEGER PRIMARY KEY,
+                    last_seen_at INTEGER NOT NULL
+                )
+            ''')
+            
+            # Flag/deletion sync position per mailbox (see mailbox_state.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS mailbox_state (
+                    account_id INTEGER NOT NULL,
+                    mailbox TEXT NOT NULL,
+                    uidvalidity INTEGER NOT NULL,
+                    highestmodseq INTEGER DEFAULT 0,
+                    uidnext INTEGER DEFAULT 0,
+                    message_count INTEGER DEFAULT 0,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (account_id, mailbox)
+                )
+            ''')
+            
+            # One entry per distinct message across accounts (see message_dedup.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS message_dedup (
+                    message_key TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    category TEXT,
+                    confidence_score REAL,
+                    copies INTEGER DEFAULT 1,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Classifications by normalized content (see classification_cache.py); times are Unix seconds
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS emails (
+                CREATE TABLE IF NOT EXISTS classification_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    category TEXT NOT NULL,
+                    confidence_score REAL,
+                    hits INTEGER DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_classification_cache_used ON classification_cache(last_used_at)')
+            
+            # Trained local classification models (see local_classifier.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS local_models (
+                    name TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    trained_through INTEGER DEFAULT 0,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Conversation threads per account (see thread_index.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS threads (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
                     account_id INTEGER NOT NULL,
-                    uid TEXT NOT NULL,
                     subject TEXT,
-                    sender TEXT,
-                    content TEXT,
+                    message_count INTEGER DEFAULT 0,
                     category TEXT,
                     confidence_score REAL,
-                    date_received TEXT,
-                    raw_message TEXT,
+                    category_updated_at DATETIME,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(account_id, uid),
-                    FOREIGN KEY (user_id) REFERENCES users(id),
-                    FOREIGN KEY (account_id) REFERENCES email_accounts(id)
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Every Message-ID seen in an account's headers -> its thread
+            # (placeholder = referenced but not received yet)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS thread_messages (
+                    account_id INTEGER NOT NULL,
+                    message_id TEXT NOT NULL,
+                    thread_id INTEGER NOT NULL,
+                    parent_id TEXT,
+                    placeholder INTEGER DEFAULT 0,
+                    PRIMARY KEY (account_id, message_id)
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_thread_messages_thread ON thread_messages(thread_id)')
+            
+            # Offline archive import progress per source file/directory (see mail_importer.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS import_checkpoints (
+                    account_id INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    mailbox TEXT NOT NULL,
+                    position TEXT,
+                    imported INTEGER DEFAULT 0,
+                    status TEXT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (account_id, source)
                 )
             ''')
             
@@ -88,6 +212,56 @@ class Database:
                 cursor.execute('ALTER TABLE emails ADD COLUMN raw_message TEXT')
                 conn.commit()
             
+            if 'flags' not in columns:
+                logging.info("Adding flags column to emails table")
+                cursor.execute('ALTER TABLE emails ADD COLUMN flags TEXT')
+                conn.commit()
+            
+            if 'message_key' not in columns and 'mailbox' in columns:
+                logging.info("Adding message_key column to emails table")
+                cursor.execute('ALTER TABLE emails ADD COLUMN message_key TEXT')
+                conn.commit()
+            
+            if 'thread_id' not in columns and 'mailbox' in columns:
+                logging.info("Adding thread_id column to emails table")
+                cursor.execute('ALTER TABLE emails ADD COLUMN thread_id INTEGER')
+                conn.commit()
+            
+            if 'classification_method' not in columns and 'mailbox' in columns:
+                logging.info("Adding classification_method column to emails table")
+                cursor.execute('ALTER TABLE emails ADD COLUMN classification_method TEXT')
+                conn.commit()
+            
+            if 'mailbox' not in columns:
+                # UNIQUE(account_id, uid) must become per folder, which needs a table rebuild
+                logging.info("Rebuilding emails table with a mailbox column")
+                cursor.execute('PRAGMA table_info(emails)')
+                old_columns = cursor.fetchall()
+                cursor.execute('ALTER TABLE emails RENAME TO emails_old')
+                cursor.execute(EMAILS_TABLE)
+                cursor.execute('PRAGMA table_info(emails)')
+                new_columns = {row[1] for row in cursor.fetchall()}
+                # Keep columns other writers (e.g. the Node app) added
+                for _, name, column_type, _, default, _ in old_columns:
+                    if name not in new_columns:
+                        constant = default is not None and not default.upper().startswith('CURRENT_')
+                        default_sql = f' DEFAULT {default}' if constant else ''
+                        cursor.execute(f'ALTER TABLE emails ADD COLUMN {name} {column_type}{default_sql}')
+                column_list = ', '.join(row[1] for row in old_columns)
+                cursor.execute(f'INSERT OR IGNORE INTO emails ({column_list}) SELECT {column_list} FROM emails_old')
+                cursor.execute('DROP TABLE emails_old')
+                conn.commit()
+            
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_message_key ON emails(message_key)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_thread ON emails(thread_id)')
+            conn.commit()
+            
+            cursor.execute("PRAGMA table_info(email_accounts)")
+            if 'sync_folders' not in [row[1] for row in cursor.fetchall()]:
+                logging.info("Adding sync_folders column to email_accounts table")
+                cursor.execute('ALTER TABLE email_accounts ADD COLUMN sync_folders TEXT')
+                conn.commit()
+            
             conn.close()
             logging.info("Database migrations completed")
             
@@ -124,7 +298,7 @@ class Database:
             conn = self.get_connection()
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, user_id, email, imap_host, imap_port, password, provider, is_active 
+                SELECT id, user_id, email, imap_host, imap_port, password, provider, is_active, sync_folders
                 FROM email_accounts 
                 WHERE user_id = ? AND is_active = 1
             ''', (user_id,))
@@ -139,7 +313,8 @@ class Database:
                     'imap_port': row[4],
                     'password': row[5],
                     'provider': row[6],
-                    'is_active': row[7]
+                    'is_active': row[7],
+                    'sync_folders': row[8]
                 })
             conn.close()
             return accounts
@@ -147,15 +322,641 @@ class Database:
             logging.error(f"Failed to get email accounts for user {user_id}: {e}")
             return []
     
-    def get_email_by_uid(self, user_id, account_id, uid):
+    def get_all_active_email_accounts(self):
+        """Get every active email account across all users"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, email, imap_host, imap_port, password, provider, is_active, sync_folders
+                FROM email_accounts 
+                WHERE is_active = 1
+            ''')
+            
+            accounts = []
+            for row in cursor.fetchall():
+                accounts.append({
+                    'id': row[0],
+                    'user_id': row[1],
+                    'email': row[2],
+                    'imap_host': row[3],
+                    'imap_port': row[4],
+                    'password': row[5],
+                    'provider': row[6],
+                    'is_active': row[7],
+                    'sync_folders': row[8]
+                })
+            conn.close()
+            return accounts
+        except Exception as e:
+            logging.error(f"Failed to get active email accounts: {e}")
+            return []
+    
+    def get_max_uid(self, account_id, mailbox='INBOX'):
+        """Get the highest stored IMAP UID for an account's folder (0 if none)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT MAX(CAST(uid AS INTEGER)) FROM emails WHERE account_id = ? AND mailbox = ?
+            ''', (account_id, mailbox))
+            
+            result = cursor.fetchone()
+            conn.close()
+            return result[0] or 0
+        except Exception as e:
+            logging.error(f"Failed to get max UID for account {account_id}: {e}")
+            return 0
+    
+    def get_backfill_checkpoint(self, account_key, mailbox='INBOX'):
+        """Get the backfill checkpoint for a mailbox (None if never started)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT account_key, mailbox, uidvalidity, high_uid, low_uid, days, fetched, status
+                FROM backfill_checkpoints WHERE account_key = ? AND mailbox = ?
+            ''', (str(account_key), mailbox))
+            
+            row = cursor.fetchone()
+            conn.close()
+            if not row:
+                return None
+            return {
+                'account_key': row[0],
+                'mailbox': row[1],
+                'uidvalidity': row[2],
+                'high_uid': row[3],
+                'low_uid': row[4],
+                'days': row[5],
+                'fetched': row[6],
+                'status': row[7]
+            }
+        except Exception as e:
+            logging.error(f"Failed to get backfill checkpoint for {account_key}: {e}")
+            return None
+    
+    def save_backfill_checkpoint(self, checkpoint):
+        """Insert or update a backfill checkpoint"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO backfill_checkpoints
+                (account_key, mailbox, uidvalidity, high_uid, low_uid, days, fetched, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                str(checkpoint['account_key']), checkpoint['mailbox'], checkpoint['uidvalidity'],
+                checkpoint['high_uid'], checkpoint['low_uid'], checkpoint['days'],
+                checkpoint['fetched'], checkpoint['status'], datetime.now().isoformat()
+            ))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to save backfill checkpoint for {checkpoint.get('account_key')}: {e}")
+            return False
+    
+    def get_mailbox_state(self, account_id, mailbox='INBOX'):
+        """Get the flag/deletion sync state of a mailbox (None if never synced)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT uidvalidity, highestmodseq, uidnext, message_count
+                FROM mailbox_state WHERE account_id = ? AND mailbox = ?
+            ''', (account_id, mailbox))
+            
+            row = cursor.fetchone()
+            conn.close()
+            if not row:
+                return None
+            return {
+                'account_id': account_id,
+                'mailbox': mailbox,
+                'uidvalidity': row[0],
+                'highestmodseq': row[1],
+                'uidnext': row[2],
+                'exists': row[3]
+            }
+        except Exception as e:
+            logging.error(f"Failed to get mailbox state for account {account_id}: {e}")
+            return None
+    
+    def save_mailbox_state(self, state):
+        """Insert or update a mailbox's flag/deletion sync state"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO mailbox_state
+                (account_id, mailbox, uidvalidity, highestmodseq, uidnext, message_count, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                state['account_id'], state['mailbox'], state['uidvalidity'], state['highestmodseq'],
+                state['uidnext'], state['exists'], datetime.now().isoformat()
+            ))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to save mailbox state for account {state.get('account_id')}: {e}")
+            return False
+    
+    def get_account_uids(self, account_id, mailbox='INBOX'):
+        """All stored IMAP UIDs for an account's folder, as ints"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT uid FROM emails WHERE account_id = ? AND mailbox = ?', (account_id, mailbox))
+            
+            uids = {int(row[0]) for row in cursor.fetchall() if str(row[0]).isdigit()}
+            conn.close()
+            return uids
+        except Exception as e:
+            logging.error(f"Failed to get UIDs for account {account_id}: {e}")
+            return set()
+    
+    def update_email_flags(self, account_id, flags_by_uid, mailbox='INBOX'):
+        """Set IMAP flags of stored emails; returns the UIDs that were stored and updated"""
+        if not flags_by_uid:
+            return set()
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            updated = set()
+            for uid, flags in flags_by_uid.items():
+                cursor.execute('''
+                    UPDATE emails SET flags = ? WHERE account_id = ? AND mailbox = ? AND uid = ?
+                ''', (flags, account_id, mailbox, str(uid)))
+                if cursor.rowcount:
+                    updated.add(uid)
+            
+            conn.commit()
+            conn.close()
+            return updated
+        except Exception as e:
+            logging.error(f"Failed to update flags for account {account_id}: {e}")
+            return set()
+    
+    def delete_emails_by_uid(self, account_id, uids, mailbox='INBOX'):
+        """Remove emails that were expunged or moved out of the folder on the server"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.executemany(
+                'DELETE FROM emails WHERE account_id = ? AND mailbox = ? AND uid = ?',
+                [(account_id, mailbox, str(uid)) for uid in uids]
+            )
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to delete emails for account {account_id}: {e}")
+            return False
+    
+    def get_message_dedup(self, message_key):
+        """Get the dedup entry of a message seen in any account (None if new)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT message_key, content_hash, category, confidence_score, copies
+                FROM message_dedup WHERE message_key = ?
+            ''', (message_key,))
+            
+            row = cursor.fetchone()
+            conn.close()
+            if not row:
+                return None
+            return {
+                'message_key': row[0],
+                'content_hash': row[1],
+                'category': row[2],
+                'confidence_score': row[3],
+                'copies': row[4]
+            }
+        except Exception as e:
+            logging.error(f"Failed to get dedup entry {message_key}: {e}")
+            return None
+    
+    def save_message_dedup(self, entry):
+        """Record a message's first classified copy (an existing entry is kept)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR IGNORE INTO message_dedup (message_key, content_hash, category, confidence_score)
+                VALUES (?, ?, ?, ?)
+            ''', (entry['message_key'], entry['content_hash'], entry['category'], entry['confidence_score']))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to save dedup entry {entry.get('message_key')}: {e}")
+            return False
+    
+    def add_message_copy(self, message_key):
+        """Count another account's copy of a known message"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('UPDATE message_dedup SET copies = copies + 1 WHERE message_key = ?', (message_key,))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to count copy of {message_key}: {e}")
+            return False
+    
+    def get_cached_classification(self, cache_key, created_after=0):
+        """Get a cached classification stored after ``created_after`` (None if missing or expired)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT category, confidence_score, created_at FROM classification_cache
+                WHERE cache_key = ? AND created_at > ?
+            ''', (cache_key, created_after))
+            
+            row = cursor.fetchone()
+            conn.close()
+            if not row:
+                return None
+            return {'category': row[0], 'confidence_score': row[1], 'created_at': row[2]}
+        except Exception as e:
+            logging.error(f"Failed to get cached classification {cache_key}: {e}")
+            return None
+    
+    def save_cached_classification(self, cache_key, category, confidence_score, now):
+        """Cache a classification (replacing an older one for the same key)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO classification_cache
+                (cache_key, category, confidence_score, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (cache_key, category, confidence_score, now, now))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to cache classification {cache_key}: {e}")
+            return False
+    
+    def touch_cached_classifications(self, used):
+        """Record cache hits: ``used`` maps cache_key -> (hits, last used time)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.executemany('''
+                UPDATE classification_cache SET hits = hits + ?, last_used_at = MAX(last_used_at, ?)
+                WHERE cache_key = ?
+            ''', [(hits, last_used, key) for key, (hits, last_used) in used.items()])
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to record classification cache hits: {e}")
+            return False
+    
+    def evict_cached_classifications(self, created_before, max_entries):
+        """Delete expired entries, then the least recently used beyond ``max_entries``; returns the count"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM classification_cache WHERE created_at <= ?', (created_before,))
+            cursor.execute('''
+                DELETE FROM classification_cache WHERE cache_key IN (
+                    SELECT cache_key FROM classification_cache
+                    ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (max_entries,))
+            
+            deleted = conn.total_changes
+            conn.commit()
+            conn.close()
+            return deleted
+        except Exception as e:
+            logging.error(f"Failed to evict cached classifications: {e}")
+            return 0
+    
+    def get_labelled_emails(self, after_id, categories, min_confidence, limit=1000):
+        """Emails stored after ``after_id`` with a category in ``categories``, oldest first"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT id, subject, sender, content, category, confidence_score, classification_method
+                FROM emails
+                WHERE id > ? AND category IN ({', '.join('?' * len(categories))}) AND confidence_score >= ?
+                ORDER BY id LIMIT ?
+            ''', (after_id, *categories, min_confidence, limit))
+            
+            rows = cursor.fetchall()
+            conn.close()
+            return [{
+                'id': row[0],
+                'subject': row[1],
+                'sender': row[2],
+                'content': row[3],
+                'category': row[4],
+                'confidence_score': row[5],
+                'classification_method': row[6]
+            } for row in rows]
+        except Exception as e:
+            logging.error(f"Failed to get labelled emails: {e}")
+            return []
+    
+    def get_local_model(self, name):
+        """Saved model state: {'state': JSON text, 'trained_through': email id} or None"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT state, trained_through FROM local_models WHERE name = ?', (name,))
+            row = cursor.fetchone()
+            conn.close()
+            return {'state': row[0], 'trained_through': row[1]} if row else None
+        except Exception as e:
+            logging.error(f"Failed to get local model {name}: {e}")
+            return None
+    
+    def save_local_model(self, name, state, trained_through):
+        """Save a model's state (JSON text) and the last email id it learned from"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO local_models (name, state, trained_through, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (name, state, trained_through))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to save local model {name}: {e}")
+            return False
+    
+    def get_thread_ids(self, account_id, message_ids):
+        """Thread of each known Message-ID of an account: {message_id: thread_id}"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            message_ids = list(message_ids)
+            found = {}
+            for i in range(0, len(message_ids), 500):
+                chunk = message_ids[i:i + 500]
+                cursor.execute(f'''
+                    SELECT message_id, thread_id FROM thread_messages
+                    WHERE account_id = ? AND message_id IN ({', '.join('?' * len(chunk))})
+                ''', (account_id, *chunk))
+                found.update(cursor.fetchall())
+            conn.close()
+            return found
+        except Exception as e:
+            logging.error(f"Failed to look up threads for account {account_id}: {e}")
+            return {}
+    
+    def create_thread(self, account_id, subject):
+        """Start an empty thread; returns its id"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO threads (account_id, subject) VALUES (?, ?)', (account_id, subject))
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+    
+    def merge_threads(self, thread_id, other_ids):
+        """Move the other threads' messages into ``thread_id`` and drop them, in one transaction"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            placeholders = ', '.join('?' * len(other_ids))
+            cursor.execute(f'''
+                SELECT id, message_count, category, confidence_score, category_updated_at
+                FROM threads WHERE id IN (?, {placeholders})
+            ''', (thread_id, *other_ids))
+            rows = cursor.fetchall()
+            # The most recently classified message decides the merged thread's category
+            latest = max((row for row in rows if row[2]), key=lambda row: row[4] or '', default=None)
+            cursor.execute(f'UPDATE thread_messages SET thread_id = ? WHERE thread_id IN ({placeholders})',
+                           (thread_id, *other_ids))
+            cursor.execute(f'UPDATE emails SET thread_id = ? WHERE thread_id IN ({placeholders})',
+                           (thread_id, *other_ids))
+            cursor.execute('''
+                UPDATE threads SET message_count = ?, category = ?, confidence_score = ?, category_updated_at = ?,
+                    updated_at = ?
+                WHERE id = ?
+            ''', (
+                sum(row[1] for row in rows), latest[2] if latest else None, latest[3] if latest else None,
+                latest[4] if latest else None, datetime.now().isoformat(), thread_id
+            ))
+            cursor.execute(f'DELETE FROM threads WHERE id IN ({placeholders})', tuple(other_ids))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def add_thread_message(self, account_id, thread_id, message_id, parent_id=None, placeholders=()):
+        """
+        Add a received message (``message_id`` may be None) and the not yet
+        seen Message-IDs it references to a thread. A message already
+        received (e.g. the same mail in two folders) is not counted twice.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT OR IGNORE INTO thread_messages (account_id, message_id, thread_id, placeholder)
+                VALUES (?, ?, ?, 1)
+            ''', [(account_id, mid, thread_id) for mid in placeholders])
+            received = 1
+            if message_id:
+                cursor.execute('''
+                    INSERT INTO thread_messages (account_id, message_id, thread_id, parent_id, placeholder)
+                    VALUES (?, ?, ?, ?, 0)
+                    ON CONFLICT(account_id, message_id) DO UPDATE SET placeholder = 0, parent_id = excluded.parent_id
+                    WHERE placeholder = 1
+                ''', (account_id, message_id, thread_id, parent_id))
+                received = cursor.rowcount
+            cursor.execute('''
+                UPDATE threads SET message_count = message_count + ?, updated_at = ? WHERE id = ?
+            ''', (received, datetime.now().isoformat(), thread_id))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def get_thread(self, thread_id):
+        """A thread's subject, size and category state (None if unknown)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, account_id, subject, message_count, category, confidence_score
+                FROM threads WHERE id = ?
+            ''', (thread_id,))
+            
+            row = cursor.fetchone()
+            conn.close()
+            if not row:
+                return None
+            return {
+                'id': row[0],
+                'account_id': row[1],
+                'subject': row[2],
+                'message_count': row[3],
+                'category': row[4],
+                'confidence_score': row[5]
+            }
+        except Exception as e:
+            logging.error(f"Failed to get thread {thread_id}: {e}")
+            return None
+    
+    def get_thread_emails(self, thread_id):
+        """Stored emails of a thread in arrival order"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, uid, mailbox, subject, sender, content, category, confidence_score, date_received
+                FROM emails WHERE thread_id = ? ORDER BY id
+            ''', (thread_id,))
+            
+            emails = [{
+                'id': row[0],
+                'uid': row[1],
+                'mailbox': row[2],
+                'subject': row[3],
+                'sender': row[4],
+                'content': row[5],
+                'category': row[6],
+                'confidence_score': row[7],
+                'date_received': row[8]
+            } for row in cursor.fetchall()]
+            conn.close()
+            return emails
+        except Exception as e:
+            logging.error(f"Failed to get emails of thread {thread_id}: {e}")
+            return []
+    
+    def set_thread_category(self, thread_id, category, confidence_score):
+        """Record the latest classified category of a thread"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            now = datetime.now().isoformat()
+            cursor.execute('''
+                UPDATE threads SET category = ?, confidence_score = ?, category_updated_at = ?, updated_at = ?
+                WHERE id = ?
+            ''', (category, confidence_score, now, now, thread_id))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to set category of thread {thread_id}: {e}")
+            return False
+    
+    def get_import_checkpoint(self, account_id, source):
+        """Get the import checkpoint for an archive source (None if never started)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT account_id, source, mailbox, position, imported, status
+                FROM import_checkpoints WHERE account_id = ? AND source = ?
+            ''', (account_id, source))
+            
+            row = cursor.fetchone()
+            conn.close()
+            if not row:
+                return None
+            return {
+                'account_id': row[0],
+                'source': row[1],
+                'mailbox': row[2],
+                'position': row[3],
+                'imported': row[4],
+                'status': row[5]
+            }
+        except Exception as e:
+            logging.error(f"Failed to get import checkpoint for {source}: {e}")
+            return None
+    
+    def save_import_checkpoint(self, checkpoint):
+        """Insert or update an import checkpoint"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO import_checkpoints
+                (account_id, source, mailbox, position, imported, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                checkpoint['account_id'], checkpoint['source'], checkpoint['mailbox'], checkpoint['position'],
+                checkpoint['imported'], checkpoint['status'], datetime.now().isoformat()
+            ))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to save import checkpoint for {checkpoint.get('source')}: {e}")
+            return False
+    
+    def touch_user_activity(self, user_id):
+        """Record that a user is looking at the dashboard right now"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO user_activity (user_id, last_seen_at)
+                VALUES (?, CAST(strftime('%s', 'now') AS INTEGER))
+            ''', (user_id,))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to record activity for user {user_id}: {e}")
+            return False
+    
+    def get_recently_active_user_ids(self, within_seconds):
+        """IDs of users seen in the dashboard in the last ``within_seconds``"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id FROM user_activity
+                WHERE last_seen_at >= CAST(strftime('%s', 'now') AS INTEGER) - ?
+            ''', (int(within_seconds),))
+            
+            user_ids = {row[0] for row in cursor.fetchall()}
+            conn.close()
+            return user_ids
+        except Exception as e:
+            logging.error(f"Failed to get active users: {e}")
+            return set()
+    
+    def get_email_by_uid(self, user_id, account_id, uid, mailbox='INBOX'):
         """Check if email already exists"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id FROM emails 
-                WHERE user_id = ? AND account_id = ? AND uid = ?
-            ''', (user_id, account_id, uid))
+                WHERE user_id = ? AND account_id = ? AND mailbox = ? AND uid = ?
+            ''', (user_id, account_id, mailbox, uid))
             
             result = cursor.fetchone()
             conn.close()
@@ -165,15 +966,25 @@ class Database:
             return False
     
     def store_email(self, email_data):
-        """Store email in database"""
+        """
+        Store email in database and return its row id. A row already stored
+        for the same account, mailbox and uid keeps its id, flags and other
+        columns; only its classification is updated.
+        """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
+            mailbox = email_data.get('mailbox', 'INBOX')
             
             cursor.execute('''
-                INSERT OR REPLACE INTO emails 
-                (user_id, account_id, uid, subject, sender, content, category, confidence_score, date_received, raw_message)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO emails 
+                (user_id, account_id, uid, subject, sender, content, category, confidence_score, date_received, raw_message,
+                 mailbox, flags, message_key, thread_id, classification_method)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(account_id, mailbox, uid) DO UPDATE SET
+                    category = excluded.category,
+                    confidence_score = excluded.confidence_score,
+                    classification_method = excluded.classification_method
             ''', (
                 email_data['user_id'],
                 email_data['account_id'],
@@ -184,11 +995,21 @@ class Database:
                 email_data['category'],
                 email_data['confidence_score'],
                 email_data['date_received'],
-                email_data.get('raw_message', '')
+                email_data.get('raw_message', ''),
+                mailbox,
+                email_data.get('flags'),
+                email_data.get('message_key'),
+                email_data.get('thread_id'),
+                email_data.get('classification_method')
             ))
+            # lastrowid is not set when the row was updated instead
+            cursor.execute(
+                'SELECT id FROM emails WHERE account_id = ? AND mailbox = ? AND uid = ?',
+                (email_data['account_id'], mailbox, email_data['uid'])
+            )
+            email_id = cursor.fetchone()[0]
             
             conn.commit()
-            email_id = cursor.lastrowid
             conn.close()
             
             logging.info(f"Stored email: {email_data['subject'][:50]}... (Category: {email_data['category']})")
@@ -198,19 +1019,64 @@ class Database:
             logging.error(f"Failed to store email: {e}")
             return None
     
-    def get_user_emails(self, user_id, limit=50):
-        """Get user's emails"""
+    def store_emails_bulk(self, emails):
+        """
+        Store many emails in one transaction; rows already stored (same
+        account, mailbox and uid) are left as they are. Returns the number of
+        rows inserted, or None if the batch failed.
+        """
+        if not emails:
+            return 0
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
-            cursor.execute('''
+            before = conn.total_changes
+            cursor.executemany('''
+                INSERT OR IGNORE INTO emails
+                (user_id, account_id, uid, subject, sender, content, category, confidence_score, date_received, raw_message,
+                 mailbox, flags, message_key, thread_id, classification_method)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                email_data['user_id'],
+                email_data['account_id'],
+                email_data['uid'],
+                email_data['subject'],
+                email_data['sender'],
+                email_data['content'],
+                email_data['category'],
+                email_data['confidence_score'],
+                email_data['date_received'],
+                email_data.get('raw_message', ''),
+                email_data.get('mailbox', 'INBOX'),
+                email_data.get('flags'),
+                email_data.get('message_key'),
+                email_data.get('thread_id'),
+                email_data.get('classification_method')
+            ) for email_data in emails])
+            
+            conn.commit()
+            inserted = conn.total_changes - before
+            conn.close()
+            return inserted
+            
+        except Exception as e:
+            logging.error(f"Failed to store {len(emails)} emails: {e}")
+            return None
+    
+    def get_user_emails(self, user_id, limit=50, mailbox='INBOX'):
+        """Get user's emails from one mailbox (mailbox=None for every folder)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            folder_filter = 'AND e.mailbox = ?' if mailbox else ''
+            cursor.execute(f'''
                 SELECT e.*, ea.email as account_email 
                 FROM emails e 
                 JOIN email_accounts ea ON e.account_id = ea.id 
-                WHERE e.user_id = ? 
+                WHERE e.user_id = ? {folder_filter}
                 ORDER BY e.date_received DESC 
                 LIMIT ?
-            ''', (user_id, limit))
+            ''', (user_id, mailbox, limit) if mailbox else (user_id, limit))
             
             emails = []
             for row in cursor.fetchall():
@@ -225,7 +1091,7 @@ class Database:
                     'category': row[7],
                     'confidence_score': row[8],
                     'date_received': row[9],
-                    'account_email': row[11]
+                    'account_email': row[-1]
                 })
             conn.close()
             return emails
@@ -233,18 +1099,19 @@ class Database:
             logging.error(f"Failed to get user emails: {e}")
             return []
     
-    def get_emails_by_category(self, user_id, category):
-        """Get user's emails by category"""
+    def get_emails_by_category(self, user_id, category, mailbox='INBOX'):
+        """Get user's emails by category (mailbox=None for every folder)"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
-            cursor.execute('''
+            folder_filter = 'AND e.mailbox = ?' if mailbox else ''
+            cursor.execute(f'''
                 SELECT e.*, ea.email as account_email 
                 FROM emails e 
                 JOIN email_accounts ea ON e.account_id = ea.id 
-                WHERE e.user_id = ? AND e.category = ?
+                WHERE e.user_id = ? AND e.category = ? {folder_filter}
                 ORDER BY e.date_received DESC
-            ''', (user_id, category))
+            ''', (user_id, category, mailbox) if mailbox else (user_id, category))
             
             emails = []
             for row in cursor.fetchall():
@@ -259,7 +1126,7 @@ class Database:
                     'category': row[7],
                     'confidence_score': row[8],
                     'date_received': row[9],
-                    'account_email': row[11]
+                    'account_email': row[-1]
                 })
             conn.close()
             return emails
@@ -3,25 +3,41 @@ import time
 import logging
 from datetime import datetime, timedelta
 from multitenant_email_sync import MultiTenantEmailSyncService
+from email_classifier import classifier as email_classifier
 from python_models import Database
+from imap_throttle import backoff_delay
+from sync_scheduler import AdaptiveSyncScheduler
+from account_leases import AccountLeaseManager, create_lease_backend
+from config import ACCOUNT_REFRESH_INTERVAL, SCHEDULER_ACTIVE_WINDOW, SCHEDULER_TICK, STATS_LOG_INTERVAL
 import os
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class RealTimeEmailSyncManager:
     """
-    Real-time email sync manager that automatically syncs emails for all users
+    Real-time email sync manager that automatically syncs emails for all users.
+    Each account is polled on its own adaptive schedule (see sync_scheduler.py).
+    Several managers can run in separate processes: each syncs only the
+    accounts it holds a lease on (see account_leases.py).
     """
     def __init__(self):
         self.db = Database()
         self.sync_service = MultiTenantEmailSyncService()
         self.running = False
         self.sync_thread = None
-        self.sync_interval = int(os.getenv('SYNC_INTERVAL_MINUTES', 5)) * 60  # Default 5 minutes
+        self.scheduler = AdaptiveSyncScheduler()
+        self.leases = AccountLeaseManager(
+            create_lease_backend(db_path=self.db.db_path),
+            self.db.get_all_active_email_accounts,
+            busy_fn=lambda: self.scheduler.in_flight_ids() | self.sync_service.sync_jobs.account_ids()
+        )
         self.auto_sync_enabled = os.getenv('AUTO_SYNC_ENABLED', 'true').lower() == 'true'
         
         logging.info(f"🔄 Auto-sync enabled: {self.auto_sync_enabled}")
-        logging.info(f"⏰ Sync interval: {self.sync_interval // 60} minutes")
+        logging.info(
+            f"⏰ Adaptive sync intervals: {self.scheduler.min_interval}s-{self.scheduler.max_interval}s "
+            f"(new accounts {self.scheduler.default_interval // 60} minutes)"
+        )
     
     def start_auto_sync(self):
         """Start the automatic email synchronization"""
@@ -34,6 +50,11 @@ class RealTimeEmailSyncManager:
             return
         
         self.running = True
+        self.leases.start()
+        if email_classifier.local_model:
+            email_classifier.local_model.start()
+        if email_classifier.knn:
+            email_classifier.knn.start()
         self.sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
         self.sync_thread.start()
         logging.info("🚀 Real-time email sync started")
@@ -43,65 +64,168 @@ class RealTimeEmailSyncManager:
         self.running = False
         if self.sync_thread:
             self.sync_thread.join()
+        self.leases.stop()
+        if email_classifier.local_model:
+            email_classifier.local_model.close()
+        if email_classifier.knn:
+            email_classifier.knn.close()
         logging.info("⏹️ Real-time email sync stopped")
     
     def _sync_loop(self):
-        """Main sync loop that runs continuously"""
+        """Main loop: sync whichever accounts are due, then sleep until the next one is"""
+        failures = 0
+        next_refresh = 0
+        next_stats = time.monotonic() + STATS_LOG_INTERVAL
         while self.running:
             try:
-                self._sync_all_users()
+                # Leased accounts change on failover and rebalancing, so track them every tick
+                self.scheduler.update_accounts(self.leases.held_accounts())
+                if time.monotonic() >= next_refresh:
+                    self._refresh_active_users()
+                    next_refresh = time.monotonic() + ACCOUNT_REFRESH_INTERVAL
+                if time.monotonic() >= next_stats:
+                    self.log_stats()
+                    next_stats = time.monotonic() + STATS_LOG_INTERVAL
                 
-                # Wait for next sync interval
-                for _ in range(self.sync_interval):
-                    if not self.running:
-                        break
-                    time.sleep(1)
+                due = self.scheduler.pop_due()
+                if due:
+                    self._sync_accounts(due)
+                failures = 0
+                
+                wait = self.scheduler.seconds_until_next()
+                wait = SCHEDULER_TICK if wait is None else min(wait, SCHEDULER_TICK)
+                time.sleep(max(wait, 0.1))
                     
             except Exception as e:
-                logging.error(f"Error in sync loop: {e}")
-                time.sleep(30)  # Wait 30 seconds before retrying on error
+                failures += 1
+                delay = backoff_delay(failures)
+                logging.error(f"Error in sync loop: {e}; retrying in {delay:.0f}s")
+                time.sleep(delay)
     
-    def _sync_all_users(self):
-        """Sync emails for all users who have email accounts"""
-        try:
-            # Get all users who have email accounts
-            users_with_accounts = self.db.get_all_users_with_email_accounts()
-            
-            if not users_with_accounts:
-                logging.info("No users with email accounts found")
-                return
-            
-            logging.info(f"🔄 Starting sync for {len(users_with_accounts)} users")
-            
-            for user in users_with_accounts:
-                try:
-                    user_id = user['id']
-                    user_email = user['email']
-                    
-                    logging.info(f"📧 Syncing emails for user: {user_email} (ID: {user_id})")
-                    
-                    # Sync this user's email accounts
-                    result = self.sync_service.sync_user_accounts(user_id)
-                    
-                    if result.get('success'):
-                        emails_synced = result.get('emails_synced', 0)
-                        logging.info(f"✅ Synced {emails_synced} emails for {user_email}")
-                    else:
-                        error = result.get('error', 'Unknown error')
-                        logging.error(f"❌ Sync failed for {user_email}: {error}")
-                        
-                except Exception as e:
-                    logging.error(f"❌ Error syncing user {user.get('email', 'unknown')}: {e}")
-                    
-        except Exception as e:
-            logging.error(f"❌ Error in _sync_all_users: {e}")
+    def _refresh_active_users(self):
+        """Pick up who is on the dashboard"""
+        self.scheduler.set_active_users(self.db.get_recently_active_user_ids(SCHEDULER_ACTIVE_WINDOW))
     
-    def sync_user_immediately(self, user_id):
-        """Immediately sync emails for a specific user (when they add an account)"""
+    def _sync_accounts(self, accounts):
+        """Queue the due accounts as one periodic job; they are rescheduled when it finishes"""
+        leased = []
+        for account in accounts:
+            if self.leases.holds(account['id']):
+                leased.append(account)
+            else:
+                self.scheduler.defer(account['id'])  # Lease lapsed; dropped at the next tick unless renewed
+        if not leased:
+            return
+        logging.info(f"🔄 Syncing {len(leased)} due accounts")
+        self.sync_service.request_sync(leased, on_complete=self._record_results)
+    
+    def _record_results(self, job):
+        """Feed each account's outcome back to the scheduler"""
+        for account in job.accounts:
+            result = job.results.get(account['id'])
+            info = self.sync_service.last_sync_info.pop(account['id'], {})
+            failed = not isinstance(result, int)
+            interval = self.scheduler.record(
+                account['id'],
+                new_messages=info.get('new_messages', 0),
+                error=failed,
+                backfill_pending=info.get('backfill_pending', False)
+            )
+            if interval is None:
+                continue  # Account removed meanwhile
+            if failed:
+                logging.error(f"❌ Sync failed for {account['email']}: {result}; next try in {interval:.0f}s")
+            else:
+                logging.info(f"✅ Synced {result} emails for {account['email']}; next poll in {interval:.0f}s")
+    
+    def get_stats(self):
+        """Snapshot of the sync service, scheduler, lease and classifier counters"""
+        return {
+            'pipeline': self.sync_service.get_pipeline_metrics(),
+            'connection_pool': self.sync_service.get_connection_pool_stats(),
+            'throttle': self.sync_service.get_throttle_stats(),
+            'scheduler': self.scheduler.get_stats(),
+            'leases': self.leases.get_stats(),
+            'dedup': self.sync_service.dedup.get_stats() if self.sync_service.dedup else None,
+            'threads': self.sync_service.threads.get_stats() if self.sync_service.threads else None,
+            'cache': email_classifier.cache.get_stats() if email_classifier.cache else None,
+            'local_model': email_classifier.local_model.describe() if email_classifier.local_model else None,
+            'knn': email_classifier.knn.describe() if email_classifier.knn else None,
+            'sync_jobs': self.sync_service.sync_jobs.get_stats(),
+        }
+    
+    def log_stats(self):
+        """Log a summary of get_stats(); called every STATS_LOG_INTERVAL seconds by the sync loop"""
+        snapshot = self.get_stats()
+        metrics = snapshot['pipeline']
+        logging.info("🚰 Ingest queues: " + ", ".join(
+            f"{name}={stage['depth']}/{stage['capacity']}" for name, stage in metrics.items()
+        ))
+        pool = snapshot['connection_pool']
+        logging.info(
+            f"🔌 IMAP sessions: {pool['open']} open ({pool['idle']} idle), "
+            f"{pool['reused']} reused, {pool['created']} logins, {pool['evicted_idle']} evicted idle"
+        )
+        for host, stats in snapshot['throttle'].items():
+            waits = stats['wait_seconds']
+            logging.info(
+                f"🐢 {host}: {stats['logins']} logins, {stats['commands']} commands, "
+                f"{stats['bytes'] // 1024} KB; waited login {waits['login']:.1f}s / "
+                f"command {waits['command']:.1f}s / bytes {waits['bytes']:.1f}s, "
+                f"throttled {stats['throttled']}x ({stats['backoff_seconds']:.1f}s backoff)"
+            )
+        stats = snapshot['scheduler']
+        logging.info(
+            f"📅 Scheduler: {stats['accounts']} accounts, mean interval {stats['mean_interval']}s, "
+            f"{stats['failing']} failing, {stats['active_users']} active users"
+        )
+        leases = snapshot['leases']
+        logging.info(
+            f"🪪 Worker {leases['worker_id']}: {leases['held']} leased accounts, {leases['workers']} live workers, "
+            f"{leases['lost']} leases lost"
+        )
+        dedup = snapshot['dedup']
+        if dedup:
+            logging.info(
+                f"🧬 Dedup: {dedup['reused']} of {dedup['lookups']} messages reused another account's "
+                f"classification, {dedup['waited']} waited on one in flight"
+            )
+        threads = snapshot['threads']
+        if threads:
+            logging.info(
+                f"🧵 Threads: {threads['messages']} messages threaded, {threads['threads_created']} new threads, "
+                f"{threads['merges']} merged"
+            )
+        cache = snapshot['cache']
+        if cache:
+            logging.info(
+                f"🗃️ Classification cache: {cache['hits']} hits, {cache['misses']} misses "
+                f"(hit rate {cache['hit_rate']:.0%}), {cache['evicted']} evicted"
+            )
+        if snapshot['local_model']:
+            logging.info(f"🧠 Local model: {snapshot['local_model']}")
+        if snapshot['knn']:
+            logging.info(f"🧭 kNN classifier: {snapshot['knn']}")
+        jobs = snapshot['sync_jobs']
+        logging.info(
+            f"🧾 Sync jobs: {jobs['queued']} queued, {jobs['running']} running, "
+            f"{jobs['coalesced']} of {jobs['requested']} account requests coalesced"
+        )
+    
+    def sync_user_immediately(self, user_id, wait=True):
+        """
+        Immediately sync emails for a specific user (when they add an account).
+        Runs ahead of scheduled syncs and joins any sync of the same accounts
+        already in progress; with ``wait=False`` returns the job id at once.
+        Only accounts this worker holds (or can lease now) are synced here, so
+        an account never has two active syncers.
+        """
         try:
             logging.info(f"🚀 Immediate sync requested for user ID: {user_id}")
             
-            result = self.sync_service.sync_user_accounts(user_id)
+            result = self.sync_service.sync_user_accounts(user_id, wait=wait, claim=self.leases.claim)
+            if not wait:
+                return result
             
             if result.get('success'):
                 emails_synced = result.get('emails_synced', 0)
@@ -116,6 +240,10 @@ class RealTimeEmailSyncManager:
             logging.error(f"❌ Error in immediate sync: {e}")
             return {'success': False, 'error': str(e)}
 
+    def get_sync_job(self, job_id):
+        """Status (and summary once finished) of an immediate or scheduled sync job"""
+        return self.sync_service.get_sync_job(job_id)
+
 # Global instance
 email_sync_manager = RealTimeEmailSyncManager()
 
@@ -127,9 +255,17 @@ def stop_email_sync_service():
     """Stop the email sync service"""
     email_sync_manager.stop_auto_sync()
 
-def sync_user_now(user_id):
+def sync_user_now(user_id, wait=True):
     """Sync a specific user immediately"""
-    return email_sync_manager.sync_user_immediately(user_id)
+    return email_sync_manager.sync_user_immediately(user_id, wait=wait)
+
+def get_sync_job(job_id):
+    """Look up a sync job returned by sync_user_now(..., wait=False)"""
+    return email_sync_manager.get_sync_job(job_id)
+
+def get_sync_stats():
+    """Current sync, scheduler and classifier counters"""
+    return email_sync_manager.get_stats()
 
 if __name__ == "__main__":
     # Test the sync manager
@@ -0,0 +1,135 @@
+"""
+Quoted-reply and signature stripping
+In reply threads most of an email body is quoted history, client
+boilerplate and signatures. clean_reply() keeps only what the sender wrote
+in this message, so the classifier prompt and RAG embeddings see the signal
+instead of the thread, and reports how many characters were removed.
+"""
+
+import re
+
+# "On Mon, 1 Jan 2024 at 10:00, Jane <jane@x.com> wrote:" (often wrapped over
+# two lines by the client) and the common localized variants
+ATTRIBUTION = re.compile(
+    r'^\s*(?:On\s.{0,200}?\bwrote|Le\s.{0,200}?\ba écrit|Am\s.{0,200}?\bschrieb'
+    r'|El\s.{0,200}?\bescribió|Il giorno\s.{0,200}?\bha scritto)\s*:\s*$',
+    re.I | re.S
+)
+# Outlook / Exchange reply separators
+ORIGINAL_MESSAGE = re.compile(r'^\s*-{2,}\s*Original Message\s*-{2,}\s*$', re.I)
+UNDERSCORE_RULE = re.compile(r'^\s*_{20,}\s*$')
+HEADER_BLOCK_START = re.compile(r'^\s*\*?From:\*?\s', re.I)
+HEADER_BLOCK_NEXT = re.compile(r'^\s*\*?(Sent|Date|To|Subject|Cc):\*?\s', re.I)
+# RFC 3676 signature delimiter ("-- ") and mobile client footers
+SIGNATURE_DELIMITER = re.compile(r'^-- \r?$')
+CLIENT_FOOTER = re.compile(
+    r'^\s*(Sent from my \w+|Sent from (Mail|Outlook|Yahoo Mail) for \w+|Get Outlook for \w+'
+    r'|Sent via \w+|Sent from my mobile device)',
+    re.I
+)
+# A sign-off line is only the closing phrase, optionally followed by
+# punctuation and a short name ("Regards, Jane"), never the start of a sentence
+SIGN_OFF = re.compile(
+    r'^\s*(regards|(best|kind|warm)\s+(regards|wishes))\s*([,!.]\s*(\w+\.?(\s+\w+\.?)?)?)?\s*$'
+    r'|^\s*(thanks|thank you|many thanks|cheers|sincerely|best|all the best|talk soon|yours truly)\s*[,!.]?\s*$',
+    re.I
+)
+
+# A sign-off only starts the signature if it is this close to the end and
+# followed by short lines (name, title, phone...)
+SIGNATURE_MAX_LINES = 8
+SIGNATURE_MAX_LINE_LENGTH = 60
+
+
+def _quote_start(lines):
+    """Index of the first line of quoted history, or None"""
+    for i, line in enumerate(lines):
+        if ORIGINAL_MESSAGE.match(line):
+            return i
+        if UNDERSCORE_RULE.match(line) and i + 1 < len(lines) and HEADER_BLOCK_START.match(lines[i + 1]):
+            return i
+        if HEADER_BLOCK_START.match(line) and i + 1 < len(lines) and HEADER_BLOCK_NEXT.match(lines[i + 1]):
+            return i
+        # Attribution lines are sometimes wrapped; try this line and this + next
+        if ATTRIBUTION.match(line):
+            return i
+        if i + 1 < len(lines) and ATTRIBUTION.match(line + ' ' + lines[i + 1]):
+            return i
+    return None
+
+
+def _signature_start(lines):
+    """Index of the first signature line, or None"""
+    for i, line in enumerate(lines):
+        if SIGNATURE_DELIMITER.match(line):
+            return i
+
+    tail_start = max(0, len(lines) - SIGNATURE_MAX_LINES)
+    for i in range(tail_start, len(lines)):
+        if not SIGN_OFF.match(lines[i]) or len(lines[i]) > SIGNATURE_MAX_LINE_LENGTH:
+            continue
+        if all(len(line) <= SIGNATURE_MAX_LINE_LENGTH for line in lines[i + 1:]):
+            return i
+    return None
+
+
+def clean_reply(text):
+    """
+    Strip quoted history and signatures from a plain-text email body.
+
+    Returns a dict with the kept ``text`` and character counts:
+    ``original_chars``, ``quoted_chars``, ``signature_chars`` and
+    ``removed_chars``. If stripping would leave nothing (e.g. a bare
+    forward) the original text is kept.
+    """
+    text = text or ""
+    result = {
+        'text': text,
+        'original_chars': len(text),
+        'quoted_chars': 0,
+        'signature_chars': 0,
+        'removed_chars': 0
+    }
+    if not text:
+        return result
+
+    lines = text.split('\n')
+
+    quote_start = _quote_start(lines)
+    if quote_start is not None:
+        quoted = lines[quote_start:]
+        lines = lines[:quote_start]
+    else:
+        quoted = []
+    # Interleaved ("> ") quotes that were not part of a trailing history block
+    inline_quotes = [line for line in lines if line.lstrip().startswith('>')]
+    lines = [line for line in lines if not line.lstrip().startswith('>')]
+    quoted_chars = sum(len(line) + 1 for line in quoted + inline_quotes)
+
+    footer = [line for line in lines if CLIENT_FOOTER.match(line)]
+    lines = [line for line in lines if not CLIENT_FOOTER.match(line)]
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if not '\n'.join(lines).strip():
+        return result
+
+    signature = []
+    signature_start = _signature_start(lines)
+    # A reply that is nothing but "Thanks!\nJane" keeps its sign-off
+    if signature_start is not None and '\n'.join(lines[:signature_start]).strip():
+        signature = lines[signature_start:]
+        lines = lines[:signature_start]
+    signature_chars = sum(len(line) + 1 for line in signature + footer)
+
+    kept = '\n'.join(lines).strip()
+
+    result['text'] = kept
+    result['quoted_chars'] = quoted_chars
+    result['signature_chars'] = signature_chars
+    result['removed_chars'] = len(text) - len(kept)
+    return result
+
+
+def strip_quoted_text(text):
+    """Convenience wrapper returning only the cleaned text"""
+    return clean_reply(text)['text']
@@ -9,9 +9,10 @@ import logging
 from typing import List, Dict, Optional
 from datetime import datetime
 import chromadb
-from sentence_transformers import SentenceTransformer
+from embedding_model import get_encoder
 import openai
-from config import OPENAI_API_KEY
+from config import OPENAI_API_KEY, STRIP_QUOTED_REPLIES
+from reply_cleaner import clean_reply
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,7 +29,7 @@ class ReplyVectorDatabase:
                 name="email_reply_templates",
                 metadata={"description": "Email reply templates and contexts"}
             )
-            self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
+            self.encoder = get_encoder()  # Shared with the kNN classifier
             logger.info("✅ Vector database initialized successfully")
         except Exception as e:
             logger.error(f"❌ Failed to initialize vector database: {e}")
@@ -316,6 +317,14 @@ class RAGReplyEngine:
     def suggest_reply(self, email_content: str, sender: str, subject: str = "", context: Dict = None) -> Dict:
         """Generate AI-powered reply suggestion using RAG"""
         try:
+            # Embed only what the sender wrote, not the quoted thread or signature
+            removed_chars = 0
+            if STRIP_QUOTED_REPLIES:
+                cleaned = clean_reply(email_content)
+                email_content, removed_chars = cleaned['text'], cleaned['removed_chars']
+                if removed_chars:
+                    logger.info(f"✂️ Stripped {removed_chars}/{cleaned['original_chars']} chars of quoted text and signature")
+            
             # Combine subject and content for better matching
             full_email_text = f"{subject} {email_content}".strip()
             
@@ -339,7 +348,9 @@ class RAGReplyEngine:
             if best_match['similarity_score'] > 0.4:  # Lowered from 0.6
                 # Use RAG with OpenAI for enhanced suggestions
                 if self.openai_client:
-                    suggestion = self._generate_rag_reply(full_email_text, sender, subject, similar_contexts)
+                    suggestion = self._generate_rag_reply(
+                        full_email_text, sender, subject, similar_contexts, (context or {}).get('thread_history')
+                    )
                 else:
                     suggestion = self._generate_template_reply(best_match)
             else:
@@ -352,7 +363,8 @@ class RAGReplyEngine:
                 "confidence": best_match['similarity_score'],
                 "scenario": best_match['metadata']['scenario'],
                 "method": "RAG" if self.openai_client and best_match['similarity_score'] > 0.4 else "Template",
-                "similar_contexts_count": len(similar_contexts)
+                "similar_contexts_count": len(similar_contexts),
+                "content_chars_removed": removed_chars
             }
             
         except Exception as e:
@@ -363,8 +375,9 @@ class RAGReplyEngine:
                 "suggestion": None
             }
     
-    def _generate_rag_reply(self, email_content: str, sender: str, subject: str, contexts: List[Dict]) -> str:
-        """Generate reply using RAG with OpenAI"""
+    def _generate_rag_reply(self, email_content: str, sender: str, subject: str, contexts: List[Dict],
+                            thread_history: List[Dict] = None) -> str:
+        """Generate reply using RAG with OpenAI (earlier thread messages, if given, are added as context)"""
         try:
             # Build context from similar templates
             context_text = "\n".join([
@@ -372,13 +385,20 @@ class RAGReplyEngine:
                 for ctx in contexts[:2]  # Use top 2 contexts
             ])
             
+            conversation = "\n".join(
+                f"From: {message.get('sender', '')} ({message.get('category') or 'unclassified'})\n"
+                f"{' '.join((message.get('content') or '').split())[:500]}"
+                for message in thread_history or []
+            )
+            conversation_text = f"\nEARLIER MESSAGES IN THIS CONVERSATION (oldest first):\n{conversation}\n" if conversation else ""
+            
             # Create RAG prompt
             rag_prompt = f"""
 You are an AI assistant helping to write professional email replies. Use the following context and templates to generate an appropriate response.
 
 CONTEXT AND TEMPLATES:
 {context_text}
-
+{conversation_text}
 INCOMING EMAIL:
 From: {sender}
 Subject: {subject}
@@ -0,0 +1,156 @@
+"""
+Declarative classification rules with hot reload
+Rules live in a JSON (or, with PyYAML installed, YAML) file instead of code:
+
+    {
+      "rules": [{"id": "meeting", "priority": 45}, {"id": "pricing", "category": "Interested",
+                 "fields": ["subject", "content"], "patterns": ["pricing", "quote"], "priority": 35}],
+      "disabled": ["spam_sender"],
+      "tenants": {"42": {"rules": [{"id": "interested", "priority": 25}], "disabled": []}}
+    }
+
+Entries in ``rules`` override the default rule with the same id (only the
+keys they give) or add a new rule; ``disabled`` drops rules by id. A
+tenant's section is applied the same way on top of the global rules, for
+that user id only.
+
+Every rule set is compiled into its RuleMatcher when loaded. A watcher
+thread checks the file's modification time and compiles changes off the
+classification path, then swaps them in with a single reference
+assignment, so classification never waits on a reload. A file that fails
+to load or compile is logged and the rules in use are kept.
+"""
+
+import os
+import json
+import copy
+import threading
+import logging
+from rule_matcher import RuleMatcher, DEFAULT_RULES, AHOCORASICK_AVAILABLE
+from config import CLASSIFICATION_RULES_FILE, RULES_RELOAD_INTERVAL
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def read_rules_file(path):
+    """The parsed rules document; raises ValueError when it cannot be read"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if path.endswith(('.yaml', '.yml')):
+            if not YAML_AVAILABLE:
+                raise ValueError("PyYAML is not installed; use a .json rules file")
+            document = yaml.safe_load(text) or {}
+        else:
+            document = json.loads(text)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot read rules file {path}: {e}")
+    if not isinstance(document, dict):
+        raise ValueError(f"Rules file {path} must contain a mapping")
+    return document
+
+
+def apply_overrides(rules, section):
+    """``rules`` with a section's ``rules`` merged in by id and its ``disabled`` ids removed"""
+    merged = [copy.deepcopy(rule) for rule in rules]
+    by_id = {rule['id']: rule for rule in merged if 'id' in rule}
+    for override in section.get('rules') or []:
+        if not isinstance(override, dict) or 'id' not in override:
+            raise ValueError(f"Override rules need an id: {override!r}")
+        if override['id'] in by_id:
+            by_id[override['id']].update(override)
+        else:
+            rule = dict(override)
+            merged.append(rule)
+            by_id[rule['id']] = rule
+    disabled = set(section.get('disabled') or [])
+    return [rule for rule in merged if rule.get('id') not in disabled]
+
+
+def compile_rules(document, base_rules=DEFAULT_RULES, use_automaton=AHOCORASICK_AVAILABLE):
+    """{'default': RuleMatcher, 'tenants': {user id: RuleMatcher}} for a rules document"""
+    rules = apply_overrides(base_rules, document)
+    tenants = {}
+    for user_id, section in (document.get('tenants') or {}).items():
+        tenants[str(user_id)] = RuleMatcher(apply_overrides(rules, section or {}), use_automaton)
+    return {'default': RuleMatcher(rules, use_automaton), 'tenants': tenants}
+
+
+class RuleEngine:
+    """
+    The compiled rules in use, reloaded from ``path`` when it changes.
+
+    ``matcher(user_id)`` returns the tenant's RuleMatcher (or the global
+    one). Without a path the default rules are used and nothing is watched.
+    ``reload_interval`` is how often, in seconds, the watcher checks the
+    file; 0 disables the watcher (``check`` can still be called).
+    """
+
+    def __init__(self, path=CLASSIFICATION_RULES_FILE, reload_interval=RULES_RELOAD_INTERVAL,
+                 use_automaton=AHOCORASICK_AVAILABLE):
+        self.path = path
+        self.use_automaton = use_automaton
+        self._compiled = compile_rules({}, use_automaton=use_automaton)
+        self._mtime = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {'version': 0, 'reloads': 0, 'reload_errors': 0}
+        self._thread = None
+        if path:
+            self.reload()
+            if reload_interval > 0:
+                self._thread = threading.Thread(
+                    target=self._watch, args=(reload_interval,), name='rule-engine-watcher', daemon=True
+                )
+                self._thread.start()
+
+    def matcher(self, user_id=None):
+        compiled = self._compiled  # One read: a reload replaces the whole dict
+        if user_id is not None:
+            return compiled['tenants'].get(str(user_id), compiled['default'])
+        return compiled['default']
+
+    def reload(self):
+        """Compile the rules file and swap it in; False (rules unchanged) if it is invalid"""
+        with self._reload_lock:
+            try:
+                self._mtime = os.stat(self.path).st_mtime_ns
+                compiled = compile_rules(read_rules_file(self.path), use_automaton=self.use_automaton)
+            except (OSError, ValueError, TypeError) as e:
+                self.stats['reload_errors'] += 1
+                logging.error(f"❌ Classification rules not loaded, keeping the rules in use: {e}")
+                return False
+            self._compiled = compiled
+            self.stats['version'] += 1
+            self.stats['reloads'] += 1
+            logging.info(
+                f"📐 Loaded classification rules v{self.stats['version']} from {self.path} "
+                f"({len(compiled['default'].rules)} rules, {len(compiled['tenants'])} tenant overrides)"
+            )
+            return True
+
+    def check(self):
+        """Reload if the rules file changed since it was last loaded"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        return mtime != self._mtime and self.reload()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            self.check()
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def get_stats(self):
+        return dict(self.stats)
@@ -0,0 +1,159 @@
+"""
+Compiled keyword rules for rule-based classification
+The classifier's keyword lists are compiled once into a single Aho-Corasick
+automaton (pyahocorasick) that finds every pattern in one pass over each
+field, with positions. Without pyahocorasick the matcher falls back to one
+str.find scan per pattern, which CPython runs faster than any single-pass
+regex over the same alternation.
+
+Rules are checked in priority order: the first rule with a hit in one of
+its fields decides the category. The default rules reproduce the old chain
+of ``any(...)`` checks; rule_engine.py loads replacements from a file.
+"""
+
+import logging
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+FIELDS = ('subject', 'content', 'sender')
+
+# Checked by ascending priority; patterns are matched as lowercase substrings of the fields.
+# weight is the confidence given to the category when the rule decides.
+DEFAULT_RULES = [
+    {'id': 'out_of_office', 'category': 'Out of Office', 'priority': 10, 'weight': 0.95, 'fields': ('subject', 'content'), 'patterns': [
+        'out of office', 'currently away', 'vacation', 'holiday',
+        'automatic reply', 'auto reply', 'away from office',
+        'not available', 'on leave', 'traveling'
+    ]},
+    {'id': 'spam', 'category': 'Spam', 'priority': 20, 'weight': 0.95, 'fields': ('subject', 'content'), 'patterns': [
+        'unsubscribe', 'click here', 'limited time offer', 'act now',
+        'free gift', 'congratulations', 'you have won', 'claim now',
+        'viagra', 'casino', 'lottery', 'millionaire', 'inheritance'
+    ]},
+    {'id': 'spam_sender', 'category': 'Spam', 'priority': 20, 'weight': 0.95, 'fields': ('sender',), 'patterns': [
+        'noreply', 'no-reply', 'donotreply'
+    ]},
+    {'id': 'meeting', 'category': 'Meeting Booked', 'priority': 30, 'weight': 0.95, 'fields': ('subject', 'content'), 'patterns': [
+        'meeting', 'calendar', 'scheduled', 'appointment', 'invite',
+        'zoom', 'teams', 'google meet', 'conference call', 'call scheduled',
+        'booking confirmed', 'meeting request', 'reschedule'
+    ]},
+    # Note 'interested' also matches inside 'not interested', and Interested is checked first
+    {'id': 'interested', 'category': 'Interested', 'priority': 40, 'weight': 0.95, 'fields': ('content',), 'patterns': [
+        'interested', 'tell me more', 'looking forward', 'sounds good',
+        'please send', 'would like to', 'can you', 'more information',
+        'demo', 'trial', 'proposal'
+    ]},
+    {'id': 'not_interested', 'category': 'Not Interested', 'priority': 50, 'weight': 0.95, 'fields': ('content',), 'patterns': [
+        'not interested', 'no thank you', 'remove me', 'stop emailing',
+        'not at this time', 'pass on this', 'not a good fit'
+    ]},
+]
+
+
+def normalize_rule(rule, index=0):
+    """Validated copy of a rule with defaults filled in; raises ValueError"""
+    if not isinstance(rule, dict) or not rule.get('category'):
+        raise ValueError(f"Rule {index} has no category: {rule!r}")
+    fields = rule.get('fields', ('subject', 'content'))
+    fields = (fields,) if isinstance(fields, str) else tuple(fields)
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Rule {rule.get('id', index)} has unknown fields {unknown or fields}")
+    patterns = rule.get('patterns', [])
+    if isinstance(patterns, str) or not all(isinstance(p, str) for p in patterns):
+        raise ValueError(f"Rule {rule.get('id', index)} patterns must be a list of strings")
+    return {
+        **rule,
+        'id': str(rule.get('id', index)),
+        'priority': float(rule.get('priority', index)),
+        'weight': float(rule.get('weight', 0.95)),
+        'fields': fields,
+        'patterns': [p.lower() for p in patterns if p],
+    }
+
+
+class RuleMatcher:
+    """
+    Keyword rules compiled for matching.
+
+    ``rules`` is a list of {'id', 'category', 'fields', 'patterns',
+    'priority', 'weight'} (see ``normalize_rule`` for defaults). The rule
+    with a hit and the lowest priority decides; among rules of equal
+    priority the higher weight, then the earlier rule wins. ``decide``
+    returns that rule (or None), ``classify`` its category and ``matches``
+    every hit as {'category', 'rule', 'pattern', 'field', 'start', 'end'}.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, use_automaton=AHOCORASICK_AVAILABLE):
+        rules = [normalize_rule(rule, index) for index, rule in enumerate(rules)]
+        # Sorted so that the first rule with a hit is the one that decides
+        self.rules = sorted(rules, key=lambda rule: (rule['priority'], -rule['weight']))
+        # pattern -> [(rule index, fields)] for every rule using it
+        self.pattern_rules = {}
+        for index, rule in enumerate(self.rules):
+            for pattern in rule['patterns']:
+                self.pattern_rules.setdefault(pattern, []).append((index, rule['fields']))
+        self.automaton = None
+        if use_automaton and self.pattern_rules:
+            self.automaton = ahocorasick.Automaton()
+            for pattern in self.pattern_rules:
+                self.automaton.add_word(pattern, pattern)
+            self.automaton.make_automaton()
+
+    def _texts(self, subject, content, sender):
+        return {'subject': (subject or '').lower(), 'content': (content or '').lower(), 'sender': (sender or '').lower()}
+
+    def _hits(self, texts):
+        """(rule index, pattern, field, start) for every occurrence"""
+        for field in FIELDS:
+            text = texts[field]
+            if not text:
+                continue
+            if self.automaton:
+                found = ((end - len(pattern) + 1, pattern) for end, pattern in self.automaton.iter(text))
+            else:
+                found = self._find_all(text)
+            for start, pattern in found:
+                for index, fields in self.pattern_rules[pattern]:
+                    if field in fields:
+                        yield index, pattern, field, start
+
+    def _find_all(self, text):
+        for pattern in self.pattern_rules:
+            start = text.find(pattern)
+            while start != -1:
+                yield start, pattern
+                start = text.find(pattern, start + 1)
+
+    def matches(self, subject='', content='', sender=''):
+        """Every rule hit in the fields, in rule precedence then position order"""
+        hits = sorted(self._hits(self._texts(subject, content, sender)), key=lambda hit: (hit[0], FIELDS.index(hit[2]), hit[3]))
+        return [
+            {'category': self.rules[index]['category'], 'rule': self.rules[index]['id'], 'pattern': pattern, 'field': field,
+             'start': start, 'end': start + len(pattern)}
+            for index, pattern, field, start in hits
+        ]
+
+    def decide(self, subject='', content='', sender=''):
+        """The first rule (in precedence order) with a hit, or None"""
+        texts = self._texts(subject, content, sender)
+        if self.automaton:
+            best = min((hit[0] for hit in self._hits(texts)), default=None)
+            return self.rules[best] if best is not None else None
+        # Without the automaton each rule is checked in order and the first hit wins
+        for rule in self.rules:
+            if any(pattern in texts[field] for pattern in rule['patterns'] for field in rule['fields']):
+                return rule
+        return None
+
+    def classify(self, subject='', content='', sender=''):
+        """Category of the deciding rule, or None"""
+        rule = self.decide(subject, content, sender)
+        return rule['category'] if rule else None
@@ -0,0 +1,141 @@
+// Coalescing sync job queue.
+// Same rules as sync_jobs.py on the Python side: at most one queued or
+// running sync per account, a second request for the same account joins it,
+// and on-demand requests run ahead of periodic ones. One worker slot is
+// always left free of periodic work.
+
+const crypto = require('crypto');
+
+const ON_DEMAND = 0;
+const PERIODIC = 1;
+
+class SyncQueue {
+    constructor(syncAccount, { concurrency = 2, retentionMs = 10 * 60 * 1000 } = {}) {
+        this.syncAccount = syncAccount; // async (userId, account) => result
+        this.concurrency = Math.max(1, concurrency);
+        this.retentionMs = retentionMs;
+        this.tasks = new Map(); // accountId -> queued or running task
+        this.queue = []; // queued tasks, on-demand first then FIFO
+        this.jobs = new Map();
+        this.running = 0;
+        this.periodicRunning = 0;
+        this.seq = 0;
+        this.stats = { requested: 0, coalesced: 0, synced: 0 };
+    }
+
+    // Queue a sync of a user's accounts; returns the job ({ id, promise, ... })
+    enqueue(userId, accounts, { priority = PERIODIC } = {}) {
+        this.expireJobs();
+        const job = {
+            id: crypto.randomUUID(),
+            userId,
+            priority: priority === ON_DEMAND ? 'on_demand' : 'periodic',
+            accountIds: accounts.map(account => account.id),
+            results: {},
+            coalesced: 0,
+            status: 'queued',
+            createdAt: new Date().toISOString(),
+            finishedAt: null
+        };
+
+        const promises = accounts.map(account => {
+            this.stats.requested++;
+            let task = this.tasks.get(account.id);
+            if (task) {
+                job.coalesced++;
+                this.stats.coalesced++;
+                if (priority < task.priority && !task.running) {
+                    task.priority = priority;
+                    this.sortQueue();
+                }
+            } else {
+                task = { userId, account, priority, running: false, seq: this.seq++ };
+                task.promise = new Promise((resolve) => { task.resolve = resolve; });
+                this.tasks.set(account.id, task);
+                this.queue.push(task);
+                this.sortQueue();
+            }
+            return task.promise.then(result => {
+                job.results[account.id] = result;
+                if (job.status === 'queued') job.status = 'running';
+                return result;
+            });
+        });
+
+        job.promise = Promise.all(promises).then(results => {
+            job.status = 'done';
+            job.finishedAt = new Date().toISOString();
+            job.failed = results.filter(result => result && result.error).length;
+            return job;
+        });
+        this.jobs.set(job.id, job);
+        if (job.coalesced) {
+            console.log(`🔗 Sync job ${job.id.slice(0, 8)} joined ${job.coalesced} sync(s) already in progress`);
+        }
+        this.pump();
+        return job;
+    }
+
+    getJob(jobId) {
+        return this.jobs.get(jobId);
+    }
+
+    getStats() {
+        return { ...this.stats, queued: this.queue.length, running: this.running };
+    }
+
+    sortQueue() {
+        this.queue.sort((a, b) => a.priority - b.priority || a.seq - b.seq);
+    }
+
+    pump() {
+        while (this.running < this.concurrency && this.queue.length) {
+            const next = this.queue[0];
+            const periodicLimit = Math.max(1, this.concurrency - 1);
+            if (next.priority === PERIODIC && this.periodicRunning >= periodicLimit) break;
+            this.queue.shift();
+            this.run(next);
+        }
+    }
+
+    async run(task) {
+        task.running = true;
+        this.running++;
+        if (task.priority === PERIODIC) this.periodicRunning++;
+        let result;
+        try {
+            result = { success: true, value: await this.syncAccount(task.userId, task.account) };
+        } catch (error) {
+            result = { success: false, error: error.message };
+        }
+        this.running--;
+        if (task.priority === PERIODIC) this.periodicRunning--;
+        this.stats.synced++;
+        this.tasks.delete(task.account.id);
+        task.resolve(result);
+        this.pump();
+    }
+
+    expireJobs() {
+        const cutoff = Date.now() - this.retentionMs;
+        for (const [id, job] of this.jobs) {
+            if (job.finishedAt && Date.parse(job.finishedAt) < cutoff) this.jobs.delete(id);
+        }
+    }
+}
+
+function describeJob(job) {
+    return {
+        jobId: job.id,
+        status: job.status,
+        priority: job.priority,
+        accounts: job.accountIds.length,
+        finishedAccounts: Object.keys(job.results).length,
+        failedAccounts: job.failed || 0,
+        coalesced: job.coalesced,
+        createdAt: job.createdAt,
+        finishedAt: job.finishedAt
+    };
+}
+
+module.exports = { SyncQueue, describeJob, ON_DEMAND, PERIODIC };
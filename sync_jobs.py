@@ -0,0 +1,257 @@
+"""
+Coalescing sync job queue
+Every account sync (on-demand or scheduled) goes through one queue that
+holds at most one queued or running sync per account. A second request for
+the same account joins the existing one instead of starting another IMAP
+session, and on-demand requests run ahead of periodic ones. Callers get a
+job id they can poll, or wait for the result.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import uuid
+import logging
+from sync_pool import AccountSyncTimeout
+from config import SYNC_JOB_WORKERS, SYNC_JOB_BATCH_SIZE, SYNC_JOB_RETENTION
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ON_DEMAND = 0
+PERIODIC = 1
+
+
+class SyncJob:
+    """One caller's request: a set of accounts whose results arrive as their syncs finish"""
+
+    def __init__(self, accounts, user_id=None, priority=PERIODIC):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.priority = priority
+        self.accounts = [{'id': account['id'], 'email': account.get('email')} for account in accounts]
+        self.account_ids = [account['id'] for account in accounts]
+        self.results = {}  # account_id -> emails synced or exception
+        self.coalesced = 0  # Accounts that joined an already queued/running sync
+        self.created_at = time.time()
+        self.finished_at = None
+        self._done = threading.Event()
+        self._callbacks = []
+
+    @property
+    def status(self):
+        if self._done.is_set():
+            return 'done'
+        return 'running' if self.results else 'queued'
+
+    def wait(self, timeout=None):
+        """Block until every account has a result; returns {account_id: result}"""
+        self._done.wait(timeout)
+        return dict(self.results)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'user_id': self.user_id,
+            'status': self.status,
+            'priority': 'on_demand' if self.priority == ON_DEMAND else 'periodic',
+            'accounts': len(self.account_ids),
+            'finished_accounts': len(self.results),
+            'coalesced': self.coalesced,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+
+class SyncJobQueue:
+    """
+    Runs account syncs from a priority queue with per-account coalescing.
+
+    ``sync_fn(accounts, on_demand)`` syncs a batch of accounts and returns
+    {account_id: result}. One worker is always kept free of periodic work
+    so an on-demand sync never waits behind a full scheduled cycle.
+    """
+
+    def __init__(self, sync_fn, workers=SYNC_JOB_WORKERS, batch_size=SYNC_JOB_BATCH_SIZE,
+                 retention=SYNC_JOB_RETENTION):
+        self.sync_fn = sync_fn
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.retention = retention
+        self._heap = []  # (priority, seq, account_id)
+        self._tasks = {}  # account_id -> queued or running task
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._periodic_running = 0
+        self._threads = []
+        self.running = False
+        self.stats = {'requested': 0, 'coalesced': 0, 'synced': 0, 'upgraded': 0}
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'sync-job-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, accounts, user_id=None, priority=PERIODIC, on_complete=None):
+        """
+        Queue a sync of ``accounts`` and return its SyncJob. Accounts that
+        already have a sync queued or running are joined, not resynced; a
+        queued periodic sync is promoted when an on-demand request joins it.
+        ``on_complete(job)`` is called once every account has a result.
+        """
+        # An account listed twice is one sync and one result
+        accounts = list({account['id']: account for account in accounts}.values())
+        job = SyncJob(accounts, user_id, priority)
+        if on_complete:
+            job._callbacks.append(on_complete)
+        with self._cond:
+            self._expire_jobs()
+            self._jobs[job.id] = job
+            self.stats['requested'] += len(accounts)
+            for account in accounts:
+                task = self._tasks.get(account['id'])
+                if task:
+                    job.coalesced += 1
+                    self.stats['coalesced'] += 1
+                    task['jobs'].append(job)
+                    if priority < task['priority'] and not task['running']:
+                        task['priority'] = priority
+                        self.stats['upgraded'] += 1
+                        heapq.heappush(self._heap, (priority, next(self._seq), account['id']))
+                    continue
+                self._tasks[account['id']] = {
+                    'account': account, 'priority': priority, 'running': False, 'jobs': [job]
+                }
+                heapq.heappush(self._heap, (priority, next(self._seq), account['id']))
+            self._cond.notify_all()
+        if not accounts:
+            self._finish_job(job)
+        elif job.coalesced:
+            logging.info(f"🔗 Sync job {job.id[:8]} joined {job.coalesced} sync(s) already in progress")
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def account_ids(self):
+        """Ids of accounts with a sync queued or running"""
+        with self._cond:
+            return set(self._tasks)
+
+    def get_stats(self):
+        with self._cond:
+            queued = sum(1 for task in self._tasks.values() if not task['running'])
+            return dict(self.stats, queued=queued, running=len(self._tasks) - queued)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self.running:
+                        return
+                    batch = self._take_batch()
+                    if batch:
+                        break
+                    self._cond.wait(1.0)
+                periodic = batch[0]['priority'] == PERIODIC
+                if periodic:
+                    self._periodic_running += 1
+            try:
+                results = self.sync_fn([task['account'] for task in batch], not periodic)
+            except Exception as e:
+                logging.error(f"❌ Sync batch failed: {e}")
+                results = {task['account']['id']: e for task in batch}
+            finally:
+                if periodic:
+                    with self._cond:
+                        self._periodic_running -= 1
+                        self._cond.notify_all()
+            self._complete(batch, results)
+
+    def _take_batch(self):
+        """
+        Highest-priority queued tasks of one priority (called with the lock
+        held). Periodic work never takes the last free worker.
+        """
+        batch = []
+        while self._heap and len(batch) < self.batch_size:
+            priority, _, account_id = self._heap[0]
+            task = self._tasks.get(account_id)
+            if not task or task['running'] or task['priority'] != priority:
+                heapq.heappop(self._heap)  # Stale entry (promoted or already taken)
+                continue
+            if batch and priority != batch[0]['priority']:
+                break
+            if priority == PERIODIC and not batch and self._periodic_running >= max(1, self.workers - 1):
+                break
+            heapq.heappop(self._heap)
+            task['running'] = True
+            batch.append(task)
+        return batch
+
+    def _complete(self, batch, results):
+        finished, abandoned = [], []
+        with self._cond:
+            for task in batch:
+                account_id = task['account']['id']
+                result = results.get(account_id, RuntimeError("No result"))
+                self.stats['synced'] += 1
+                for job in task['jobs']:
+                    job.results[account_id] = result
+                    if len(job.results) == len(job.account_ids):
+                        finished.append(job)
+                if isinstance(result, AccountSyncTimeout) and result.future and not result.future.done():
+                    # The timed-out sync still holds the account's sessions: keep
+                    # it marked running so requests meanwhile wait for a fresh sync
+                    task['jobs'] = []
+                    abandoned.append((account_id, result.future))
+                else:
+                    self._tasks.pop(account_id, None)
+        for job in finished:
+            self._finish_job(job)
+        # Registered outside the lock: the callback runs right away if the sync just ended
+        for account_id, future in abandoned:
+            future.add_done_callback(lambda _, account_id=account_id: self._release(account_id))
+
+    def _release(self, account_id):
+        """An abandoned sync has ended; requeue the account if jobs joined it meanwhile"""
+        with self._cond:
+            task = self._tasks.get(account_id)
+            if not task:
+                return
+            if not task['jobs']:
+                del self._tasks[account_id]
+                return
+            task['running'] = False
+            task['priority'] = min(job.priority for job in task['jobs'])
+            heapq.heappush(self._heap, (task['priority'], next(self._seq), account_id))
+            self._cond.notify_all()
+
+    def _finish_job(self, job):
+        job.finished_at = time.time()
+        job._done.set()
+        for callback in job._callbacks:
+            try:
+                callback(job)
+            except Exception as e:
+                logging.warning(f"Sync job callback failed: {e}")
+
+    def _expire_jobs(self):
+        # Called with the lock held: forget finished jobs after the retention period
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
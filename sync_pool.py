@@ -0,0 +1,144 @@
+"""
+Bounded parallel account sync
+Runs per-account sync jobs on a worker pool with a global concurrency cap,
+a per-IMAP-host cap and a per-account timeout, so one slow or hung server
+cannot hold up every other tenant.
+"""
+
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import SYNC_MAX_WORKERS, SYNC_MAX_PER_HOST, SYNC_ACCOUNT_TIMEOUT
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class AccountSyncTimeout(Exception):
+    """
+    Returned (as a result value) when an account exceeds its sync timeout.
+    The worker thread cannot be killed, so ``future`` is the sync that may
+    still be running and holding the account's IMAP sessions; callers must
+    not start another sync of the account until it is done.
+    """
+
+    def __init__(self, message, future=None):
+        super().__init__(message)
+        self.future = future
+
+
+class AccountSyncPool:
+    """Thread pool that dispatches account jobs under global and per-host limits"""
+
+    def __init__(self, max_workers=SYNC_MAX_WORKERS, max_per_host=SYNC_MAX_PER_HOST,
+                 account_timeout=SYNC_ACCOUNT_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.account_timeout = account_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='account-sync')
+
+    def run(self, accounts, sync_fn, on_timeout=None):
+        """
+        Run ``sync_fn(account)`` for every account and wait for the cycle to finish.
+
+        Returns {account_id: result}; failed accounts map to the raised exception
+        and accounts that ran past the timeout map to AccountSyncTimeout. For a
+        timed-out account ``on_timeout(account)`` is called so the caller can
+        abort its connection; the cycle does not wait for it any longer, but
+        the AccountSyncTimeout carries the still-running future. The abandoned
+        sync keeps its per-host slot until it returns; accounts left waiting on
+        that slot for another timeout are reported as AccountSyncTimeout too.
+        """
+        pending = defaultdict(deque)
+        for account in accounts:
+            pending[self._host_key(account)].append(account)
+
+        running = {}
+        host_load = defaultdict(int)
+        holds = {}  # future -> host slot it occupies until the sync really returns
+        lock = threading.Lock()
+        released = threading.Event()
+        results = {}
+
+        def release(future):
+            with lock:
+                host = holds.pop(future, None)
+                if host is None:
+                    return
+                host_load[host] -= 1
+            released.set()
+
+        def dispatch():
+            for host, queue in pending.items():
+                while queue and len(running) < self.max_workers:
+                    with lock:
+                        if host_load[host] >= self.max_per_host:
+                            break
+                        host_load[host] += 1
+                    account = queue.popleft()
+                    future = self.executor.submit(sync_fn, account)
+                    with lock:
+                        holds[future] = host
+                    running[future] = (account, time.monotonic())
+                    # An abandoned sync keeps its host slot until it returns
+                    future.add_done_callback(release)
+
+        dispatch()
+        stalled_since = None
+        while running or any(pending.values()):
+            if running:
+                stalled_since = None
+                done, _ = wait(running, timeout=1.0, return_when=FIRST_COMPLETED)
+            else:
+                # Only abandoned syncs hold the hosts still waiting to run
+                stalled_since = stalled_since or time.monotonic()
+                if time.monotonic() - stalled_since >= self.account_timeout:
+                    self._give_up_waiting(pending, results)
+                    break
+                released.wait(1.0)
+                done = ()
+            released.clear()
+
+            for future in done:
+                account, _ = running.pop(future)
+                release(future)
+                try:
+                    results[account['id']] = future.result()
+                except Exception as e:
+                    logging.error(f"❌ Sync failed for {account['email']}: {e}")
+                    results[account['id']] = e
+
+            now = time.monotonic()
+            for future, (account, started) in list(running.items()):
+                if now - started < self.account_timeout:
+                    continue
+                running.pop(future)
+                logging.error(f"⏱️ Sync for {account['email']} exceeded {self.account_timeout}s, abandoning")
+                results[account['id']] = AccountSyncTimeout(f"Timed out after {self.account_timeout}s", future)
+                future.add_done_callback(
+                    lambda _, email=account['email']: logging.info(f"Abandoned sync for {email} has finished")
+                )
+                if on_timeout:
+                    try:
+                        on_timeout(account)
+                    except Exception as e:
+                        logging.warning(f"Timeout handler failed for {account['email']}: {e}")
+
+            dispatch()
+
+        return results
+
+    def _give_up_waiting(self, pending, results):
+        """Report accounts whose host is still held by an abandoned sync as timed out"""
+        for host, queue in pending.items():
+            for account in queue:
+                logging.error(f"⏱️ {host} still busy with an abandoned sync, skipping {account['email']}")
+                results[account['id']] = AccountSyncTimeout(f"{host} busy with an abandoned sync")
+            queue.clear()
+
+    def _host_key(self, account):
+        return (account.get('imap_host') or account.get('imap_server') or '').lower()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,187 @@
+"""
+Adaptive per-account sync scheduling
+Instead of syncing every mailbox on one fixed tick, each account gets its own
+next-poll time from a priority queue. Busy inboxes are polled often, quiet
+ones rarely, failing ones back off, and accounts whose user is looking at
+the dashboard are kept fresh, all within configured min/max bounds.
+"""
+
+import heapq
+import random
+import itertools
+import threading
+import time
+import logging
+from config import (
+    SCHEDULER_MIN_INTERVAL, SCHEDULER_MAX_INTERVAL, SCHEDULER_DEFAULT_INTERVAL,
+    SCHEDULER_ACTIVE_INTERVAL, SCHEDULER_TARGET_PER_POLL, SCHEDULER_RATE_SMOOTHING
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Spread of each computed interval so accounts added together drift apart
+JITTER = 0.1
+
+
+class AdaptiveSyncScheduler:
+    """
+    Priority queue of accounts ordered by next-poll time.
+
+    The interval after a sync aims for about ``target_per_poll`` new messages
+    per poll given the account's smoothed arrival rate. Errors double it
+    (jittered), an unfinished backfill or an active dashboard user shortens
+    it, and it is always clamped to [min_interval, max_interval].
+    """
+
+    def __init__(self, min_interval=SCHEDULER_MIN_INTERVAL, max_interval=SCHEDULER_MAX_INTERVAL,
+                 default_interval=SCHEDULER_DEFAULT_INTERVAL, active_interval=SCHEDULER_ACTIVE_INTERVAL,
+                 target_per_poll=SCHEDULER_TARGET_PER_POLL, smoothing=SCHEDULER_RATE_SMOOTHING):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        self.active_interval = active_interval
+        self.target_per_poll = target_per_poll
+        self.smoothing = smoothing
+        self._heap = []  # (due, seq, account_id); stale entries are skipped on pop
+        self._states = {}
+        self._active_users = set()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.stats = {'polls': 0, 'errors': 0}
+
+    def update_accounts(self, accounts, now=None):
+        """
+        Track exactly these accounts: new ones are due soon (spread over the
+        first minimum interval), removed ones are dropped
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            current = {account['id'] for account in accounts}
+            for account_id in list(self._states):
+                if account_id not in current:
+                    del self._states[account_id]
+            for account in accounts:
+                state = self._states.get(account['id'])
+                if state:
+                    state['account'] = account
+                    continue
+                self._states[account['id']] = {
+                    'account': account,
+                    'rate': None,  # Smoothed new messages per second; None until first poll
+                    'errors': 0,
+                    'last_polled': None,
+                    'backfill_pending': True,
+                    'in_flight': False,
+                    'due': None,
+                    'interval': None
+                }
+                self._push(account['id'], now + random.uniform(0, self.min_interval))
+
+    def set_active_users(self, user_ids, now=None):
+        """Users currently on the dashboard: their accounts are pulled forward"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            newly_active = set(user_ids) - self._active_users
+            self._active_users = set(user_ids)
+            for account_id, state in self._states.items():
+                if state['account'].get('user_id') not in newly_active or state['in_flight']:
+                    continue
+                due = (state['last_polled'] or now) + self.active_interval
+                if state['due'] is None or due < state['due']:
+                    self._push(account_id, max(now, due))
+
+    def pop_due(self, now=None):
+        """Accounts whose poll time has come, most overdue first; they are in flight until record()"""
+        now = time.monotonic() if now is None else now
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, _, account_id = heapq.heappop(self._heap)
+                state = self._states.get(account_id)
+                if not state or state['in_flight'] or state['due'] != when:
+                    continue  # Removed, already running, or rescheduled since
+                state['in_flight'] = True
+                state['due'] = None
+                due.append(state['account'])
+        return due
+
+    def seconds_until_next(self, now=None):
+        """Seconds until the next account is due (None when nothing is scheduled)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            pending = [state['due'] for state in self._states.values() if state['due'] is not None]
+        return max(0.0, min(pending) - now) if pending else None
+
+    def record(self, account_id, new_messages=0, error=False, backfill_pending=False, now=None):
+        """Feed back a finished sync and schedule the account's next poll; returns the interval"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._states.get(account_id)
+            if not state:
+                return None
+            self.stats['polls'] += 1
+            if error:
+                self.stats['errors'] += 1
+                state['errors'] += 1
+            else:
+                state['errors'] = 0
+                if state['last_polled'] is not None:
+                    elapsed = max(now - state['last_polled'], 1.0)
+                    observed = new_messages / elapsed
+                    if state['rate'] is None:
+                        state['rate'] = observed
+                    else:
+                        state['rate'] = self.smoothing * observed + (1 - self.smoothing) * state['rate']
+                state['last_polled'] = now
+                state['backfill_pending'] = backfill_pending
+            state['in_flight'] = False
+            interval = self._interval(state)
+            state['interval'] = interval
+            self._push(account_id, now + interval)
+            return interval
+
+    def defer(self, account_id, delay=None, now=None):
+        """Hand back a popped account without a result; it is retried after ``delay`` (min interval)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._states.get(account_id)
+            if state:
+                state['in_flight'] = False
+                self._push(account_id, now + (self.min_interval if delay is None else delay))
+
+    def in_flight_ids(self):
+        with self._lock:
+            return {account_id for account_id, state in self._states.items() if state['in_flight']}
+
+    def _interval(self, state):
+        if state['rate'] is None:
+            interval = self.default_interval
+        elif state['rate'] > 0:
+            interval = self.target_per_poll / state['rate']
+        else:
+            interval = self.max_interval
+        if state['backfill_pending']:
+            interval = self.min_interval  # Keep importing history in time-boxed slices
+        if state['account'].get('user_id') in self._active_users:
+            interval = min(interval, self.active_interval)
+        if state['errors']:
+            interval = max(interval, self.min_interval) * 2 ** min(state['errors'], 10)
+        interval *= random.uniform(1 - JITTER, 1 + JITTER)
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def _push(self, account_id, when):
+        # Called with the lock held
+        self._states[account_id]['due'] = when
+        heapq.heappush(self._heap, (when, next(self._seq), account_id))
+
+    def get_stats(self):
+        with self._lock:
+            intervals = [s['interval'] for s in self._states.values() if s['interval'] is not None]
+            return dict(
+                self.stats,
+                accounts=len(self._states),
+                in_flight=sum(1 for s in self._states.values() if s['in_flight']),
+                failing=sum(1 for s in self._states.values() if s['errors']),
+                active_users=len(self._active_users),
+                mean_interval=round(sum(intervals) / len(intervals), 1) if intervals else None
+            )
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test account leases for multiple sync workers
+"""
+
+import os
+import tempfile
+from account_leases import AccountLeaseManager, SQLiteLeaseBackend, MemoryLeaseBackend, create_lease_backend
+
+ACCOUNTS = [{'id': n, 'email': f'user{n}@example.com'} for n in range(1, 101)]
+
+
+def sqlite_backend():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    return SQLiteLeaseBackend(path)
+
+
+def workers(backend, names, ttl=60):
+    return [AccountLeaseManager(backend, lambda: ACCOUNTS, worker_id=name, ttl=ttl) for name in names]
+
+
+def settle(managers, now, rounds=3):
+    """A few heartbeat rounds so every worker has seen the others"""
+    for _ in range(rounds):
+        for manager in managers:
+            manager.heartbeat(now=now)
+    return [manager.held_ids(now) for manager in managers]
+
+
+def test_accounts_sharded_without_overlap():
+    """Every account is leased by exactly one of three workers, roughly evenly"""
+    managers = workers(sqlite_backend(), ['a', 'b', 'c'])
+    held = settle(managers, now=1000)
+    print(f"Leases per worker: {[len(h) for h in held]}")
+    assert set().union(*held) == {account['id'] for account in ACCOUNTS}
+    assert sum(len(h) for h in held) == len(ACCOUNTS)
+    assert all(15 <= len(h) <= 55 for h in held)
+
+
+def test_dead_worker_accounts_fail_over():
+    """When a worker stops heartbeating, its accounts move once its leases expire"""
+    managers = workers(sqlite_backend(), ['a', 'b', 'c'], ttl=60)
+    a, b, c = managers
+    settle(managers, now=1000)
+    orphaned = c.held_ids(1000)
+
+    # c dies; before the TTL runs out nobody may take its accounts
+    for manager in (a, b):
+        manager.heartbeat(now=1030)
+    assert not (a.held_ids(1030) | b.held_ids(1030)) & orphaned
+    assert not c.holds(next(iter(orphaned)), now=1061)  # c itself treats the lapsed lease as lost
+
+    held = settle([a, b], now=1061)
+    assert held[0] | held[1] == {account['id'] for account in ACCOUNTS}
+    assert not held[0] & held[1]
+
+
+def test_new_worker_takes_its_share():
+    """A worker joining later gets accounts handed back by the others"""
+    backend = MemoryLeaseBackend()
+    a, b = workers(backend, ['a', 'b'])
+    settle([a, b], now=1000)
+    c, = workers(backend, ['c'])
+    held = settle([a, b, c], now=1010)
+    assert len(held[2]) > 15
+    assert sum(len(h) for h in held) == len(ACCOUNTS)
+
+
+def test_busy_account_not_handed_back():
+    """An account still syncing keeps its lease until the sync finishes"""
+    backend = MemoryLeaseBackend()
+    busy = set()
+    a = AccountLeaseManager(backend, lambda: ACCOUNTS, worker_id='a', busy_fn=lambda: busy)
+    a.heartbeat(now=1000)
+    assert len(a.held_ids(1000)) == len(ACCOUNTS)
+
+    b, = workers(backend, ['b'])
+    b.heartbeat(now=1001)
+    busy.update(a.held_ids(1000))
+    a.heartbeat(now=1002)
+    assert len(a.held_ids(1002)) == len(ACCOUNTS)
+
+    busy.clear()
+    a.heartbeat(now=1003)
+    b.heartbeat(now=1004)
+    assert a.held_ids(1004).isdisjoint(b.held_ids(1004))
+    assert len(b.held_ids(1004)) > 0
+
+
+def test_clean_shutdown_releases_leases():
+    backend = sqlite_backend()
+    a, b = workers(backend, ['a', 'b'])
+    settle([a, b], now=1000)
+    a.stop()
+    b.heartbeat(now=1001)
+    assert len(b.held_ids(1001)) == len(ACCOUNTS)
+
+
+def test_backend_by_name():
+    assert isinstance(create_lease_backend('memory'), MemoryLeaseBackend)
+    assert isinstance(create_lease_backend('account_leases.MemoryLeaseBackend'), MemoryLeaseBackend)
+
+
+def test_on_demand_claim_only_takes_free_accounts():
+    """An on-demand sync may lease an account nobody holds, never one another worker holds"""
+    backend = MemoryLeaseBackend()
+    a, b = workers(backend, ['a', 'b'])
+    settle([a, b], now=1000)
+    theirs = sorted(b.held_ids(1000))[:2]
+    new_account = 500  # Added after the last heartbeat: nobody holds it yet
+    assert a.claim(theirs + [new_account], now=1001) == {new_account}
+    assert b.held_ids(1001).isdisjoint(a.held_ids(1001))
+    a.heartbeat(now=1002)  # Not assigned to a and idle: handed back
+    assert not a.holds(new_account, now=1002)
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Account Leases")
+    print("=" * 50)
+    test_accounts_sharded_without_overlap()
+    test_dead_worker_accounts_fail_over()
+    test_new_worker_takes_its_share()
+    test_busy_account_not_handed_back()
+    test_clean_shutdown_releases_leases()
+    test_backend_by_name()
+    test_on_demand_claim_only_takes_free_accounts()
+    print("✅ All account lease tests passed")
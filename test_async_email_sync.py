@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Test the asyncio IMAP client and sync engine against a fake IMAP server
+"""
+
+import os
+import json
+import asyncio
+import tempfile
+import threading
+import email_classifier
+import async_email_sync
+from async_email_sync import AsyncIMAPClient, AsyncEmailSyncEngine, IMAPCommandError
+from mime_parser import ParsePool
+from rule_engine import RuleEngine
+
+MESSAGES = {
+    7: b"From: Ana <ana@lead.com>\r\nSubject: Pricing\r\nDate: Mon, 1 Jan 2024 10:00:00 +0000\r\n\r\nCould you share pricing?\r\n",
+    9: b"From: Bo <bo@lead.com>\r\nSubject: Hello\r\nDate: Mon, 1 Jan 2024 11:00:00 +0000\r\n\r\nJust checking in.\r\n",
+}
+
+
+class FakeIMAPServer:
+    """Enough of IMAP4rev1 for the client: LOGIN, CAPABILITY, SELECT, UID SEARCH/FETCH, NOOP, IDLE, LOGOUT"""
+
+    def __init__(self, password='secret', exists_in_idle=True):
+        self.password = password
+        self.exists_in_idle = exists_in_idle
+        self.commands = []
+        self.fetched = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._session, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _session(self, reader, writer):
+        writer.write(b'* OK fake IMAP ready\r\n')
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            tag, command, *args = line.rstrip(b'\r\n').split(b' ')
+            self.commands.append(command)
+            if command == b'LOGIN':
+                if args[1] != b'"%s"' % self.password.encode():
+                    writer.write(tag + b' NO [AUTHENTICATIONFAILED] Invalid credentials\r\n')
+                    continue
+            elif command == b'CAPABILITY':
+                writer.write(b'* CAPABILITY IMAP4rev1 IDLE\r\n')
+            elif command == b'SELECT':
+                writer.write(b'* 2 EXISTS\r\n')
+            elif command == b'UID' and args[0] == b'SEARCH':
+                writer.write(b'* SEARCH ' + b' '.join(str(uid).encode() for uid in MESSAGES) + b'\r\n')
+            elif command == b'UID' and args[0] == b'FETCH':
+                self.fetched.extend(int(uid) for uid in args[1].split(b','))
+                for n, uid in enumerate(int(uid) for uid in args[1].split(b',')):
+                    raw = MESSAGES[uid]
+                    writer.write(b'* %d FETCH (UID %d RFC822 {%d}\r\n' % (n + 1, uid, len(raw)) + raw + b')\r\n')
+            elif command == b'IDLE':
+                writer.write(b'+ idling\r\n' + (b'* 3 EXISTS\r\n' if self.exists_in_idle else b''))
+                await writer.drain()
+                await reader.readline()  # DONE
+            elif command == b'LOGOUT':
+                writer.write(b'* BYE logging out\r\n' + tag + b' OK LOGOUT completed\r\n')
+                await writer.drain()
+                break
+            writer.write(tag + b' OK ' + command + b' completed\r\n')
+            await writer.drain()
+        writer.close()
+
+    def close(self):
+        self.server.close()
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_client_login_search_fetch_idle():
+    async def scenario():
+        server = FakeIMAPServer()
+        port = await server.start()
+        client = AsyncIMAPClient('127.0.0.1', port, timeout=5)
+        throttled = client.throttle.get_stats()['throttled']
+        await client.connect()
+        await client.login('ana@example.com', 'secret')
+        await client.select('INBOX')
+        uids = await client.uid_search('ALL')
+        messages = await client.uid_fetch_rfc822(uids)
+        new_mail = await client.idle(5)
+        await client.logout()
+        server.close()
+        return client, uids, messages, new_mail, client.throttle.get_stats()['throttled'] - throttled
+
+    client, uids, messages, new_mail, throttled = run(scenario())
+    assert 'IDLE' in client.capabilities
+    assert uids == [7, 9]
+    assert messages == [(7, MESSAGES[7]), (9, MESSAGES[9])]
+    assert new_mail
+    assert throttled == 0  # The BYE answering LOGOUT is not throttling
+
+
+def test_client_raises_on_rejected_login():
+    async def scenario():
+        server = FakeIMAPServer(password='other')
+        port = await server.start()
+        client = AsyncIMAPClient('127.0.0.1', port, timeout=5)
+        await client.connect()
+        try:
+            await client.login('ana@example.com', 'secret')
+        except IMAPCommandError as e:
+            return str(e)
+        finally:
+            await client.logout()
+            server.close()
+
+    assert 'AUTHENTICATIONFAILED' in run(scenario())
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.stored = []
+
+    def get_max_uid(self, account_id):
+        return 0
+
+    def store_email(self, email):
+        self.stored.append(email)
+        return len(self.stored)
+
+
+def sync_once(server, password='secret', until=lambda engine: False):
+    """Run one mailbox task against ``server`` until ``until(engine)`` or a short timeout"""
+    db = FakeDatabase()
+    engine = AsyncEmailSyncEngine(db=db, parse_pool=ParsePool(workers=0), io_workers=2)
+    uniform = async_email_sync.random.uniform
+    async_email_sync.random.uniform = lambda a, b: 0  # No startup spread
+
+    async def scenario():
+        port = await server.start()
+        account = {'id': 1, 'user_id': 1, 'email': 'ana@example.com', 'password': password,
+                   'imap_host': '127.0.0.1', 'imap_port': port}
+        engine.login_semaphore = asyncio.Semaphore(1)
+        engine.pipeline.start()
+        task = asyncio.create_task(engine._mailbox_task(account))
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if until(engine):
+                break
+        engine.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        server.close()
+        await engine._in_thread(engine.pipeline.wait_until_persisted, 5)
+
+    try:
+        run(scenario())
+    finally:
+        async_email_sync.random.uniform = uniform
+        engine.pipeline.stop()
+        engine.io_executor.shutdown(wait=False)
+    return engine, db
+
+
+def test_engine_syncs_new_mail():
+    engine, db = sync_once(FakeIMAPServer(exists_in_idle=False), until=lambda e: e.get_stats()['emails_synced'] >= 2)
+    stats = engine.get_stats()
+    print(f"Async engine stats: { {k: v for k, v in stats.items() if not isinstance(v, dict)} }")
+    assert sorted(email['uid'] for email in db.stored) == ['7', '9']
+    assert db.stored[0]['subject'] in ('Pricing', 'Hello')
+    assert stats['logins'] == 1 and stats['login_failures'] == 0 and stats['emails_synced'] == 2
+    assert 'parse' not in stats['ingest_pipeline']
+
+
+def test_engine_counts_only_failed_logins_as_login_failures():
+    engine, db = sync_once(FakeIMAPServer(password='other'), until=lambda e: e.get_stats()['login_failures'])
+    stats = engine.get_stats()
+    assert stats['login_failures'] >= 1 and stats['sync_errors'] == 0 and stats['logins'] == 0
+    assert not db.stored
+
+
+def test_stat_counters_are_thread_safe():
+    engine = AsyncEmailSyncEngine(db=FakeDatabase(), parse_pool=ParsePool(workers=0), io_workers=1)
+    threads = [threading.Thread(target=lambda: [engine._count('emails_synced') for _ in range(10000)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.io_executor.shutdown(wait=False)
+    assert engine.get_stats()['emails_synced'] == 40000
+
+
+def test_reconnect_does_not_refetch_queued_mail():
+    """UIDs still in the pipeline at a reconnect are not fetched again; a failed write is"""
+    server = FakeIMAPServer()
+    engine = AsyncEmailSyncEngine(db=FakeDatabase(), parse_pool=ParsePool(workers=0), io_workers=2)
+    held = []
+    engine.pipeline.submit_parsed = held.append  # Nothing gets stored until the test says so
+
+    async def scenario():
+        port = await server.start()
+        account = {'id': 1, 'user_id': 1, 'email': 'ana@example.com', 'password': 'secret',
+                   'imap_host': '127.0.0.1', 'imap_port': port}
+
+        async def connect_and_sync():
+            client = AsyncIMAPClient('127.0.0.1', port, timeout=5)
+            await client.connect()
+            await client.login(account['email'], account['password'])
+            await client.select('INBOX')
+            await engine._sync_new(client, account, await engine._new_mail_progress(account))
+            await client.logout()
+
+        await connect_and_sync()
+        await connect_and_sync()  # Reconnect while both messages are still queued
+        fetched_before_store = list(server.fetched)
+        first, second = held
+        first['store_failed'] = True
+        first['on_done']()
+        second['on_done']()
+        await connect_and_sync()
+        server.close()
+        return fetched_before_store
+
+    try:
+        fetched_before_store = run(scenario())
+    finally:
+        engine.io_executor.shutdown(wait=False)
+    assert fetched_before_store == [7, 9]
+    assert server.fetched == [7, 9, 7]  # Only the failed write is fetched again
+    assert engine.new_mail[1].last_uid == 0  # 9 is stored but 7 is not yet
+    held[-1]['on_done']()
+    assert engine.new_mail[1].last_uid == 9
+
+
+def test_classification_uses_tenant_rules():
+    """A tenant's rule override applies to mail the async engine syncs"""
+    path = os.path.join(tempfile.mkdtemp(), 'rules.json')
+    with open(path, 'w') as f:
+        json.dump({'tenants': {'42': {'rules': [{'id': 'interested', 'priority': 25, 'weight': 0.9}]}}}, f)
+    engine = AsyncEmailSyncEngine(db=FakeDatabase(), parse_pool=ParsePool(workers=0), io_workers=1)
+    original = email_classifier.classifier.rule_engine
+    email_classifier.classifier.rule_engine = RuleEngine(path, reload_interval=0)
+    fields = {'subject': 'Re: demo', 'content': 'Sounds good, can we set up a meeting?', 'sender': 'ana@lead.com'}
+    try:
+        tenant = engine._classify_item({'account': {'id': 1, 'user_id': 42}, 'fields': fields})['classification']
+        other = engine._classify_item({'account': {'id': 2, 'user_id': 7}, 'fields': fields})['classification']
+    finally:
+        email_classifier.classifier.rule_engine = original
+        engine.io_executor.shutdown(wait=False)
+    assert tenant['category'] == 'Interested' and tenant['confidence_score'] == 0.9
+    assert other['category'] == 'Meeting Booked'
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Async Email Sync")
+    print("=" * 50)
+    test_client_login_search_fetch_idle()
+    test_client_raises_on_rejected_login()
+    test_engine_syncs_new_mail()
+    test_engine_counts_only_failed_logins_as_login_failures()
+    test_stat_counters_are_thread_safe()
+    test_reconnect_does_not_refetch_queued_mail()
+    test_classification_uses_tenant_rules()
+    print("✅ All async email sync tests passed")
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Test resumable newest-first backfill with per-batch checkpoints
+"""
+
+import threading
+import time
+from backfill import BackfillJob, backfill_connections
+
+
+class FakeMailbox:
+    """Just enough of imaplib.IMAP4 for BackfillJob"""
+
+    def __init__(self, uids, uidvalidity=7, fail_after_fetches=None, fetch_latency=0):
+        self.uids = sorted(uids)
+        self.uidvalidity = uidvalidity
+        self.fetch_calls = []
+        self.fail_after_fetches = fail_after_fetches
+        self.fetch_latency = fetch_latency
+        self._responses = {}
+
+    def select(self, mailbox='INBOX'):
+        self._responses = {
+            'UIDVALIDITY': [str(self.uidvalidity).encode()],
+            'UIDNEXT': [str(max(self.uids) + 1).encode()]
+        }
+        return 'OK', [str(len(self.uids)).encode()]
+
+    def response(self, name):
+        return name, self._responses.pop(name, [None])
+
+    def uid(self, command, *args):
+        if command == 'search':
+            return 'OK', [' '.join(str(uid) for uid in self.uids).encode()]
+        if self.fail_after_fetches is not None and len(self.fetch_calls) >= self.fail_after_fetches:
+            raise ConnectionError("connection dropped")
+        requested = [int(uid) for uid in args[0].split(',')]
+        self.fetch_calls.append(requested)
+        time.sleep(self.fetch_latency)  # Server round trip
+        data = []
+        for uid in requested:
+            data.append((f'1 (UID {uid} RFC822 {{5}}'.encode(), b'hello'))
+            data.append(b')')
+        return 'OK', data
+
+
+class MemoryStore:
+    def __init__(self):
+        self.checkpoints = {}
+        self.history = []
+
+    def get_backfill_checkpoint(self, account_key, mailbox='INBOX'):
+        checkpoint = self.checkpoints.get((account_key, mailbox))
+        return dict(checkpoint) if checkpoint else None
+
+    def save_backfill_checkpoint(self, checkpoint):
+        self.checkpoints[(checkpoint['account_key'], checkpoint['mailbox'])] = dict(checkpoint)
+        self.history.append(checkpoint['low_uid'])
+
+
+def test_newest_first_and_complete():
+    """History is fetched newest first and the job completes"""
+    store = MemoryStore()
+    stored = []
+    mail = FakeMailbox(range(1, 251))
+
+    def submit(uid, raw, on_done):
+        stored.append(uid)
+        on_done()
+
+    job = BackfillJob(store, 'user@example.com', submit, batch_size=100)
+    queued = job.run(mail)
+
+    assert queued == 250
+    assert stored[:3] == [250, 249, 248]
+    assert job.complete
+    assert store.checkpoints[('user@example.com', 'INBOX')]['low_uid'] == 1
+
+
+def test_resume_without_refetch():
+    """A crash mid-backfill resumes below the checkpoint without refetching"""
+    store = MemoryStore()
+    stored = []
+
+    def submit(uid, raw, on_done):
+        stored.append(uid)
+        on_done()
+
+    crashing = FakeMailbox(range(1, 501), fail_after_fetches=2)
+    try:
+        BackfillJob(store, 'acct', submit, batch_size=100).run(crashing)
+    except ConnectionError:
+        pass
+    assert store.checkpoints[('acct', 'INBOX')]['low_uid'] == 301
+
+    mail = FakeMailbox(range(1, 501))
+    BackfillJob(store, 'acct', submit, batch_size=100).run(mail)
+    fetched_after_restart = [uid for batch in mail.fetch_calls for uid in batch]
+    print(f"Refetched after restart: {len(fetched_after_restart)} (max {max(fetched_after_restart)})")
+    assert max(fetched_after_restart) == 300
+    assert sorted(stored) == list(range(1, 501))
+
+
+def test_checkpoint_monotonic_with_out_of_order_completion():
+    """An older batch finishing first does not move the checkpoint past a newer unfinished one"""
+    store = MemoryStore()
+    callbacks = {}
+
+    def submit(uid, raw, on_done):
+        callbacks[uid] = on_done
+
+    job = BackfillJob(store, 'acct', submit, batch_size=10)
+    job.run(FakeMailbox(range(1, 31)))
+
+    # Finish the oldest batch (1-10) first: checkpoint must not move yet
+    for uid in range(1, 11):
+        callbacks[uid]()
+    assert store.checkpoints[('acct', 'INBOX')]['low_uid'] is None
+
+    # Newest batch done -> 21; then the middle one releases everything
+    for uid in range(21, 31):
+        callbacks[uid]()
+    assert store.checkpoints[('acct', 'INBOX')]['low_uid'] == 21
+    for uid in range(11, 21):
+        callbacks[uid]()
+    checkpoint = store.checkpoints[('acct', 'INBOX')]
+    assert checkpoint['low_uid'] == 1 and checkpoint['status'] == 'complete'
+    lows = [low for low in store.history if low is not None]
+    assert lows == sorted(lows, reverse=True)
+
+
+def test_uidvalidity_change_restarts():
+    """A new UIDVALIDITY invalidates the old checkpoint"""
+    store = MemoryStore()
+
+    def submit(uid, raw, on_done):
+        on_done()
+
+    BackfillJob(store, 'acct', submit).run(FakeMailbox(range(1, 11), uidvalidity=1))
+    mail = FakeMailbox(range(1, 11), uidvalidity=2)
+    queued = BackfillJob(store, 'acct', submit).run(mail)
+    assert queued == 10
+
+
+def test_parallel_connections_keep_checkpoint_monotonic():
+    """UID ranges fetched over several connections are all stored and checkpoints only move down"""
+    uids = range(1, 2001)
+    store = MemoryStore()
+    stored = []
+    stored_lock = threading.Lock()
+    connections = []
+
+    def submit(uid, raw, on_done):
+        with stored_lock:
+            stored.append(uid)
+        on_done()
+
+    def connect():
+        conn = FakeMailbox(uids, fetch_latency=0.02)
+        connections.append(conn)
+        return conn
+
+    start = time.perf_counter()
+    BackfillJob(MemoryStore(), 'acct', submit, batch_size=50).run(FakeMailbox(uids, fetch_latency=0.02))
+    serial = time.perf_counter() - start
+    stored.clear()
+
+    start = time.perf_counter()
+    job = BackfillJob(store, 'acct', submit, batch_size=50)
+    queued = job.run(FakeMailbox(uids, fetch_latency=0.02), connect=connect, connections=8)
+    parallel = time.perf_counter() - start
+    print(f"40 ranges: serial {serial:.2f}s, 8 connections {parallel:.2f}s")
+
+    assert queued == 2000
+    assert sorted(stored) == list(uids)
+    assert len(connections) == 7
+    assert job.complete
+    lows = [low for low in store.history if low is not None]
+    assert lows == sorted(lows, reverse=True)
+    assert parallel < serial / 3
+
+
+def test_failed_connection_leaves_range_for_others():
+    """A dropped extra connection does not lose its range"""
+    store = MemoryStore()
+    stored = []
+
+    def submit(uid, raw, on_done):
+        stored.append(uid)
+        on_done()
+
+    def connect():
+        return FakeMailbox(range(1, 301), fail_after_fetches=0)
+
+    job = BackfillJob(store, 'acct', submit, batch_size=50)
+    job.run(FakeMailbox(range(1, 301), fetch_latency=0.01), connect=connect, connections=3)
+    assert sorted(stored) == list(range(1, 301))
+    assert job.complete
+
+
+def test_connection_limits():
+    """Provider limits leave one connection free and unknown hosts are conservative"""
+    assert backfill_connections('imap.gmail.com') == 14
+    assert backfill_connections('outlook.office365.com') == 7
+    assert backfill_connections('mail.example.org') == 3
+    assert backfill_connections(None) == 3
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Resumable Backfill")
+    print("=" * 50)
+    test_newest_first_and_complete()
+    test_resume_without_refetch()
+    test_checkpoint_monotonic_with_out_of_order_completion()
+    test_uidvalidity_change_restarts()
+    test_parallel_connections_keep_checkpoint_monotonic()
+    test_failed_connection_leaves_range_for_others()
+    test_connection_limits()
+    print("✅ All backfill tests passed")
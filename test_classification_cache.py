@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test the persistent classification cache
+"""
+
+import os
+import tempfile
+from python_models import Database
+from classification_cache import ClassificationCache, cache_key
+
+EMAIL = {'subject': 'Re: Pricing for 20 seats', 'sender': 'Ana <ana@lead.com>', 'content': 'Could you share numbers for 20 seats?'}
+
+
+def cache(**kwargs):
+    return ClassificationCache(Database(os.path.join(tempfile.mkdtemp(), 'cache.db')), **kwargs)
+
+
+def test_key_normalization():
+    near_copy = {'subject': 'pricing for 35 SEATS', 'sender': 'bob@lead.com', 'content': 'Could  you share\nnumbers for 35 seats?'}
+    assert cache_key(EMAIL) == cache_key(near_copy)
+    assert cache_key(EMAIL) != cache_key({**EMAIL, 'sender': 'ana@other.com'})
+    assert cache_key(EMAIL) != cache_key({**EMAIL, 'content': 'Not for us, thanks.'})
+    assert cache_key(EMAIL) != cache_key({**EMAIL, 'thread_category': 'Meeting Booked'})
+    assert cache_key(EMAIL, version='1') != cache_key(EMAIL, version='2')
+
+
+def test_hits_survive_restart():
+    results = cache()
+    assert results.get(EMAIL) is None
+    results.put(EMAIL, {'category': 'Interested', 'confidence_score': 0.85})
+    assert results.get(EMAIL) == {'category': 'Interested', 'confidence_score': 0.85}
+
+    reopened = ClassificationCache(results.store)  # e.g. after a restart: nothing in memory
+    assert reopened.get(EMAIL)['category'] == 'Interested'
+    reopened.flush()
+    stats = results.get_stats()
+    print(f"Cache stats: {stats}")
+    assert stats['hits'] == 1 and stats['misses'] == 1 and stats['hit_rate'] == 0.5
+    assert stats['memory_hits'] == 1
+
+
+def test_ttl_expiry():
+    results = cache(ttl=-1)  # Everything is already expired
+    results.put(EMAIL, {'category': 'Interested', 'confidence_score': 0.85})
+    assert results.get(EMAIL) is None
+
+
+def test_lru_eviction():
+    results = cache(max_entries=2, memory_entries=1)
+    emails = [{**EMAIL, 'content': f'Message about {name}'} for name in ('alpha', 'beta', 'gamma')]
+    for email in emails:
+        results.put(email, {'category': 'Interested', 'confidence_score': 0.85})
+    results.get(emails[0])  # Most recently used now; beta is the least
+    assert results.evict() == 1
+    assert results.get(emails[1]) is None
+    assert results.get(emails[0]) and results.get(emails[2])
+
+
+def test_classifier_calls_ai_once_per_content():
+    from email_classifier import EmailClassifier
+    classifier = EmailClassifier()
+    classifier.cache = cache()
+    classifier.ai_enabled = True
+    calls = []
+    classifier.ai_classify = lambda data: calls.append(data) or ('Interested', 0.85)
+    first = classifier.classify_email(EMAIL, notify=False)
+    again = classifier.classify_email({**EMAIL, 'subject': 'Pricing for 25 seats'}, notify=False)
+    assert len(calls) == 1
+    assert first['classification_method'] == 'AI' and again['classification_method'] == 'Cache'
+    assert again['category'] == 'Interested' and again['confidence_score'] == 0.85
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Classification Cache")
+    print("=" * 50)
+    test_key_normalization()
+    test_hits_survive_restart()
+    test_ttl_expiry()
+    test_lru_eviction()
+    test_classifier_calls_ai_once_per_content()
+    print("✅ All classification cache tests passed")
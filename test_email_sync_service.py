@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test the single-tenant sync service's new-mail checkpoint
+"""
+
+import os
+import tempfile
+from types import SimpleNamespace
+import email_sync_service
+from python_models import Database
+
+
+class FakeStorage:
+    def __init__(self):
+        self.last_uid = None
+
+    def get_last_uid(self, account_email):
+        return self.last_uid
+
+    def update_sync_status(self, account_email, last_uid=None, status='active'):
+        self.last_uid = last_uid
+
+
+class HeldPipeline:
+    """Keeps submitted items until finish() is called"""
+
+    def __init__(self):
+        self.items = []
+
+    def submit(self, item):
+        self.items.append(item)
+
+    def finish(self, uid, stored=True):
+        item = next(item for item in self.items if item['uid'] == str(uid))
+        self.items.remove(item)
+        if not stored:
+            item['store_failed'] = True
+        item['on_done']()
+
+    def stop(self):
+        pass
+
+
+def make_service(server_uids, fetched):
+    path = os.path.join(tempfile.mkdtemp(), 'sync.db')
+    originals = {name: getattr(email_sync_service, name) for name in ('Database', 'imap_call', 'fetch_messages')}
+    email_sync_service.Database = lambda: Database(path)
+    service = email_sync_service.EmailSyncService()
+    service.pipeline.stop()
+    service.pipeline = HeldPipeline()
+    service.storage = FakeStorage()
+    email_sync_service.imap_call = lambda mail, method, *args: ('OK', [' '.join(map(str, server_uids)).encode()])
+    email_sync_service.fetch_messages = lambda mail, uids: fetched.extend(uids) or [(uid, b'raw') for uid in uids]
+
+    def restore():
+        for name, value in originals.items():
+            setattr(email_sync_service, name, value)
+    return service, restore
+
+
+ACCOUNT = {'email': 'ana@example.com'}
+MAIL = SimpleNamespace(uid=None)  # imap_call is replaced
+
+
+def test_last_uid_moves_only_past_stored_mail():
+    fetched = []
+    service, restore = make_service([5, 6, 7], fetched)
+    try:
+        service.fetch_new_emails(MAIL, ACCOUNT)
+        assert fetched == [5, 6, 7] and service.storage.last_uid is None  # Queued, nothing stored yet
+        service.fetch_new_emails(MAIL, ACCOUNT)
+        assert fetched == [5, 6, 7]  # Still in the pipeline: not fetched again
+        service.pipeline.finish(6)
+        assert service.storage.last_uid is None  # 5 is not stored yet
+        service.pipeline.finish(5)
+        assert service.storage.last_uid == '6'
+        service.pipeline.finish(7, stored=False)
+        assert service.storage.last_uid == '6'
+        service.fetch_new_emails(MAIL, ACCOUNT)
+        assert fetched == [5, 6, 7, 7]  # The failed write is fetched again
+        service.pipeline.finish(7)
+        assert service.storage.last_uid == '7'
+    finally:
+        restore()
+        service.push_engine.stop()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Email Sync Service")
+    print("=" * 50)
+    test_last_uid_moves_only_past_stored_mail()
+    print("✅ All email sync service tests passed")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test folder discovery (LIST / SPECIAL-USE) and per-folder polling
+"""
+
+from folders import list_folders, resolve_folders, quote_mailbox, FolderSyncPlanner
+
+
+class FakeList:
+    def __init__(self, lines):
+        self.lines = lines
+        self.calls = 0
+
+    def list(self):
+        self.calls += 1
+        return 'OK', self.lines
+
+
+GMAIL = [
+    b'(\\HasNoChildren) "/" "INBOX"',
+    b'(\\HasChildren \\Noselect) "/" "[Gmail]"',
+    b'(\\All \\HasNoChildren) "/" "[Gmail]/All Mail"',
+    b'(\\HasNoChildren \\Sent) "/" "[Gmail]/Sent Mail"',
+    b'(\\HasNoChildren \\Trash) "/" "[Gmail]/Trash"',
+    (b'(\\HasNoChildren) "/" {14}', b'Clients "Acme"'),
+]
+
+# No SPECIAL-USE: roles come from the usual names
+DOVECOT = [
+    b'(\\HasNoChildren) "." INBOX',
+    b'(\\HasNoChildren) "." "Sent Items"',
+    b'(\\HasNoChildren) "." Archive',
+]
+
+
+def test_special_use_roles():
+    folders = {folder['name']: folder['role'] for folder in list_folders(FakeList(GMAIL))}
+    print(f"Gmail folders: {folders}")
+    assert folders['INBOX'] == 'inbox'
+    assert folders['[Gmail]/Sent Mail'] == 'sent'
+    assert folders['[Gmail]/All Mail'] == 'all'
+    assert folders['Clients "Acme"'] is None
+    assert '[Gmail]' not in folders  # \\Noselect
+
+
+def test_name_hints_without_special_use():
+    folders = {folder['name']: folder['role'] for folder in list_folders(FakeList(DOVECOT))}
+    assert folders == {'INBOX': 'inbox', 'Sent Items': 'sent', 'Archive': 'archive'}
+
+
+def test_resolve_configured_folders():
+    """Roles and names resolve to what exists; missing ones are skipped, INBOX is first"""
+    folders = list_folders(FakeList(GMAIL))
+    chosen = resolve_folders(folders, ['\\Sent', '\\Archive', 'Clients "Acme"', 'INBOX', 'Missing'])
+    assert [folder['name'] for folder in chosen] == ['INBOX', '[Gmail]/Sent Mail', 'Clients "Acme"']
+
+
+def test_quote_mailbox():
+    assert quote_mailbox('Sent Items') == '"Sent Items"'
+    assert quote_mailbox('Clients "Acme"') == '"Clients \\"Acme\\""'
+
+
+def test_idle_folders_polled_less_often():
+    """INBOX is always due; a folder with no changes backs off, one with changes resets"""
+    planner = FolderSyncPlanner(min_interval=300, max_interval=3600)
+    folders = [{'name': 'INBOX', 'role': 'inbox'}, {'name': 'Sent', 'role': 'sent'}]
+    assert planner.due(1, folders, now=0) == folders
+
+    intervals = [planner.record(1, 'Sent', changed=False, now=0) for _ in range(6)]
+    assert intervals == [600, 1200, 2400, 3600, 3600, 3600]
+    assert [f['name'] for f in planner.due(1, folders, now=100)] == ['INBOX']
+    assert planner.due(1, folders, now=3600) == folders
+    assert planner.record(1, 'Sent', changed=True, now=3600) == 300
+
+
+def test_folder_list_cached_per_setting():
+    planner = FolderSyncPlanner(list_refresh=3600)
+    mail = FakeList(GMAIL)
+    account = {'id': 1, 'email': 'a@example.com', 'sync_folders': 'INBOX,\\Sent'}
+    first = planner.folders_for(account, mail, now=0)
+    assert planner.folders_for(account, mail, now=10) == first
+    assert mail.calls == 1
+
+    account['sync_folders'] = 'INBOX,\\Sent,Clients "Acme"'
+    assert len(planner.folders_for(account, mail, now=20)) == 3
+    assert mail.calls == 2
+
+    account['sync_folders'] = 'INBOX'
+    assert planner.folders_for(account, mail, now=30) == [{'name': 'INBOX', 'role': 'inbox'}]
+    assert mail.calls == 2
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Folder Sync")
+    print("=" * 50)
+    test_special_use_roles()
+    test_name_hints_without_special_use()
+    test_resolve_configured_folders()
+    test_quote_mailbox()
+    test_idle_folders_polled_less_often()
+    test_folder_list_cached_per_setting()
+    print("✅ All folder tests passed")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test shared body extraction (charsets, HTML-to-text, length cap)
+"""
+
+import random
+import html_text
+from email import message_from_bytes
+from html_text import html_to_text, extract_body, decode_payload
+
+
+def test_hidden_elements_and_entities():
+    """Script/style/head content is dropped and entities are decoded"""
+    markup = (
+        "<html><head><title>Digest</title><style>p {color: red}</style></head>"
+        "<body><p>Hi&nbsp;there &amp; welcome</p><script>track()</script>"
+        "<table><tr><td>Price</td><td>&euro;10</td></tr></table><!-- hidden --></body></html>"
+    )
+    text = html_to_text(markup)
+    print(repr(text))
+    assert text == "Hi there & welcome\n\nPrice €10"
+
+
+def test_cap_stops_early():
+    """A capped conversion returns at most max_chars of the leading text"""
+    markup = "<div>" + "<p>Interested in a demo next week</p>" * 50000 + "</div>"
+    text = html_to_text(markup, max_chars=100)
+    assert len(text) <= 100
+    assert text.startswith("Interested in a demo next week")
+
+
+def test_capped_conversion_is_incremental():
+    """Markup past the point where the cap is reached is never converted"""
+    markup = "<style>p {color: red}</style>" + "<p>Interested in a demo next week</p>" * 60000  # ~2 MB
+    converted = []
+    strip_tags = html_text._strip_tags
+    html_text._strip_tags = lambda fragment: converted.append(len(fragment)) or strip_tags(fragment)
+    try:
+        text = html_to_text(markup, max_chars=2000)
+    finally:
+        html_text._strip_tags = strip_tags
+    assert 1990 <= len(text) <= 2000 and 'color' not in text
+    assert sum(converted) < len(markup) / 50
+
+
+def test_capped_matches_uncapped_prefix():
+    """Windows cut mid-document (and through hidden elements) give the same text as a full conversion"""
+    rng = random.Random(3)
+    parts = ["<p>word%d &amp; more</p>" % i for i in range(400)]
+    for i in range(0, 400, 37):
+        parts[i] += "<style>.x%d{color:red}</style><!-- note %d --><script>t(%d)</script>" % (i, i, i)
+    for _ in range(20):
+        markup = "".join(rng.sample(parts, len(parts)))
+        cap = rng.randint(10, 3000)
+        assert html_to_text(markup, max_chars=cap) == html_to_text(markup)[:cap].rstrip()
+
+
+def test_unclosed_head_keeps_body():
+    """A broken template without </head> still yields its text"""
+    assert html_to_text("<head><title>x</title><p>Still here</p>") == "Still here"
+
+
+def test_charset_from_part_headers():
+    """Bodies are decoded with the declared charset, not always utf-8"""
+    raw = (
+        "Subject: Hola\r\nContent-Type: text/plain; charset=iso-8859-1\r\n"
+        "Content-Transfer-Encoding: 8bit\r\n\r\n"
+    ).encode() + "¿Podemos hablar mañana?".encode('iso-8859-1')
+    assert extract_body(message_from_bytes(raw)) == "¿Podemos hablar mañana?"
+
+
+def test_meta_charset_for_html():
+    """HTML parts without a charset parameter fall back to <meta charset>"""
+    raw = (
+        b"Subject: Hi\r\nContent-Type: text/html\r\nContent-Transfer-Encoding: 8bit\r\n\r\n"
+        b'<html><head><meta charset="windows-1251"></head><body><p>'
+        + "Привет".encode('cp1251') + b"</p></body></html>"
+    )
+    assert extract_body(message_from_bytes(raw)) == "Привет"
+
+
+def test_plain_preferred_and_attachments_skipped():
+    """text/plain wins over text/html and attached text files are ignored"""
+    raw = (
+        b"Subject: Mixed\r\nMIME-Version: 1.0\r\n"
+        b'Content-Type: multipart/mixed; boundary="b1"\r\n\r\n'
+        b"--b1\r\n"
+        b'Content-Type: multipart/alternative; boundary="b2"\r\n\r\n'
+        b"--b2\r\nContent-Type: text/plain; charset=utf-8\r\n\r\nPlain body\r\n"
+        b"--b2\r\nContent-Type: text/html; charset=utf-8\r\n\r\n<p>Html body</p>\r\n"
+        b"--b2--\r\n"
+        b"--b1\r\nContent-Type: text/plain\r\nContent-Disposition: attachment; filename=log.txt\r\n\r\n"
+        b"attached log\r\n"
+        b"--b1--\r\n"
+    )
+    assert extract_body(message_from_bytes(raw)) == "Plain body"
+
+
+def test_unknown_charset_falls_back():
+    """Unknown charset labels decode as utf-8 instead of raising"""
+    assert decode_payload("café".encode(), "x-made-up") == "café"
+
+
+if __name__ == "__main__":
+    print("🧪 Testing HTML-to-text Extraction")
+    print("=" * 50)
+    test_hidden_elements_and_entities()
+    test_cap_stops_early()
+    test_capped_conversion_is_incremental()
+    test_capped_matches_uncapped_prefix()
+    test_unclosed_head_keeps_body()
+    test_charset_from_part_headers()
+    test_meta_charset_for_html()
+    test_plain_preferred_and_attachments_skipped()
+    test_unknown_charset_falls_back()
+    print("✅ All HTML-to-text tests passed")
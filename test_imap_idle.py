@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test the IMAP IDLE push engine against a fake server over a socket pair
+"""
+
+import time
+import socket
+import threading
+from imap_idle import IdleWatcher, IdlePushEngine
+
+
+class FakeServer:
+    """
+    Scripted IMAP server end of a socket pair. ``on_idle`` is sent in a
+    single write when IDLE starts, so several responses share one packet.
+    """
+
+    def __init__(self, on_idle):
+        self.sock, self.client_sock = socket.socketpair()
+        self.on_idle = list(on_idle)
+        self.idles = 0
+        self.idle_started = []
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        reader = self.sock.makefile('rb')
+        tag = None
+        try:
+            for line in reader:
+                if line.endswith(b' IDLE\r\n'):
+                    tag = line.split()[0]
+                    self.idles += 1
+                    self.idle_started.append(time.time())
+                    self.sock.sendall(self.on_idle.pop(0) if self.on_idle else b'+ idling\r\n')
+                elif line == b'DONE\r\n':
+                    self.sock.sendall(tag + b' OK IDLE terminated\r\n')
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+
+
+class FakeConnection:
+    """The parts of imaplib.IMAP4 the watcher uses, on a real (buffered) socket"""
+
+    capabilities = ('IMAP4REV1', 'IDLE')
+
+    def __init__(self, server):
+        self.sock = server.client_sock
+        self.file = self.sock.makefile('rb')
+        self.tags = 0
+        self.logged_out = False
+
+    def _new_tag(self):
+        self.tags += 1
+        return f'A{self.tags:03d}'.encode()
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        return self.file.readline()
+
+    def logout(self):
+        self.logged_out = True
+
+
+def watch(on_idle, idle_timeout=10, events=1):
+    """Run a watcher until it has seen ``events`` new-mail callbacks after the initial catch-up"""
+    server = FakeServer(on_idle)
+    connection = FakeConnection(server)
+    calls = []
+
+    def on_new_mail(mail, account):
+        calls.append(time.time())
+        if len(calls) > events:
+            watcher.stop()
+
+    watcher = IdleWatcher({'email': 'user@example.com'}, lambda account: connection, on_new_mail, idle_timeout=idle_timeout)
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+    thread.join(idle_timeout + 5)
+    server.close()
+    return watcher, server, connection, calls
+
+
+def test_exists_in_same_packet_as_continuation():
+    """EXISTS buffered behind '+ idling' is seen at once, not at the IDLE renewal"""
+    watcher, server, connection, calls = watch([b'+ idling\r\n* 3 EXISTS\r\n'])
+    assert len(calls) == 2 and calls[1] - server.idle_started[0] < 2
+    assert watcher.stats['exists_events'] == 1 and watcher.stats['mode'] == 'idle'
+    assert connection.logged_out
+
+
+def test_exists_after_expunge_in_one_packet():
+    watcher, server, connection, calls = watch([b'+ idling\r\n* 2 EXPUNGE\r\n* 4 EXISTS\r\n'])
+    assert len(calls) == 2 and calls[1] - server.idle_started[0] < 2
+    assert watcher.stats['idle_renewals'] == 0 and watcher.stats['exists_events'] == 1
+
+
+def test_exists_arriving_later_during_idle():
+    server = FakeServer([b'+ idling\r\n'])
+    connection = FakeConnection(server)
+    calls = []
+    watcher = IdleWatcher({'email': 'user@example.com'}, lambda account: connection,
+                          lambda mail, account: calls.append(time.time()) or (len(calls) > 1 and watcher.stop()), idle_timeout=10)
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+    while not server.idles:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    sent = time.time()
+    server.sock.sendall(b'* 5 EXISTS\r\n')
+    thread.join(5)
+    server.close()
+    assert len(calls) == 2 and calls[1] - sent < 2
+
+
+def test_push_engine_runs_a_watcher_per_account():
+    servers = {}
+
+    def connect(account):
+        servers[account['email']] = FakeServer([])
+        return FakeConnection(servers[account['email']])
+
+    seen = []
+    engine = IdlePushEngine(connect, lambda mail, account: seen.append(account['email']), startup_spread=0)
+    engine.start([{'email': 'a@example.com'}, {'email': 'b@example.com'}])
+    deadline = time.time() + 5
+    while len(seen) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    stats = engine.get_stats()
+    engine.stop(timeout=3)
+    for server in servers.values():
+        server.close()
+    assert sorted(seen) == ['a@example.com', 'b@example.com']
+    assert set(stats) == {'a@example.com', 'b@example.com'} and all(s['connects'] == 1 for s in stats.values())
+
+
+if __name__ == "__main__":
+    print("🧪 Testing IMAP IDLE")
+    print("=" * 50)
+    test_exists_in_same_packet_as_continuation()
+    test_exists_after_expunge_in_one_packet()
+    test_exists_arriving_later_during_idle()
+    test_push_engine_runs_a_watcher_per_account()
+    print("✅ All IMAP IDLE tests passed")
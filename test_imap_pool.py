@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test the reusable IMAP connection pool
+"""
+
+import time
+from imap_pool import IMAPConnectionPool
+
+
+class FakeConnection:
+    def __init__(self, account):
+        self.account = account
+        self.alive = True
+        self.noops = 0
+        self.logged_out = False
+
+    def noop(self):
+        self.noops += 1
+        if not self.alive:
+            raise ConnectionError("socket closed")
+        return 'OK', [b'NOOP completed']
+
+    def logout(self):
+        self.logged_out = True
+
+
+class Connector:
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self, account):
+        conn = FakeConnection(account)
+        self.opened.append(conn)
+        return conn
+
+
+def account(n, password='secret'):
+    return {'id': n, 'email': f'user{n}@example.com', 'imap_host': 'imap.example.com',
+            'imap_port': 993, 'password': password}
+
+
+def test_session_reused_across_cycles():
+    """The second cycle reuses the first cycle's login"""
+    connect = Connector()
+    pool = IMAPConnectionPool(connect, health_check_after=60)
+    for _ in range(3):
+        mail = pool.checkout(account(1))
+        pool.checkin(account(1), mail)
+    stats = pool.get_stats()
+    print(stats)
+    assert len(connect.opened) == 1
+    assert stats['reused'] == 2 and stats['open'] == 1
+
+
+def test_stale_session_health_checked():
+    """A session idle past the threshold is NOOPed, and replaced if the server dropped it"""
+    connect = Connector()
+    pool = IMAPConnectionPool(connect, health_check_after=0)
+    first = pool.checkout(account(1))
+    pool.checkin(account(1), first)
+
+    assert pool.checkout(account(1)) is first
+    assert first.noops == 1
+    pool.checkin(account(1), first)
+
+    first.alive = False
+    second = pool.checkout(account(1))
+    assert second is not first and first.logged_out
+    assert pool.get_stats()['health_failures'] == 1
+    assert pool.get_stats()['open'] == 1
+
+
+def test_failed_session_not_reused():
+    """Sessions checked in after an error are closed"""
+    connect = Connector()
+    pool = IMAPConnectionPool(connect)
+    mail = pool.checkout(account(1))
+    pool.checkin(account(1), mail, healthy=False)
+    assert mail.logged_out
+    assert pool.checkout(account(1)) is not mail
+    assert pool.get_stats()['open'] == 1
+
+
+def test_idle_eviction():
+    """Sessions unused past the idle timeout are logged out"""
+    connect = Connector()
+    pool = IMAPConnectionPool(connect, idle_timeout=0.05)
+    mail = pool.checkout(account(1))
+    pool.checkin(account(1), mail)
+    time.sleep(0.1)
+    assert pool.evict_idle() == 1
+    assert mail.logged_out and pool.get_stats()['open'] == 0
+
+
+def test_socket_cap_evicts_least_recently_used():
+    """At the cap, the oldest idle session makes room; in-use ones are never taken"""
+    connect = Connector()
+    pool = IMAPConnectionPool(connect, max_connections=2, wait_timeout=0.1)
+    a, b = pool.checkout(account(1)), pool.checkout(account(2))
+    assert pool.checkout(account(3)) is None  # Both in use: wait, then give up
+
+    pool.checkin(account(1), a)
+    c = pool.checkout(account(3))
+    time.sleep(0.05)  # LRU logout runs in the background
+    assert c is not None and a.logged_out and not b.logged_out
+    assert pool.get_stats()['open'] == 2
+
+
+def test_changed_password_not_reused():
+    """A session logged in with old credentials is not handed out"""
+    connect = Connector()
+    pool = IMAPConnectionPool(connect)
+    mail = pool.checkout(account(1))
+    pool.checkin(account(1), mail)
+    assert pool.checkout(account(1, password='rotated')) is not mail
+    assert mail.logged_out
+
+
+if __name__ == "__main__":
+    print("🧪 Testing IMAP Connection Pool")
+    print("=" * 50)
+    test_session_reused_across_cycles()
+    test_stale_session_health_checked()
+    test_failed_session_not_reused()
+    test_idle_eviction()
+    test_socket_cap_evicts_least_recently_used()
+    test_changed_password_not_reused()
+    print("✅ All connection pool tests passed")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test per-host IMAP rate limiting and adaptive throttling
+"""
+
+import imaplib
+import time
+from imap_throttle import HostThrottle, TokenBucket, is_throttle_response
+
+
+def test_bucket_paces_after_burst():
+    """A burst goes through at once, then calls are spaced at the configured rate"""
+    bucket = TokenBucket(rate=100, burst=5)
+    waits = [bucket.reserve() for _ in range(15)]
+    assert waits[:5] == [0.0] * 5
+    assert 0.09 < waits[-1] < 0.11
+
+
+def test_throttled_command_is_retried():
+    """NO [THROTTLED] is retried after a backoff and counted"""
+    throttle = HostThrottle('imap.example.com', backoff_base=0.01, backoff_max=0.05)
+    responses = [('NO', [b'[THROTTLED] Too many commands']), ('OK', [b'1 2 3'])]
+
+    result = throttle.call(lambda: responses.pop(0))
+    stats = throttle.get_stats()
+    print(stats)
+    assert result == ('OK', [b'1 2 3'])
+    assert stats['throttled'] == 1 and stats['retries'] == 1
+    assert stats['commands'] == 2
+
+
+def test_throttled_login_raises_after_retries():
+    """Login errors that are throttling are retried; real failures are not"""
+    throttle = HostThrottle('imap.example.com', retry_limit=2, backoff_base=0.01, backoff_max=0.02)
+    calls = []
+
+    def login():
+        calls.append(1)
+        raise imaplib.IMAP4.error("[UNAVAILABLE] Too many simultaneous connections")
+
+    try:
+        throttle.call(login, kind='login')
+        assert False, "expected the login to fail"
+    except imaplib.IMAP4.error:
+        pass
+    assert len(calls) == 3
+
+    def bad_password():
+        calls.append(1)
+        raise imaplib.IMAP4.error("[AUTHENTICATIONFAILED] Invalid credentials")
+
+    calls.clear()
+    try:
+        throttle.call(bad_password, kind='login')
+    except imaplib.IMAP4.error:
+        pass
+    assert len(calls) == 1
+
+
+def test_bye_holds_host_and_slows_rates():
+    """A BYE puts the host on hold for every caller and halves its rates, which recover"""
+    throttle = HostThrottle('imap.example.com', backoff_base=0.2, backoff_max=0.2)
+
+    def dropped():
+        raise imaplib.IMAP4.abort("* BYE Server busy")
+
+    try:
+        throttle.call(dropped)
+    except imaplib.IMAP4.abort:
+        pass
+    assert throttle.get_stats()['rate_scale'] == 0.5
+
+    start = time.perf_counter()
+    throttle.acquire('command')
+    assert time.perf_counter() - start >= 0.09
+
+    for _ in range(20):
+        throttle.call(lambda: ('OK', [b'']))
+    assert throttle.get_stats()['rate_scale'] == 1.0
+
+
+def test_plain_abort_does_not_hold_host():
+    """A dropped connection or a deliberate abort is re-raised without penalising the host"""
+    throttle = HostThrottle('imap.example.com', backoff_base=5, backoff_max=5)
+    for message in ("socket error: EOF", "command: FETCH => socket error: [Errno 9] Bad file descriptor"):
+        def dropped():
+            raise imaplib.IMAP4.abort(message)
+        try:
+            throttle.call(dropped)
+            assert False, "the abort must be re-raised"
+        except imaplib.IMAP4.abort:
+            pass
+    stats = throttle.get_stats()
+    assert stats['throttled'] == 0 and stats['rate_scale'] == 1.0 and stats['on_hold'] == 0
+
+
+def test_bytes_budget():
+    """Downloaded bytes past the burst wait at the byte rate"""
+    throttle = HostThrottle('imap.example.com', bytes_rate=1000, bytes_burst=1000)
+    assert throttle.delay('bytes', 1000) == 0.0
+    assert 0.45 < throttle.delay('bytes', 500) < 0.55
+    assert throttle.get_stats()['bytes'] == 1500
+
+
+def test_throttle_response_detection():
+    assert is_throttle_response([b'[THROTTLED] Please slow down'])
+    assert is_throttle_response("Too many simultaneous connections. (Failure)")
+    assert not is_throttle_response("[NONEXISTENT] Unknown Mailbox")
+    assert is_throttle_response("[THROTTLED] Account exceeded command or bandwidth limits")
+
+
+def test_login_and_quota_failures_are_not_throttling():
+    assert not is_throttle_response("[AUTHENTICATIONFAILED] Too many login failures")
+    assert not is_throttle_response("Too many login failures, try again later [AUTHENTICATIONFAILED]")
+    assert not is_throttle_response("Too many login failures")
+    assert not is_throttle_response([b'[OVERQUOTA] Quota exceeded'])
+    assert not is_throttle_response("Mailbox size exceeded")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing IMAP Throttle")
+    print("=" * 50)
+    test_bucket_paces_after_burst()
+    test_throttled_command_is_retried()
+    test_throttled_login_raises_after_retries()
+    test_bye_holds_host_and_slows_rates()
+    test_plain_abort_does_not_hold_host()
+    test_bytes_budget()
+    test_throttle_response_detection()
+    test_login_and_quota_failures_are_not_throttling()
+    print("✅ All IMAP throttle tests passed")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test the staged ingest pipeline (fetch -> parse -> classify -> persist -> notify)
+"""
+
+import threading
+import time
+from ingest_pipeline import IngestPipeline
+
+
+def build_pipeline(classify_delay=0.0, queue_size=10, classify_workers=4):
+    stored = []
+    notified = []
+    lock = threading.Lock()
+
+    def parse(item):
+        item['fields'] = {'subject': item.pop('raw').decode()}
+        return item
+
+    def classify(item):
+        time.sleep(classify_delay)
+        if item['fields']['subject'] == 'boom':
+            raise ValueError("classifier exploded")
+        item['classification'] = {'category': 'Interested'}
+        return item
+
+    def persist(item):
+        with lock:
+            stored.append(item['uid'])
+        return item
+
+    def notify(item):
+        notified.append(item['uid'])
+
+    pipeline = IngestPipeline(parse, classify, persist, notify,
+                              parse_workers=1, classify_workers=classify_workers,
+                              persist_workers=1, notify_workers=1, queue_size=queue_size)
+    pipeline.start()
+    return pipeline, stored, notified
+
+
+def test_all_stages_run():
+    """Every submitted message is parsed, classified, stored and notified"""
+    pipeline, stored, notified = build_pipeline()
+    for uid in range(20):
+        pipeline.submit({'uid': uid, 'raw': f'subject {uid}'.encode()})
+
+    assert pipeline.wait_until_persisted(timeout=5)
+    pipeline.stop()
+
+    print(f"Stored {len(stored)} emails, notified {len(notified)}")
+    assert sorted(stored) == list(range(20))
+    assert sorted(notified) == list(range(20))
+
+
+def test_fetch_not_capped_by_classifier():
+    """Fetch can queue a full buffer of messages while the classifier is slow"""
+    pipeline, stored, _ = build_pipeline(classify_delay=0.2, queue_size=50, classify_workers=2)
+
+    started = time.monotonic()
+    for uid in range(40):
+        pipeline.submit({'uid': uid, 'raw': b'hello'})
+    submit_time = time.monotonic() - started
+
+    assert pipeline.wait_until_persisted(timeout=10)
+    metrics = pipeline.get_metrics()
+    pipeline.stop()
+
+    print(f"Submitted 40 messages in {submit_time:.3f}s; classify busy {metrics['classify']['busy_seconds']:.1f}s")
+    assert submit_time < 0.2
+    assert len(stored) == 40
+
+
+def test_backpressure_is_measured():
+    """A full downstream queue blocks producers and shows up in the metrics"""
+    pipeline, _, _ = build_pipeline(classify_delay=0.05, queue_size=2, classify_workers=1)
+    for uid in range(10):
+        pipeline.submit({'uid': uid, 'raw': b'hello'})
+    pipeline.wait_until_persisted(timeout=10)
+    metrics = pipeline.get_metrics()
+    pipeline.stop()
+
+    print(f"Blocked on classify queue for {metrics['classify']['blocked_put_seconds']:.2f}s")
+    assert metrics['classify']['blocked_put_seconds'] > 0
+    assert metrics['classify']['max_depth'] <= 2
+
+
+def test_stage_errors_are_counted():
+    """A failing message is dropped and counted without stopping the stage"""
+    pipeline, stored, _ = build_pipeline()
+    pipeline.submit({'uid': 1, 'raw': b'boom'})
+    pipeline.submit({'uid': 2, 'raw': b'fine'})
+    pipeline.wait_until_persisted(timeout=5)
+    metrics = pipeline.get_metrics()
+    pipeline.stop()
+
+    assert stored == [2]
+    assert metrics['classify']['errors'] == 1
+
+
+def test_on_done_for_stored_and_dropped():
+    """on_done fires once per item, whether it was stored or dropped on the way"""
+    pipeline, stored, _ = build_pipeline()
+    done = []
+    for uid, raw in [(1, b'fine'), (2, b'boom'), (3, b'also fine')]:
+        pipeline.submit({'uid': uid, 'raw': raw, 'on_done': lambda uid=uid: done.append(uid)})
+    pipeline.wait_until_persisted(timeout=5)
+    pipeline.stop()
+
+    assert sorted(done) == [1, 2, 3]
+    assert sorted(stored) == [1, 3]
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Ingest Pipeline")
+    print("=" * 50)
+    test_all_stages_run()
+    test_fetch_not_capped_by_classifier()
+    test_backpressure_is_measured()
+    test_stage_errors_are_counted()
+    test_on_done_for_stored_and_dropped()
+    print("✅ All ingest pipeline tests passed")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test the embedding kNN classifier tier
+"""
+
+import os
+import re
+import zlib
+import random
+import tempfile
+import pytest
+from python_models import Database
+from knn_classifier import KNNClassifier, EmbeddingIndex
+
+np = pytest.importorskip("numpy")
+
+CATEGORIES = ["Interested", "Meeting Booked", "Not Interested", "Spam", "Out of Office"]
+PHRASES = {
+    'Interested': ['could you share pricing', 'we would love a walkthrough', 'send over the deck'],
+    'Not Interested': ['we decided to go another way', 'please take us off your list', 'no budget this year'],
+    'Spam': ['exclusive crypto giveaway', 'cheap watches shipped today', 'earn cash from home fast'],
+}
+FILLER = ['thanks', 'regards', 'team', 'quarter', 'project', 'update', 'hello', 'best']
+
+
+class ToyEncoder:
+    """Hashed bag of words, normalized like sentence-transformers' normalize_embeddings=True"""
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=False):
+        self.batches.append(len(texts))
+        vectors = np.zeros((len(texts), 256), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r'[a-z]+', text.lower()):
+                vectors[row, zlib.crc32(word.encode()) % 256] += 1.0
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+
+def make_email(category, rng, uid, method='AI'):
+    words = rng.sample(FILLER, 2)
+    return {
+        'user_id': 1, 'account_id': 1, 'uid': str(uid), 'subject': f'Re: {rng.choice(FILLER)}',
+        'sender': f'person{uid}@lead.com', 'content': f"{words[0]} {rng.choice(PHRASES[category])} {words[1]}",
+        'category': category, 'confidence_score': 0.85, 'date_received': '', 'classification_method': method
+    }
+
+
+def store_emails(db, count, start=0, seed=1, method='AI'):
+    rng = random.Random(seed)
+    for uid in range(start, start + count):
+        db.store_email(make_email(rng.choice(list(PHRASES)), rng, uid, method))
+
+
+def knn(db, **kwargs):
+    options = {'encoder': ToyEncoder(), 'index_path': os.path.join(tempfile.mkdtemp(), 'knn.npz'), 'min_examples': 20, 'k': 5}
+    return KNNClassifier(CATEGORIES, store=db, **{**options, **kwargs})
+
+
+def database():
+    return Database(os.path.join(tempfile.mkdtemp(), 'knn.db'))
+
+
+def test_index_grows_and_finds_neighbours():
+    index = EmbeddingIndex()
+    vectors = np.eye(4, dtype=np.float32)
+    for row in range(4):
+        index.add(vectors[row:row + 1], [row])
+    index.add(np.tile(vectors[2], (2000, 1)), [2] * 2000)  # Past the initial capacity
+    assert index.size == 2004
+    similarities, labels = index.neighbours(vectors[[0, 3]], 3)
+    assert similarities[0, 0] == pytest.approx(1.0) and labels[0, 0] == 0
+    assert labels[1, 0] == 3 and similarities[1, 1] == pytest.approx(0.0)
+
+
+def test_untrained_index_defers_to_ai():
+    classifier = knn(database())
+    assert classifier.predict_many([{'subject': 'Hi', 'content': 'could you share pricing'}]) == [None]
+
+
+def test_trains_incrementally_and_votes():
+    db = database()
+    store_emails(db, 60)
+    classifier = knn(db)
+    assert classifier.train() == 60
+    assert classifier.train() == 0  # Nothing new
+    store_emails(db, 30, start=60, seed=2)
+    store_emails(db, 10, start=90, seed=3, method='KNN')  # Its own answers are never indexed
+    assert classifier.train() == 30
+
+    results = classifier.predict_many([
+        {'subject': 'Re: update', 'content': 'thanks, could you share pricing'},
+        {'subject': 'Re: hello', 'content': 'exclusive crypto giveaway'},
+    ])
+    assert [r['category'] for r in results] == ['Interested', 'Spam']
+    assert all(r['margin'] >= classifier.min_margin for r in results)
+    assert classifier.encoder.batches[-1] == 2  # Both embedded in one call
+    stats = classifier.get_stats()
+    print(f"kNN: {classifier.describe()}")
+    assert stats['index_size'] == 90 and stats['decided'] == 2
+
+
+def test_close_vote_goes_to_ai():
+    classifier = knn(database(), min_margin=0.3, k=20)
+    interested = {'subject': 'Re: hello', 'content': 'could you share pricing'}
+    not_interested = {'subject': 'Re: hello', 'content': 'no budget this year'}
+    classifier.add([interested] * 10 + [not_interested] * 10, ['Interested'] * 10 + ['Not Interested'] * 10)
+    ambiguous = {'subject': 'Re: hello', 'content': 'could you share pricing, no budget this year'}
+    assert classifier.predict_many([ambiguous]) == [None]
+    assert classifier.get_stats()['low_margin'] == 1
+
+
+def test_saved_index_loaded_elsewhere():
+    db = database()
+    store_emails(db, 40)
+    first = knn(db)
+    first.train()
+    other = knn(db, index_path=first.index_path)
+    assert other.load()
+    assert other.get_stats()['index_size'] == 40 and other.trained_through == 40
+    assert other.train() == 0
+    renamed = KNNClassifier(CATEGORIES[::-1], store=db, encoder=ToyEncoder(), index_path=first.index_path)
+    assert not renamed.load()  # Built for other categories
+
+
+def test_classifier_skips_ai_on_clear_vote():
+    from email_classifier import EmailClassifier
+    db = database()
+    store_emails(db, 60)
+    classifier = EmailClassifier()
+    classifier.cache = None
+    classifier.local_model = None
+    classifier.ai_enabled = True
+    asked = []
+    classifier.batcher.classify_many = lambda batch: asked.extend(batch) or [('Interested', 0.85)] * len(batch)
+    classifier.knn = knn(db)
+    classifier.knn.train()
+    results = classifier.batch_classify([
+        {'subject': 'Re: hello', 'sender': 'z@lead.com', 'content': 'earn cash from home fast'},
+        {'subject': 'Quick question', 'sender': 'z@lead.com', 'content': 'when is the next release planned'},
+    ], notify=False)
+    assert [r['classification_method'] for r in results] == ['KNN', 'AI']
+    assert results[0]['category'] == 'Spam' and len(asked) == 1
+
+
+if __name__ == "__main__":
+    print("🧪 Testing kNN Classifier")
+    print("=" * 50)
+    test_index_grows_and_finds_neighbours()
+    test_untrained_index_defers_to_ai()
+    test_trains_incrementally_and_votes()
+    test_close_vote_goes_to_ai()
+    test_saved_index_loaded_elsewhere()
+    test_classifier_skips_ai_on_clear_vote()
+    print("✅ All kNN classifier tests passed")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test batched, concurrent AI classification and the shared rate budget
+"""
+
+import re
+import json
+import asyncio
+import openai
+import pytest
+from types import SimpleNamespace
+from llm_batch import BatchClassifier, LLMBudget, build_batch_prompt, parse_batch_response
+
+CATEGORIES = ["Interested", "Meeting Booked", "Not Interested", "Spam", "Out of Office"]
+
+
+def reply(results, tokens=100):
+    """A ChatCompletion response carrying ``results`` as its JSON content"""
+    response = {'usage': {'total_tokens': tokens}}
+    message = SimpleNamespace(content=json.dumps({'results': results}))
+    return type('Response', (dict,), {'choices': [SimpleNamespace(message=message)]})(response)
+
+
+class FakeAPI:
+    """Stands in for openai.ChatCompletion.acreate; answers Spam for 'offer' mail, else Interested"""
+
+    def __init__(self, skip_once=None, rate_limit_first=False):
+        self.calls = []
+        self.in_flight = self.max_in_flight = 0
+        self.skip_once = skip_once
+        self.rate_limit_first = rate_limit_first
+
+    async def acreate(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.rate_limit_first and len(self.calls) == 1:
+            error = RuntimeError("Rate limit reached for requests")
+            error.http_status = 429
+            raise error
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.05)
+        self.in_flight -= 1
+        prompt = kwargs['messages'][1]['content']
+        results = []
+        for number, subject in re.findall(r'\[(\d+)\]\nSubject: (.*)', prompt):
+            if subject == self.skip_once:
+                self.skip_once = None
+                continue
+            results.append({'id': int(number), 'category': 'Spam' if 'offer' in subject else 'Interested'})
+        return reply(results)
+
+
+def run(batcher, api, emails):
+    original = getattr(openai.ChatCompletion, 'acreate', None)
+    openai.ChatCompletion.acreate = api.acreate
+    try:
+        return batcher.classify_many(emails)
+    finally:
+        openai.ChatCompletion.acreate = original
+
+
+def emails(count):
+    return [{'subject': f'offer {i}' if i % 3 == 0 else f'question {i}', 'sender': 'a@b.com', 'content': 'Hello'} for i in range(count)]
+
+
+def test_prompt_and_parse():
+    prompt = build_batch_prompt(emails(2), CATEGORIES)
+    assert '[1]\nSubject: offer 0' in prompt and '[2]\nSubject: question 1' in prompt
+    text = '```json\n{"results": [{"id": 2, "category": "Spam"}, {"id": 1, "category": "Maybe"}, {"id": 9, "category": "Spam"}]}\n```'
+    assert parse_batch_response(text, 2, CATEGORIES) == [None, 'Spam']
+    assert parse_batch_response('not json', 2, CATEGORIES) == [None, None]
+
+
+def test_prompt_carries_thread_history():
+    email = dict(emails(1)[0], thread_category='Interested', thread_history=[
+        {'sender': 'me@us.com', 'category': 'Sent', 'content': 'Here is  our\npricing sheet'},
+        {'sender': 'a@b.com', 'category': 'Interested', 'content': 'Thanks, looking at it'},
+    ])
+    prompt = build_batch_prompt([email], CATEGORIES)
+    assert 'Earlier messages in this conversation (oldest first):' in prompt
+    assert '- From me@us.com (Sent): Here is our pricing sheet' in prompt
+    assert '- From a@b.com (Interested): Thanks, looking at it' in prompt
+
+
+def test_batches_run_concurrently_within_limit():
+    api = FakeAPI()
+    batcher = BatchClassifier(CATEGORIES, batch_size=10, max_in_flight=2, budget=LLMBudget(rpm=1000, tpm=10_000_000))
+    results = run(batcher, api, emails(45))
+    print(f"Batch stats: {batcher.get_stats()}, requests: {len(api.calls)}, max in flight: {api.max_in_flight}")
+    assert len(api.calls) == 5
+    assert api.max_in_flight == 2
+    assert results[0] == ('Spam', 0.85) and results[1] == ('Interested', 0.85)
+    assert all(category == ('Spam' if i % 3 == 0 else 'Interested') for i, (category, _) in enumerate(results))
+
+
+def test_left_out_email_retried_once():
+    api = FakeAPI(skip_once='question 4')
+    batcher = BatchClassifier(CATEGORIES, batch_size=10, max_in_flight=4, budget=LLMBudget(rpm=1000, tpm=10_000_000))
+    results = run(batcher, api, emails(10))
+    assert len(api.calls) == 2 and '[1]\nSubject: question 4' in api.calls[1]['messages'][1]['content']
+    assert results[4] == ('Interested', 0.85)
+    assert batcher.get_stats()['retried'] == 1 and batcher.get_stats()['failed'] == 0
+
+
+def test_rate_limit_backs_off_and_retries():
+    api = FakeAPI(rate_limit_first=True)
+    budget = LLMBudget(rpm=1000, tpm=10_000_000)
+    batcher = BatchClassifier(CATEGORIES, batch_size=10, budget=budget)
+    results = run(batcher, api, emails(3))
+    assert len(api.calls) == 2 and all(category != 'Uncategorized' for category, _ in results)
+    assert budget.get_stats()['rate_limited'] == 1
+
+
+def test_budget_limits_requests_and_tokens():
+    budget = LLMBudget(rpm=2, tpm=1000)
+    assert budget.delay(100) == 0 and budget.delay(100) == 0
+    assert 29 < budget.delay(100) <= 30  # Third request in a minute waits for the RPM bucket
+    tokens = LLMBudget(rpm=100, tpm=600)
+    assert tokens.delay(600) == 0
+    assert 9 < tokens.delay(100) <= 10  # 100 tokens at 10 tokens/second
+    tokens.settle(600, 300)  # Used less than estimated: the difference is given back
+    assert tokens.delay(100) <= 10
+
+
+def test_classifier_batches_only_undecided_emails():
+    from email_classifier import EmailClassifier
+    classifier = EmailClassifier()
+    classifier.ai_enabled = True
+    classifier.cache = None
+    asked = []
+    classifier.batcher.classify_many = lambda batch: asked.extend(batch) or [('Interested', 0.85)] * len(batch)
+    batch = [
+        {'subject': 'Out of office', 'sender': 'a@b.com', 'content': 'Back Monday'},
+        {'subject': 'Pricing', 'sender': 'a@b.com', 'content': 'What does it cost?'},
+        {'subject': 'Re: Pricing', 'sender': 'a@b.com', 'content': 'What does it cost?'},
+    ]
+    results = classifier.batch_classify(batch, notify=False)
+    assert len(asked) == 1  # Rules decided the first; the other two are one question
+    assert [r['classification_method'] for r in results] == ['Rule', 'AI', 'AI']
+    assert [r['category'] for r in results] == ['Out of Office', 'Interested', 'Interested']
+
+
+def test_ai_disabled_results_not_labelled_ai():
+    from email_classifier import EmailClassifier
+    classifier = EmailClassifier()
+    classifier.ai_enabled = False
+    classifier.knn = None
+    classifier.local_model = None
+    classifier.batcher.classify_many = lambda batch: pytest.fail("AI is disabled")
+    batch = [
+        {'subject': 'Out of office', 'sender': 'a@b.com', 'content': 'Back Monday'},
+        {'subject': 'Pricing', 'sender': 'a@b.com', 'content': 'What does it cost?'},
+    ]
+    results = classifier.batch_classify(batch, notify=False)
+    assert [r['classification_method'] for r in results] == ['Rule', 'Unclassified']
+    assert results[1]['category'] == 'Uncategorized'
+    assert classifier.classify_email(dict(batch[1]), notify=False)['classification_method'] == 'Unclassified'
+
+
+if __name__ == "__main__":
+    print("🧪 Testing LLM Batching")
+    print("=" * 50)
+    test_prompt_and_parse()
+    test_prompt_carries_thread_history()
+    test_batches_run_concurrently_within_limit()
+    test_left_out_email_retried_once()
+    test_rate_limit_backs_off_and_retries()
+    test_budget_limits_requests_and_tokens()
+    test_classifier_batches_only_undecided_emails()
+    test_ai_disabled_results_not_labelled_ai()
+    print("✅ All LLM batching tests passed")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test the local naive Bayes classifier tier
+"""
+
+import os
+import random
+import tempfile
+from python_models import Database
+from local_classifier import LocalClassifier, NaiveBayesModel, features
+
+CATEGORIES = ["Interested", "Meeting Booked", "Not Interested", "Spam", "Out of Office"]
+PHRASES = {
+    'Interested': ['could you share pricing', 'we would love a walkthrough', 'what does onboarding look like', 'send over the deck'],
+    'Not Interested': ['we decided to go another way', 'please take us off your list', 'no budget this year', 'we are all set'],
+    'Spam': ['exclusive crypto giveaway', 'cheap watches shipped today', 'earn cash from home fast', 'hot singles nearby'],
+}
+FILLER = ['thanks', 'regards', 'team', 'quarter', 'project', 'update', 'hello', 'best']
+
+
+def make_email(category, rng, uid, method='AI'):
+    words = rng.sample(FILLER, 3)
+    return {
+        'user_id': 1, 'account_id': 1, 'uid': str(uid), 'subject': f'Re: {rng.choice(FILLER)}',
+        'sender': f'person{uid}@{"promo-deals.biz" if category == "Spam" else "lead.com"}',
+        'content': f"{words[0]} {rng.choice(PHRASES[category])} {words[1]} {words[2]}",
+        'category': category, 'confidence_score': 0.85, 'date_received': '', 'classification_method': method
+    }
+
+
+def store_emails(db, count, start=0, seed=1, method='AI'):
+    rng = random.Random(seed)
+    for uid in range(start, start + count):
+        db.store_email(make_email(rng.choice(list(PHRASES)), rng, uid, method))
+
+
+def local(db, **kwargs):
+    return LocalClassifier(CATEGORIES, store=db, **{'threshold': 0.9, 'min_examples': 50, **kwargs})
+
+
+def database():
+    return Database(os.path.join(tempfile.mkdtemp(), 'local.db'))
+
+
+def test_features_are_stable():
+    one = features('Pricing', 'Could you share pricing?', 'Ana <ana@Lead.com>')
+    assert one == features('pricing', 'could you share pricing', 'ana@lead.com')
+    assert one != features('pricing', 'could you share pricing', 'ana@other.com')
+
+
+def test_naive_bayes_round_trip():
+    model = NaiveBayesModel()
+    model.learn(features('', 'send the deck', ''), 'Interested')
+    model.learn(features('', 'no budget', ''), 'Not Interested')
+    restored = NaiveBayesModel.from_json(model.to_json())
+    sample = features('', 'please send the deck', '')
+    assert restored.predict(sample) == model.predict(sample)
+    assert model.predict(sample)[0] == 'Interested'
+
+
+def test_untrained_model_defers_to_ai():
+    classifier = local(database())
+    assert classifier.predict({'subject': 'Hi', 'content': 'could you share pricing', 'sender': 'a@lead.com'}) is None
+
+
+def test_trains_incrementally_and_predicts():
+    db = database()
+    store_emails(db, 200)
+    classifier = local(db)
+    assert classifier.train() == 200
+    assert classifier.train() == 0  # Nothing new
+    store_emails(db, 100, start=200, seed=2)
+    store_emails(db, 20, start=300, seed=3, method='Local')  # Its own answers are never learned
+    assert classifier.train() == 100
+
+    result = classifier.predict({'subject': 'Re: update', 'content': 'thanks, could you share pricing', 'sender': 'x@lead.com'})
+    assert result['category'] == 'Interested' and result['confidence_score'] >= 0.9
+    stats = classifier.get_stats()
+    print(f"Local model: {classifier.describe()}")
+    assert stats['examples'] == 300 and stats['confident'] == 1
+    # Test-then-train on the second batch: confident answers agreed with the AI labels
+    assert stats['evaluated'] == 250 and stats['accuracy'] >= 0.95 and stats['coverage'] > 0.5
+
+
+def test_saved_model_loaded_elsewhere():
+    db = database()
+    store_emails(db, 100)
+    local(db).train()
+    other = local(db)
+    assert other.load()
+    assert other.get_stats()['examples'] == 100 and other.trained_through == 100
+    assert other.train() == 0
+
+
+def test_classifier_skips_ai_when_confident():
+    from email_classifier import EmailClassifier
+    db = database()
+    store_emails(db, 200)
+    classifier = EmailClassifier()
+    classifier.cache = None
+    classifier.ai_enabled = True
+    calls = []
+    classifier.ai_classify = lambda data: calls.append(data) or ('Interested', 0.85)
+    classifier.local_model = local(db)
+    classifier.local_model.train()
+    result = classifier.classify_email({'subject': 'Re: hello', 'sender': 'z@promo-deals.biz', 'content': 'earn cash from home fast'}, notify=False)
+    assert result['classification_method'] == 'Local' and result['category'] == 'Spam'
+    assert not calls
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Local Classifier")
+    print("=" * 50)
+    test_features_are_stable()
+    test_naive_bayes_round_trip()
+    test_untrained_model_defers_to_ai()
+    test_trains_incrementally_and_predicts()
+    test_saved_model_loaded_elsewhere()
+    test_classifier_skips_ai_when_confident()
+    print("✅ All local classifier tests passed")
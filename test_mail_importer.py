@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Test the offline mbox / Maildir importer
+"""
+
+import os
+import tempfile
+from mime_parser import ParsePool
+from python_models import Database
+from mail_importer import MailImporter, find_sources, iter_mbox, iter_maildir
+
+ACCOUNT = {'id': 1, 'user_id': 1}
+
+
+def message(subject, body, sender='lead@example.com'):
+    return f"From: {sender}\nSubject: {subject}\nDate: Mon, 1 Jan 2024 10:00:00 +0000\n\n{body}\n".encode()
+
+
+def write_mbox(path, messages):
+    with open(path, 'wb') as f:
+        for raw in messages:
+            f.write(b'From lead@example.com Mon Jan  1 10:00:00 2024\n' + raw + b'\n')
+
+
+def scratch_db():
+    return Database(os.path.join(tempfile.mkdtemp(), 'import.db'))
+
+
+def stored(db, mailbox=None):
+    conn = db.get_connection()
+    rows = conn.execute('SELECT mailbox, uid, subject, category, flags FROM emails ORDER BY id').fetchall()
+    conn.close()
+    return [row for row in rows if mailbox is None or row[0] == mailbox]
+
+
+def importer(db, **kwargs):
+    return MailImporter(db, ACCOUNT, parse_pool=ParsePool(workers=0), **kwargs)
+
+
+def test_mbox_streaming_and_resume_offsets():
+    path = os.path.join(tempfile.mkdtemp(), 'Inbox.mbox')
+    write_mbox(path, [
+        message('One', 'hello'),
+        message('Two', 'quoting a line\n>From here on it was escaped'),
+        message('Three', 'bye')
+    ])
+    messages = list(iter_mbox(path))
+    assert len(messages) == 3
+    assert b'\nFrom here on' in messages[1][1]
+    assert messages[0][0] == '0'
+    # Resuming from a message's end position yields exactly the rest
+    assert [m[0] for m in iter_mbox(path, messages[0][3])] == [m[0] for m in messages[1:]]
+    assert messages[-1][3] == os.path.getsize(path)
+
+
+def test_maildir_sources_and_flags():
+    root = tempfile.mkdtemp()
+    for folder in ('', '.Sent'):
+        for subdir in ('cur', 'new', 'tmp'):
+            os.makedirs(os.path.join(root, folder, subdir))
+    with open(os.path.join(root, 'cur', '1700000001.M1.host:2,FS'), 'wb') as f:
+        f.write(message('Read', 'hello'))
+    with open(os.path.join(root, 'new', '1700000002.M2.host'), 'wb') as f:
+        f.write(message('Unread', 'hello'))
+    with open(os.path.join(root, '.Sent', 'cur', '1700000003.M3.host:2,S'), 'wb') as f:
+        f.write(message('Re: Read', 'thanks', sender='me@example.com'))
+
+    assert [(kind, folder) for kind, _, folder in find_sources(root)] == [('maildir', 'INBOX'), ('maildir', 'Sent')]
+    messages = list(iter_maildir(root))
+    assert [(uid, flags) for uid, _, flags, _ in messages] == [
+        ('1700000001.M1.host', '\\Flagged \\Seen'), ('1700000002.M2.host', '')
+    ]
+    assert [m[0] for m in iter_maildir(root, after='1700000001.M1.host')] == ['1700000002.M2.host']
+
+    db = scratch_db()
+    imp = importer(db)
+    imp.import_path(root)
+    imp.close()
+    rows = stored(db)
+    assert [(r[0], r[2], r[4]) for r in rows] == [
+        ('Import/INBOX', 'Read', '\\Flagged \\Seen'),
+        ('Import/INBOX', 'Unread', ''),
+        ('Import/Sent', 'Re: Read', '\\Seen')
+    ]
+    assert stored(db, 'Import/Sent')[0][3] == 'Sent'
+
+
+def test_local_classification_only():
+    """Rules decide what they can; no LLM call is made for the rest"""
+    from email_classifier import classifier
+    calls = []
+    original = classifier.ai_classify
+    classifier.ai_classify = lambda *args: calls.append(args) or ('Interested', 0.9)
+    try:
+        path = os.path.join(tempfile.mkdtemp(), 'archive.mbox')
+        write_mbox(path, [message('Automatic reply', 'I am out of office'), message('Hi', 'plain note')])
+        db = scratch_db()
+        imp = importer(db)
+        stats = imp.import_path(path)
+        imp.close()
+    finally:
+        classifier.ai_classify = original
+    assert calls == []
+    assert [row[3] for row in stored(db)] == ['Out of Office', 'Uncategorized']
+    assert stats['categories'] == {'Out of Office': 1, 'Uncategorized': 1}
+
+
+def test_interrupted_import_resumes():
+    """A failed batch stops the import; the next run continues after the last stored batch"""
+    path = os.path.join(tempfile.mkdtemp(), 'archive.mbox')
+    write_mbox(path, [message(f'Message {n}', 'body') for n in range(7)])
+    db = scratch_db()
+    real_store = db.store_emails_bulk
+    calls = []
+
+    def failing_store(rows):
+        calls.append(len(rows))
+        return None if len(calls) == 2 else real_store(rows)
+
+    db.store_emails_bulk = failing_store
+    imp = importer(db, batch_size=3)
+    try:
+        imp.import_path(path)
+        assert False, "import should have stopped"
+    except RuntimeError:
+        pass
+    imp.close()
+    checkpoint = db.get_import_checkpoint(1, os.path.abspath(path))
+    assert checkpoint['imported'] == 3 and checkpoint['status'] == 'running'
+
+    db.store_emails_bulk = real_store
+    imp = importer(db, batch_size=3)
+    stats = imp.import_path(path)
+    imp.close()
+    print(f"Resumed import stats: {dict(stats, categories=dict(stats['categories']))}")
+    assert stats['messages'] == 4 and stats['duplicates'] == 0
+    assert [row[2] for row in stored(db)] == [f'Message {n}' for n in range(7)]
+    assert db.get_import_checkpoint(1, os.path.abspath(path))['status'] == 'complete'
+
+    # Finished sources are skipped; a forced restart stores nothing twice
+    imp = importer(db)
+    assert imp.import_path(path)['messages'] == 0
+    assert imp.import_path(path, restart=True)['duplicates'] == 7
+    imp.close()
+    assert len(stored(db)) == 7
+
+
+def test_archive_threads_built():
+    path = os.path.join(tempfile.mkdtemp(), 'archive.mbox')
+    write_mbox(path, [
+        b'Message-ID: <a@x.com>\n' + message('Pricing', 'send the proposal'),
+        b'Message-ID: <b@x.com>\nIn-Reply-To: <a@x.com>\n' + message('Re: Pricing', 'here it is', sender='me@example.com'),
+        b'Message-ID: <c@x.com>\n' + message('Other', 'unrelated')
+    ])
+    db = scratch_db()
+    imp = importer(db, batch_size=2)
+    imp.import_path(path)
+    imp.close()
+    conn = db.get_connection()
+    thread_ids = [row[0] for row in conn.execute('SELECT thread_id FROM emails ORDER BY id')]
+    conn.close()
+    assert thread_ids[0] == thread_ids[1] != thread_ids[2]
+    assert db.get_thread(thread_ids[0])['message_count'] == 2
+
+
+def test_bulk_insert_ignores_existing_rows():
+    db = scratch_db()
+    row = {'user_id': 1, 'account_id': 1, 'uid': '5', 'subject': 's', 'sender': 'a', 'content': 'c',
+           'category': 'Spam', 'confidence_score': 0.95, 'date_received': '', 'mailbox': 'INBOX'}
+    assert db.store_emails_bulk([row, dict(row, uid='6')]) == 2
+    assert db.store_emails_bulk([dict(row, category='Interested'), dict(row, uid='7')]) == 1
+    assert [r[3] for r in stored(db)] == ['Spam', 'Spam', 'Spam']
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Mail Importer")
+    print("=" * 50)
+    test_mbox_streaming_and_resume_offsets()
+    test_maildir_sources_and_flags()
+    test_local_classification_only()
+    test_interrupted_import_resumes()
+    test_archive_threads_built()
+    test_bulk_insert_ignores_existing_rows()
+    print("✅ All mail importer tests passed")
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Test incremental flag and deletion sync (CONDSTORE/QRESYNC and fallback)
+"""
+
+import os
+import re
+import tempfile
+from python_models import Database
+from backfill import select_mailbox
+from mailbox_state import MailboxStateSync, enable_qresync, uid_set, parse_uid_set
+
+
+class FakeServer:
+    """Just enough of imaplib.IMAP4 for MailboxStateSync, with per-message MODSEQs"""
+
+    def __init__(self, uids, extensions=(), uidvalidity=7):
+        self.extensions = set(extensions)
+        self.uidvalidity = uidvalidity
+        self.modseq = 1
+        self.messages = {uid: ['', 1] for uid in uids}  # uid -> [flags, modseq]
+        self.expunged = {}  # uid -> modseq of the expunge
+        self.uidnext = max(uids) + 1
+        self.commands = []
+        self.flags_returned = 0
+        self._responses = {}
+
+    # Server-side changes
+    def set_flags(self, uid, flags):
+        self.modseq += 1
+        self.messages[uid] = [flags, self.modseq]
+
+    def expunge(self, uid):
+        self.modseq += 1
+        del self.messages[uid]
+        self.expunged[uid] = self.modseq
+
+    def deliver(self, uid, flags=''):
+        self.modseq += 1
+        self.messages[uid] = [flags, self.modseq]
+        self.uidnext = uid + 1
+
+    # imaplib.IMAP4
+    def capability(self):
+        return 'OK', [' '.join(['IMAP4rev1', 'ENABLE', *sorted(self.extensions)]).encode()]
+
+    def enable(self, capability):
+        return 'OK', [capability.encode()]
+
+    def select(self, mailbox='INBOX'):
+        self._responses = {
+            'UIDVALIDITY': [str(self.uidvalidity).encode()],
+            'UIDNEXT': [str(self.uidnext).encode()]
+        }
+        if self.extensions:
+            self._responses['HIGHESTMODSEQ'] = [str(self.modseq).encode()]
+        return 'OK', [str(len(self.messages)).encode()]
+
+    def response(self, name):
+        return name, self._responses.pop(name, [None])
+
+    def uid(self, command, *args):
+        self.commands.append((command, args))
+        if command == 'search':
+            criteria = args[1]
+            if criteria == 'ALL':
+                uids = sorted(self.messages)
+            else:
+                low = int(re.match(r'UID (\d+):\*', criteria).group(1))
+                uids = [uid for uid in sorted(self.messages) if uid >= low] or sorted(self.messages)[-1:]
+            return 'OK', [' '.join(map(str, uids)).encode()]
+
+        requested = parse_uid_set(args[0].replace('*', str(self.uidnext)))
+        items = args[1]
+        since = re.search(r'CHANGEDSINCE (\d+)', items)
+        data = []
+        for uid in sorted(requested & set(self.messages)):
+            flags, modseq = self.messages[uid]
+            if since and modseq <= int(since.group(1)):
+                continue
+            extra = f' MODSEQ ({modseq})' if since or 'MODSEQ' in items else ''
+            data.append(f'1 (UID {uid} FLAGS ({flags}){extra})'.encode())
+        self.flags_returned += len(data)
+        if since and 'VANISHED' in items:
+            gone = [uid for uid, modseq in self.expunged.items() if modseq > int(since.group(1))]
+            if gone:
+                self._responses['VANISHED'] = [f'(EARLIER) {uid_set(gone)}'.encode()]
+        return 'OK', data
+
+
+class MemoryStore:
+    def __init__(self, uids):
+        self.emails = {uid: None for uid in uids}  # uid -> stored flags
+        self.states = {}
+
+    def get_mailbox_state(self, account_id, mailbox='INBOX'):
+        state = self.states.get((account_id, mailbox))
+        return dict(state) if state else None
+
+    def save_mailbox_state(self, state):
+        self.states[(state['account_id'], state['mailbox'])] = dict(state)
+
+    def get_account_uids(self, account_id, mailbox='INBOX'):
+        return set(self.emails)
+
+    def update_email_flags(self, account_id, flags_by_uid, mailbox='INBOX'):
+        updated = {uid for uid in flags_by_uid if uid in self.emails}
+        for uid in updated:
+            self.emails[uid] = flags_by_uid[uid]
+        return updated
+
+    def delete_emails_by_uid(self, account_id, uids, mailbox='INBOX'):
+        for uid in uids:
+            self.emails.pop(uid, None)
+
+
+def sync(server, store, pending=()):
+    return MailboxStateSync(store, 1).run(server, select_mailbox(server), pending)
+
+
+def test_qresync_fetches_only_changes():
+    """With QRESYNC one FETCH returns just the changed flags and the expunged UIDs"""
+    uids = range(1, 1001)
+    server, store = FakeServer(uids, extensions={'CONDSTORE', 'QRESYNC'}), MemoryStore(uids)
+    assert enable_qresync(server) == {'CONDSTORE', 'QRESYNC'}
+    assert sync(server, store)['mode'] == 'scan'  # First sync: baseline of every stored message
+
+    server.set_flags(10, '\\Seen')
+    server.set_flags(20, '\\Seen \\Flagged')
+    server.expunge(30)
+    server.flags_returned = 0
+    server.commands = []
+    result = sync(server, store)
+    print(f"QRESYNC result: {result}, flags returned: {server.flags_returned}")
+    assert result == {'mode': 'qresync', 'flags_updated': 2, 'deleted': 1}
+    assert server.flags_returned == 2
+    assert store.emails[10] == '\\Seen' and store.emails[20] == '\\Seen \\Flagged'
+    assert 30 not in store.emails
+    assert not any(args[1] == 'ALL' for command, args in server.commands if command == 'search')
+
+    server.commands = []
+    assert sync(server, store)['flags_updated'] == 0
+    assert server.commands == []  # HIGHESTMODSEQ unchanged: no round trips at all
+
+
+def test_condstore_diffs_uids_only_when_counts_disagree():
+    uids = range(1, 101)
+    server, store = FakeServer(uids, extensions={'CONDSTORE'}), MemoryStore(uids)
+    enable_qresync(server)
+    sync(server, store)
+
+    # New mail only: EXISTS grew by exactly the arrivals, so no SEARCH ALL
+    server.deliver(101)
+    server.commands = []
+    sync(server, store)
+    assert not any(args[1] == 'ALL' for command, args in server.commands if command == 'search')
+
+    server.expunge(5)
+    result = sync(server, store)
+    assert result['mode'] == 'condstore' and result['deleted'] == 1
+    assert 5 not in store.emails
+
+
+def test_fallback_without_condstore():
+    """Plain servers: newest stored messages' flags are rescanned, deletions found by UID diff"""
+    uids = range(1, 51)
+    server, store = FakeServer(uids), MemoryStore(uids)
+    enable_qresync(server)
+    sync(server, store)
+
+    server.set_flags(50, '\\Seen')
+    server.set_flags(1, '\\Seen')  # Older than the scan window
+    server.expunge(25)
+    result = MailboxStateSync(store, 1, flag_scan_limit=10).run(server, select_mailbox(server))
+    assert result['mode'] == 'scan' and result['deleted'] == 1
+    assert store.emails[50] == '\\Seen'
+    assert store.emails[1] == ''
+
+
+def test_changes_for_unstored_messages_retried():
+    """A flag change for a message still in the ingest pipeline is fetched again next sync"""
+    uids = range(1, 11)
+    server, store = FakeServer(uids, extensions={'CONDSTORE', 'QRESYNC'}), MemoryStore(uids)
+    enable_qresync(server)
+    sync(server, store)
+
+    server.deliver(11, flags='\\Seen')  # Read on the phone before we stored it
+    sync(server, store, pending={11})
+    assert 11 not in store.emails
+
+    store.emails[11] = None  # Pipeline stored it
+    assert sync(server, store)['flags_updated'] == 1
+    assert store.emails[11] == '\\Seen'
+
+
+def test_uidvalidity_change_resets_state():
+    uids = range(1, 11)
+    server, store = FakeServer(uids, extensions={'CONDSTORE', 'QRESYNC'}), MemoryStore(uids)
+    enable_qresync(server)
+    sync(server, store)
+    server.uidvalidity = 8
+    assert sync(server, store)['mode'] == 'scan'
+
+
+def test_uid_set_round_trip():
+    assert uid_set([7, 1, 2, 3, 9, 10]) == '1:3,7,9:10'
+    assert parse_uid_set('1:3,7,9:10') == {1, 2, 3, 7, 9, 10}
+
+
+def test_restoring_an_email_keeps_its_flags_and_id():
+    """Re-storing a synced email updates its classification only"""
+    db = Database(os.path.join(tempfile.mkdtemp(), 'state.db'))
+    email = {'user_id': 1, 'account_id': 1, 'uid': '5', 'subject': 'Hi', 'sender': 'a@lead.com', 'content': 'Hello',
+             'category': 'Uncategorized', 'confidence_score': 0.0, 'date_received': '2024-01-01T10:00:00', 'mailbox': 'INBOX'}
+    email_id = db.store_email(email)
+    db.store_email(dict(email, mailbox='Archive'))
+    db.update_email_flags(1, {5: '\\Seen'})
+    assert db.store_email(dict(email, category='Interested', confidence_score=0.9)) == email_id
+    conn = db.get_connection()
+    rows = conn.execute("SELECT mailbox, flags, category FROM emails ORDER BY id").fetchall()
+    conn.close()
+    assert [tuple(row) for row in rows] == [('INBOX', '\\Seen', 'Interested'), ('Archive', None, 'Uncategorized')]
+    assert db.get_email_by_uid(1, 1, '5', mailbox='Archive')
+    assert not db.get_email_by_uid(1, 1, '5', mailbox='Sent')
+
+
+def test_dashboard_reads_only_inbox_by_default():
+    """Sent copies stay out of the dashboard unless every folder is asked for"""
+    db = Database(os.path.join(tempfile.mkdtemp(), 'state.db'))
+    conn = db.get_connection()
+    conn.execute("INSERT INTO email_accounts (user_id, email, imap_host, imap_port, password, provider) "
+                 "VALUES (1, 'me@corp.com', 'imap.corp.com', 993, 'x', 'custom')")
+    conn.commit()
+    conn.close()
+    email = {'user_id': 1, 'account_id': 1, 'uid': '5', 'subject': 'Hi', 'sender': 'a@lead.com', 'content': 'Hello',
+             'category': 'Interested', 'confidence_score': 0.9, 'date_received': '2024-01-01T10:00:00', 'mailbox': 'INBOX'}
+    db.store_email(email)
+    db.store_email(dict(email, uid='6', subject='Re: Hi', mailbox='Sent'))
+    assert [e['subject'] for e in db.get_user_emails(1)] == ['Hi']
+    assert [e['subject'] for e in db.get_emails_by_category(1, 'Interested')] == ['Hi']
+    assert len(db.get_user_emails(1, mailbox=None)) == 2
+    assert len(db.get_emails_by_category(1, 'Interested', mailbox='Sent')) == 1
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Mailbox State Sync")
+    print("=" * 50)
+    test_qresync_fetches_only_changes()
+    test_condstore_diffs_uids_only_when_counts_disagree()
+    test_fallback_without_condstore()
+    test_changes_for_unstored_messages_retried()
+    test_uidvalidity_change_resets_state()
+    test_uid_set_round_trip()
+    test_restoring_an_email_keeps_its_flags_and_id()
+    test_dashboard_reads_only_inbox_by_default()
+    print("✅ All mailbox state tests passed")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test cross-account message deduplication
+"""
+
+import os
+import tempfile
+import threading
+import time
+from python_models import Database
+from message_dedup import MessageDedupIndex, normalize_message_id
+
+MESSAGE = ('<CAF1234@Mail.Example.COM>', 'Ana <ana@lead.com>', 'Re: pricing', 'Sounds good, send the proposal.')
+
+
+def index(**kwargs):
+    return MessageDedupIndex(Database(os.path.join(tempfile.mkdtemp(), 'dedup.db')), **kwargs)
+
+
+def classify_once(dedup, message, calls, delay=0.0, scope=None):
+    """What a classify stage does with the index"""
+    claim = dedup.claim(*message, scope=scope)
+    if claim['classification']:
+        return claim['classification']
+    try:
+        time.sleep(delay)
+        calls.append(message)
+        result = {'category': 'Interested', 'confidence_score': 0.9}
+        dedup.complete(claim, result)
+        return result
+    finally:
+        dedup.release(claim)
+
+
+def test_normalize_message_id():
+    assert normalize_message_id(' <Abc.1@Mail.Example.COM> (comment)') == 'Abc.1@mail.example.com'
+    assert normalize_message_id('abc@example.com') == 'abc@example.com'
+    assert normalize_message_id(None) is None
+    assert normalize_message_id('') is None
+
+
+def test_later_copies_reuse_classification():
+    dedup = index()
+    calls = []
+    first = classify_once(dedup, MESSAGE, calls)
+    # Another account's copy: different display name and whitespace, same message
+    copy = ('<CAF1234@mail.example.com>', 'ana@lead.com', 'Re:  pricing', 'Sounds good,\nsend the proposal.')
+    second = classify_once(dedup, copy, calls)
+    assert len(calls) == 1
+    assert second['category'] == first['category'] and second['classification_method'] == 'Duplicate'
+    assert dedup.store.get_message_dedup('mid:CAF1234@mail.example.com')['copies'] == 2
+    assert dedup.get_stats()['reused'] == 1
+
+
+def test_forged_message_id_not_reused():
+    """Same Message-ID but different content is classified on its own"""
+    dedup = index()
+    calls = []
+    classify_once(dedup, MESSAGE, calls)
+    forged = (MESSAGE[0], 'attacker@evil.com', 'Re: pricing', 'Something else entirely')
+    assert classify_once(dedup, forged, calls).get('classification_method') != 'Duplicate'
+    assert len(calls) == 2
+    assert dedup.get_stats()['hash_mismatches'] == 1
+
+
+def test_body_hash_without_message_id():
+    dedup = index()
+    calls = []
+    message = (None, 'ana@lead.com', 'Hello', 'Body')
+    classify_once(dedup, message, calls)
+    classify_once(dedup, message, calls)
+    assert len(calls) == 1
+
+
+def test_concurrent_copies_classified_once():
+    """Copies arriving while the first is being classified wait for its result"""
+    dedup = index()
+    calls = []
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(classify_once(dedup, MESSAGE, calls, delay=0.2)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"Dedup stats: {dedup.get_stats()}")
+    assert len(calls) == 1
+    assert len(results) == 4 and all(r['category'] == 'Interested' for r in results)
+    assert dedup.get_stats()['waited'] == 3
+
+
+def test_failed_classification_releases_waiters():
+    dedup = index(wait_timeout=5)
+    owner = dedup.claim(*MESSAGE)
+    waiter = []
+    thread = threading.Thread(target=lambda: waiter.append(dedup.claim(*MESSAGE)))
+    thread.start()
+    time.sleep(0.1)
+    dedup.release(owner)  # Classification failed: nothing recorded
+    thread.join(timeout=2)
+    assert waiter and waiter[0]['classification'] is None
+    assert dedup.claim(*MESSAGE)['owner']  # The next copy classifies it
+
+
+def test_classification_not_reused_across_tenants():
+    """Each tenant has its own rules: only the same tenant's copies reuse a classification"""
+    dedup = index()
+    calls = []
+    classify_once(dedup, MESSAGE, calls, scope='user:1')
+    assert classify_once(dedup, MESSAGE, calls, scope='user:1')['classification_method'] == 'Duplicate'
+    assert classify_once(dedup, MESSAGE, calls, scope='user:2').get('classification_method') != 'Duplicate'
+    assert len(calls) == 2
+    assert dedup.claim(*MESSAGE, scope='user:1')['key'] == dedup.claim(*MESSAGE, scope='user:2')['key']
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Message Dedup")
+    print("=" * 50)
+    test_normalize_message_id()
+    test_later_copies_reuse_classification()
+    test_forged_message_id_not_reused()
+    test_body_hash_without_message_id()
+    test_concurrent_copies_classified_once()
+    test_failed_classification_releases_waiters()
+    test_classification_not_reused_across_tenants()
+    print("✅ All message dedup tests passed")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test MIME parsing in the process pool (inline, pickled and shared memory paths)
+"""
+
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from mime_parser import ParsePool, parse_message
+
+
+def make_raw(i, body_size=100):
+    body = f"Hello {i} " + "x" * body_size
+    return (
+        f"From: Sender {i} <sender{i}@example.com>\r\n"
+        f"Subject: Message {i}\r\n"
+        f"Message-ID: <msg{i}@example.com>\r\n"
+        f"Date: Mon, 1 Jan 2024 10:00:00 +0000\r\n"
+        f"Content-Type: text/plain; charset=utf-8\r\n"
+        f"\r\n{body}\r\n"
+    ).encode()
+
+
+def test_parse_message_record():
+    """A single message parses into headers, text and sizes"""
+    raw = make_raw(1)
+    record = parse_message(memoryview(raw))
+
+    assert record['subject'] == 'Message 1'
+    assert record['sender'] == 'Sender 1 <sender1@example.com>'
+    assert record['message_id'] == '<msg1@example.com>'
+    assert record['text'].startswith('Hello 1 ')
+    assert record['raw_size'] == len(raw)
+
+
+def test_html_fallback_is_stripped():
+    """HTML-only messages fall back to tag-stripped text"""
+    raw = (
+        b"Subject: Html\r\nContent-Type: text/html; charset=utf-8\r\n\r\n"
+        b"<p>Interested in <b>a demo</b></p>\r\n"
+    )
+    record = parse_message(raw)
+    assert record['text'].strip() == 'Interested in a demo'
+
+
+def test_batch_order_and_failures():
+    """Pooled batches keep input order across the pickled and shared memory paths"""
+    small = [make_raw(i) for i in range(20)]
+    large = [make_raw(i, body_size=50_000) for i in range(20, 40)]
+
+    pool = ParsePool(workers=2, batch_size=8, shm_threshold=64 * 1024)
+    try:
+        records = pool.parse_batch(small + large)
+    finally:
+        pool.shutdown()
+
+    subjects = [record['subject'] for record in records]
+    print(f"Parsed {len(records)} messages in pool")
+    assert subjects == [f'Message {i}' for i in range(40)]
+    assert records[-1]['raw_size'] > 50_000
+
+
+def test_inline_when_no_workers():
+    """workers=0 parses in-process"""
+    pool = ParsePool(workers=0)
+    records = pool.parse_batch([make_raw(1), make_raw(2)])
+    assert [record['subject'] for record in records] == ['Message 1', 'Message 2']
+
+
+class BrokenExecutor:
+    """Fails the first job as if its worker died; the rest never run"""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        future = Future()
+        if not self.submitted:
+            future.set_running_or_notify_cancel()
+            future.set_exception(BrokenProcessPool("worker died"))
+        self.submitted += 1
+        return future
+
+
+def test_shared_memory_released_when_a_worker_fails():
+    pool = ParsePool(workers=0, batch_size=4, shm_threshold=1024)
+    pool.executor = BrokenExecutor()
+    names = []
+    pack = pool._pack
+
+    def tracking_pack(chunk, total):
+        shm, offsets = pack(chunk, total)
+        names.append(shm.name)
+        return shm, offsets
+
+    pool._pack = tracking_pack
+    try:
+        pool.parse_batch([make_raw(i, body_size=2000) for i in range(12)])
+        assert False, "BrokenProcessPool should propagate"
+    except BrokenProcessPool:
+        pass
+    assert len(names) == 3
+    for name in names:
+        try:
+            shared_memory.SharedMemory(name=name).close()
+            assert False, f"{name} was not unlinked"
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == "__main__":
+    print("🧪 Testing MIME Parse Pool")
+    print("=" * 50)
+    test_parse_message_record()
+    test_html_fallback_is_stripped()
+    test_batch_order_and_failures()
+    test_inline_when_no_workers()
+    test_shared_memory_released_when_a_worker_fails()
+    print("✅ All MIME parser tests passed")
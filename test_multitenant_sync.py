@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test the multi-tenant sync service's folder sync and ingest stages
+"""
+
+import os
+import time
+import tempfile
+import threading
+import multitenant_email_sync
+from python_models import Database
+
+
+def make_service():
+    """A service on a temporary database (its worker threads are real)"""
+    path = os.path.join(tempfile.mkdtemp(), 'sync.db')
+    original = multitenant_email_sync.Database
+    multitenant_email_sync.Database = lambda: Database(path)
+    try:
+        return multitenant_email_sync.MultiTenantEmailSyncService()
+    finally:
+        multitenant_email_sync.Database = original
+
+
+class HeldPipeline:
+    """Stands in for the ingest pipeline: keeps submitted items until store() is called"""
+
+    def __init__(self):
+        self.items = []
+
+    def submit(self, item):
+        self.items.append(item)
+
+    def store(self, uid):
+        item = next(item for item in self.items if item['uid'] == str(uid))
+        self.items.remove(item)
+        item['on_done']()
+
+    def stop(self):
+        pass
+
+
+class FakeBackfill:
+    """No history to backfill; only new mail is fetched"""
+
+    def __init__(self, *args, **kwargs):
+        self.high_uid = 0
+        self.batch_size = 50
+        self.remaining_uids = 0
+        self.selected = {}
+
+    def prepare(self, mail):
+        return []
+
+    def run(self, mail, **kwargs):
+        return 0
+
+
+class NoStateSync:
+    def __init__(self, *args):
+        pass
+
+    def run(self, mail, selected, pending):
+        return {'flags_updated': 0, 'deleted': 0}
+
+
+def patched_folder_sync(server_uids, fetched):
+    """Swap the IMAP helpers sync_folder uses; returns a restore function"""
+    names = ('BackfillJob', 'MailboxStateSync', 'search_uids', 'fetch_messages')
+    originals = {name: getattr(multitenant_email_sync, name) for name in names}
+    multitenant_email_sync.BackfillJob = FakeBackfill
+    multitenant_email_sync.MailboxStateSync = NoStateSync
+    multitenant_email_sync.search_uids = lambda mail, criteria: list(server_uids)
+    multitenant_email_sync.fetch_messages = lambda mail, uids: fetched.extend(uids) or [(uid, b'raw') for uid in uids]
+
+    def restore():
+        for name, value in originals.items():
+            setattr(multitenant_email_sync, name, value)
+    return restore
+
+
+ACCOUNT = {'id': 1, 'user_id': 1, 'email': 'ana@example.com', 'imap_host': 'imap.example.com'}
+INBOX = {'name': 'INBOX', 'role': 'inbox'}
+
+
+def test_uids_still_in_pipeline_not_fetched_again():
+    service = make_service()
+    service.pipeline.stop()
+    service.pipeline = HeldPipeline()
+    fetched = []
+    restore = patched_folder_sync([5, 6, 7], fetched)
+    try:
+        assert service.sync_folder(ACCOUNT, None, INBOX, deadline=None)['queued'] == 3
+        # Next cycle before the pipeline stored anything: nothing is fetched twice
+        assert service.sync_folder(ACCOUNT, None, INBOX, deadline=None)['queued'] == 0
+        assert fetched == [5, 6, 7]
+        service.pipeline.store(6)
+        assert service.in_flight({1}) == {((1, 'INBOX'), 5), ((1, 'INBOX'), 7)}
+    finally:
+        restore()
+        service.stop()
+
+
+class OneBatchBackfill(FakeBackfill):
+    """Submits one batch of history and records which UIDs it was told are stored"""
+
+    def __init__(self, store, account_key, submit, **kwargs):
+        super().__init__()
+        self.submit = submit
+        OneBatchBackfill.done = []
+
+    def run(self, mail, **kwargs):
+        for uid in (3, 4):
+            self.submit(uid, b'raw', lambda uid=uid: OneBatchBackfill.done.append(uid))
+        return 2
+
+
+def test_failed_store_does_not_complete_backfill_item():
+    service = make_service()
+    service.pipeline.stop()
+    service.pipeline = HeldPipeline()
+    restore = patched_folder_sync([], [])
+    multitenant_email_sync.BackfillJob = OneBatchBackfill
+    fields = {'subject': 'Hi', 'sender': 'a@lead.com', 'content': 'Hello', 'date_received': '2024-01-01T10:00:00'}
+    try:
+        service.sync_folder(ACCOUNT, None, INBOX, deadline=None)
+        stored, failed = service.pipeline.items
+        for item in (stored, failed):
+            item.update(fields=fields, classification={'category': 'Interested', 'confidence_score': 0.9})
+        service.persist_item(stored)
+        service.db.store_email = lambda email_data: None
+        try:
+            service.persist_item(failed)
+            assert False, "a failed store must raise so the pipeline counts an error"
+        except RuntimeError:
+            pass
+        for item in (stored, failed):
+            item['on_done']()  # The pipeline finishes the item either way
+        assert OneBatchBackfill.done == [3]
+        assert not service.in_flight({1})
+    finally:
+        restore()
+        service.stop()
+
+
+def test_wait_only_for_the_given_items():
+    service = make_service()
+    service.pipeline.stop()
+    service.pipeline = HeldPipeline()
+    restore = patched_folder_sync([5, 6], [])
+    try:
+        service.sync_folder(ACCOUNT, None, INBOX, deadline=None)
+        other = dict(ACCOUNT, id=2, user_id=2)
+        multitenant_email_sync.search_uids = lambda mail, criteria: [1, 2, 3]
+        service.sync_folder(other, None, INBOX, deadline=None)  # Another tenant's backlog
+
+        mine = service.in_flight({1})
+        assert not service.wait_until_stored(mine, timeout=0.1)
+        threading.Timer(0.1, lambda: (service.pipeline.store(5), service.pipeline.store(6))).start()
+        started = time.monotonic()
+        assert service.wait_until_stored(mine, timeout=5)
+        assert time.monotonic() - started < 2
+        assert len(service.in_flight({2})) == 3  # Not waited for
+    finally:
+        restore()
+        service.stop()
+
+
+def test_on_demand_sync_only_claimed_accounts():
+    service = make_service()
+    accounts = [dict(ACCOUNT, id=n, is_active=True) for n in (1, 2, 3)]
+    service.db.get_user_email_accounts = lambda user_id: accounts
+    requested = []
+    service.request_sync = lambda accounts, **kwargs: requested.extend(accounts) or service.sync_jobs.submit([])
+    try:
+        result = service.sync_user_accounts(1, wait=False, claim=lambda ids: {1, 3})
+        assert [a['id'] for a in requested] == [1, 3]  # Account 2 is leased by another worker
+        assert result['accounts_skipped'] == 1
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Multi-Tenant Sync")
+    print("=" * 50)
+    test_uids_still_in_pipeline_not_fetched_again()
+    test_failed_store_does_not_complete_backfill_item()
+    test_wait_only_for_the_given_items()
+    test_on_demand_sync_only_claimed_accounts()
+    print("✅ All multi-tenant sync tests passed")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test bounded parallel account sync (global/per-host limits and timeouts)
+"""
+
+import threading
+import time
+from collections import defaultdict
+from sync_pool import AccountSyncPool, AccountSyncTimeout
+
+
+def make_accounts(hosts):
+    return [
+        {'id': i, 'email': f'user{i}@{host}', 'imap_host': host}
+        for i, host in enumerate(hosts)
+    ]
+
+
+def test_per_host_limit():
+    """No host ever sees more concurrent syncs than max_per_host"""
+    accounts = make_accounts(['imap.gmail.com'] * 6 + ['outlook.office365.com'] * 6)
+    lock = threading.Lock()
+    current = defaultdict(int)
+    peak = defaultdict(int)
+
+    def fake_sync(account):
+        with lock:
+            current[account['imap_host']] += 1
+            peak[account['imap_host']] = max(peak[account['imap_host']], current[account['imap_host']])
+        time.sleep(0.05)
+        with lock:
+            current[account['imap_host']] -= 1
+        return 1
+
+    pool = AccountSyncPool(max_workers=8, max_per_host=2, account_timeout=10)
+    results = pool.run(accounts, fake_sync)
+    pool.shutdown()
+
+    print(f"Peak concurrency per host: {dict(peak)}")
+    assert all(value <= 2 for value in peak.values())
+    assert sum(results.values()) == len(accounts)
+
+
+def test_cycle_takes_slowest_not_sum():
+    """A cycle of parallel accounts finishes in roughly the slowest account's time"""
+    accounts = make_accounts([f'imap{i}.example.com' for i in range(8)])
+
+    def fake_sync(account):
+        time.sleep(0.2)
+        return 0
+
+    pool = AccountSyncPool(max_workers=8, max_per_host=1, account_timeout=10)
+    started = time.monotonic()
+    pool.run(accounts, fake_sync)
+    elapsed = time.monotonic() - started
+    pool.shutdown()
+
+    print(f"8 accounts x 0.2s synced in {elapsed:.2f}s")
+    assert elapsed < 0.2 * 8 / 2
+
+
+def test_hung_account_times_out():
+    """A hung account is reported as timed out and its abort handler is called"""
+    accounts = make_accounts(['imap.slow.com', 'imap.fast.com'])
+    release = threading.Event()
+    aborted = []
+
+    def fake_sync(account):
+        if account['imap_host'] == 'imap.slow.com':
+            release.wait(10)
+        return 3
+
+    def on_timeout(account):
+        aborted.append(account['id'])
+        release.set()
+
+    pool = AccountSyncPool(max_workers=2, max_per_host=1, account_timeout=1)
+    results = pool.run(accounts, fake_sync, on_timeout=on_timeout)
+    pool.shutdown()
+
+    print(f"Results: {results}")
+    assert isinstance(results[0], AccountSyncTimeout)
+    assert results[1] == 3
+    assert aborted == [0]
+
+
+def test_timed_out_sync_still_tracked():
+    """The timeout result carries the abandoned sync, which keeps running until it returns"""
+    release = threading.Event()
+
+    def fake_sync(account):
+        release.wait(10)
+        return 1
+
+    pool = AccountSyncPool(max_workers=1, max_per_host=1, account_timeout=0.5)
+    result = pool.run(make_accounts(['imap.slow.com']), fake_sync)[0]
+    assert isinstance(result, AccountSyncTimeout) and not result.future.done()
+    release.set()
+    assert result.future.result(5) == 1
+    pool.shutdown()
+
+
+def test_abandoned_sync_keeps_host_slot():
+    """A timed-out sync still counts against its host until it returns"""
+    accounts = make_accounts(['imap.slow.com', 'imap.slow.com'])
+    release = threading.Event()
+    lock = threading.Lock()
+    active = []
+    peak = [0]
+
+    def fake_sync(account):
+        with lock:
+            active.append(account['id'])
+            peak[0] = max(peak[0], len(active))
+        if account['id'] == 0:
+            release.wait(10)
+        with lock:
+            active.remove(account['id'])
+        return 1
+
+    pool = AccountSyncPool(max_workers=2, max_per_host=1, account_timeout=0.5)
+    threading.Timer(1.0, release.set).start()
+    results = pool.run(accounts, fake_sync)
+    pool.shutdown()
+
+    assert isinstance(results[0], AccountSyncTimeout)
+    assert results[1] == 1
+    assert peak[0] == 1
+
+
+def test_host_held_by_hung_sync_gives_up():
+    """Accounts queued behind a sync that never returns are reported, not waited on forever"""
+    release = threading.Event()
+    pool = AccountSyncPool(max_workers=2, max_per_host=1, account_timeout=0.5)
+    results = pool.run(make_accounts(['imap.slow.com', 'imap.slow.com']), lambda account: release.wait(10))
+    release.set()
+    pool.shutdown()
+
+    assert isinstance(results[0], AccountSyncTimeout) and results[0].future
+    assert isinstance(results[1], AccountSyncTimeout) and results[1].future is None
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Parallel Account Sync")
+    print("=" * 50)
+    test_per_host_limit()
+    test_cycle_takes_slowest_not_sum()
+    test_hung_account_times_out()
+    test_timed_out_sync_still_tracked()
+    test_abandoned_sync_keeps_host_slot()
+    test_host_held_by_hung_sync_gives_up()
+    print("✅ All parallel sync tests passed")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test quoted-reply and signature stripping
+"""
+
+from reply_cleaner import clean_reply
+
+
+def test_gmail_attribution_and_quotes():
+    """'On ... wrote:' and everything after it is removed"""
+    text = (
+        "Yes, I'm interested. Can we talk Thursday?\n"
+        "\n"
+        "On Mon, 1 Jan 2024 at 10:00, Jane Doe <jane@example.com>\n"
+        "wrote:\n"
+        "> Hi John,\n"
+        "> Would you like a demo of our product?\n"
+    )
+    result = clean_reply(text)
+    print(result)
+    assert result['text'] == "Yes, I'm interested. Can we talk Thursday?"
+    assert result['quoted_chars'] > 0
+    assert result['removed_chars'] == len(text) - len(result['text'])
+
+
+def test_outlook_separator():
+    """Outlook header blocks start the quoted history"""
+    text = (
+        "Please remove me from this list.\n"
+        "\n"
+        "________________________________\n"
+        "From: Sales Team <sales@example.com>\n"
+        "Sent: Monday, January 1, 2024 10:00 AM\n"
+        "Subject: Special offer\n"
+        "\n"
+        "We think you'd be interested in our offer...\n"
+    )
+    assert clean_reply(text)['text'] == "Please remove me from this list."
+
+
+def test_signature_and_mobile_footer():
+    """Sign-offs with a short signature block and client footers are removed"""
+    text = (
+        "Sounds good, send over the contract.\n"
+        "\n"
+        "Best regards,\n"
+        "John Smith\n"
+        "VP Engineering | Acme Corp\n"
+        "+1 555 0100\n"
+        "\n"
+        "Sent from my iPhone\n"
+    )
+    result = clean_reply(text)
+    assert result['text'] == "Sounds good, send over the contract."
+    assert result['signature_chars'] > 0
+
+
+def test_dash_dash_signature():
+    """The RFC 3676 '-- ' delimiter starts the signature"""
+    text = "I'm out until Monday.\n-- \nJane\nhttps://example.com\n"
+    assert clean_reply(text)['text'] == "I'm out until Monday."
+
+
+def test_nothing_left_keeps_original():
+    """A message that is only quoted text is kept as-is"""
+    text = "> quoted only\n> more quoted"
+    result = clean_reply(text)
+    assert result['text'] == text
+    assert result['removed_chars'] == 0
+
+
+def test_bare_sign_off_kept():
+    """A reply that is only a sign-off keeps it"""
+    assert clean_reply("Thanks!\nJane")['text'] == "Thanks!\nJane"
+
+
+def test_bare_double_dash_is_not_a_signature():
+    """Only the exact '-- ' delimiter counts; a bare '--' is body text"""
+    text = "Agenda:\n--\nPricing review\nRollout dates"
+    assert clean_reply(text)['text'] == text
+
+
+def test_sentence_starting_with_wishes_is_kept():
+    """Body lines that merely start with 'Wishes'/'Regards' are not sign-offs"""
+    text = "Thanks for the intro.\nWishes to meet next week\nRegards to your team, see you Monday"
+    assert clean_reply(text)['text'] == text
+    signed = "Thanks for the intro.\n\nKind regards, Jane\nAcme Corp"
+    assert clean_reply(signed)['text'] == "Thanks for the intro."
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Reply Cleaner")
+    print("=" * 50)
+    test_gmail_attribution_and_quotes()
+    test_outlook_separator()
+    test_signature_and_mobile_footer()
+    test_dash_dash_signature()
+    test_nothing_left_keeps_original()
+    test_bare_sign_off_kept()
+    test_bare_double_dash_is_not_a_signature()
+    test_sentence_starting_with_wishes_is_kept()
+    print("✅ All reply cleaner tests passed")
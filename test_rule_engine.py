@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test declarative, hot-reloaded classification rules
+"""
+
+import os
+import json
+import tempfile
+import threading
+from rule_engine import RuleEngine, apply_overrides
+from rule_matcher import RuleMatcher, DEFAULT_RULES
+
+MEETING_REPLY = ('Re: demo', 'Sounds good, can we set up a meeting?', 'ana@lead.com')
+
+
+def write_rules(path, document):
+    with open(path, 'w') as f:
+        json.dump(document, f)
+    # Make the change visible even on filesystems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def engine_with(document):
+    path = os.path.join(tempfile.mkdtemp(), 'rules.json')
+    write_rules(path, document)
+    return RuleEngine(path, reload_interval=0), path
+
+
+def test_defaults_without_file():
+    engine = RuleEngine('', reload_interval=0)
+    assert engine.matcher().classify(*MEETING_REPLY) == 'Meeting Booked'
+    assert engine.matcher(42) is engine.matcher()
+
+
+def test_overrides_priorities_and_new_rules():
+    engine, _ = engine_with({
+        'rules': [
+            {'id': 'meeting', 'priority': 45},
+            {'id': 'pricing', 'category': 'Interested', 'fields': ['subject'], 'patterns': ['Pricing'], 'priority': 5, 'weight': 0.8},
+        ],
+        'disabled': ['spam_sender'],
+    })
+    matcher = engine.matcher()
+    assert matcher.classify(*MEETING_REPLY) == 'Interested'  # Interested (40) now ahead of Meeting (45)
+    assert matcher.classify('Weekly digest', 'Hello', 'news@no-reply.example.com') is None
+    rule = matcher.decide('Pricing question', 'Out of office until Monday', 'ana@lead.com')
+    assert rule['id'] == 'pricing' and rule['weight'] == 0.8
+    assert engine.get_stats()['version'] == 1
+
+
+def test_tenant_overrides():
+    engine, _ = engine_with({'tenants': {'42': {'rules': [{'id': 'interested', 'priority': 25}]}}})
+    assert engine.matcher(42).classify(*MEETING_REPLY) == 'Interested'
+    assert engine.matcher('7').classify(*MEETING_REPLY) == 'Meeting Booked'
+    assert engine.matcher().classify(*MEETING_REPLY) == 'Meeting Booked'
+
+
+def test_equal_priority_higher_weight_wins():
+    rules = apply_overrides(DEFAULT_RULES, {'rules': [
+        {'id': 'meeting', 'priority': 40, 'weight': 0.9},
+        {'id': 'interested', 'weight': 0.7},
+    ]})
+    assert RuleMatcher(rules, use_automaton=False).classify(*MEETING_REPLY) == 'Meeting Booked'
+
+
+def test_hot_reload_and_invalid_file_kept_out():
+    engine, path = engine_with({})
+    first = engine.matcher()
+    write_rules(path, {'rules': [{'id': 'interested', 'priority': 25}]})
+    assert engine.check()
+    assert engine.matcher() is not first
+    assert engine.matcher().classify(*MEETING_REPLY) == 'Interested'
+    assert not engine.check()  # Unchanged file
+
+    for broken in ('{not json', json.dumps({'rules': [{'id': 'x', 'category': 'Spam', 'fields': ['body']}]})):
+        with open(path, 'w') as f:
+            f.write(broken)
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2_000_000_000))
+        assert not engine.check()
+        assert engine.matcher().classify(*MEETING_REPLY) == 'Interested'
+    print(f"Rule engine stats: {engine.get_stats()}")
+    assert engine.get_stats()['reload_errors'] == 2
+
+
+def test_classification_never_sees_partial_rules():
+    """Classifying threads only ever see a complete old or new rule set"""
+    engine, path = engine_with({})
+    seen, errors = set(), []
+    stop = threading.Event()
+
+    def classify():
+        while not stop.is_set():
+            try:
+                seen.add(engine.matcher(42).classify(*MEETING_REPLY))
+            except Exception as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=classify) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for version in range(20):
+        priority = 25 if version % 2 else 45
+        write_rules(path, {'tenants': {'42': {'rules': [{'id': 'interested', 'priority': priority}]}}})
+        engine.reload()
+    stop.set()
+    for worker in workers:
+        worker.join()
+    assert not errors
+    assert seen and seen <= {'Interested', 'Meeting Booked'}
+
+
+def test_classifier_uses_tenant_rules_and_weight():
+    from email_classifier import EmailClassifier
+    classifier = EmailClassifier()
+    classifier.rule_engine, _ = engine_with({'tenants': {'42': {'rules': [{'id': 'interested', 'priority': 25, 'weight': 0.9}]}}})
+    subject, content, sender = MEETING_REPLY
+    email = {'subject': subject, 'content': content, 'sender': sender}
+    assert classifier.classify_email(email, notify=False)['category'] == 'Meeting Booked'
+    result = classifier.classify_email({**email, 'user_id': 42}, notify=False)
+    assert result['category'] == 'Interested' and result['confidence_score'] == 0.9
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Rule Engine")
+    print("=" * 50)
+    test_defaults_without_file()
+    test_overrides_priorities_and_new_rules()
+    test_tenant_overrides()
+    test_equal_priority_higher_weight_wins()
+    test_hot_reload_and_invalid_file_kept_out()
+    test_classification_never_sees_partial_rules()
+    test_classifier_uses_tenant_rules_and_weight()
+    print("✅ All rule engine tests passed")
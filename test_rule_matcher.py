@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test the compiled keyword rule matcher
+"""
+
+from rule_matcher import RuleMatcher, AHOCORASICK_AVAILABLE
+
+CASES = [
+    (('Automatic reply: Pricing', 'I am on vacation, please unsubscribe me', 'ana@lead.com'), 'Out of Office'),
+    (('Hello', 'Click here to claim now', 'ana@lead.com'), 'Spam'),
+    (('Weekly digest', 'Meeting notes inside', 'news@no-reply.example.com'), 'Spam'),
+    (('Re: call', 'Zoom link for our meeting', 'ana@lead.com'), 'Meeting Booked'),
+    (('Re: Pricing', 'Sounds good, send the proposal.', 'ana@lead.com'), 'Interested'),
+    (('Re: Pricing', 'Not a good fit for us right now.', 'ana@lead.com'), 'Not Interested'),
+    # 'interested' matches inside 'not interested' and Interested is checked first, as before
+    (('Re: Pricing', 'We are not interested.', 'ana@lead.com'), 'Interested'),
+    # Interested rules only look at the body
+    (('Interested in a demo?', 'Ok, noted.', 'ana@lead.com'), None),
+    (('', '', ''), None),
+]
+
+
+def matchers():
+    found = [RuleMatcher(use_automaton=False)]
+    if AHOCORASICK_AVAILABLE:
+        found.append(RuleMatcher(use_automaton=True))
+    return found
+
+
+def test_classify_precedence():
+    for matcher in matchers():
+        for email, category in CASES:
+            assert matcher.classify(*email) == category, (email, category)
+
+
+def test_matches_with_positions():
+    for matcher in matchers():
+        hits = matcher.matches('Re: Demo', 'We are NOT interested in a demo. Not interested!', 'ana@lead.com')
+        print(f"Hits: {hits}")
+        assert [(h['category'], h['pattern'], h['field'], h['start']) for h in hits] == [
+            ('Interested', 'interested', 'content', 11),
+            ('Interested', 'demo', 'content', 27),
+            ('Interested', 'interested', 'content', 37),
+            ('Not Interested', 'not interested', 'content', 7),
+            ('Not Interested', 'not interested', 'content', 33),
+        ]
+        assert all(h['end'] - h['start'] == len(h['pattern']) for h in hits)
+
+
+def test_sender_rule_only_checks_sender():
+    for matcher in matchers():
+        hits = matcher.matches('no-reply', 'Reply to noreply@example.com', 'bot@noreply.example.com')
+        assert [(h['category'], h['field'], h['start']) for h in hits] == [('Spam', 'sender', 4)]
+
+
+def test_custom_rules():
+    rules = [
+        {'category': 'Spam', 'fields': ('subject',), 'patterns': ['WIN']},
+        {'category': 'Interested', 'fields': ('content',), 'patterns': ['pricing', 'win']},
+    ]
+    for matcher in [RuleMatcher(rules, use_automaton=False)] + ([RuleMatcher(rules, use_automaton=True)] if AHOCORASICK_AVAILABLE else []):
+        assert matcher.classify('You win', 'pricing?', '') == 'Spam'
+        assert matcher.classify('Hi', 'a win-win', '') == 'Interested'
+        assert len(matcher.matches('Hi', 'a win-win', '')) == 2
+
+
+def test_classifier_uses_matcher():
+    from email_classifier import EmailClassifier
+    classifier = EmailClassifier()
+    email = {'subject': 'Re: Pricing', 'sender': 'ana@lead.com', 'content': 'Can you send the proposal?'}
+    assert classifier.rule_based_classify(email) == 'Interested'
+    assert {h['pattern'] for h in classifier.rule_matches(email)} == {'can you', 'proposal'}
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Rule Matcher")
+    print("=" * 50)
+    test_classify_precedence()
+    test_matches_with_positions()
+    test_sender_rule_only_checks_sender()
+    test_custom_rules()
+    test_classifier_uses_matcher()
+    print("✅ All rule matcher tests passed")
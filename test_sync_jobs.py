@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test the coalescing sync job queue
+"""
+
+import threading
+from concurrent.futures import Future
+from sync_pool import AccountSyncTimeout
+from sync_jobs import SyncJobQueue, ON_DEMAND, PERIODIC
+
+
+def account(n):
+    return {'id': n, 'email': f'user{n}@example.com'}
+
+
+class GatedSync:
+    """sync_fn that records each batch and blocks until released"""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Semaphore(0)
+        self.gate = threading.Event()
+
+    def __call__(self, accounts, on_demand):
+        self.batches.append(([a['id'] for a in accounts], on_demand))
+        self.started.release()
+        self.gate.wait(5)
+        return {a['id']: 1 for a in accounts}
+
+
+def test_duplicate_requests_coalesced():
+    """A second request for an account already queued joins it instead of syncing again"""
+    sync = GatedSync()
+    queue = SyncJobQueue(sync, workers=1)
+    first = queue.submit([account(1), account(2)], user_id=1)
+    second = queue.submit([account(2), account(3)], user_id=1)
+    queue.start()
+    sync.gate.set()
+    assert first.wait(5) == {1: 1, 2: 1}
+    assert second.wait(5) == {2: 1, 3: 1}
+    queue.stop()
+
+    synced = [account_id for ids, _ in sync.batches for account_id in ids]
+    print(f"Batches: {sync.batches}, stats: {queue.get_stats()}")
+    assert sorted(synced) == [1, 2, 3]
+    assert second.coalesced == 1 and queue.get_stats()['coalesced'] == 1
+
+
+def test_on_demand_runs_ahead_of_periodic():
+    sync = GatedSync()
+    queue = SyncJobQueue(sync, workers=1)
+    queue.submit([account(n) for n in range(1, 4)], priority=PERIODIC)
+    job = queue.submit([account(9)], user_id=9, priority=ON_DEMAND)
+    queue.start()
+    sync.gate.set()
+    job.wait(5)
+    queue.stop()
+    assert sync.batches[0] == ([9], True)
+
+
+def test_queued_periodic_sync_promoted():
+    """An on-demand request for an account waiting in the periodic queue moves it to the front"""
+    sync = GatedSync()
+    queue = SyncJobQueue(sync, workers=1, batch_size=1)
+    queue.submit([account(1), account(2), account(3)], priority=PERIODIC)
+    job = queue.submit([account(3)], user_id=3, priority=ON_DEMAND)
+    queue.start()
+    sync.gate.set()
+    job.wait(5)
+    queue.stop()
+    assert sync.batches[0] == ([3], True)
+    assert queue.get_stats()['upgraded'] == 1
+
+
+def test_worker_kept_free_for_on_demand():
+    """While periodic work holds a worker, an on-demand sync starts without waiting for it"""
+    sync = GatedSync()
+    queue = SyncJobQueue(sync, workers=2, batch_size=1)
+    queue.start()
+    queue.submit([account(1), account(2)], priority=PERIODIC)
+    assert sync.started.acquire(timeout=5)
+    assert not sync.started.acquire(timeout=0.2)  # Second periodic account waits
+
+    job = queue.submit([account(9)], user_id=9, priority=ON_DEMAND)
+    assert sync.started.acquire(timeout=5)
+    assert sync.batches[-1] == ([9], True)
+    sync.gate.set()
+    assert job.wait(5) == {9: 1}
+    queue.stop()
+
+
+def test_job_status_and_failures():
+    """Jobs are looked up by id; a failing batch reports the exception per account"""
+    def failing_sync(accounts, on_demand):
+        raise ConnectionError("server unavailable")
+
+    queue = SyncJobQueue(failing_sync, workers=1)
+    queue.start()
+    job = queue.submit([account(1)], user_id=1, priority=ON_DEMAND)
+    results = job.wait(5)
+    queue.stop()
+    assert isinstance(results[1], ConnectionError)
+    assert queue.get(job.id) is job
+    assert job.to_dict()['status'] == 'done'
+    assert job.to_dict()['priority'] == 'on_demand'
+
+
+def test_on_complete_callback():
+    done = []
+    queue = SyncJobQueue(lambda accounts, on_demand: {a['id']: 0 for a in accounts}, workers=1)
+    queue.start()
+    job = queue.submit([account(1)], on_complete=done.append)
+    job.wait(5)
+    queue.stop()
+    assert done == [job]
+
+
+def test_account_listed_twice_completes():
+    queue = SyncJobQueue(lambda accounts, on_demand: {a['id']: 2 for a in accounts}, workers=1)
+    queue.start()
+    job = queue.submit([account(1), account(1), account(2)])
+    assert job.wait(5) == {1: 2, 2: 2}
+    queue.stop()
+    assert job.to_dict()['status'] == 'done' and job.to_dict()['accounts'] == 2
+
+
+def test_timed_out_account_not_resynced_until_abandoned_sync_ends():
+    """A timed-out sync stays the account's running sync; a new request waits for it to end"""
+    abandoned = Future()
+    batches = []
+
+    def sync(accounts, on_demand):
+        batches.append([a['id'] for a in accounts])
+        if len(batches) == 1:
+            return {a['id']: AccountSyncTimeout("Timed out", abandoned) for a in accounts}
+        return {a['id']: 5 for a in accounts}
+
+    queue = SyncJobQueue(sync, workers=2)
+    queue.start()
+    first = queue.submit([account(1)])
+    assert isinstance(first.wait(5)[1], AccountSyncTimeout)
+    second = queue.submit([account(1)], priority=ON_DEMAND)
+    assert second.coalesced == 1
+    assert not second._done.wait(0.3) and batches == [[1]]
+    assert queue.get_stats()['running'] == 1
+
+    abandoned.set_result(0)  # The old worker thread finally returns
+    assert second.wait(5) == {1: 5}
+    assert batches == [[1], [1]]
+    queue.stop()
+    assert queue.get_stats()['running'] == 0
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Sync Job Queue")
+    print("=" * 50)
+    test_duplicate_requests_coalesced()
+    test_on_demand_runs_ahead_of_periodic()
+    test_queued_periodic_sync_promoted()
+    test_worker_kept_free_for_on_demand()
+    test_job_status_and_failures()
+    test_on_complete_callback()
+    test_account_listed_twice_completes()
+    test_timed_out_account_not_resynced_until_abandoned_sync_ends()
+    print("✅ All sync job queue tests passed")
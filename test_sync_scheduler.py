@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test adaptive per-account sync scheduling
+"""
+
+from sync_scheduler import AdaptiveSyncScheduler
+
+
+def make_scheduler():
+    return AdaptiveSyncScheduler(min_interval=60, max_interval=3600, default_interval=300,
+                                 active_interval=60, target_per_poll=1, smoothing=0.5)
+
+
+def account(n, user_id=None):
+    return {'id': n, 'user_id': user_id or n, 'email': f'user{n}@example.com'}
+
+
+def simulate(scheduler, arrivals_per_hour, hours=24, now=0.0, step=5.0):
+    """Drive the scheduler through a simulated day; returns polls per account"""
+    polls = {account_id: 0 for account_id in arrivals_per_hour}
+    last_poll = {account_id: now for account_id in arrivals_per_hour}
+    end = now + hours * 3600
+    while now < end:
+        for acc in scheduler.pop_due(now):
+            polls[acc['id']] += 1
+            new = round(arrivals_per_hour[acc['id']] * (now - last_poll[acc['id']]) / 3600)
+            last_poll[acc['id']] = now
+            scheduler.record(acc['id'], new_messages=new, now=now)
+        now += step
+    return polls
+
+
+def test_busy_inbox_polled_more_than_quiet_one():
+    """Polling follows the arrival rate, and total work is below a fixed 5-minute tick"""
+    # One busy inbox, one with a couple of mails an hour, eight that get nothing
+    rates = {1: 60, 2: 2, **{n: 0 for n in range(3, 11)}}
+    scheduler = make_scheduler()
+    scheduler.update_accounts([account(n) for n in rates], now=0)
+    polls = simulate(scheduler, rates)
+    fixed_tick = len(rates) * 24 * 12
+    print(f"Polls per day: {polls}, total {sum(polls.values())} (fixed 5-minute tick: {fixed_tick})")
+    assert polls[1] > 10 * polls[3]
+    assert polls[1] > polls[2] > polls[3]
+    assert polls[1] >= 24 * 60 * 0.8  # Busy inbox kept near the minimum interval
+    assert sum(polls.values()) < fixed_tick
+
+
+def test_intervals_stay_within_bounds():
+    scheduler = make_scheduler()
+    scheduler.update_accounts([account(1), account(2)], now=0)
+    scheduler.pop_due(now=100)
+    scheduler.record(1, new_messages=0, now=100)
+    scheduler.record(2, new_messages=0, now=100)
+    assert 60 <= scheduler.record(1, new_messages=10000, now=200) <= 3600
+    assert 60 <= scheduler.record(2, new_messages=0, now=200) <= 3600
+
+
+def test_errors_back_off():
+    """Consecutive failures stretch the interval; a success resets it"""
+    scheduler = make_scheduler()
+    scheduler.update_accounts([account(1)], now=0)
+    scheduler.pop_due(now=60)
+    first = scheduler.record(1, error=True, now=60)
+    second = scheduler.record(1, error=True, now=60 + first)
+    third = scheduler.record(1, error=True, now=60 + first + second)
+    assert first < second < third
+    assert scheduler.record(1, new_messages=0, now=10000) <= 300 * 1.1
+
+
+def test_active_user_pulled_forward():
+    """An account whose user opens the dashboard is polled within the active interval"""
+    scheduler = make_scheduler()
+    scheduler.update_accounts([account(1, user_id=7)], now=0)
+    scheduler.pop_due(now=60)
+    scheduler.record(1, new_messages=0, now=60)
+    scheduler.record(1, new_messages=0, now=3700)  # Quiet: next poll an hour out
+    assert scheduler.pop_due(now=3800) == []
+
+    scheduler.set_active_users({7}, now=3800)
+    assert [acc['id'] for acc in scheduler.pop_due(now=3800)] == [1]
+
+
+def test_in_flight_accounts_not_handed_out_twice():
+    scheduler = make_scheduler()
+    scheduler.update_accounts([account(1)], now=0)
+    assert len(scheduler.pop_due(now=60)) == 1
+    scheduler.set_active_users({1}, now=61)
+    assert scheduler.pop_due(now=10000) == []
+
+
+def test_removed_accounts_dropped():
+    scheduler = make_scheduler()
+    scheduler.update_accounts([account(1), account(2)], now=0)
+    scheduler.update_accounts([account(2)], now=0)
+    assert [acc['id'] for acc in scheduler.pop_due(now=60)] == [2]
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Adaptive Sync Scheduler")
+    print("=" * 50)
+    test_busy_inbox_polled_more_than_quiet_one()
+    test_intervals_stay_within_bounds()
+    test_errors_back_off()
+    test_active_user_pulled_forward()
+    test_in_flight_accounts_not_handed_out_twice()
+    test_removed_accounts_dropped()
+    print("✅ All scheduler tests passed")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test the conversation thread index
+"""
+
+import os
+import tempfile
+from python_models import Database
+from thread_index import ThreadIndex, parse_references, base_subject
+
+ACCOUNT = 1
+
+
+def index():
+    return ThreadIndex(Database(os.path.join(tempfile.mkdtemp(), 'threads.db')))
+
+
+def add(threads, message_id, in_reply_to=None, references=None, subject='Pricing', category=None, uid=None):
+    """Thread a message and store it the way the persist stage does"""
+    thread = threads.add_message(ACCOUNT, message_id, in_reply_to, references, subject)
+    if category:
+        threads.record_category(thread['id'], {'category': category, 'confidence_score': 0.9})
+    with threads.locked(ACCOUNT):
+        threads.store.store_email({
+            'user_id': 1, 'account_id': ACCOUNT, 'uid': uid or message_id or 'none', 'subject': subject,
+            'sender': 'lead@example.com', 'content': f'body of {message_id}', 'category': category or 'Uncategorized',
+            'confidence_score': 0.9, 'date_received': '', 'thread_id': threads.resolve(thread['id'])
+        })
+    return thread
+
+
+def test_parse_references():
+    assert parse_references('<b@x.com>', '<a@X.com> <b@x.com>\n <c@x.com>') == ['a@x.com', 'b@x.com', 'c@x.com']
+    assert parse_references(None, None) == []
+    assert base_subject('Re: FWD: Re[2]: Pricing') == 'Pricing'
+
+
+def test_reply_chain_in_one_thread():
+    threads = index()
+    first = add(threads, '<a@x.com>')
+    add(threads, '<b@x.com>', in_reply_to='<a@x.com>', subject='Re: Pricing')
+    third = add(threads, '<c@x.com>', in_reply_to='<b@x.com>', references='<a@x.com> <b@x.com>')
+    assert third['id'] == first['id']
+    assert third['message_count'] == 3 and third['subject'] == 'Pricing'
+    assert [e['uid'] for e in threads.store.get_thread_emails(first['id'])] == ['<a@x.com>', '<b@x.com>', '<c@x.com>']
+
+
+def test_out_of_order_arrival():
+    """A reply seen before its parent leaves a placeholder the parent later fills"""
+    threads = index()
+    reply = add(threads, '<c@x.com>', references='<a@x.com> <b@x.com>')
+    assert reply['message_count'] == 1
+    parent = add(threads, '<a@x.com>')
+    assert parent['id'] == reply['id'] and parent['message_count'] == 2
+
+
+def test_threads_merged_by_linking_message():
+    """Two threads joined by a message referencing both; stored emails follow the merge"""
+    threads = index()
+    one = add(threads, '<a@x.com>', category='Interested')
+    add(threads, '<a2@x.com>', in_reply_to='<a@x.com>')
+    two = add(threads, '<b@x.com>', category='Meeting Booked')
+    assert one['id'] != two['id']
+
+    merged = add(threads, '<c@x.com>', references='<b@x.com> <a2@x.com>')
+    print(f"Merged thread: {merged}, stats: {threads.get_stats()}")
+    assert merged['id'] == one['id']  # The larger thread absorbs the smaller
+    assert merged['message_count'] == 4
+    assert merged['category'] == 'Meeting Booked'  # Latest classified message wins
+    assert threads.resolve(two['id']) == one['id']
+    assert len(threads.store.get_thread_emails(one['id'])) == 4
+    assert threads.store.get_thread(two['id']) is None
+    assert threads.get_stats()['merges'] == 1
+
+
+def test_same_message_twice_counted_once():
+    threads = index()
+    add(threads, '<a@x.com>')
+    again = threads.add_message(ACCOUNT, '<a@x.com>', subject='Pricing')  # e.g. INBOX and All Mail
+    assert again['message_count'] == 1
+
+
+def test_category_state_and_history():
+    threads = index()
+    first = add(threads, '<a@x.com>', category='Interested')
+    threads.record_category(first['id'], {'category': 'Sent', 'confidence_score': 1.0})
+    add(threads, '<b@x.com>', in_reply_to='<a@x.com>', category='Uncategorized')
+    state = threads.store.get_thread(first['id'])
+    assert state['category'] == 'Interested' and state['confidence_score'] == 0.9
+    history = threads.history(first['id'], limit=1)
+    assert [h['content'] for h in history] == ['body of <b@x.com>']
+
+
+def test_classifier_falls_back_to_thread_category():
+    """Without an AI decision a reply keeps its conversation's category"""
+    from email_classifier import EmailClassifier
+    classifier = EmailClassifier()
+    classifier.ai_enabled = False
+    email = {'subject': 'Re: Pricing', 'sender': 'lead@example.com', 'content': 'Ok, noted.'}
+    assert classifier.classify_email(email, notify=False)['category'] == 'Uncategorized'
+    result = classifier.classify_email(
+        {**email, 'thread_category': 'Meeting Booked', 'thread_confidence': 0.95}, notify=False
+    )
+    assert result['category'] == 'Meeting Booked' and result['classification_method'] == 'Thread'
+    assert result['confidence_score'] == 0.76
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Thread Index")
+    print("=" * 50)
+    test_parse_references()
+    test_reply_chain_in_one_thread()
+    test_out_of_order_arrival()
+    test_threads_merged_by_linking_message()
+    test_same_message_twice_counted_once()
+    test_category_state_and_history()
+    test_classifier_falls_back_to_thread_category()
+    print("✅ All thread index tests passed")
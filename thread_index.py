@@ -0,0 +1,131 @@
+"""
+Conversation threading
+Groups an account's messages into threads from their Message-ID,
+In-Reply-To and References headers, a simplified JWZ threading: every
+Message-ID a message mentions becomes a node of the message's thread
+(placeholders for messages we have not seen), and a message that links
+nodes of several threads merges them (union by size). Every node stores its
+thread id directly, so a message's thread is one indexed lookup and a
+thread's messages are one indexed scan.
+
+Threads also keep a category state (the latest category classified in the
+conversation), which classification and reply suggestions use as context.
+"""
+
+import re
+import threading
+import logging
+from message_dedup import normalize_message_id
+from config import THREAD_HISTORY_LIMIT
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+REFERENCE = re.compile(r'<[^<>\s]+>')
+SUBJECT_PREFIX = re.compile(r'^\s*((re|fw|fwd|aw|sv|wg)(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+
+# Categories that say nothing about the other side of the conversation
+NO_THREAD_STATE = {'Sent', 'Uncategorized', None}
+
+
+def parse_references(in_reply_to, references):
+    """Normalized Message-IDs from References (oldest first) then In-Reply-To, without repeats"""
+    found = []
+    for header in (references, in_reply_to):
+        for token in REFERENCE.findall(header or ''):
+            message_id = normalize_message_id(token)
+            if message_id and message_id not in found:
+                found.append(message_id)
+    return found
+
+
+def base_subject(subject):
+    """'Re: Fwd: Pricing' -> 'Pricing'"""
+    return SUBJECT_PREFIX.sub('', subject or '').strip()
+
+
+class ThreadIndex:
+    """
+    Incremental thread index over ``store`` (python_models.Database:
+    ``get_thread_ids``, ``create_thread``, ``merge_threads``,
+    ``add_thread_message``, ``get_thread``, ``get_thread_emails`` and
+    ``set_thread_category``).
+
+    Threads never span accounts. Changes to one account's threads are
+    serialized by a lock striped on the account id. A thread id handed out
+    earlier may since have been merged away: callers store emails with
+    ``resolve(thread_id)`` inside ``locked(account_id)``, which follows the
+    merges (union-find with path compression) and cannot race a new one.
+    """
+
+    def __init__(self, store, lock_stripes=64):
+        self.store = store
+        self._locks = [threading.RLock() for _ in range(lock_stripes)]
+        self._merged = {}  # thread id merged away -> the thread it went into
+        self.stats = {'messages': 0, 'threads_created': 0, 'merges': 0}
+        self._stats_lock = threading.Lock()
+
+    def locked(self, account_id):
+        return self._locks[hash(account_id) % len(self._locks)]
+
+    def add_message(self, account_id, message_id, in_reply_to=None, references=None, subject=''):
+        """Thread a message; returns its thread (see ``get_thread``)"""
+        own = normalize_message_id(message_id)
+        parents = [mid for mid in parse_references(in_reply_to, references) if mid != own]
+        ids = parents + ([own] if own else [])
+        created = merged = 0
+        with self.locked(account_id):
+            found = self.store.get_thread_ids(account_id, ids) if ids else {}
+            thread_ids = set(found.values())
+            if not thread_ids:
+                thread_id = self.store.create_thread(account_id, base_subject(subject))
+                created = 1
+            elif len(thread_ids) == 1:
+                thread_id = thread_ids.pop()
+            else:
+                # Relabel the smaller threads into the largest one
+                threads = [self.store.get_thread(tid) for tid in thread_ids]
+                threads = [t for t in threads if t]
+                largest = max(threads, key=lambda t: (t['message_count'], -t['id']))
+                thread_id = largest['id']
+                others = [t['id'] for t in threads if t['id'] != thread_id]
+                self.store.merge_threads(thread_id, others)
+                self._merged.update((other, thread_id) for other in others)
+                merged = len(others)
+            self.store.add_thread_message(
+                account_id, thread_id, own, parent_id=parents[-1] if parents else None,
+                placeholders=[mid for mid in parents if mid not in found]
+            )
+            thread = self.store.get_thread(thread_id)
+        with self._stats_lock:
+            self.stats['messages'] += 1
+            self.stats['threads_created'] += created
+            self.stats['merges'] += merged
+        return thread
+
+    def resolve(self, thread_id):
+        """The thread a (possibly merged) thread id now belongs to"""
+        root = thread_id
+        while root in self._merged:
+            root = self._merged[root]
+        while thread_id in self._merged and self._merged[thread_id] != root:
+            self._merged[thread_id], thread_id = root, self._merged[thread_id]
+        return root
+
+    def record_category(self, thread_id, classification):
+        """Make a classified message's category the thread's current state"""
+        category = classification.get('category')
+        if thread_id and category not in NO_THREAD_STATE:
+            self.store.set_thread_category(self.resolve(thread_id), category, classification.get('confidence_score', 0.0))
+
+    def history(self, thread_id, limit=THREAD_HISTORY_LIMIT, exclude_uid=None):
+        """The thread's latest messages, oldest first, as reply/classification context"""
+        emails = [e for e in self.store.get_thread_emails(self.resolve(thread_id)) if e['uid'] != exclude_uid]
+        return [
+            {key: email[key] for key in ('sender', 'subject', 'category', 'date_received')}
+            | {'content': (email['content'] or '')[:500]}
+            for email in emails[-limit:]
+        ]
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)